@@ -1,6 +1,38 @@
-from _ast import ClassDef, FunctionDef
-from typing import Union
-from .ast_analyzer import ASTAnalyzer
-from .file_visitor import FileVisitor
-DocGenDef = Union[ClassDef, FunctionDef]
+from _ast import AsyncFunctionDef, ClassDef, FunctionDef
+from typing import Union, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from .ast_analyzer import ASTAnalyzer
+    from .file_visitor import FileVisitor
+    from .cache import DocstringCache
+
+DocGenDef = Union[ClassDef, FunctionDef, AsyncFunctionDef]
+
+_LAZY_ATTRIBUTES = {
+    "ASTAnalyzer": ".ast_analyzer",
+    "FileVisitor": ".file_visitor",
+    "DocstringCache": ".cache",
+}
+
+
+def __getattr__(name: str):
+    """
+    Imports the public classes of the package on first access, so importing the package (or
+    running the CLI) does not import every module.
+
+    Args:
+        name (str): The name of the attribute.
+
+    Raises:
+        AttributeError: If the package has no such attribute.
+
+    Returns:
+        The requested class.
+    """
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib  # pylint: disable=import-outside-toplevel
+
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
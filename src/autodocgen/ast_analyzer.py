@@ -1,20 +1,36 @@
 import ast
 import logging
-import os
-import re
 from _ast import AST
 from pathlib import Path
-from typing import Union, Optional, Literal, TypedDict, TYPE_CHECKING
+from types import SimpleNamespace
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Union,
+    Optional,
+    Literal,
+    TypedDict,
+    TYPE_CHECKING,
+)
 
 if TYPE_CHECKING:
     from . import FileVisitor
     from . import DocGenDef
+    from .node_index import NodeIndex
+    from .scheduler import RunBudget
+
+from .backends import Backend, BackendIdentity, OpenAIBackend, backend_identity
+from .context import ContextPolicy
+from .metrics import record_early_stop, record_rate_limit_wait, record_request_usage
+from .output import write_atomic
+from .rate_limiter import RateLimiter
+from .retry import RetryExecutor
+from .splice import splice_docstrings
+from .streaming import aconsume_stream, consume_stream, extract_docstring
+from .tokens import estimate_tokens
+from .tracing import span
 
-import black
-import dotenv
-import openai
-
-dotenv.load_dotenv()
 Role = Union[Literal["user"], Literal["system"], Literal["assistant"]]
 
 
@@ -88,11 +104,36 @@ class ASTAnalyzer:
         Adds a new prompt to the list of chat messages.
     add_response_to_messages(self, role: Role, content: str)
         Adds a new response to the list of chat messages.
-    update_token_usage(self, new_usage: int)
+    estimate_request_tokens(self, messages: list[ChatMessage], max_tokens: Optional[int]=None)
+     -> int
+        Estimates the number of tokens a request will count against the rate limits.
+    update_token_usage(self, new_usage: int, reserved_tokens: int=0)
         Updates the total token usage of the OpenAI API.
+    streamed_response(self, request_kwargs: ModelKwargs, content: str, stopped_early: bool)
+     -> SimpleNamespace
+        Builds a response from the text of a streamed completion.
+    charge_response(self, response: Any, reserved_tokens: int) -> Any
+        Counts the usage of a response.
+    attempt_request(self, send: Callable[[], Any], reserved_tokens: int) -> Any
+        Sends a request once, with hedging, charging every response.
+    aattempt_request(self, send: Callable[[], Awaitable[Any]], reserved_tokens: int) -> Any
+        Sends a request once without blocking the event loop, charging every response.
+    create_completion(self, request_kwargs: ModelKwargs, reserved_tokens: int=0) -> Any
+        Requests a completion, streamed if stream is set.
+    acreate_completion(self, request_kwargs: ModelKwargs, reserved_tokens: int=0) -> Any
+        Requests a completion without blocking the event loop, streamed if stream is set.
     obtain_pydoc(self, new_prompt: str) -> str
         Generates PyDoc for a given prompt.
-    write_file_from_ast(self, file_path: Union[str, Path], str_return=False) -> Optional[str]
+    aobtain_pydoc(self, new_prompt: str) -> str
+        Generates PyDoc for a given prompt without blocking the event loop.
+    obtain_pydoc_batch(self, batch_prompt: str, node_count: int) -> str
+        Generates PyDoc for a batch of nodes in a single request.
+    aobtain_pydoc_batch(self, batch_prompt: str, node_count: int) -> str
+        Generates PyDoc for a batch of nodes without blocking the event loop.
+    render_source(self, reformat: bool=False, index: Optional[NodeIndex]=None) -> str
+        Renders a modified Python AST as source code.
+    write_file_from_ast(self, file_path: Union[str, Path], str_return=False, reformat: bool=False,
+     index: Optional[NodeIndex]=None) -> Optional[str]
         Writes a modified Python AST to a file.
     add_docstring_to_ast(node: DocGenDef, new_docstring: str)
         Adds a docstring to a given node in the Python AST.
@@ -100,6 +141,8 @@ class ASTAnalyzer:
         Removes all chat messages except for the default message.
     generate_documentation(self, file_visitor: 'FileVisitor')
         Generates documentation for a Python AST.
+    agenerate_documentation(self, file_visitor: 'FileVisitor', concurrency: int=4)
+        Generates documentation for a Python AST with concurrent requests.
     """
 
     default_messages: list[ChatMessage] = [
@@ -134,29 +177,61 @@ class ASTAnalyzer:
             model_kwargs (ModelKwargs, optional): The model's keyword arguments. Defaults to None.
             prepend_prompt (str, optional): The prompt to prepend to the input text.
             Defaults to default_prepend_prompt.
-            **kwargs: Additional keyword arguments.
+            **kwargs: Additional keyword arguments. Supports file_path, line_length,
+            backend, the Backend answering the requests (defaults to an OpenAIBackend using
+            $OPENAI_KEY), stream, whether to stream single-node completions and stop them once
+            the docstring is complete (defaults to False), rate_limiter, the RateLimiter shared
+            by the requests of a run (defaults to a new limiter with the limits of the model),
+            context_policy, the ContextPolicy bounding the conversation history (defaults
+            to the last two exchanges), budget, the RunBudget every response is charged
+            to (defaults to None, for no limit), and retry_executor, the RetryExecutor retrying
+            failed requests and hedging slow ones (defaults to a new executor with its default
+            timeout and number of attempts).
 
         Raises:
-            EnvironmentError: If OPENAI_KEY is missing.
+            EnvironmentError: If no backend is given and OPENAI_KEY is missing.
 
         Returns:
             None
         """
-        self.model_kwargs: ModelKwargs = model_kwargs or self.default_model_kwargs
+        model_kwargs = model_kwargs or self.default_model_kwargs
+        self.model_kwargs: ModelKwargs = ModelKwargs(
+            **{**model_kwargs, "messages": list(model_kwargs["messages"])}
+        )
         self.prepend_prompt = prepend_prompt
         self.source_code: Optional[str] = None
+        self.file_path: Optional[Path] = None
         self.tree: Optional[AST] = None
         self.latest_response = None
         self.total_token_usage = 0
-        openai.api_key = os.getenv("OPENAI_KEY", None)
-        if openai.api_key is None:
-            raise EnvironmentError("OPENAI_KEY is missing")
+        if "backend" in kwargs:
+            self.backend: Backend = kwargs["backend"]
+        else:
+            self.backend = OpenAIBackend()
+        # The model actually requested, which the backend may override.
+        self.backend_identity: BackendIdentity = backend_identity(
+            self.backend, self.model_kwargs["model"]
+        )
+        self.stream: bool = kwargs.get("stream", False)
         if "file_path" in kwargs:
             self.load_ast_from_file(kwargs["file_path"])
         if "line_length" in kwargs:
             self.line_length = kwargs["line_length"]
         else:
             self.line_length = 100
+        if "rate_limiter" in kwargs:
+            self.rate_limiter: RateLimiter = kwargs["rate_limiter"]
+        else:
+            self.rate_limiter = RateLimiter.for_model(self.backend_identity.model)
+        if "context_policy" in kwargs:
+            self.context_policy: ContextPolicy = kwargs["context_policy"]
+        else:
+            self.context_policy = ContextPolicy()
+        self.budget: Optional["RunBudget"] = kwargs.get("budget")
+        if "retry_executor" in kwargs:
+            self.retry_executor: RetryExecutor = kwargs["retry_executor"]
+        else:
+            self.retry_executor = RetryExecutor()
 
     def load_ast_from_file(self, file_path: Union[str, Path]):
         """
@@ -168,13 +243,16 @@ class ASTAnalyzer:
         Returns:
             None
         """
-        with open(file_path, "r", encoding="utf-8") as file:
-            self.source_code = file.read()
-        self.tree: AST = ast.parse(self.source_code)
+        with span("read_file", "io", file=str(file_path)):
+            with open(file_path, "r", encoding="utf-8") as file:
+                self.source_code = file.read()
+        self.file_path = Path(file_path)
+        with span("ast.parse", file=str(file_path)):
+            self.tree: AST = ast.parse(self.source_code)
 
     def add_new_prompt_to_messages(self, new_prompt: str) -> None:
         """
-        Adds a new prompt to the messages.
+        Adds a new prompt to the messages and bounds the history with the context policy.
 
         Args:
             new_prompt (str): The new prompt to add.
@@ -185,6 +263,7 @@ class ASTAnalyzer:
         self.model_kwargs["messages"].append(
             ChatMessage(role="user", content=self.prepend_prompt + new_prompt)
         )
+        self.model_kwargs["messages"] = self.context_policy.apply(self.model_kwargs["messages"])
 
     def add_response_to_messages(self, role: Role, content: str):
         """
@@ -199,22 +278,217 @@ class ASTAnalyzer:
         """
         self.model_kwargs["messages"].append(ChatMessage(role=role, content=content))
 
-    def update_token_usage(self, new_usage: int):
+    def estimate_request_tokens(
+            self, messages: list[ChatMessage], max_tokens: Optional[int] = None
+    ) -> int:
+        """
+        Estimates the number of tokens a request will count against the tokens-per-minute limit.
+
+        The prompt is estimated locally with estimate_tokens, and max_tokens is added since
+        the API reserves it for the completion.
+
+        Args:
+            messages (list[ChatMessage]): The messages of the request.
+            max_tokens (Optional[int], optional): The max_tokens of the request.
+            Defaults to the max_tokens of the model kwargs.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return prompt_tokens + (max_tokens or self.model_kwargs["max_tokens"])
+
+    def update_token_usage(self, new_usage: int, reserved_tokens: int = 0):
         """
-        Updates the total token usage.
+        Updates the total token usage, reconciles it with the rate limiter and charges the
+        budget, if any.
 
         Args:
             new_usage (int): The new token usage to add.
+            reserved_tokens (int, optional): The number of tokens reserved with the rate
+            limiter for the request. Defaults to 0.
 
         Returns:
             None
         """
         self.total_token_usage += new_usage
+        self.rate_limiter.record_usage(new_usage, reserved_tokens)
+        if self.budget is not None:
+            self.budget.charge(new_usage)
+
+    def streamed_response(
+            self, request_kwargs: ModelKwargs, content: str, stopped_early: bool
+    ) -> SimpleNamespace:
+        """
+        Builds a response from the text of a streamed completion, with the shape of a
+        non-streamed response. Streams do not report their usage, so it is estimated locally.
+        An early stop is recorded with the completion tokens it left unused.
+
+        Args:
+            request_kwargs (ModelKwargs): The model kwargs of the request.
+            content (str): The text received, up to the end of the docstring.
+            stopped_early (bool): Whether the stream was stopped once the docstring was
+            complete.
+
+        Returns:
+            SimpleNamespace: The response.
+        """
+        prompt_tokens = sum(
+            estimate_tokens(message["content"]) for message in request_kwargs["messages"]
+        )
+        completion_tokens = estimate_tokens(content)
+        if stopped_early:
+            record_early_stop(max(0, request_kwargs["max_tokens"] - completion_tokens))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    def charge_response(self, response: Any, reserved_tokens: int) -> Any:
+        """
+        Counts the usage of a response in the total token usage, the rate limiter, the budget
+        and the metrics of the current node. Every attempt is charged, including a hedged
+        duplicate losing the race.
+
+        Args:
+            response (Any): The response.
+            reserved_tokens (int): The number of tokens reserved with the rate limiter for the
+            attempt.
+
+        Returns:
+            Any: The response.
+        """
+        self.update_token_usage(response.usage["total_tokens"], reserved_tokens)
+        record_request_usage(response.usage)
+        return response
+
+    def attempt_request(self, send: Callable[[], Any], reserved_tokens: int) -> Any:
+        """
+        Sends a request once with the retry executor, charging every response. A hedged
+        duplicate first reserves its own capacity with the rate limiter.
+
+        Args:
+            send (Callable[[], Any]): A function sending the request and returning the
+            response.
+            reserved_tokens (int): The number of tokens reserved with the rate limiter for
+            every attempt, the first one being reserved by the caller.
+
+        Returns:
+            Any: The first response.
+        """
+
+        def charged_send() -> Any:
+            return self.charge_response(send(), reserved_tokens)
+
+        def hedge_send() -> Any:
+            with span("rate_limiter.acquire", "wait"):
+                record_rate_limit_wait(self.rate_limiter.acquire(reserved_tokens))
+            return charged_send()
+
+        return self.retry_executor.attempt(charged_send, hedge_send)
+
+    async def aattempt_request(
+            self, send: Callable[[], Awaitable[Any]], reserved_tokens: int
+    ) -> Any:
+        """
+        Sends a request once with the retry executor without blocking the event loop,
+        charging every response. A hedged duplicate first reserves its own capacity with the
+        rate limiter.
+
+        Args:
+            send (Callable[[], Awaitable[Any]]): A coroutine function sending the request and
+            returning the response.
+            reserved_tokens (int): The number of tokens reserved with the rate limiter for
+            every attempt, the first one being reserved by the caller.
+
+        Returns:
+            Any: The first response.
+        """
+
+        async def charged_send() -> Any:
+            return self.charge_response(await send(), reserved_tokens)
+
+        async def hedge_send() -> Any:
+            with span("rate_limiter.acquire", "wait"):
+                record_rate_limit_wait(await self.rate_limiter.aacquire(reserved_tokens))
+            return await charged_send()
+
+        return await self.retry_executor.aattempt(charged_send, hedge_send)
+
+    def create_completion(self, request_kwargs: ModelKwargs, reserved_tokens: int = 0) -> Any:
+        """
+        Requests a completion from the backend, with the hedging of the retry executor, and
+        charges its usage. The backend bounds the duration of the request. With stream set,
+        the completion is streamed and stopped as soon as the docstring is complete.
+
+        Args:
+            request_kwargs (ModelKwargs): The model kwargs of the request.
+            reserved_tokens (int, optional): The number of tokens reserved with the rate
+            limiter for the request. Defaults to 0.
+
+        Returns:
+            Any: The response.
+        """
+        # The messages are copied, as a hedged attempt losing the race may still read them
+        # when the conversation has moved on.
+        request_kwargs = ModelKwargs(
+            **{**request_kwargs, "messages": list(request_kwargs["messages"])}
+        )
+
+        def send() -> Any:
+            if not self.stream:
+                return self.backend.create(**request_kwargs)
+            content, stopped_early = consume_stream(
+                self.backend.create(**request_kwargs, stream=True)
+            )
+            return self.streamed_response(request_kwargs, content, stopped_early)
+
+        with span("request", "network", model=request_kwargs["model"]):
+            return self.attempt_request(send, reserved_tokens)
+
+    async def acreate_completion(
+            self, request_kwargs: ModelKwargs, reserved_tokens: int = 0
+    ) -> Any:
+        """
+        Requests a completion from the backend without blocking the event loop, within the
+        timeout and with the hedging of the retry executor, and charges its usage. With
+        stream set, the completion is streamed and stopped as soon as the docstring is
+        complete.
+
+        Args:
+            request_kwargs (ModelKwargs): The model kwargs of the request.
+            reserved_tokens (int, optional): The number of tokens reserved with the rate
+            limiter for the request. Defaults to 0.
+
+        Raises:
+            RequestTimeout: If no response arrived within the timeout.
+
+        Returns:
+            Any: The response.
+        """
+
+        async def send() -> Any:
+            if not self.stream:
+                return await self.backend.acreate(**request_kwargs)
+            content, stopped_early = await aconsume_stream(
+                await self.backend.acreate(**request_kwargs, stream=True)
+            )
+            return self.streamed_response(request_kwargs, content, stopped_early)
+
+        with span("request", "network", model=request_kwargs["model"]):
+            return await self.aattempt_request(send, reserved_tokens)
 
     def obtain_pydoc(self, new_prompt: str) -> str:
         """
         Obtains the PyDoc for a given prompt.
 
+        If the request fails, the prompt is removed from the messages again so a retry does
+        not send it twice.
+
         Args:
             new_prompt (str): The prompt to obtain the PyDoc for.
 
@@ -222,28 +496,161 @@ class ASTAnalyzer:
             str: The PyDoc for the given prompt.
         """
         self.add_new_prompt_to_messages(new_prompt)
-        self.latest_response = openai.ChatCompletion.create(**self.model_kwargs)
+        reserved_tokens = self.estimate_request_tokens(self.model_kwargs["messages"])
+        with span("rate_limiter.acquire", "wait"):
+            record_rate_limit_wait(self.rate_limiter.acquire(reserved_tokens))
+        try:
+            self.latest_response = self.create_completion(self.model_kwargs, reserved_tokens)
+        except Exception:
+            self.model_kwargs["messages"].pop()
+            raise
         latest_message = self.latest_response.choices[0].message
         self.add_response_to_messages(role=latest_message.role, content=latest_message.content)
-        self.update_token_usage(self.latest_response.usage["total_tokens"])
         return latest_message.content.strip()
 
-    def write_file_from_ast(self, file_path: Union[str, Path], str_return=False) -> Optional[str]:
+    async def aobtain_pydoc(self, new_prompt: str) -> str:
+        """
+        Obtains the PyDoc for a given prompt using the asynchronous OpenAI API.
+
+        Concurrent requests cannot share a conversation, so only the first message and the
+        new prompt are sent and the conversation history is left untouched.
+
+        Args:
+            new_prompt (str): The prompt to obtain the PyDoc for.
+
+        Returns:
+            str: The PyDoc for the given prompt.
+        """
+        messages = [
+            self.model_kwargs["messages"][0],
+            ChatMessage(role="user", content=self.prepend_prompt + new_prompt),
+        ]
+        reserved_tokens = self.estimate_request_tokens(messages)
+        with span("rate_limiter.acquire", "wait"):
+            record_rate_limit_wait(await self.rate_limiter.aacquire(reserved_tokens))
+        self.latest_response = await self.acreate_completion(
+            ModelKwargs(**{**self.model_kwargs, "messages": messages}), reserved_tokens
+        )
+        return self.latest_response.choices[0].message.content.strip()
+
+    def batch_request_kwargs(self, batch_prompt: str, node_count: int) -> ModelKwargs:
+        """
+        Builds the model kwargs of a batch request. Batch requests are stateless, like
+        concurrent requests, and may use up to four times max_tokens for the completion.
+
+        Args:
+            batch_prompt (str): The prompt of the batch, see batching.build_batch_prompt.
+            node_count (int): The number of nodes in the batch.
+
+        Returns:
+            ModelKwargs: The model kwargs of the request.
+        """
+        max_tokens = self.model_kwargs["max_tokens"] * min(node_count, 4)
+        messages = [
+            self.model_kwargs["messages"][0],
+            ChatMessage(role="user", content=batch_prompt),
+        ]
+        return ModelKwargs(**{**self.model_kwargs, "messages": messages, "max_tokens": max_tokens})
+
+    def obtain_pydoc_batch(self, batch_prompt: str, node_count: int) -> str:
+        """
+        Obtains the PyDoc of a batch of nodes in a single request.
+
+        Args:
+            batch_prompt (str): The prompt of the batch, see batching.build_batch_prompt.
+            node_count (int): The number of nodes in the batch.
+
+        Returns:
+            str: The response, which should contain a JSON object mapping names to PyDoc.
+        """
+        request_kwargs = self.batch_request_kwargs(batch_prompt, node_count)
+        reserved_tokens = self.estimate_request_tokens(
+            request_kwargs["messages"], request_kwargs["max_tokens"]
+        )
+        with span("rate_limiter.acquire", "wait"):
+            record_rate_limit_wait(self.rate_limiter.acquire(reserved_tokens))
+        with span("request", "network", model=request_kwargs["model"], nodes=node_count):
+            self.latest_response = self.attempt_request(
+                lambda: self.backend.create(**request_kwargs), reserved_tokens
+            )
+        return self.latest_response.choices[0].message.content.strip()
+
+    async def aobtain_pydoc_batch(self, batch_prompt: str, node_count: int) -> str:
+        """
+        Obtains the PyDoc of a batch of nodes in a single request using the asynchronous
+        OpenAI API.
+
+        Args:
+            batch_prompt (str): The prompt of the batch, see batching.build_batch_prompt.
+            node_count (int): The number of nodes in the batch.
+
+        Returns:
+            str: The response, which should contain a JSON object mapping names to PyDoc.
         """
-        Writes the AST to a file.
+        request_kwargs = self.batch_request_kwargs(batch_prompt, node_count)
+        reserved_tokens = self.estimate_request_tokens(
+            request_kwargs["messages"], request_kwargs["max_tokens"]
+        )
+        with span("rate_limiter.acquire", "wait"):
+            record_rate_limit_wait(await self.rate_limiter.aacquire(reserved_tokens))
+        with span("request", "network", model=request_kwargs["model"], nodes=node_count):
+            self.latest_response = await self.aattempt_request(
+                lambda: self.backend.acreate(**request_kwargs), reserved_tokens
+            )
+        return self.latest_response.choices[0].message.content.strip()
+
+    def render_source(self, reformat: bool = False, index: Optional["NodeIndex"] = None) -> str:
+        """
+        Renders the AST as source code.
+
+        By default, only the new docstrings are spliced into the source code the AST was
+        loaded from, so comments and formatting are preserved. With reformat, or when the AST
+        was not loaded from a file, the whole file is regenerated with ast.unparse and black.
+
+        Args:
+            reformat (bool, optional): Whether to regenerate and reformat the whole file.
+            Defaults to False.
+            index (Optional[NodeIndex], optional): The index of the AST the docstrings were
+            added to, see splice_docstrings. Defaults to None.
+
+        Returns:
+            str: The source code.
+        """
+        if reformat or self.source_code is None:
+            import black  # pylint: disable=import-outside-toplevel
+
+            with span("ast.unparse"):
+                new_code: str = ast.unparse(ast_obj=self.tree)
+            with span("black.format_str"):
+                return black.format_str(new_code, mode=black.Mode(line_length=self.line_length))
+        with span("splice_docstrings"):
+            return splice_docstrings(self.source_code, self.tree, index)
+
+    def write_file_from_ast(
+            self,
+            file_path: Union[str, Path],
+            str_return=False,
+            reformat: bool = False,
+            index: Optional["NodeIndex"] = None,
+    ) -> Optional[str]:
+        """
+        Writes the AST to a file atomically, rendered by render_source.
 
         Args:
             file_path (Union[str, Path]): The path to the file.
             str_return (bool, optional): Whether to return the new code as a string.
             Defaults to False.
+            reformat (bool, optional): Whether to regenerate and reformat the whole file.
+            Defaults to False.
+            index (Optional[NodeIndex], optional): The index of the AST the docstrings were
+            added to, see splice_docstrings. Defaults to None.
 
         Returns:
             Optional[str]: The new code as a string if str_return is True, otherwise None.
         """
-        new_code: str = ast.unparse(ast_obj=self.tree)
-        new_code: str = black.format_str(new_code, mode=black.Mode(line_length=self.line_length))
-        with open(file_path, "w", encoding="utf-8") as file:
-            file.write(new_code)
+        new_code = self.render_source(reformat, index)
+        with span("write_file", "io", file=str(file_path)):
+            write_atomic(file_path, new_code)
         if str_return:
             return new_code
         return None
@@ -261,21 +668,11 @@ class ASTAnalyzer:
             None
         """
         existing_docstring = ast.get_docstring(node)
-        double_quote_match = re.search(r"\"\"\"([\s\S]*?)\"\"\"", new_docstring)
-        single_quote_match = re.search(r"'''([\s\S]*?)'''", new_docstring)
-        backtick_match = re.search(r"```([\s\S]*?)```", new_docstring)
-
-        if double_quote_match:
-            clean_docstring = double_quote_match.group(1)
-            logging.debug("Docstring was extracted using three double quotes")
-        elif backtick_match:
-            clean_docstring = backtick_match.group(1)
-            logging.debug("Docstring was extracted using three backticks")
-        elif single_quote_match:
-            clean_docstring = single_quote_match.group(1)
-            logging.debug("Docstring was extracted using three single quotes")
+        with span("extract_docstring"):
+            clean_docstring, delimiter = extract_docstring(new_docstring)
+        if delimiter is not None:
+            logging.debug("Docstring was extracted using %s", delimiter)
         else:
-            clean_docstring = new_docstring
             logging.debug("The docstring could not be extracted.")
         docstring_node = ast.Expr(value=ast.Str(s=clean_docstring + "\n"))
         if existing_docstring:
@@ -303,3 +700,17 @@ class ASTAnalyzer:
             None
         """
         file_visitor.visit(self.tree)
+
+    async def agenerate_documentation(self, file_visitor: "FileVisitor", concurrency: int = 4):
+        """
+        Generates documentation for the abstract syntax tree (AST) with concurrent requests.
+
+        Args:
+            file_visitor ('FileVisitor'): The file visitor to use.
+            concurrency (int, optional): The maximum number of concurrent requests.
+            Defaults to 4.
+
+        Returns:
+            None
+        """
+        await file_visitor.avisit(self.tree, concurrency=concurrency)
@@ -0,0 +1,679 @@
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Protocol,
+    TypeVar,
+    Union,
+)
+
+from .batching import BATCH_PROMPT
+from .tokens import estimate_tokens
+
+T = TypeVar("T")
+_BATCH_HEADING = re.compile(r"^### (\S+)$", re.MULTILINE)
+_DEFINITION = re.compile(r"(?:class|def) (\w+)")
+
+
+@functools.lru_cache(maxsize=None)
+def load_dotenv_once():
+    """
+    Loads the variables of a .env file into the environment the first time it is called.
+    python-dotenv is imported here rather than at module import to keep the CLI startup fast.
+
+    Returns:
+        None
+    """
+    import dotenv  # pylint: disable=import-outside-toplevel
+
+    dotenv.load_dotenv()
+
+
+class Backend(Protocol):
+    """
+    Backend protocol for the chat completion services documentation is requested from.
+
+    A backend is created once per run (and once per worker process) and shared by all files,
+    so it can keep connections and an event loop alive between requests. Responses must have
+    the shape of OpenAI chat completions: `choices[0].message.role/content` and a `usage`
+    dictionary with prompt, completion and total tokens. With stream=True, create returns an
+    iterator and acreate an asynchronous iterator of chunks with a `choices[0].delta` dictionary.
+
+    Methods:
+    --------
+    create(self, **kwargs) -> Any
+        Sends a chat completion request.
+    acreate(self, **kwargs) -> Any
+        Sends a chat completion request without blocking the event loop.
+    run(self, coroutine: Awaitable[T]) -> T
+        Runs a coroutine on the event loop of the backend.
+    close(self)
+        Releases the connections and the event loop of the backend.
+    """
+
+    def create(self, **kwargs) -> Any:
+        ...
+
+    async def acreate(self, **kwargs) -> Any:
+        ...
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        ...
+
+    def close(self):
+        ...
+
+
+class _EventLoopOwner:
+    """
+    Base class of the backends, owning an event loop that is reused by every call of run.
+
+    Runtime state (the loop, locks and connections) is not pickled, so a backend can be sent
+    to worker processes, where it creates its own on first use.
+    """
+
+    _runtime_attributes: tuple[str, ...] = ("_loop",)
+
+    def __init__(self):
+        self._loop = None
+
+    def run(self, coroutine: Awaitable[T]) -> T:
+        """
+        Runs a coroutine on the event loop of the backend, creating the loop on first use.
+
+        Args:
+            coroutine (Awaitable[T]): The coroutine to run.
+
+        Returns:
+            T: The result of the coroutine.
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        if self._loop is None or self._loop.is_closed():
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    def close(self):
+        """
+        Closes the event loop of the backend.
+
+        Returns:
+            None
+        """
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.close()
+        self._loop = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        for name in self._runtime_attributes:
+            state[name] = None
+        return state
+
+
+class OpenAIBackend(_EventLoopOwner):
+    """
+    OpenAIBackend class for requesting chat completions from the OpenAI API.
+
+    The API key, base URL and organization are passed with every request instead of being
+    set on the openai module. Synchronous requests share one requests.Session with a
+    keep-alive connection pool, and asynchronous requests share one aiohttp.ClientSession
+    (the openai library otherwise opens a new session for every asynchronous request).
+
+    Attributes:
+    -----------
+    api_key : Optional[str]
+        The API key.
+    api_base : Optional[str]
+        The base URL of the API, or None for the default of the openai library.
+    organization : Optional[str]
+        The OpenAI organization, if any.
+    model : Optional[str]
+        A model name that overrides the model of every request, if any.
+    max_connections : int
+        The maximum number of pooled connections.
+    timeout_secs : Optional[float]
+        The maximum duration of a request, passed to the HTTP layer, or None for the default
+        of the openai library.
+
+    Methods:
+    --------
+    create(self, **kwargs) -> Any
+        Sends a chat completion request over the pooled session.
+    acreate(self, **kwargs) -> Any
+        Sends a chat completion request over the pooled asynchronous session.
+    run(self, coroutine: Awaitable[T]) -> T
+        Runs a coroutine on the event loop of the backend.
+    close(self)
+        Closes the sessions and the event loop.
+    """
+
+    _runtime_attributes = ("_loop", "_session", "_asession", "_asession_loop", "_lock")
+
+    def __init__(
+            self,
+            api_key: Optional[str] = None,
+            api_base: Optional[str] = None,
+            organization: Optional[str] = None,
+            model: Optional[str] = None,
+            max_connections: int = 32,
+            timeout_secs: Optional[float] = None,
+    ):
+        """
+        Initializes an instance of the class. No connection is opened until the first request.
+
+        Args:
+            api_key (Optional[str], optional): The API key. Defaults to $OPENAI_KEY, which may
+            be set in a .env file.
+            api_base (Optional[str], optional): The base URL of the API. Defaults to the
+            default of the openai library.
+            organization (Optional[str], optional): The OpenAI organization. Defaults to None.
+            model (Optional[str], optional): A model name overriding the model of every
+            request. Defaults to None.
+            max_connections (int, optional): The maximum number of pooled connections.
+            Defaults to 32.
+            timeout_secs (Optional[float], optional): The maximum duration of a request, after
+            which it fails with openai.error.Timeout. Defaults to the default of the openai
+            library.
+
+        Raises:
+            EnvironmentError: If no API key is given and OPENAI_KEY is missing.
+
+        Returns:
+            None
+        """
+        super().__init__()
+        if api_key is None:
+            load_dotenv_once()
+        self.api_key = api_key or os.getenv("OPENAI_KEY", None)
+        if self.api_key is None:
+            raise EnvironmentError("OPENAI_KEY is missing")
+        self.api_base = api_base
+        self.organization = organization
+        self.model = model
+        self.max_connections = max_connections
+        self.timeout_secs = timeout_secs
+        self._session = None
+        self._asession = None
+        self._asession_loop = None
+        self._lock = None
+
+    def request_kwargs(self, kwargs: dict) -> dict:
+        """
+        Adds the credentials, base URL, model override and timeout to the kwargs of a request.
+
+        Args:
+            kwargs (dict): The kwargs of the request.
+
+        Returns:
+            dict: The kwargs to pass to openai.ChatCompletion.
+        """
+        request_kwargs = {**kwargs, "api_key": self.api_key}
+        if self.api_base is not None:
+            request_kwargs["api_base"] = self.api_base
+        if self.organization is not None:
+            request_kwargs["organization"] = self.organization
+        if self.model is not None:
+            request_kwargs["model"] = self.model
+        if self.timeout_secs is not None:
+            request_kwargs["request_timeout"] = self.timeout_secs
+        return request_kwargs
+
+    def _requests_session(self):
+        import requests  # pylint: disable=import-outside-toplevel
+
+        if self._lock is None:
+            self._lock = threading.Lock()
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.max_connections, pool_maxsize=self.max_connections
+                )
+                self._session.mount("https://", adapter)
+                self._session.mount("http://", adapter)
+        return self._session
+
+    def _aiohttp_session(self):
+        import asyncio  # pylint: disable=import-outside-toplevel
+        import aiohttp  # pylint: disable=import-outside-toplevel
+
+        loop = asyncio.get_running_loop()
+        if self._asession is None or self._asession.closed or self._asession_loop is not loop:
+            self._asession = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=self.timeout_secs),
+            )
+            self._asession_loop = loop
+        return self._asession
+
+    def create(self, **kwargs) -> Any:
+        """
+        Sends a chat completion request over the pooled session.
+
+        Args:
+            **kwargs: The keyword arguments of openai.ChatCompletion.create.
+
+        Returns:
+            Any: The response.
+        """
+        import openai  # pylint: disable=import-outside-toplevel
+
+        # openai 0.27 only accepts a custom session globally; every backend installs the same
+        # pooled session, so requests keep reusing its connections.
+        openai.requestssession = self._requests_session()
+        return openai.ChatCompletion.create(**self.request_kwargs(kwargs))
+
+    async def acreate(self, **kwargs) -> Any:
+        """
+        Sends a chat completion request over the pooled asynchronous session.
+
+        Args:
+            **kwargs: The keyword arguments of openai.ChatCompletion.acreate.
+
+        Returns:
+            Any: The response.
+        """
+        import openai  # pylint: disable=import-outside-toplevel
+
+        token = openai.aiosession.set(self._aiohttp_session())
+        try:
+            return await openai.ChatCompletion.acreate(**self.request_kwargs(kwargs))
+        finally:
+            openai.aiosession.reset(token)
+
+    def close(self):
+        """
+        Closes the sessions and the event loop.
+
+        Returns:
+            None
+        """
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        if self._asession is not None and not self._asession.closed:
+            if self._asession_loop is not None and not self._asession_loop.is_closed():
+                self._asession_loop.run_until_complete(self._asession.close())
+        self._asession = None
+        self._asession_loop = None
+        super().close()
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """
+    OpenAICompatibleBackend class for requesting chat completions from a server implementing
+    the OpenAI API, such as a self-hosted model, at a base URL. An API key is optional.
+    """
+
+    def __init__(
+            self,
+            base_url: str,
+            api_key: Optional[str] = None,
+            model: Optional[str] = None,
+            max_connections: int = 32,
+            timeout_secs: Optional[float] = None,
+    ):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            base_url (str): The base URL of the API, e.g. http://localhost:8000/v1.
+            api_key (Optional[str], optional): The API key. Defaults to $OPENAI_KEY, or a
+            placeholder when it is not set.
+            model (Optional[str], optional): The name of the model served at the base URL,
+            overriding the model of every request. Defaults to None.
+            max_connections (int, optional): The maximum number of pooled connections.
+            Defaults to 32.
+            timeout_secs (Optional[float], optional): The maximum duration of a request.
+            Defaults to the default of the openai library.
+
+        Returns:
+            None
+        """
+        load_dotenv_once()
+        super().__init__(
+            api_key=api_key or os.getenv("OPENAI_KEY", None) or "not-needed",
+            api_base=base_url,
+            model=model,
+            max_connections=max_connections,
+            timeout_secs=timeout_secs,
+        )
+
+
+class StubBackend(_EventLoopOwner):
+    """
+    StubBackend class for answering chat completion requests in-process, without any API.
+
+    The stub answers every prompt with a short docstring naming the class or function in the
+    prompt (or a JSON object for batch prompts), after a configurable latency, and can inject
+    connection errors and rate limit errors. It reports a token usage estimated from the
+    request and response, so benchmarks exercise the same bookkeeping as real requests.
+    Completions take a configurable time per token and can be streamed in chunks of about a
+    token; docstrings can be followed by commentary, like models often add.
+
+    Attributes:
+    -----------
+    latency_secs : float
+        The base latency of every request.
+    jitter_secs : float
+        The maximum random latency added to every request.
+    error_rate : float
+        The fraction of requests failing with an APIConnectionError.
+    rate_limit_rate : float
+        The fraction of requests failing with a RateLimitError (HTTP 429).
+    token_latency_secs : float
+        The time taken to generate every completion token.
+    commentary_tokens : int
+        The number of tokens of commentary following every docstring.
+    requests : int
+        The number of requests received, including failed ones.
+    errors : int
+        The number of injected connection errors.
+    rate_limited : int
+        The number of injected rate limit errors.
+
+    Methods:
+    --------
+    respond(self, **kwargs) -> SimpleNamespace
+        Builds the response to a request.
+    create(self, **kwargs) -> Union[SimpleNamespace, Iterator[SimpleNamespace]]
+        Answers a request, blocking for its latency.
+    acreate(self, **kwargs) -> Union[SimpleNamespace, AsyncIterator[SimpleNamespace]]
+        Answers a request without blocking the event loop.
+    run(self, coroutine: Awaitable[T]) -> T
+        Runs a coroutine on the event loop of the backend.
+    close(self)
+        Closes the event loop.
+    """
+
+    _runtime_attributes = ("_loop", "lock")
+
+    def __init__(
+            self,
+            latency_secs: float = 0.0,
+            jitter_secs: float = 0.0,
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            seed: int = 0,
+            token_latency_secs: float = 0.0,
+            commentary_tokens: int = 0,
+    ):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            latency_secs (float, optional): The base latency of every request. Defaults to 0.
+            jitter_secs (float, optional): The maximum random latency added to every request.
+            Defaults to 0.
+            error_rate (float, optional): The fraction of requests failing with an
+            APIConnectionError. Defaults to 0.
+            rate_limit_rate (float, optional): The fraction of requests failing with a
+            RateLimitError. Defaults to 0.
+            seed (int, optional): The seed of the random latencies and failures. Defaults to 0.
+            token_latency_secs (float, optional): The time taken to generate every completion
+            token. Defaults to 0.
+            commentary_tokens (int, optional): The number of tokens of commentary following
+            every docstring. Defaults to 0.
+
+        Returns:
+            None
+        """
+        super().__init__()
+        self.latency_secs = latency_secs
+        self.jitter_secs = jitter_secs
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.token_latency_secs = token_latency_secs
+        self.commentary_tokens = commentary_tokens
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def _next_outcome(self) -> float:
+        """
+        Counts a request, raises the error injected for it, if any, and draws its latency.
+
+        Returns:
+            float: The latency of the request in seconds.
+        """
+        from openai.error import (  # pylint: disable=import-outside-toplevel
+            APIConnectionError,
+            RateLimitError,
+        )
+
+        with self.lock:
+            self.requests += 1
+            draw = self.random.random()
+            latency = self.latency_secs + self.random.uniform(0, self.jitter_secs)
+            if draw < self.rate_limit_rate:
+                self.rate_limited += 1
+                raise RateLimitError("Injected rate limit error", http_status=429)
+            if draw < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                raise APIConnectionError("Injected connection error")
+        return latency
+
+    def respond(self, **kwargs) -> SimpleNamespace:
+        """
+        Builds the response to a request.
+
+        Args:
+            **kwargs: The keyword arguments of openai.ChatCompletion.create.
+
+        Returns:
+            SimpleNamespace: A response with the attributes used by ASTAnalyzer.
+        """
+        messages = kwargs["messages"]
+        prompt = messages[-1]["content"]
+        if prompt.startswith(BATCH_PROMPT):
+            content = json.dumps(
+                {name: f"Docs for {name}." for name in _BATCH_HEADING.findall(prompt)}
+            )
+        else:
+            definition = _DEFINITION.search(prompt)
+            name = definition.group(1) if definition is not None else "module"
+            content = f'"""Docs for {name}."""'
+            if self.commentary_tokens > 0:
+                content += "\n\nThis docstring" + " explains" * self.commentary_tokens
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        completion_tokens = estimate_tokens(content)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+            usage={
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    @staticmethod
+    def chunks(response: SimpleNamespace) -> list[SimpleNamespace]:
+        """
+        Splits a response into stream chunks of about a token.
+
+        Args:
+            response (SimpleNamespace): The response.
+
+        Returns:
+            list[SimpleNamespace]: The chunks, with the attributes of streamed chunks.
+        """
+        content = response.choices[0].message.content
+        return [
+            SimpleNamespace(choices=[SimpleNamespace(delta={"content": content[start:start + 4]})])
+            for start in range(0, len(content), 4)
+        ]
+
+    def _stream(self, response: SimpleNamespace) -> Iterator[SimpleNamespace]:
+        for chunk in self.chunks(response):
+            time.sleep(self.token_latency_secs)
+            yield chunk
+
+    async def _astream(self, response: SimpleNamespace) -> AsyncIterator[SimpleNamespace]:
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        for chunk in self.chunks(response):
+            await asyncio.sleep(self.token_latency_secs)
+            yield chunk
+
+    def create(self, **kwargs) -> Union[SimpleNamespace, Iterator[SimpleNamespace]]:
+        """
+        Answers a request, blocking for its latency.
+
+        Args:
+            **kwargs: The keyword arguments of openai.ChatCompletion.create.
+
+        Returns:
+            Union[SimpleNamespace, Iterator[SimpleNamespace]]: The response, or its chunks if
+            stream is set.
+        """
+        latency = self._next_outcome()
+        response = self.respond(**kwargs)
+        if kwargs.get("stream"):
+            time.sleep(latency)
+            return self._stream(response)
+        time.sleep(latency + self.token_latency_secs * len(self.chunks(response)))
+        return response
+
+    async def acreate(self, **kwargs) -> Union[SimpleNamespace, AsyncIterator[SimpleNamespace]]:
+        """
+        Answers a request without blocking the event loop.
+
+        Args:
+            **kwargs: The keyword arguments of openai.ChatCompletion.acreate.
+
+        Returns:
+            Union[SimpleNamespace, AsyncIterator[SimpleNamespace]]: The response, or its
+            chunks if stream is set.
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        latency = self._next_outcome()
+        response = self.respond(**kwargs)
+        if kwargs.get("stream"):
+            await asyncio.sleep(latency)
+            return self._astream(response)
+        await asyncio.sleep(latency + self.token_latency_secs * len(self.chunks(response)))
+        return response
+
+
+class BackendIdentity(NamedTuple):
+    """
+    BackendIdentity class for the service and the model that answer the requests of a run, as
+    far as it decides the docstrings: part of the docstring cache key, and the model the rate
+    limits, the metrics and the plan are resolved for.
+
+    Attributes:
+    -----------
+    kind : str
+        The command line name of the backend ("openai", "openai-compatible" or "stub"), or the
+        class name of any other backend.
+    base_url : Optional[str]
+        The base URL of the API, if any.
+    model : str
+        The model actually requested: the model override of the backend, if any, or the
+        model of the request kwargs.
+    """
+
+    kind: str
+    base_url: Optional[str]
+    model: str
+
+
+def backend_identity(backend: Backend, default_model: str) -> BackendIdentity:
+    """
+    Identifies a backend and the model it actually requests.
+
+    Args:
+        backend (Backend): The backend.
+        default_model (str): The model of the request kwargs.
+
+    Returns:
+        BackendIdentity: The identity of the backend.
+    """
+    kind = {
+        OpenAIBackend: "openai",
+        OpenAICompatibleBackend: "openai-compatible",
+        StubBackend: "stub",
+    }.get(type(backend), type(backend).__name__)
+    return BackendIdentity(
+        kind,
+        getattr(backend, "api_base", None),
+        getattr(backend, "model", None) or default_model,
+    )
+
+
+def resolve_backend_identity(
+        name: str, base_url: Optional[str], model: Optional[str], default_model: str
+) -> BackendIdentity:
+    """
+    Identifies the backend create_backend would create, without creating it (and so without
+    needing an API key), e.g. to plan a run.
+
+    Args:
+        name (str): "openai", "openai-compatible" or "stub".
+        base_url (Optional[str]): The base URL of the API, if any.
+        model (Optional[str]): The model name overriding the model of every request, if any.
+        default_model (str): The model of the request kwargs.
+
+    Returns:
+        BackendIdentity: The identity of the backend.
+    """
+    if name == "stub":
+        # The stub ignores the base URL and the model override.
+        return BackendIdentity("stub", None, default_model)
+    return BackendIdentity(name, base_url, model or default_model)
+
+
+def create_backend(
+        name: str,
+        base_url: Optional[str] = None,
+        model: Optional[str] = None,
+        timeout_secs: Optional[float] = None,
+) -> Backend:
+    """
+    Creates a backend from its command line name.
+
+    Args:
+        name (str): "openai", "openai-compatible" or "stub".
+        base_url (Optional[str], optional): The base URL of the API. Required for
+        "openai-compatible". Defaults to None.
+        model (Optional[str], optional): A model name overriding the model of every request.
+        Defaults to None.
+        timeout_secs (Optional[float], optional): The maximum duration of a request over
+        HTTP. The stub answers in-process and ignores it. Defaults to the default of the
+        openai library.
+
+    Raises:
+        ValueError: If the name is unknown, or base_url is missing for "openai-compatible".
+        EnvironmentError: If OPENAI_KEY is missing for "openai".
+
+    Returns:
+        Backend: The backend.
+    """
+    if name == "openai":
+        return OpenAIBackend(api_base=base_url, model=model, timeout_secs=timeout_secs)
+    if name == "openai-compatible":
+        if base_url is None:
+            raise ValueError("The openai-compatible backend requires a base URL")
+        return OpenAICompatibleBackend(base_url, model=model, timeout_secs=timeout_secs)
+    if name == "stub":
+        return StubBackend()
+    raise ValueError(f"Unknown backend: {name}")
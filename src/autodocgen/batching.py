@@ -0,0 +1,90 @@
+import json
+import logging
+import re
+from typing import Sequence
+
+BATCH_PROMPT = (
+    "Write Pydoc for each of the classes and functions below. Return only a JSON object that "
+    "maps the name in the heading above each code block to the Pydoc of that code, as a plain "
+    "string without surrounding quotes.\n\n"
+)
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(\{[\s\S]*\})\s*```")
+
+
+def pack_batches(
+        prompt_tokens: Sequence[int], token_budget: int, max_batch_size: int = 10
+) -> list[list[int]]:
+    """
+    Packs prompts into batches in order. Prompts larger than a quarter of the budget are
+    considered large and always get a batch of their own.
+
+    Args:
+        prompt_tokens (Sequence[int]): The estimated number of tokens of every prompt.
+        token_budget (int): The maximum estimated number of prompt tokens of a batch.
+        max_batch_size (int, optional): The maximum number of prompts in a batch. Defaults to 10.
+
+    Returns:
+        list[list[int]]: The indices of the prompts in every batch.
+    """
+    batches: list[list[int]] = []
+    current: list[int] = []
+    current_tokens = 0
+    for index, tokens in enumerate(prompt_tokens):
+        if tokens > token_budget // 4:
+            batches.append([index])
+            continue
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(named_sources: Sequence[tuple[str, str]]) -> str:
+    """
+    Builds the prompt of a batch.
+
+    Args:
+        named_sources (Sequence[tuple[str, str]]): The qualified name and prompt source code of
+        every node in the batch.
+
+    Returns:
+        str: The prompt asking for a JSON object mapping the names to docstrings.
+    """
+    sections = [f"### {name}\n```python\n{source.rstrip()}\n```" for name, source in named_sources]
+    return BATCH_PROMPT + "\n\n".join(sections)
+
+
+def parse_batch_response(response: str, names: Sequence[str]) -> dict[str, str]:
+    """
+    Parses the response to a batch prompt.
+
+    Args:
+        response (str): The response of the model.
+        names (Sequence[str]): The names of the nodes in the batch.
+
+    Returns:
+        dict[str, str]: The docstrings that were found, keyed by name. Names that are missing or
+        not mapped to a string are left out, and an empty dictionary is returned if the
+        response is not a JSON object.
+    """
+    fenced = _JSON_FENCE.search(response)
+    if fenced is not None:
+        payload = fenced.group(1)
+    else:
+        payload = response[response.find("{"):response.rfind("}") + 1]
+    try:
+        parsed = json.loads(payload)
+    except ValueError:
+        logging.warning("The batch response is not valid JSON")
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+    return {
+        name: parsed[name]
+        for name in names
+        if isinstance(parsed.get(name), str) and parsed[name].strip()
+    }
@@ -0,0 +1,413 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Literal, Optional, TypedDict, Union, get_args
+
+from .backends import StubBackend
+from .cli import process_directory
+from .metrics import MetricsCollector
+from .prompt_builder import PromptBuilder
+from .rate_limiter import RateLimiter
+from .retry import CircuitBreaker, RetryExecutor
+
+CorpusShape = Literal["small-functions", "huge-classes", "deep-packages"]
+CORPUS_SHAPES: tuple[str, ...] = get_args(CorpusShape)
+UNLIMITED_RPM = 1_000_000
+UNLIMITED_TPM = 1_000_000_000
+
+
+class BenchmarkResult(TypedDict):
+    """
+    BenchmarkResult class for type hints of the result of a benchmark run
+
+    Attributes:
+    -----------
+    shape : str
+        The shape of the synthetic corpus.
+    files : int
+        The number of files in the corpus.
+    nodes : int
+        The number of classes and functions in the corpus.
+    requests : int
+        The number of requests received by the stub backend, including failed ones.
+    rate_limited : int
+        The number of injected rate limit errors.
+    errors : int
+        The number of injected connection errors.
+    prompt_tokens : int
+        The prompt tokens of the successful requests.
+    completion_tokens : int
+        The completion tokens of the successful requests.
+    wall_secs : float
+        The time spent processing the corpus.
+    nodes_per_sec : float
+        The number of documented nodes per second.
+    """
+
+    shape: str
+    files: int
+    nodes: int
+    requests: int
+    rate_limited: int
+    errors: int
+    prompt_tokens: int
+    completion_tokens: int
+    wall_secs: float
+    nodes_per_sec: float
+
+
+def _function_source(name: str, statements: int, indent: str = "") -> str:
+    parameters = "self, value, factor=2" if indent else "value, factor=2"
+    lines = [f"{indent}def {name}({parameters}):"]
+    for index in range(statements):
+        lines.append(f"{indent}    value = value * factor + {index}  # step {index}")
+    lines.append(f"{indent}    return value")
+    return "\n".join(lines) + "\n"
+
+
+def _class_source(name: str, methods: int, statements: int) -> str:
+    lines = [f"class {name}:", "    scale = 1", ""]
+    for index in range(methods):
+        lines.append(_function_source(f"method_{index}", statements, indent="    "))
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(
+        directory: Union[str, Path],
+        shape: CorpusShape,
+        files: int = 10,
+        nodes_per_file: int = 20,
+        depth: int = 4,
+) -> int:
+    """
+    Generates a synthetic corpus of Python files.
+
+    The "small-functions" shape holds many short functions per file, "huge-classes" holds a
+    single class per file with long methods, and "deep-packages" spreads files holding a
+    class and functions over packages nested depth levels deep.
+
+    Args:
+        directory (Union[str, Path]): The directory to generate the corpus in.
+        shape (CorpusShape): The shape of the corpus.
+        files (int, optional): The number of files. Defaults to 10.
+        nodes_per_file (int, optional): The number of classes and functions per file.
+        Defaults to 20.
+        depth (int, optional): The nesting depth of the "deep-packages" shape. Defaults to 4.
+
+    Raises:
+        ValueError: If the shape is unknown.
+
+    Returns:
+        int: The number of classes and functions in the corpus.
+    """
+    directory = Path(directory)
+    nodes = 0
+    for file_index in range(files):
+        if shape == "small-functions":
+            file_path = directory / f"module_{file_index}.py"
+            source = "\n\n".join(
+                _function_source(f"function_{index}", 2) for index in range(nodes_per_file)
+            )
+            nodes += nodes_per_file
+        elif shape == "huge-classes":
+            file_path = directory / f"module_{file_index}.py"
+            source = _class_source(f"Class{file_index}", max(1, nodes_per_file - 1), 30)
+            nodes += max(1, nodes_per_file - 1) + 1
+        elif shape == "deep-packages":
+            package = Path(*(f"package_{level}" for level in range(file_index % (depth + 1))))
+            file_path = directory / package / f"module_{file_index}.py"
+            methods = max(1, nodes_per_file // 2 - 1)
+            functions = max(0, nodes_per_file - methods - 1)
+            source = _class_source(f"Class{file_index}", methods, 5) + "\n\n".join(
+                _function_source(f"function_{index}", 5) for index in range(functions)
+            )
+            nodes += methods + 1 + functions
+        else:
+            raise ValueError(f"Unknown corpus shape: {shape}")
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(source, encoding="utf-8")
+    return nodes
+
+
+def run_benchmark(
+        shape: CorpusShape,
+        files: int = 10,
+        nodes_per_file: int = 20,
+        stub: Optional[StubBackend] = None,
+        concurrency: int = 1,
+        batch_token_budget: int = 0,
+        rpm: int = UNLIMITED_RPM,
+        tpm: int = UNLIMITED_TPM,
+        connection_retry_secs: float = 0.0,
+        stream: bool = False,
+        pipeline_depth: int = 0,
+) -> BenchmarkResult:
+    """
+    Generates a corpus in a temporary directory and documents it with process_directory,
+    answering every request with a stub backend.
+
+    Args:
+        shape (CorpusShape): The shape of the corpus.
+        files (int, optional): The number of files. Defaults to 10.
+        nodes_per_file (int, optional): The number of classes and functions per file.
+        Defaults to 20.
+        stub (Optional[StubBackend], optional): The stub backend. Defaults to a stub
+        answering instantly without errors.
+        concurrency (int, optional): The maximum number of concurrent requests per file.
+        Defaults to 1.
+        batch_token_budget (int, optional): The maximum number of prompt tokens of a batch
+        request, or 0 to disable batching. Defaults to 0.
+        rpm (int, optional): The requests-per-minute limit. Defaults to practically unlimited.
+        tpm (int, optional): The tokens-per-minute limit. Defaults to practically unlimited.
+        connection_retry_secs (float, optional): The maximum pause before retrying after an
+        injected connection error, without exponential growth, and the time the circuit
+        breaker stays open. Defaults to 0.
+        stream (bool, optional): Whether to stream the completions and stop them once the
+        docstring is complete. Defaults to False.
+        pipeline_depth (int, optional): The depth of the pipeline overlapping the parsing and
+        writing of files with the requests, or 0 to process the files one after the other.
+        Defaults to 0.
+
+    Returns:
+        BenchmarkResult: The result of the run.
+    """
+    stub = stub or StubBackend()
+    metrics = MetricsCollector()
+    # Injected errors are retried until they succeed, as the error rate is under test.
+    retry_executor = RetryExecutor(
+        timeout_secs=None,
+        max_attempts=1_000,
+        base_delay_secs=connection_retry_secs,
+        max_delay_secs=connection_retry_secs,
+        breaker=CircuitBreaker(reset_secs=connection_retry_secs),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        nodes = generate_corpus(directory, shape, files=files, nodes_per_file=nodes_per_file)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                start_time = time.perf_counter()
+                process_directory(
+                    Path(directory),
+                    overwrite_file=True,
+                    stem_suffix="_doc",
+                    disable_tqdm=True,
+                    concurrency=concurrency,
+                    rate_limiter=RateLimiter(rpm=rpm, tpm=tpm),
+                    prompt_builder=PromptBuilder(),
+                    batch_token_budget=batch_token_budget,
+                    metrics=metrics,
+                    backend=stub,
+                    stream=stream,
+                    pipeline_depth=pipeline_depth,
+                    retry_executor=retry_executor,
+                )
+                wall_secs = time.perf_counter() - start_time
+        finally:
+            retry_executor.close()
+            stub.close()
+    run = metrics.report()["run"]
+    return BenchmarkResult(
+        shape=shape,
+        files=files,
+        nodes=nodes,
+        requests=stub.requests,
+        rate_limited=stub.rate_limited,
+        errors=stub.errors,
+        prompt_tokens=run["prompt_tokens"],
+        completion_tokens=run["completion_tokens"],
+        wall_secs=wall_secs,
+        nodes_per_sec=nodes / wall_secs if wall_secs > 0 else 0.0,
+    )
+
+
+def save_baseline(results: list[BenchmarkResult], path: Union[str, Path]):
+    """
+    Saves benchmark results as a baseline.
+
+    Args:
+        results (list[BenchmarkResult]): The results to save.
+        path (Union[str, Path]): The path of the JSON baseline file.
+
+    Returns:
+        None
+    """
+    with open(path, "w", encoding="utf-8") as baseline_file:
+        json.dump({result["shape"]: result for result in results}, baseline_file, indent=2)
+
+
+def compare_to_baseline(
+        results: list[BenchmarkResult], baseline: dict[str, BenchmarkResult], tolerance: float = 0.2
+) -> list[str]:
+    """
+    Compares benchmark results to a baseline. A result regresses when its throughput drops,
+    or its number of requests or tokens grows, by more than the tolerance.
+
+    Args:
+        results (list[BenchmarkResult]): The results of the current run.
+        baseline (dict[str, BenchmarkResult]): The baseline results, keyed by shape.
+        tolerance (float, optional): The allowed relative change. Defaults to 0.2.
+
+    Returns:
+        list[str]: A description of every regression.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result["shape"])
+        if expected is None:
+            continue
+        if result["nodes_per_sec"] < expected["nodes_per_sec"] * (1 - tolerance):
+            regressions.append(
+                f"{result['shape']}: {result['nodes_per_sec']:.1f} nodes/s, "
+                f"baseline {expected['nodes_per_sec']:.1f} nodes/s"
+            )
+        for key in ("requests", "prompt_tokens", "completion_tokens"):
+            if result[key] > expected[key] * (1 + tolerance):
+                regressions.append(
+                    f"{result['shape']}: {result[key]} {key}, baseline {expected[key]} {key}"
+                )
+    return regressions
+
+
+def main():
+    """
+    Runs the offline benchmarks based on command-line arguments, prints their results and
+    optionally saves them as a baseline or compares them to one. Exits with status 1 when a
+    result regresses compared to the baseline.
+
+    The function takes no arguments and returns nothing."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark autodocgen offline against a local stub backend"
+    )
+    parser.add_argument(
+        "--shape",
+        help="The shape of the synthetic corpus (may be repeated, defaults to all shapes)",
+        choices=CORPUS_SHAPES,
+        action="append",
+        default=None,
+    )
+    parser.add_argument("--files", help="The number of files per corpus", type=int, default=10)
+    parser.add_argument(
+        "--nodes", help="The number of classes and functions per file", type=int, default=20
+    )
+    parser.add_argument(
+        "--latency", help="The latency of every stub request in seconds", type=float, default=0.0
+    )
+    parser.add_argument(
+        "--jitter",
+        help="The maximum random latency added to every stub request in seconds",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--error-rate",
+        help="The fraction of stub requests failing with a connection error",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--rate-limit-rate",
+        help="The fraction of stub requests failing with a rate limit (429) error",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="The maximum number of concurrent requests per file",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--batch-tokens",
+        help="The maximum number of prompt tokens of a batch request (0 disables batching)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--rpm", help="The requests-per-minute limit", type=int, default=UNLIMITED_RPM
+    )
+    parser.add_argument("--tpm", help="The tokens-per-minute limit", type=int, default=UNLIMITED_TPM)
+    parser.add_argument("--seed", help="The seed of the stub backend", type=int, default=0)
+    parser.add_argument(
+        "--token-latency",
+        help="The time the stub takes to generate every completion token in seconds",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--commentary-tokens",
+        help="The number of tokens of commentary the stub adds after every docstring",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--stream",
+        help="Stream the completions and stop them once the docstring is complete",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        help="Overlap the parsing and writing of files with the requests, keeping at most this "
+             "many files between stages (0 processes the files one after the other)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--save-baseline", help="Save the results as a baseline to this path", type=Path
+    )
+    parser.add_argument(
+        "--baseline", help="Compare the results to the baseline at this path", type=Path
+    )
+    parser.add_argument(
+        "--tolerance",
+        help="The relative change allowed before a result counts as a regression",
+        type=float,
+        default=0.2,
+    )
+    args = parser.parse_args()
+    results = []
+    for shape in args.shape or CORPUS_SHAPES:
+        stub = StubBackend(
+            latency_secs=args.latency,
+            jitter_secs=args.jitter,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            seed=args.seed,
+            token_latency_secs=args.token_latency,
+            commentary_tokens=args.commentary_tokens,
+        )
+        result = run_benchmark(
+            shape,
+            files=args.files,
+            nodes_per_file=args.nodes,
+            stub=stub,
+            concurrency=args.concurrency,
+            batch_token_budget=args.batch_tokens,
+            rpm=args.rpm,
+            tpm=args.tpm,
+            stream=args.stream,
+            pipeline_depth=args.pipeline_depth,
+        )
+        results.append(result)
+        print(
+            f"{shape:<16} {result['nodes']:>6} nodes {result['requests']:>6} requests "
+            f"{result['prompt_tokens'] + result['completion_tokens']:>9} tokens "
+            f"{result['wall_secs']:>8.2f}s {result['nodes_per_sec']:>9.1f} nodes/s"
+        )
+    if args.save_baseline is not None:
+        save_baseline(results, args.save_baseline)
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print("Regression:", regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .ast_analyzer import ModelKwargs
+    from .backends import BackendIdentity
+
+DEFAULT_CACHE_DIR = Path(os.getenv("AUTODOCGEN_CACHE_DIR", Path.home() / ".cache" / "autodocgen"))
+
+
+class DocstringCache:
+    """
+    DocstringCache class for persisting generated docstrings on disk.
+
+    Responses are stored in a SQLite database and keyed by a hash of the normalized node
+    source, the model kwargs and the prepended prompt, so unchanged nodes are not sent
+    to the model again on the next run.
+
+    Attributes:
+    -----------
+    db_path : Path
+        The path of the SQLite database holding the cache.
+    max_entries : int
+        The maximum number of entries kept after eviction.
+    max_age_secs : float
+        The maximum age (since last access) of an entry before it is evicted.
+    hits : int
+        The number of cache lookups that returned a docstring.
+    misses : int
+        The number of cache lookups that did not return a docstring.
+
+    Methods:
+    --------
+    make_key(source_code: str, model_kwargs: ModelKwargs, prepend_prompt: str) -> str
+        Computes the cache key of a node.
+    get(self, key: str) -> Optional[str]
+        Looks up a cached response.
+    contains(self, key: str) -> bool
+        Checks whether a response is cached, without side effects.
+    put(self, key: str, response: str)
+        Stores a response in the cache.
+    evict(self) -> int
+        Removes expired entries and trims the cache to max_entries.
+    close(self)
+        Evicts stale entries and closes the database connection.
+    """
+
+    db_file_name = "docstrings.sqlite3"
+
+    def __init__(
+            self,
+            cache_dir: Union[str, Path, None] = None,
+            max_entries: int = 100_000,
+            max_age_secs: float = 30 * 24 * 60 * 60,
+    ):
+        """
+        Initializes an instance of the class and opens (or creates) the cache database.
+
+        Args:
+            cache_dir (Union[str, Path, None], optional): The directory to store the cache in.
+            Defaults to $AUTODOCGEN_CACHE_DIR or ~/.cache/autodocgen.
+            max_entries (int, optional): The maximum number of entries to keep.
+            max_age_secs (float, optional): The maximum age of an entry in seconds.
+
+        Returns:
+            None
+        """
+        cache_dir = Path(cache_dir) if cache_dir is not None else DEFAULT_CACHE_DIR
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = cache_dir / self.db_file_name
+        self.max_entries = max_entries
+        self.max_age_secs = max_age_secs
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(self.db_path, timeout=30)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS docstrings ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(
+            source_code: str,
+            model_kwargs: "ModelKwargs",
+            prepend_prompt: str,
+            backend: Optional["BackendIdentity"] = None,
+    ) -> str:
+        """
+        Computes the cache key of a node.
+
+        The conversation history is left out of the key; only the first (instruction)
+        message is included, together with the other model kwargs, the prompt and the
+        backend, so docstrings of another service or model (e.g. of the stub backend, or of
+        another --backend-model) are never served from the cache.
+
+        Args:
+            source_code (str): The source code of the node, as produced by astor.to_source.
+            model_kwargs (ModelKwargs): The model kwargs used to generate the docstring.
+            prepend_prompt (str): The prompt prepended to the source code.
+            backend (Optional[BackendIdentity], optional): The backend the docstring is
+            requested from. Defaults to None.
+
+        Returns:
+            str: The hexadecimal SHA-256 digest identifying the node.
+        """
+        normalized_source = "\n".join(line.rstrip() for line in source_code.strip().splitlines())
+        key_kwargs = {name: value for name, value in model_kwargs.items() if name != "messages"}
+        messages = model_kwargs.get("messages") or []
+        key_kwargs["instruction"] = messages[0]["content"] if messages else None
+        key_kwargs["backend"] = None if backend is None else backend._asdict()
+        digest = hashlib.sha256()
+        digest.update(json.dumps(key_kwargs, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0" + prepend_prompt.encode("utf-8"))
+        digest.update(b"\0" + normalized_source.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Looks up a cached response and refreshes its access time.
+
+        Args:
+            key (str): The cache key of the node.
+
+        Returns:
+            Optional[str]: The cached response, or None if it is missing or expired.
+        """
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT response FROM docstrings WHERE key = ? AND accessed_at >= ?",
+            (key, now - self.max_age_secs),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.connection.execute("UPDATE docstrings SET accessed_at = ? WHERE key = ?", (now, key))
+        self.connection.commit()
+        return row[0]
+
+    def contains(self, key: str) -> bool:
+        """
+        Checks whether a response is cached, without refreshing its access time or counting
+        a hit or miss.
+
+        Args:
+            key (str): The cache key of the node.
+
+        Returns:
+            bool: Whether an unexpired response is cached.
+        """
+        row = self.connection.execute(
+            "SELECT 1 FROM docstrings WHERE key = ? AND accessed_at >= ?",
+            (key, time.time() - self.max_age_secs),
+        ).fetchone()
+        return row is not None
+
+    def put(self, key: str, response: str):
+        """
+        Stores a response in the cache.
+
+        Args:
+            key (str): The cache key of the node.
+            response (str): The response of the model.
+
+        Returns:
+            None
+        """
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO docstrings (key, response, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, response, now, now),
+        )
+        self.connection.commit()
+
+    def evict(self) -> int:
+        """
+        Removes expired entries and the least recently used entries above max_entries.
+
+        Returns:
+            int: The number of evicted entries.
+        """
+        cursor = self.connection.execute(
+            "DELETE FROM docstrings WHERE accessed_at < ?", (time.time() - self.max_age_secs,)
+        )
+        evicted = cursor.rowcount
+        cursor = self.connection.execute(
+            "DELETE FROM docstrings WHERE key NOT IN "
+            "(SELECT key FROM docstrings ORDER BY accessed_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        evicted += cursor.rowcount
+        self.connection.commit()
+        return evicted
+
+    def close(self):
+        """
+        Evicts stale entries, logs the hit/miss counters and closes the database connection.
+
+        Returns:
+            None
+        """
+        evicted = self.evict()
+        logging.info(
+            "Docstring cache: %d hits, %d misses, %d evicted", self.hits, self.misses, evicted
+        )
+        self.connection.close()
@@ -1,31 +1,61 @@
 import argparse
 import logging
-import os
 import sys
 import time
 from pathlib import Path
-from tqdm import tqdm
+from typing import Callable, Collection, NamedTuple, Optional, Sequence, TYPE_CHECKING
 from . import ASTAnalyzer
+from . import DocstringCache
 from . import FileVisitor
+from .backends import Backend, backend_identity, create_backend, resolve_backend_identity
+from .context import ContextPolicy
+from .discovery import discover_python_files
+from .fingerprint import FingerprintIndex
+from .git_diff import DiffScope, GitDiffError
+from .journal import CheckpointJournal, default_journal_path
+from .manifest import FileRecord, Policy, RunManifest
+from .metrics import MetricsCollector
+from .node_index import NodeIndex
+from .output import OutputFormat, OutputWriter
+from .pipeline import run_pipeline
+from .planner import format_plan, plan_run
+from .prompt_builder import PromptBuilder
+from .rate_limiter import RateLimiter
+from .retry import RetryExecutor
+from .scheduler import RunBudget, parse_duration, rank_files
+from .splice import is_new_docstring
+from .tracing import current_tracer, disable_tracing, enable_tracing, span
 
+if TYPE_CHECKING:
+    import cProfile
+    import threading
 
-def path_walk(directory: Path) -> tuple[list[Path], list[Path]]:
-    """
-    Return a tuple containing two lists of Path objects representing directories and
-     files in a given directory and its subdirectories.
-
-    :param directory: A Path object representing the directory to walk.
-    :type directory: Path
-    :return: A tuple containing two lists of Path objects representing directories and files.
-    :rtype: tuple[list[Path], list[Path]]"""
-    for root, dirs, files in os.walk(directory):
-        root_path = Path(root)
-        dir_paths = [root_path / d for d in dirs]
-        file_paths = [root_path / f for f in files]
-        yield dir_paths, file_paths
+_worker_state: dict = {}
 
 
-def process_python_file(file_path: Path, overwrite_file: bool, stem_suffix: str):
+def process_python_file(
+        file_path: Path,
+        overwrite_file: bool,
+        stem_suffix: str,
+        cache: Optional[DocstringCache] = None,
+        manifest: Optional[RunManifest] = None,
+        policy: Policy = "all",
+        concurrency: int = 1,
+        rate_limiter: Optional[RateLimiter] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        batch_token_budget: int = 0,
+        metrics: Optional[MetricsCollector] = None,
+        reformat: bool = False,
+        backend: Optional[Backend] = None,
+        stream: bool = False,
+        journal: Optional[CheckpointJournal] = None,
+        budget: Optional[RunBudget] = None,
+        fingerprints: Optional[FingerprintIndex] = None,
+        retry_executor: Optional[RetryExecutor] = None,
+        select_nodes: Optional[Callable[[NodeIndex], Collection[str]]] = None,
+        output: Optional[OutputWriter] = None,
+) -> bool:
     """
     Process a Python file by analyzing its AST, generating documentation,
     and writing the modified AST to a file.
@@ -37,25 +67,469 @@ def process_python_file(file_path: Path, overwrite_file: bool, stem_suffix: str)
     :type overwrite_file: bool
     :param stem_suffix: A string to append to the stem of the original file name
      when creating the output file. If None, the original file name is used.
-    :type stem_suffix: str"""
+    :type stem_suffix: str
+    :param cache: The docstring cache to consult before calling the model,
+     or None to disable caching.
+    :type cache: Optional[DocstringCache]
+    :param manifest: The run manifest used to skip unchanged files and select nodes, if any.
+    :type manifest: Optional[RunManifest]
+    :param policy: Which nodes to document: "all", "only-missing" or "refresh-stale".
+    :type policy: Policy
+    :param concurrency: The maximum number of concurrent requests. When larger than 1,
+     the docstrings are generated by the asyncio engine instead of the serial visitors.
+    :type concurrency: int
+    :param rate_limiter: The rate limiter shared by all files of the run. If None, the
+     ASTAnalyzer creates one with the limits of its model.
+    :type rate_limiter: Optional[RateLimiter]
+    :param context_policy: The policy bounding the conversation history sent with every prompt.
+     If None, the default policy of the ASTAnalyzer is used.
+    :type context_policy: Optional[ContextPolicy]
+    :param prompt_builder: The builder of the source code sent for every node. If None, the
+     default PromptBuilder of the FileVisitor is used.
+    :type prompt_builder: Optional[PromptBuilder]
+    :param batch_token_budget: The maximum number of prompt tokens of a request packing several
+     small classes and functions, or 0 to send every node in its own request.
+    :type batch_token_budget: int
+    :param metrics: The collector of the per-node and per-file metrics of the run, if any.
+    :type metrics: Optional[MetricsCollector]
+    :param reformat: A boolean indicating whether to regenerate the whole file with ast.unparse
+     and black instead of only inserting the new docstrings into the original source code.
+    :type reformat: bool
+    :param backend: The backend answering the requests, shared by all files of the run so its
+     connections are reused. If None, the ASTAnalyzer creates an OpenAIBackend for this file.
+    :type backend: Optional[Backend]
+    :param stream: A boolean indicating whether to stream the completions and stop them as soon
+     as the docstring is complete.
+    :type stream: bool
+    :param journal: The journal every response is checkpointed to as soon as it is obtained,
+     and replayed from when a run is resumed, if any.
+    :type journal: Optional[CheckpointJournal]
+    :param budget: The budget of the run, if any. The nodes are documented by priority, and
+     once the budget has run out the remaining nodes are left untouched and the file is not
+     recorded in the manifest, so the next run documents them.
+    :type budget: Optional[RunBudget]
+    :param fingerprints: The index reusing the docstrings of structurally identical classes
+     and functions, shared by all files of the run, if any.
+    :type fingerprints: Optional[FingerprintIndex]
+    :param retry_executor: The executor bounding the duration of every request and retrying
+     failed ones, shared by all files of the run so its circuit breaker and latencies are too.
+     If None, the ASTAnalyzer creates one with the default limits for this file.
+    :type retry_executor: Optional[RetryExecutor]
+    :param select_nodes: A function returning the unique names of the nodes of the file to
+     document given the index of the file, e.g. the selector of a DiffScope, or None to
+     document every node selected by the policy.
+    :type select_nodes: Optional[Callable[[NodeIndex], Collection[str]]]
+    :param output: The writer of the patch or JSONL sidecar of the run, if any. With an output,
+     the file itself is left untouched, and overwrite_file and stem_suffix are ignored.
+    :type output: Optional[OutputWriter]
+    :return: True if the file was processed, False if it was skipped as unchanged, because
+     the budget had run out or because select_nodes selected no node.
+    :rtype: bool"""
+    prepared = prepare_python_file(
+        file_path,
+        cache=cache,
+        manifest=manifest,
+        policy=policy,
+        rate_limiter=rate_limiter,
+        context_policy=context_policy,
+        prompt_builder=prompt_builder,
+        batch_token_budget=batch_token_budget,
+        metrics=metrics,
+        backend=backend,
+        stream=stream,
+        journal=journal,
+        budget=budget,
+        fingerprints=fingerprints,
+        retry_executor=retry_executor,
+        select_nodes=select_nodes,
+    )
+    if prepared is None:
+        return False
+    generate_python_file(prepared, concurrency)
+    write_python_file(prepared, overwrite_file, stem_suffix, manifest, metrics, reformat, output)
+    return True
+
+
+class PreparedFile(NamedTuple):
+    """
+    PreparedFile class for a file passed between the stages of processing: parsed and with
+    its prompts built by prepare_python_file, documented by generate_python_file and written
+    by write_python_file.
+
+    Attributes:
+    -----------
+    file_path : Path
+        The path of the Python file.
+    ast_analyzer : ASTAnalyzer
+        The ASTAnalyzer holding the AST of the file.
+    file_visitor : FileVisitor
+        The FileVisitor documenting the file.
+    owns_backend : bool
+        Whether the backend of the ASTAnalyzer was created for this file only.
+    start_time : float
+        The time the processing of the file started.
+    """
+
+    file_path: Path
+    ast_analyzer: ASTAnalyzer
+    file_visitor: FileVisitor
+    owns_backend: bool
+    start_time: float
+
+
+def prepare_python_file(
+        file_path: Path,
+        cache: Optional[DocstringCache] = None,
+        manifest: Optional[RunManifest] = None,
+        policy: Policy = "all",
+        rate_limiter: Optional[RateLimiter] = None,
+        context_policy: Optional[ContextPolicy] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        batch_token_budget: int = 0,
+        metrics: Optional[MetricsCollector] = None,
+        backend: Optional[Backend] = None,
+        stream: bool = False,
+        journal: Optional[CheckpointJournal] = None,
+        budget: Optional[RunBudget] = None,
+        fingerprints: Optional[FingerprintIndex] = None,
+        retry_executor: Optional[RetryExecutor] = None,
+        select_nodes: Optional[Callable[[NodeIndex], Collection[str]]] = None,
+) -> Optional[PreparedFile]:
+    """
+    Parse a Python file, select the nodes to document and build their prompts. This is the
+    CPU-bound first stage of process_python_file; see it for the other parameters.
+
+    :param file_path: A Path object representing the path to the Python file to process.
+    :type file_path: Path
+    :param select_nodes: A function returning the unique names (see DocNode.unique_name) of
+     the nodes of the file to document, among those selected by the policy, given the index
+     of the file, or None to document every node selected by the policy.
+    :type select_nodes: Optional[Callable[[NodeIndex], Collection[str]]]
+    :return: The prepared file, or None if it was skipped as unchanged, because the budget
+     had run out or because select_nodes selected no node.
+    :rtype: Optional[PreparedFile]"""
+    if manifest is not None and manifest.is_unchanged(file_path):
+        logging.info("Skipping unchanged file: %s", file_path)
+        return None
+    if budget is not None and budget.exhausted():
+        logging.info(
+            "Budget exhausted (%s), skipping file: %s", budget.exhausted_reason(), file_path
+        )
+        return None
     print("Processing:", file_path)
     start_time = time.time()
-    ast_analyzer = ASTAnalyzer()
+    analyzer_kwargs = {}
+    if rate_limiter is not None:
+        analyzer_kwargs["rate_limiter"] = rate_limiter
+    if context_policy is not None:
+        analyzer_kwargs["context_policy"] = context_policy
+    if backend is not None:
+        analyzer_kwargs["backend"] = backend
+    if stream:
+        analyzer_kwargs["stream"] = stream
+    if budget is not None:
+        analyzer_kwargs["budget"] = budget
+    if retry_executor is not None:
+        analyzer_kwargs["retry_executor"] = retry_executor
+    ast_analyzer = ASTAnalyzer(**analyzer_kwargs)
     ast_analyzer.load_ast_from_file(file_path)
-    file_visitor = FileVisitor(ast_analyzer)
-    ast_analyzer.generate_documentation(file_visitor)
-    output_file_path = file_path
-    if overwrite_file is False and isinstance(stem_suffix, str):
-        output_file_path = file_path.with_stem(file_path.stem + stem_suffix)
-    ast_analyzer.write_file_from_ast(file_path=output_file_path)
+    file_visitor = FileVisitor(
+        ast_analyzer,
+        cache=cache,
+        prompt_builder=prompt_builder,
+        batch_token_budget=batch_token_budget,
+        metrics=metrics,
+        journal=journal,
+        fingerprints=fingerprints,
+    )
+    index = file_visitor.index(ast_analyzer.tree)
+    node_filter = None
+    if manifest is not None:
+        node_filter = manifest.node_filter(file_path, index, policy)
+    elif policy == "only-missing":
+        node_filter = RunManifest.only_missing
+    file_visitor.node_filter = node_filter
+    if select_nodes is not None:
+        names = select_nodes(index)
+        if not names:
+            logging.info("No node to document in file: %s", file_path)
+            return None
+        file_visitor.node_filter = index.select_filter(names, node_filter)
+    with span("prepare_prompts", file=str(file_path)):
+        file_visitor.prepare_prompts(ast_analyzer.tree)
+    return PreparedFile(file_path, ast_analyzer, file_visitor, backend is None, start_time)
+
+
+def generate_python_file(prepared: PreparedFile, concurrency: int = 1):
+    """
+    Generate the docstrings of a prepared Python file. This is the network-bound stage of
+    process_python_file.
+
+    :param prepared: The file prepared by prepare_python_file.
+    :type prepared: PreparedFile
+    :param concurrency: The maximum number of concurrent requests. When larger than 1,
+     the docstrings are generated by the asyncio engine instead of the serial visitors.
+    :type concurrency: int"""
+    ast_analyzer = prepared.ast_analyzer
+    try:
+        with span("generate_documentation", "network", file=str(prepared.file_path)):
+            if concurrency > 1:
+                ast_analyzer.backend.run(
+                    ast_analyzer.agenerate_documentation(
+                        prepared.file_visitor, concurrency=concurrency
+                    )
+                )
+            else:
+                ast_analyzer.generate_documentation(prepared.file_visitor)
+    finally:
+        if prepared.owns_backend:
+            ast_analyzer.backend.close()
+
+
+def write_python_file(
+        prepared: PreparedFile,
+        overwrite_file: bool,
+        stem_suffix: str,
+        manifest: Optional[RunManifest] = None,
+        metrics: Optional[MetricsCollector] = None,
+        reformat: bool = False,
+        output: Optional[OutputWriter] = None,
+):
+    """
+    Write a documented Python file, or its patch or sidecar records to the output of the run,
+    and record it in the manifest and the metrics. This is the last stage of
+    process_python_file, which is CPU-bound with reformat. A file with nodes skipped because
+    the budget ran out is written but not recorded in the manifest, unless none of its nodes
+    was documented, in which case it is not written at all. A file whose docstrings go to a
+    patch or sidecar output is not recorded in the manifest either.
+
+    :param prepared: The file documented by generate_python_file.
+    :type prepared: PreparedFile
+    :param overwrite_file: A boolean indicating whether
+     to overwrite the original file with the modified AST.
+    :type overwrite_file: bool
+    :param stem_suffix: A string to append to the stem of the original file name
+     when creating the output file. If None, the original file name is used.
+    :type stem_suffix: str
+    :param manifest: The run manifest to record the file in, if any.
+    :type manifest: Optional[RunManifest]
+    :param metrics: The collector of the metrics of the run, if any.
+    :type metrics: Optional[MetricsCollector]
+    :param reformat: A boolean indicating whether to regenerate the whole file with ast.unparse
+     and black.
+    :type reformat: bool
+    :param output: The writer of the patch or JSONL sidecar of the run, if any, in which case
+     the file itself is left untouched.
+    :type output: Optional[OutputWriter]"""
+    file_path = prepared.file_path
+    ast_analyzer = prepared.ast_analyzer
+    index = prepared.file_visitor.index(ast_analyzer.tree)
+    if prepared.file_visitor.skipped_nodes and not any(
+            is_new_docstring(entry.node) for entry in index
+    ):
+        logging.info("Budget exhausted, not writing %s", file_path)
+        return
+    if output is not None:
+        new_code = ast_analyzer.render_source(reformat, index)
+        with span("write_output", "io", file=str(file_path)):
+            output.write(file_path, ast_analyzer.source_code, new_code, ast_analyzer.tree, index)
+    else:
+        output_file_path = file_path
+        if overwrite_file is False and isinstance(stem_suffix, str):
+            output_file_path = file_path.with_stem(file_path.stem + stem_suffix)
+        ast_analyzer.write_file_from_ast(
+            file_path=output_file_path, reformat=reformat, index=index
+        )
+    # A file left untouched by a patch or sidecar output keeps its missing docstrings, so the
+    # next run must not skip it.
+    if manifest is not None and output is None and not prepared.file_visitor.skipped_nodes:
+        with span("manifest.record", "io", file=str(file_path)):
+            manifest.record(file_path, index)
     end_time = time.time()
-    logging.info("Executed in %ds", end_time - start_time)
+    logging.info("Executed in %ds", end_time - prepared.start_time)
+    if metrics is not None:
+        metrics.record_file(str(file_path), end_time - prepared.start_time)
+
+
+def _init_worker(
+        cache_dir: Optional[Path],
+        manifest_path: Optional[Path],
+        rpm: int,
+        tpm: int,
+        backend: Optional[Backend],
+        journal_path: Optional[Path],
+        budget: Optional[RunBudget],
+        fingerprints: Optional[FingerprintIndex],
+        retry_executor: Optional[RetryExecutor],
+        trace: bool = False,
+):
+    """
+    Initialize the state of a worker process of process_directory. Every worker opens its own
+    docstring cache connection, manifest copy and checkpoint journal, gets an equal share of
+    the rate limits and of the budget and a copy of the backend, whose connection pool is then
+    shared by all files of the worker, of the fingerprint index, which then grows with the
+    files of the worker, and of the retry executor. With trace, the worker records its own
+    spans, which are sent back with the results of every file.
+
+    :param cache_dir: The directory of the docstring cache, or None to disable caching.
+    :type cache_dir: Optional[Path]
+    :param manifest_path: The path of the run manifest, or None to disable it.
+    :type manifest_path: Optional[Path]
+    :param rpm: The requests-per-minute limit of the worker.
+    :type rpm: int
+    :param tpm: The tokens-per-minute limit of the worker.
+    :type tpm: int
+    :param backend: The backend of the run, or None to create one per file.
+    :type backend: Optional[Backend]
+    :param journal_path: The path of the checkpoint journal, or None to disable it.
+    :type journal_path: Optional[Path]
+    :param budget: The share of the budget of the run of the worker, if any.
+    :type budget: Optional[RunBudget]
+    :param fingerprints: The fingerprint index of the run, if any.
+    :type fingerprints: Optional[FingerprintIndex]
+    :param retry_executor: The retry executor of the run, if any.
+    :type retry_executor: Optional[RetryExecutor]
+    :param trace: A boolean indicating whether to record spans.
+    :type trace: bool"""
+    # A forked worker inherits the tracer of the main process and the spans it recorded.
+    disable_tracing()
+    if trace:
+        enable_tracing()
+    _worker_state["cache"] = None if cache_dir is None else DocstringCache(cache_dir)
+    _worker_state["manifest"] = None if manifest_path is None else RunManifest(manifest_path)
+    _worker_state["rate_limiter"] = RateLimiter(rpm=rpm, tpm=tpm)
+    _worker_state["backend"] = backend
+    _worker_state["journal"] = None if journal_path is None else CheckpointJournal(journal_path)
+    _worker_state["budget"] = budget
+    _worker_state["fingerprints"] = fingerprints
+    _worker_state["retry_executor"] = retry_executor
 
 
-def process_directory(directory: Path, overwrite_file: bool, stem_suffix: str, disable_tqdm: bool, sleep_in_secs: int = 5):
+def _process_python_file_in_worker(
+        file_path: Path,
+        overwrite_file: bool,
+        stem_suffix: str,
+        policy: Policy,
+        concurrency: int,
+        context_policy: Optional[ContextPolicy],
+        prompt_builder: Optional[PromptBuilder],
+        batch_token_budget: int,
+        reformat: bool,
+        stream: bool,
+        select_nodes: Optional[Callable[[NodeIndex], Collection[str]]] = None,
+        output_format: Optional[OutputFormat] = None,
+) -> tuple[bool, Optional[FileRecord], dict, tuple[str, int], list[dict]]:
     """
-    Recursively process a directory by
-     analyzing all Python files in the directory and its subdirectories.
+    Process a Python file in a worker process of process_directory, using the cache, manifest,
+    rate limiter, backend, journal, budget, fingerprint index and retry executor set up by
+    _init_worker.
+
+    :param file_path: A Path object representing the path to the Python file to process.
+    :type file_path: Path
+    :param overwrite_file: A boolean indicating whether
+     to overwrite the original file with the modified AST.
+    :type overwrite_file: bool
+    :param stem_suffix: A string to append to the stem of the original file name.
+    :type stem_suffix: str
+    :param policy: Which nodes to document: "all", "only-missing" or "refresh-stale".
+    :type policy: Policy
+    :param concurrency: The maximum number of concurrent requests.
+    :type concurrency: int
+    :param context_policy: The policy bounding the conversation history, if any.
+    :type context_policy: Optional[ContextPolicy]
+    :param prompt_builder: The builder of the source code sent for every node, if any.
+    :type prompt_builder: Optional[PromptBuilder]
+    :param batch_token_budget: The maximum number of prompt tokens of a batch request.
+    :type batch_token_budget: int
+    :param reformat: A boolean indicating whether to regenerate and reformat the whole file.
+    :type reformat: bool
+    :param stream: A boolean indicating whether to stream the completions.
+    :type stream: bool
+    :param select_nodes: A picklable function selecting the nodes of the file to document,
+     if any.
+    :type select_nodes: Optional[Callable[[NodeIndex], Collection[str]]]
+    :param output_format: The format of the output of the run, "patch" or "jsonl", if any.
+     The output of the file is rendered in the worker and written by the main process.
+    :type output_format: Optional[OutputFormat]
+    :return: Whether the file was processed, its new manifest entry if any, its exported
+     metrics, its output and number of docstrings in it, and the spans recorded while
+     processing it.
+    :rtype: tuple[bool, Optional[FileRecord], dict, tuple[str, int], list[dict]]"""
+    import io  # pylint: disable=import-outside-toplevel
+
+    manifest: Optional[RunManifest] = _worker_state["manifest"]
+    metrics = MetricsCollector()
+    output = None if output_format is None else OutputWriter(output_format, io.StringIO())
+    processed = process_python_file(
+        file_path,
+        overwrite_file,
+        stem_suffix,
+        cache=_worker_state["cache"],
+        manifest=manifest,
+        policy=policy,
+        concurrency=concurrency,
+        rate_limiter=_worker_state["rate_limiter"],
+        context_policy=context_policy,
+        prompt_builder=prompt_builder,
+        batch_token_budget=batch_token_budget,
+        metrics=metrics,
+        reformat=reformat,
+        backend=_worker_state["backend"],
+        stream=stream,
+        journal=_worker_state["journal"],
+        budget=_worker_state["budget"],
+        fingerprints=_worker_state["fingerprints"],
+        retry_executor=_worker_state["retry_executor"],
+        select_nodes=select_nodes,
+        output=output,
+    )
+    record = manifest.get_record(file_path) if processed and manifest is not None else None
+    rendered = ("", 0) if output is None else (output.stream.getvalue(), output.docstrings)
+    tracer = current_tracer()
+    return processed, record, metrics.export(), rendered, [] if tracer is None else tracer.drain()
+
+
+def process_directory(
+        directory: Path,
+        overwrite_file: bool,
+        stem_suffix: str,
+        disable_tqdm: bool,
+        sleep_in_secs: int = 0,
+        cache: Optional[DocstringCache] = None,
+        manifest: Optional[RunManifest] = None,
+        policy: Policy = "all",
+        concurrency: int = 1,
+        rate_limiter: Optional[RateLimiter] = None,
+        jobs: int = 1,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        use_gitignore: bool = True,
+        context_policy: Optional[ContextPolicy] = None,
+        prompt_builder: Optional[PromptBuilder] = None,
+        batch_token_budget: int = 0,
+        metrics: Optional[MetricsCollector] = None,
+        reformat: bool = False,
+        backend: Optional[Backend] = None,
+        stream: bool = False,
+        journal: Optional[CheckpointJournal] = None,
+        pipeline_depth: int = 0,
+        budget: Optional[RunBudget] = None,
+        fingerprints: Optional[FingerprintIndex] = None,
+        retry_executor: Optional[RetryExecutor] = None,
+        scope: Optional[DiffScope] = None,
+        output: Optional[OutputWriter] = None,
+):
+    """
+    Process a directory by analyzing all Python files in the directory and its subdirectories.
+
+    The files are discovered in a single walk, so every file is processed exactly once, and are
+    then processed one by one or, when jobs is larger than 1, by a pool of worker processes.
+    With a pipeline depth, the files of a single process go through a pipeline instead: the
+    next files are parsed and their prompts built, and the previous files written, while the
+    docstrings of a file are generated. With a budget, the most valuable files are processed
+    first (see rank_files), and the run stops once the budget has run out. With a diff scope,
+    only the changed files are processed, and only their changed classes and functions are
+    documented.
 
     :param directory: A Path object representing the directory to process.
     :type directory: Path
@@ -67,27 +541,361 @@ def process_directory(directory: Path, overwrite_file: bool, stem_suffix: str, d
     :type stem_suffix: str
     :param disable_tqdm: A boolean indicating whether to disable the progress bar
      when processing the directory.
-    :type disable_tqdm: bool"""
-    dirs: list[Path]
-    files: list[Path]
-    for dirs, files in tqdm(path_walk(directory), disable=disable_tqdm):
-        for current_dir in dirs:
-            process_directory(current_dir, overwrite_file, stem_suffix, disable_tqdm)
-        for current_file in files:
-            if current_file.suffix == ".py" and current_file.name != "__init__.py":
-                process_python_file(current_file, overwrite_file, stem_suffix)
-                time.sleep(5)
+    :type disable_tqdm: bool
+    :param sleep_in_secs: A fixed pause after every processed file. Requests are throttled by
+     the rate limiter, so no pause is needed by default.
+    :type sleep_in_secs: int
+    :param cache: The docstring cache to consult before calling the model,
+     or None to disable caching.
+    :type cache: Optional[DocstringCache]
+    :param manifest: The run manifest used to skip unchanged files and select nodes, if any.
+    :type manifest: Optional[RunManifest]
+    :param policy: Which nodes to document: "all", "only-missing" or "refresh-stale".
+    :type policy: Policy
+    :param concurrency: The maximum number of concurrent requests per file.
+    :type concurrency: int
+    :param rate_limiter: The rate limiter shared by all files of the run, if any. With several
+     jobs, its limits are split evenly between the worker processes.
+    :type rate_limiter: Optional[RateLimiter]
+    :param jobs: The number of worker processes.
+    :type jobs: int
+    :param include: Globs a file must match to be processed. Defaults to "*.py".
+    :type include: Optional[Sequence[str]]
+    :param exclude: Globs of files and directories to skip.
+    :type exclude: Optional[Sequence[str]]
+    :param use_gitignore: A boolean indicating whether to skip paths ignored by .gitignore files.
+    :type use_gitignore: bool
+    :param context_policy: The policy bounding the conversation history, if any.
+    :type context_policy: Optional[ContextPolicy]
+    :param prompt_builder: The builder of the source code sent for every node, if any.
+    :type prompt_builder: Optional[PromptBuilder]
+    :param batch_token_budget: The maximum number of prompt tokens of a batch request,
+     or 0 to disable batching.
+    :type batch_token_budget: int
+    :param metrics: The collector of the metrics of the run, if any. The metrics of worker
+     processes are merged into it.
+    :type metrics: Optional[MetricsCollector]
+    :param reformat: A boolean indicating whether to regenerate and reformat the whole files.
+    :type reformat: bool
+    :param backend: The backend answering the requests of all files, if any. Every worker
+     process gets its own copy with its own connection pool.
+    :type backend: Optional[Backend]
+    :param stream: A boolean indicating whether to stream the completions.
+    :type stream: bool
+    :param journal: The checkpoint journal of the run, if any. Worker processes append to
+     the same file.
+    :type journal: Optional[CheckpointJournal]
+    :param pipeline_depth: The maximum number of files waiting between two stages of the
+     pipeline, or 0 to process the files one after the other. Only used with a single job.
+    :type pipeline_depth: int
+    :param budget: The budget of the run, if any. With several jobs, its token and request
+     limits are split evenly between the worker processes.
+    :type budget: Optional[RunBudget]
+    :param fingerprints: The index reusing the docstrings of structurally identical classes
+     and functions, if any. Every worker process gets its own copy.
+    :type fingerprints: Optional[FingerprintIndex]
+    :param retry_executor: The executor bounding the duration of every request and retrying
+     failed ones, if any. Every worker process gets its own copy.
+    :type retry_executor: Optional[RetryExecutor]
+    :param scope: The lines changed in a revision range, limiting the run to the classes and
+     functions enclosing them, if any.
+    :type scope: Optional[DiffScope]
+    :param output: The writer of the patch or JSONL sidecar of the run, if any, in which case
+     the files themselves are left untouched. Worker processes send it the output of their
+     files.
+    :type output: Optional[OutputWriter]"""
+    files: list[Path] = list(
+        discover_python_files(
+            directory,
+            include=include,
+            exclude=exclude,
+            use_gitignore=use_gitignore,
+            stem_suffix=None if overwrite_file else stem_suffix,
+        )
+    )
+    if scope is not None:
+        files = [file_path for file_path in files if scope.covers(file_path)]
+    if manifest is not None:
+        files = [file_path for file_path in files if not manifest.is_unchanged(file_path)]
+    if budget is not None:
+        files = rank_files(files)
+    from tqdm import tqdm  # pylint: disable=import-outside-toplevel
 
+    if jobs <= 1 and pipeline_depth > 0:
+        progress = tqdm(total=len(files), disable=disable_tqdm, unit="file")
 
+        def generate(prepared: PreparedFile):
+            generate_python_file(prepared, concurrency)
+            if sleep_in_secs > 0:
+                with span("sleep", "wait"):
+                    time.sleep(sleep_in_secs)
 
-def main():
+        def finish(prepared: PreparedFile):
+            write_python_file(
+                prepared, overwrite_file, stem_suffix, manifest, metrics, reformat, output
+            )
+            progress.update()
+
+        try:
+            run_pipeline(
+                files,
+                lambda current_file: prepare_python_file(
+                    current_file,
+                    cache=cache,
+                    manifest=manifest,
+                    policy=policy,
+                    rate_limiter=rate_limiter,
+                    context_policy=context_policy,
+                    prompt_builder=prompt_builder,
+                    batch_token_budget=batch_token_budget,
+                    metrics=metrics,
+                    backend=backend,
+                    stream=stream,
+                    journal=journal,
+                    budget=budget,
+                    fingerprints=fingerprints,
+                    retry_executor=retry_executor,
+                    select_nodes=None if scope is None else scope.selector(current_file),
+                ),
+                generate,
+                finish,
+                depth=pipeline_depth,
+            )
+        finally:
+            progress.close()
+        return
+    if jobs <= 1:
+        for current_file in tqdm(files, disable=disable_tqdm, unit="file"):
+            if budget is not None and budget.exhausted():
+                break
+            if process_python_file(
+                    current_file,
+                    overwrite_file,
+                    stem_suffix,
+                    cache=cache,
+                    manifest=manifest,
+                    policy=policy,
+                    concurrency=concurrency,
+                    rate_limiter=rate_limiter,
+                    context_policy=context_policy,
+                    prompt_builder=prompt_builder,
+                    batch_token_budget=batch_token_budget,
+                    metrics=metrics,
+                    reformat=reformat,
+                    backend=backend,
+                    stream=stream,
+                    journal=journal,
+                    budget=budget,
+                    fingerprints=fingerprints,
+                    retry_executor=retry_executor,
+                    select_nodes=None if scope is None else scope.selector(current_file),
+                    output=output,
+            ) and sleep_in_secs > 0:
+                with span("sleep", "wait"):
+                    time.sleep(sleep_in_secs)
+        return
+    from concurrent.futures import (  # pylint: disable=import-outside-toplevel
+        ProcessPoolExecutor,
+        as_completed,
+    )
+
+    if rate_limiter is None:
+        model = ASTAnalyzer.default_model_kwargs["model"]
+        if backend is not None:
+            model = backend_identity(backend, model).model
+        rate_limiter = RateLimiter.for_model(model)
+    with ProcessPoolExecutor(
+            max_workers=jobs,
+            initializer=_init_worker,
+            initargs=(
+                None if cache is None else cache.db_path.parent,
+                None if manifest is None else manifest.path,
+                max(1, rate_limiter.rpm // jobs),
+                max(1, rate_limiter.tpm // jobs),
+                backend,
+                None if journal is None else journal.path,
+                None if budget is None else budget.split(jobs),
+                fingerprints,
+                retry_executor,
+                current_tracer() is not None,
+            ),
+    ) as executor:
+        futures = {
+            executor.submit(
+                _process_python_file_in_worker,
+                current_file,
+                overwrite_file,
+                stem_suffix,
+                policy,
+                concurrency,
+                context_policy,
+                prompt_builder,
+                batch_token_budget,
+                reformat,
+                stream,
+                None if scope is None else scope.selector(current_file),
+                None if output is None else output.output_format,
+            ): current_file
+            for current_file in files
+        }
+        for future in tqdm(
+                as_completed(futures), total=len(futures), disable=disable_tqdm, unit="file"
+        ):
+            _, record, file_metrics, rendered, events = future.result()
+            if manifest is not None and record is not None:
+                manifest.set_record(futures[future], record)
+            if output is not None:
+                output.write_text(*rendered)
+            if events:
+                current_tracer().extend(events)
+            if metrics is not None:
+                metrics.merge(file_metrics)
+
+
+def close_run_state(
+        cache: Optional[DocstringCache],
+        manifest: Optional[RunManifest],
+        metrics: Optional[MetricsCollector] = None,
+        metrics_out: Optional[Path] = None,
+        prometheus_out: Optional[Path] = None,
+        backend: Optional[Backend] = None,
+        journal: Optional[CheckpointJournal] = None,
+        retry_executor: Optional[RetryExecutor] = None,
+        output: Optional[OutputWriter] = None,
+):
     """
-    The main function that processes Python files in a directory based on command-line arguments.
+    Close the docstring cache, save the run manifest, write the metrics reports and close the
+    backend, the checkpoint journal, the retry executor and the output at the end of a run.
 
-    The function parses command-line arguments using argparse and processes the specified file or
-     directory using the process_python_file or process_directory functions, respectively.
+    :param cache: The docstring cache of the run, if any.
+    :type cache: Optional[DocstringCache]
+    :param manifest: The run manifest of the run, if any.
+    :type manifest: Optional[RunManifest]
+    :param metrics: The collected metrics of the run, if any.
+    :type metrics: Optional[MetricsCollector]
+    :param metrics_out: The path of the JSON metrics report, if any.
+    :type metrics_out: Optional[Path]
+    :param prometheus_out: The path of the Prometheus textfile, if any.
+    :type prometheus_out: Optional[Path]
+    :param backend: The backend of the run, if any.
+    :type backend: Optional[Backend]
+    :param journal: The checkpoint journal of the run, if any.
+    :type journal: Optional[CheckpointJournal]
+    :param retry_executor: The retry executor of the run, if any.
+    :type retry_executor: Optional[RetryExecutor]
+    :param output: The writer of the patch or JSONL sidecar of the run, if any.
+    :type output: Optional[OutputWriter]"""
+    if cache is not None:
+        cache.close()
+    if manifest is not None:
+        manifest.save()
+    if metrics is not None:
+        if metrics_out is not None:
+            metrics.write_json(metrics_out)
+        if prometheus_out is not None:
+            metrics.write_prometheus(prometheus_out)
+    if backend is not None:
+        backend.close()
+    if journal is not None:
+        journal.close()
+    if retry_executor is not None:
+        retry_executor.close()
+    if output is not None:
+        output.close()
 
-    The function takes no arguments and returns nothing."""
+
+def create_budget(
+        max_tokens: Optional[int], max_requests: Optional[int], deadline_secs: Optional[float]
+) -> Optional[RunBudget]:
+    """
+    Create the budget of a run from the command-line limits. The deadline starts running
+    immediately.
+
+    :param max_tokens: The maximum number of tokens, or None for no limit.
+    :type max_tokens: Optional[int]
+    :param max_requests: The maximum number of requests, or None for no limit.
+    :type max_requests: Optional[int]
+    :param deadline_secs: The number of seconds after which no request is started, or None.
+    :type deadline_secs: Optional[float]
+    :return: The budget, or None if no limit is set.
+    :rtype: Optional[RunBudget]"""
+    if max_tokens is None and max_requests is None and deadline_secs is None:
+        return None
+    return RunBudget(max_tokens, max_requests, deadline_secs)
+
+
+def create_output(
+        patch_out: Optional[Path], jsonl_out: Optional[Path]
+) -> Optional[OutputWriter]:
+    """
+    Create the writer of the patch or JSONL sidecar of a run from the command-line paths.
+
+    :param patch_out: The path of the patch, if any.
+    :type patch_out: Optional[Path]
+    :param jsonl_out: The path of the JSONL sidecar, if any.
+    :type jsonl_out: Optional[Path]
+    :return: The writer, or None if the documented files are written instead.
+    :rtype: Optional[OutputWriter]"""
+    if patch_out is not None:
+        return OutputWriter.open("patch", patch_out)
+    if jsonl_out is not None:
+        return OutputWriter.open("jsonl", jsonl_out)
+    return None
+
+
+def report_output(output: Optional[OutputWriter]):
+    """
+    Print the number of docstrings written to the patch or JSONL sidecar of a run.
+
+    :param output: The writer of the output of the run, if any.
+    :type output: Optional[OutputWriter]"""
+    if output is not None:
+        print(
+            f"Wrote {output.docstrings} docstrings of {output.files} files as "
+            f"{output.output_format} to {output.stream.name}",
+            file=sys.stderr,
+        )
+
+
+def report_budget(budget: Optional[RunBudget]):
+    """
+    Print a notice if the budget of a run ran out, so the run is known to be partial.
+
+    :param budget: The budget of the run, if any.
+    :type budget: Optional[RunBudget]"""
+    if budget is not None and budget.exhausted():
+        print(
+            f"Budget exhausted ({budget.exhausted_reason()}): the remaining classes and "
+            "functions were left undocumented",
+            file=sys.stderr,
+        )
+
+
+def report_reuse(fingerprints: Optional[FingerprintIndex], metrics: Optional[MetricsCollector]):
+    """
+    Print the size of the fingerprint index and the rate of docstrings reused from structurally
+    identical classes and functions, counted over the metrics of all processes of the run.
+
+    :param fingerprints: The fingerprint index of the run, if any.
+    :type fingerprints: Optional[FingerprintIndex]
+    :param metrics: The collected metrics of the run, if any.
+    :type metrics: Optional[MetricsCollector]"""
+    if fingerprints is None or metrics is None:
+        return
+    run = metrics.report()["run"]
+    print(
+        f"Fingerprint index: {len(fingerprints)} fingerprints, reused {run['reused']} of "
+        f"{run['nodes']} docstrings ({run['reuse_rate']:.0%})",
+        file=sys.stderr,
+    )
+
+
+def create_parser() -> argparse.ArgumentParser:
+    """
+    Create the parser of the command-line arguments shared by a run and watch mode.
+
+    :return: The parser.
+    :rtype: argparse.ArgumentParser"""
     parser = argparse.ArgumentParser(description="Process Python files in a directory")
     parser.add_argument("path", help="path to Python file or directory")
     parser.add_argument(
@@ -105,17 +913,720 @@ def main():
         default="_doc",
     )
     parser.add_argument("--disable_tqdm", help="Disable the progress bar", action="store_true")
+    parser.add_argument(
+        "--no-cache",
+        help="Do not read or write the on-disk docstring cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="The directory of the docstring cache (defaults to ~/.cache/autodocgen)",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--manifest",
+        help="A manifest file used to skip files that are unchanged since the previous run",
+        type=Path,
+        default=None,
+    )
+    policy_group = parser.add_mutually_exclusive_group()
+    policy_group.add_argument(
+        "--only-missing",
+        help="Only document classes and functions that do not have a docstring yet",
+        action="store_true",
+    )
+    policy_group.add_argument(
+        "--refresh-stale",
+        help="Also regenerate docstrings whose code changed since they were generated "
+             "(requires --manifest)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--concurrency",
+        help="The maximum number of concurrent requests per file (1 processes nodes serially)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--rpm",
+        help="The requests-per-minute limit of the model (defaults to its known limit)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--tpm",
+        help="The tokens-per-minute limit of the model (defaults to its known limit)",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="The number of files to process in parallel worker processes",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--include",
+        help="Only process files matching this glob (may be repeated)",
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--exclude",
+        help="Skip files and directories matching this glob (may be repeated)",
+        action="append",
+        default=None,
+    )
+    parser.add_argument(
+        "--no-gitignore",
+        help="Also process files ignored by .gitignore files",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--context",
+        help="How much conversation history to send with every prompt: none (stateless), "
+             "the last --context-window exchanges (window) or as much as fits in "
+             "--context-budget tokens (budget)",
+        choices=["stateless", "window", "budget"],
+        default="window",
+    )
+    parser.add_argument(
+        "--context-window",
+        help="The number of previous exchanges sent in window mode",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--context-budget",
+        help="The maximum number of prompt tokens in budget mode",
+        type=int,
+        default=2048,
+    )
+    parser.add_argument(
+        "--max-prompt-tokens",
+        help="The maximum number of source code tokens sent for a class or function; "
+             "longer code is trimmed",
+        type=int,
+        default=2048,
+    )
+    parser.add_argument(
+        "--full-class-source",
+        help="Send the full source code of classes instead of a skeleton of their methods",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--batch-tokens",
+        help="Pack small classes and functions into requests of at most this many prompt "
+             "tokens (0 sends every class and function in its own request)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--metrics-out",
+        help="Write a JSON report of the latency, tokens, retries, rate limit waits, cache hits "
+             "and estimated cost of every class, function and file to this path",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--prometheus-out",
+        help="Write the run totals as a Prometheus textfile to this path",
+        type=Path,
+        default=None,
+    )
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument(
+        "--patch-out",
+        help="Leave the files untouched and write a single unified diff of all generated "
+             "docstrings to this path, for git apply",
+        type=Path,
+        default=None,
+    )
+    output_group.add_argument(
+        "--jsonl-out",
+        help="Leave the files untouched and write every generated docstring as a JSON line "
+             "to this path, for autodocgen apply",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--reformat",
+        help="Regenerate the whole file with ast.unparse and black instead of only inserting "
+             "the docstrings (drops comments)",
+        action="store_true",
+    )
+    scope_group = parser.add_mutually_exclusive_group()
+    scope_group.add_argument(
+        "--since",
+        help="Only document the classes and functions changed since the current branch forked "
+             "from this git revision, including uncommitted changes and untracked files",
+        metavar="REV",
+        default=None,
+    )
+    scope_group.add_argument(
+        "--diff",
+        help="Only document the classes and functions changed in this git revision range, "
+             "e.g. main...HEAD",
+        metavar="RANGE",
+        default=None,
+    )
+    parser.add_argument(
+        "--plan",
+        help="Estimate the requests, tokens, cost and wall time of the run without calling the "
+             "model (no OPENAI_KEY needed)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--plan-format",
+        help="Print the plan as a per-directory table (text) or as JSON",
+        choices=["text", "json"],
+        default="text",
+    )
+    parser.add_argument(
+        "--backend",
+        help="The service answering the requests: the OpenAI API (openai), a server implementing "
+             "the OpenAI API at --base-url (openai-compatible) or an offline stub (stub)",
+        choices=["openai", "openai-compatible", "stub"],
+        default="openai",
+    )
+    parser.add_argument(
+        "--base-url",
+        help="The base URL of the API, e.g. http://localhost:8000/v1",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--backend-model",
+        help="The model name sent to the backend instead of the default model",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--stream",
+        help="Stream the completions and stop each one as soon as the docstring is complete, "
+             "instead of waiting for the commentary models often add after it",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--resume",
+        help="Resume an interrupted run: replay the responses checkpointed to its journal and "
+             "only request the missing classes and functions",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--journal",
+        help="The checkpoint journal of the run (defaults to a journal of the path in the "
+             "cache directory)",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--pipeline-depth",
+        help="Parse the next files and write the previous ones while the docstrings of a file "
+             "are generated, keeping at most this many files between stages (0 processes the "
+             "files one after the other; ignored with --jobs)",
+        type=int,
+        default=2,
+    )
+    parser.add_argument(
+        "--max-tokens",
+        help="Stop sending requests once the run has used this many tokens; the most valuable "
+             "classes and functions are documented first",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--max-requests",
+        help="Stop sending requests once the run has sent this many",
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--deadline",
+        help="Stop sending requests after this duration, in seconds or with an s, m or h "
+             "suffix (e.g. 15m); the docstrings obtained so far are written",
+        type=parse_duration,
+        default=None,
+    )
+    parser.add_argument(
+        "--reuse-duplicates",
+        help="Reuse the docstring of a structurally identical class or function (differing only "
+             "in identifiers and literals), adapted to its identifiers, instead of requesting one",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--reuse-threshold",
+        help="The minimum similarity of the source code, between 0 and 1, for --reuse-duplicates "
+             "to reuse a docstring (0 reuses the docstrings of all structurally identical nodes)",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--request-timeout",
+        help="Fail a request after this duration, in seconds or with an s, m or h suffix, "
+             "and retry it (0 uses the default of the openai library)",
+        type=parse_duration,
+        default=120.0,
+    )
+    parser.add_argument(
+        "--max-attempts",
+        help="Give up on a request after this many attempts, retrying failed requests with an "
+             "exponential backoff or after the delay the API asks for",
+        type=int,
+        default=6,
+    )
+    parser.add_argument(
+        "--hedge",
+        help="Send a duplicate of a request taking longer than 95%% of the previous ones and use "
+             "the first response",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trace-out",
+        help="Record the time spent parsing, building prompts, waiting for the API and the "
+             "rate limiter, extracting docstrings and writing files, and write it to this path "
+             "as a Chrome trace, viewable in Perfetto",
+        type=Path,
+        default=None,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile the run with cProfile and print the functions taking the most "
+             "cumulative time (the main process only)",
+        action="store_true",
+    )
+    return parser
+
+
+def check_args(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """
+    Exit with a usage error if command-line arguments parsed by create_parser are inconsistent.
+
+    :param parser: The parser of the arguments.
+    :type parser: argparse.ArgumentParser
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace"""
+    if args.backend == "openai-compatible" and args.base_url is None:
+        parser.error("--backend openai-compatible requires --base-url")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.pipeline_depth < 0:
+        parser.error("--pipeline-depth must not be negative")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.refresh_stale and args.manifest is None:
+        parser.error("--refresh-stale requires --manifest")
+    if (args.max_tokens is not None and args.max_tokens < 1) or (
+            args.max_requests is not None and args.max_requests < 1
+    ):
+        parser.error("--max-tokens and --max-requests must be at least 1")
+    if not 0 <= args.reuse_threshold <= 1:
+        parser.error("--reuse-threshold must be between 0 and 1")
+    if args.max_attempts < 1:
+        parser.error("--max-attempts must be at least 1")
+    if (args.since is not None or args.diff is not None) and args.reformat:
+        parser.error("--since and --diff cannot be used with --reformat")
+
+
+def policy_from_args(args: argparse.Namespace) -> Policy:
+    """
+    Select the policy of a run from the command-line arguments.
+
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace
+    :return: "only-missing", "refresh-stale" or "all".
+    :rtype: Policy"""
+    if args.only_missing:
+        return "only-missing"
+    if args.refresh_stale:
+        return "refresh-stale"
+    return "all"
+
+
+def watch_main(argv: Optional[Sequence[str]] = None, stop: Optional["threading.Event"] = None):
+    """
+    Watch a Python file or directory and document the classes and functions whose body changes,
+    as soon as the changes settle. The backend, caches, rate limiter and fingerprint index are
+    created once and kept warm between changes, and every changed file is parsed once to find
+    the changed nodes and build their prompts.
+
+    :param argv: The command-line arguments following watch. If None, they are read from
+     sys.argv.
+    :type argv: Optional[Sequence[str]]
+    :param stop: An event ending the watch when set, or None to watch until interrupted.
+    :type stop: Optional[threading.Event]"""
+    from .watch import Watcher  # pylint: disable=import-outside-toplevel
+
+    parser = create_parser()
+    parser.prog = "autodocgen watch"
+    parser.description = "Document the classes and functions of Python files as they change"
+    parser.add_argument(
+        "--poll-interval",
+        help="The pause between two polls of the watched path, in seconds (default: 0.5)",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "--debounce",
+        help="The time without further changes to wait for before documenting changed files, "
+             "in seconds (default: 0.3)",
+        type=float,
+        default=0.3,
+    )
+    args = parser.parse_args(argv)
+    check_args(parser, args)
+    if not args.overwrite:
+        # Every change only documents the changed nodes, so a file written next to the
+        # source code would lose the docstrings of the previous changes.
+        parser.error("watch mode documents files in place and requires -i/--overwrite")
+    if args.plan or args.resume or args.journal is not None:
+        parser.error("--plan, --resume and --journal cannot be used in watch mode")
+    if args.since is not None or args.diff is not None:
+        parser.error("--since and --diff cannot be used in watch mode")
+    if args.trace_out is not None or args.profile:
+        parser.error("--trace-out and --profile cannot be used in watch mode")
+    if args.patch_out is not None or args.jsonl_out is not None:
+        parser.error("--patch-out and --jsonl-out cannot be used in watch mode")
+    if args.max_tokens is not None or args.max_requests is not None or args.deadline is not None:
+        parser.error("--max-tokens, --max-requests and --deadline cannot be used in watch mode")
+    if args.poll_interval <= 0 or args.debounce < 0:
+        parser.error("--poll-interval must be positive and --debounce must not be negative")
+    path = Path(args.path)
+    if not path.is_dir() and not (path.is_file() and path.suffix == ".py"):
+        parser.error(f"'{path}' is not a Python file or a directory")
+    policy = policy_from_args(args)
+    identity = resolve_backend_identity(
+        args.backend, args.base_url, args.backend_model, ASTAnalyzer.default_model_kwargs["model"]
+    )
+    rate_limiter = RateLimiter.for_model(identity.model, rpm=args.rpm, tpm=args.tpm)
+    context_policy = ContextPolicy(
+        mode=args.context, window=args.context_window, token_budget=args.context_budget
+    )
+    prompt_builder = PromptBuilder(
+        max_prompt_tokens=args.max_prompt_tokens, skeletonize_classes=not args.full_class_source
+    )
+    metrics = None
+    if args.metrics_out is not None or args.prometheus_out is not None or args.reuse_duplicates:
+        metrics = MetricsCollector()
+    fingerprints = None
+    if args.reuse_duplicates:
+        fingerprints = FingerprintIndex(threshold=args.reuse_threshold)
+    retry_executor = RetryExecutor(
+        timeout_secs=args.request_timeout or None,
+        max_attempts=args.max_attempts,
+        hedge=args.hedge,
+    )
+    backend = create_backend(
+        args.backend, args.base_url, args.backend_model, args.request_timeout or None
+    )
+    cache = None if args.no_cache else DocstringCache(args.cache_dir)
+    manifest = None if args.manifest is None else RunManifest(args.manifest)
+
+    def document(file_path: Path, select_nodes: Callable[[NodeIndex], Collection[str]]) -> bool:
+        stat = file_path.stat()
+        prepared = prepare_python_file(
+            file_path,
+            cache=cache,
+            manifest=manifest,
+            policy=policy,
+            rate_limiter=rate_limiter,
+            context_policy=context_policy,
+            prompt_builder=prompt_builder,
+            batch_token_budget=args.batch_tokens,
+            metrics=metrics,
+            backend=backend,
+            stream=args.stream,
+            fingerprints=fingerprints,
+            retry_executor=retry_executor,
+            select_nodes=select_nodes,
+        )
+        if prepared is None:
+            return True
+        generate_python_file(prepared, args.concurrency)
+        current = file_path.stat()
+        if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+            logging.info("File changed while it was documented, retrying: %s", file_path)
+            return False
+        write_python_file(prepared, args.overwrite, args.suffix, manifest, metrics, args.reformat)
+        file_visitor = prepared.file_visitor
+        print(
+            f"Documented {len(file_visitor.node_index.defs(file_visitor.node_filter))} node(s) "
+            f"of {file_path} in {time.time() - prepared.start_time:.1f}s"
+        )
+        return True
+
+    watcher = Watcher(
+        path,
+        document,
+        poll_interval=args.poll_interval,
+        debounce=args.debounce,
+        include=args.include,
+        exclude=args.exclude,
+        use_gitignore=not args.no_gitignore,
+    )
+    print(f"Watching {path} for changes, press Ctrl+C to stop")
+    try:
+        watcher.run(stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_run_state(
+            cache,
+            manifest,
+            metrics,
+            args.metrics_out,
+            args.prometheus_out,
+            backend,
+            retry_executor=retry_executor,
+        )
+
+
+def apply_main(argv: Optional[Sequence[str]] = None):
+    """
+    Apply the docstrings of a JSONL sidecar written with --jsonl-out to their files in bulk.
+
+    :param argv: The command-line arguments following apply. If None, they are read from
+     sys.argv.
+    :type argv: Optional[Sequence[str]]"""
+    from .output import apply_sidecar  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(
+        prog="autodocgen apply",
+        description="Apply the docstrings of a JSONL sidecar written with --jsonl-out",
+    )
+    parser.add_argument("sidecar", help="path to the JSONL sidecar", type=Path)
+    args = parser.parse_args(argv)
+    if not args.sidecar.is_file():
+        print(f"Error: sidecar '{args.sidecar}' does not exist", file=sys.stderr)
+        sys.exit(1)
+    applied, skipped = apply_sidecar(args.sidecar)
+    print(f"Applied {applied} docstrings, skipped {skipped}")
+    if skipped:
+        sys.exit(1)
+
+
+def main():
+    """
+    The main function that processes Python files in a directory based on command-line arguments.
+
+    The function parses command-line arguments using argparse and processes the specified file or
+     directory using the process_python_file or process_directory functions, respectively. With
+     watch or apply as the first argument, the arguments are passed on to watch_main or
+     apply_main instead. With --trace-out or --profile, the spans of the run are exported or
+     the run is profiled, even if it fails.
+
+    The function takes no arguments and returns nothing."""
+    if sys.argv[1:2] == ["watch"]:
+        watch_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["apply"]:
+        apply_main(sys.argv[2:])
+        return
+    parser = create_parser()
     args = parser.parse_args()
+    check_args(parser, args)
+    if args.trace_out is not None:
+        enable_tracing()
+    profiler = None
+    if args.profile:
+        import cProfile  # pylint: disable=import-outside-toplevel
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with span("run", path=args.path):
+            run_from_args(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            report_profile(profiler)
+        tracer = current_tracer()
+        if args.trace_out is not None and tracer is not None:
+            tracer.write(args.trace_out)
+            print(f"Wrote {len(tracer.events)} spans to {args.trace_out}", file=sys.stderr)
+
+
+def report_profile(profiler: "cProfile.Profile", limit: int = 40):
+    """
+    Print the functions of a profiled run taking the most cumulative time.
+
+    :param profiler: The profiler of the run.
+    :type profiler: cProfile.Profile
+    :param limit: The number of functions to print.
+    :type limit: int"""
+    import pstats  # pylint: disable=import-outside-toplevel
+
+    pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(limit)
+
+
+def run_from_args(args: argparse.Namespace):
+    """
+    Plan or process the file or directory of the command-line arguments checked by check_args.
+
+    :param args: The parsed arguments.
+    :type args: argparse.Namespace"""
+    policy = policy_from_args(args)
+    identity = resolve_backend_identity(
+        args.backend, args.base_url, args.backend_model, ASTAnalyzer.default_model_kwargs["model"]
+    )
+    rate_limiter = RateLimiter.for_model(identity.model, rpm=args.rpm, tpm=args.tpm)
+    context_policy = ContextPolicy(
+        mode=args.context, window=args.context_window, token_budget=args.context_budget
+    )
+    prompt_builder = PromptBuilder(
+        max_prompt_tokens=args.max_prompt_tokens, skeletonize_classes=not args.full_class_source
+    )
+    metrics = None
+    if args.metrics_out is not None or args.prometheus_out is not None or args.reuse_duplicates:
+        metrics = MetricsCollector()
+    fingerprints = None
+    if args.reuse_duplicates:
+        fingerprints = FingerprintIndex(threshold=args.reuse_threshold)
+    retry_executor = RetryExecutor(
+        timeout_secs=args.request_timeout or None,
+        max_attempts=args.max_attempts,
+        hedge=args.hedge,
+    )
     path: Path = Path(args.path)
-    if path.is_file() and path.suffix == ".py":
-        process_python_file(file_path=path, overwrite_file=args.overwrite, stem_suffix=args.suffix)
+    scope = None
+    if (args.since is not None or args.diff is not None) and path.exists():
+        try:
+            scope = DiffScope.from_git(path, since=args.since, diff=args.diff)
+        except GitDiffError as error:
+            print(f"Error: {error}", file=sys.stderr)
+            sys.exit(1)
+        logging.info("%d changed file(s) in the diff", len(scope))
+    if args.plan and (path.is_dir() or (path.is_file() and path.suffix == ".py")):
+        cache = None if args.no_cache else DocstringCache(args.cache_dir)
+        try:
+            plan = plan_run(
+                path,
+                prompt_builder,
+                context_policy,
+                rate_limiter,
+                cache=cache,
+                manifest=None if args.manifest is None else RunManifest(args.manifest),
+                policy=policy,
+                concurrency=args.concurrency,
+                jobs=args.jobs,
+                batch_token_budget=args.batch_tokens,
+                include=args.include,
+                exclude=args.exclude,
+                use_gitignore=not args.no_gitignore,
+                stem_suffix=None if args.overwrite else args.suffix,
+                backend=identity,
+                scope=scope,
+            )
+        finally:
+            if cache is not None:
+                cache.connection.close()
+        print(format_plan(plan, as_json=args.plan_format == "json"))
+    elif path.is_file() and path.suffix == ".py":
+        budget = create_budget(args.max_tokens, args.max_requests, args.deadline)
+        backend = create_backend(
+            args.backend, args.base_url, args.backend_model, args.request_timeout or None
+        )
+        journal = CheckpointJournal(args.journal or default_journal_path(path), replay=args.resume)
+        cache = None if args.no_cache else DocstringCache(args.cache_dir)
+        manifest = None if args.manifest is None else RunManifest(args.manifest)
+        output = create_output(args.patch_out, args.jsonl_out)
+        try:
+            process_python_file(
+                file_path=path,
+                overwrite_file=args.overwrite,
+                stem_suffix=args.suffix,
+                cache=cache,
+                manifest=manifest,
+                policy=policy,
+                concurrency=args.concurrency,
+                rate_limiter=rate_limiter,
+                context_policy=context_policy,
+                prompt_builder=prompt_builder,
+                batch_token_budget=args.batch_tokens,
+                metrics=metrics,
+                reformat=args.reformat,
+                backend=backend,
+                stream=args.stream,
+                journal=journal,
+                budget=budget,
+                fingerprints=fingerprints,
+                retry_executor=retry_executor,
+                select_nodes=None if scope is None else scope.selector(path),
+                output=output,
+            )
+            journal.discard()
+            report_budget(budget)
+            report_reuse(fingerprints, metrics)
+            report_output(output)
+        finally:
+            close_run_state(
+                cache,
+                manifest,
+                metrics,
+                args.metrics_out,
+                args.prometheus_out,
+                backend,
+                journal,
+                retry_executor,
+                output,
+            )
     elif path.is_dir():
-        process_directory(
-            directory=path,
-            overwrite_file=args.overwrite,
-            stem_suffix=args.suffix,
-            disable_tqdm=args.disable_tqdm,
+        budget = create_budget(args.max_tokens, args.max_requests, args.deadline)
+        backend = create_backend(
+            args.backend, args.base_url, args.backend_model, args.request_timeout or None
         )
+        journal = CheckpointJournal(args.journal or default_journal_path(path), replay=args.resume)
+        cache = None if args.no_cache else DocstringCache(args.cache_dir)
+        manifest = None if args.manifest is None else RunManifest(args.manifest)
+        output = create_output(args.patch_out, args.jsonl_out)
+        try:
+            process_directory(
+                directory=path,
+                overwrite_file=args.overwrite,
+                stem_suffix=args.suffix,
+                disable_tqdm=args.disable_tqdm,
+                cache=cache,
+                manifest=manifest,
+                policy=policy,
+                concurrency=args.concurrency,
+                rate_limiter=rate_limiter,
+                jobs=args.jobs,
+                include=args.include,
+                exclude=args.exclude,
+                use_gitignore=not args.no_gitignore,
+                context_policy=context_policy,
+                prompt_builder=prompt_builder,
+                batch_token_budget=args.batch_tokens,
+                metrics=metrics,
+                reformat=args.reformat,
+                backend=backend,
+                stream=args.stream,
+                journal=journal,
+                pipeline_depth=args.pipeline_depth,
+                budget=budget,
+                fingerprints=fingerprints,
+                retry_executor=retry_executor,
+                scope=scope,
+                output=output,
+            )
+            journal.discard()
+            report_budget(budget)
+            report_reuse(fingerprints, metrics)
+            report_output(output)
+        finally:
+            close_run_state(
+                cache,
+                manifest,
+                metrics,
+                args.metrics_out,
+                args.prometheus_out,
+                backend,
+                journal,
+                retry_executor,
+                output,
+            )
     elif not path.exists():
         print(f"Error: path '{path}' does not exist", file=sys.stderr)
         sys.exit(1)
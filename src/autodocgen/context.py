@@ -0,0 +1,106 @@
+from typing import Literal, Sequence, Union, TYPE_CHECKING
+
+from .tokens import estimate_tokens
+
+if TYPE_CHECKING:
+    from .ast_analyzer import ChatMessage
+
+ContextMode = Union[Literal["stateless"], Literal["window"], Literal["budget"]]
+
+
+class ContextPolicy:
+    """
+    ContextPolicy class for bounding the conversation sent with every prompt.
+
+    The first message (the instruction) and the current prompt are always sent. The exchanges
+    in between are dropped ("stateless"), limited to the last `window` exchanges ("window"), or
+    limited to the most recent exchanges that fit in `token_budget` tokens ("budget").
+
+    Attributes:
+    -----------
+    mode : ContextMode
+        The way the conversation history is bounded.
+    window : int
+        The number of previous exchanges kept in "window" mode.
+    token_budget : int
+        The maximum estimated number of prompt tokens in "budget" mode.
+
+    Methods:
+    --------
+    apply(self, messages: list[ChatMessage]) -> list[ChatMessage]
+        Bounds a conversation whose last message is the current prompt.
+    kept_exchanges(self, exchange_tokens: Sequence[int], fixed_tokens: int) -> int
+        Computes how many of the most recent exchanges of a conversation are kept.
+    """
+
+    def __init__(self, mode: ContextMode = "window", window: int = 2, token_budget: int = 2048):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            mode (ContextMode, optional): The way the history is bounded. Defaults to "window".
+            window (int, optional): The number of previous exchanges kept in "window" mode.
+            Defaults to 2.
+            token_budget (int, optional): The maximum estimated number of prompt tokens in
+            "budget" mode. Defaults to 2048.
+
+        Raises:
+            ValueError: If the mode is unknown.
+
+        Returns:
+            None
+        """
+        if mode not in ("stateless", "window", "budget"):
+            raise ValueError(f"Unknown context mode: {mode}")
+        self.mode = mode
+        self.window = window
+        self.token_budget = token_budget
+
+    def apply(self, messages: list["ChatMessage"]) -> list["ChatMessage"]:
+        """
+        Bounds a conversation whose first message is the instruction and whose last message is
+        the current prompt; the messages in between are prompt/response exchanges.
+
+        Args:
+            messages (list[ChatMessage]): The conversation.
+
+        Returns:
+            list[ChatMessage]: The bounded conversation.
+        """
+        if len(messages) <= 2:
+            return messages
+        head, history, current = messages[:1], messages[1:-1], messages[-1:]
+        exchange_tokens = [
+            sum(estimate_tokens(message["content"]) for message in history[start:start + 2])
+            for start in range(len(history) % 2, len(history), 2)
+        ]
+        fixed_tokens = sum(estimate_tokens(message["content"]) for message in head + current)
+        kept = self.kept_exchanges(exchange_tokens, fixed_tokens)
+        history = history[len(history) - 2 * kept:] if kept > 0 else []
+        return head + history + current
+
+    def kept_exchanges(self, exchange_tokens: Sequence[int], fixed_tokens: int) -> int:
+        """
+        Computes how many of the most recent exchanges of a conversation are kept.
+
+        Args:
+            exchange_tokens (Sequence[int]): The estimated number of tokens of every
+            prompt/response exchange, oldest first.
+            fixed_tokens (int): The estimated number of tokens of the instruction and the
+            current prompt, which are always sent.
+
+        Returns:
+            int: The number of most recent exchanges kept.
+        """
+        if self.mode == "stateless":
+            return 0
+        if self.mode == "window":
+            return min(len(exchange_tokens), max(0, self.window))
+        remaining = self.token_budget - fixed_tokens
+        kept = 0
+        for tokens in reversed(exchange_tokens):
+            if tokens > remaining:
+                break
+            remaining -= tokens
+            kept += 1
+        return kept
@@ -0,0 +1,232 @@
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import Iterator, Optional, Sequence
+
+
+def _translate_gitignore_pattern(pattern: str) -> str:
+    """
+    Translates a .gitignore glob into a regular expression over a relative POSIX path.
+
+    Args:
+        pattern (str): The glob, without negation, trailing slash or leading slash.
+
+    Returns:
+        str: The regular expression.
+    """
+    regex = ""
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+            continue
+        if pattern.startswith("/**", index) and index + 3 == len(pattern):
+            regex += "/.*"
+            index += 3
+            continue
+        if char == "*":
+            regex += ".*" if pattern.startswith("**", index) else "[^/]*"
+            index += 2 if pattern.startswith("**", index) else 1
+            continue
+        if char == "?":
+            regex += "[^/]"
+        elif char == "[" and "]" in pattern[index + 1:]:
+            end = pattern.index("]", index + 1)
+            regex += "[" + pattern[index + 1:end].replace("!", "^", 1) + "]"
+            index = end
+        else:
+            regex += re.escape(char)
+        index += 1
+    return regex
+
+
+class GitIgnore:
+    """
+    GitIgnore class for matching paths against the patterns of a .gitignore file.
+
+    Attributes:
+    -----------
+    base : Path
+        The directory containing the .gitignore file; patterns are relative to it.
+    rules : list[tuple[re.Pattern, bool, bool]]
+        The compiled patterns, each with its negation and directory-only flags.
+
+    Methods:
+    --------
+    from_file(file_path: Path) -> GitIgnore
+        Loads the patterns of a .gitignore file.
+    match(self, path: Path, is_dir: bool) -> Optional[bool]
+        Matches a path against the patterns.
+    """
+
+    def __init__(self, base: Path, patterns: Sequence[str]):
+        """
+        Initializes an instance of the class and compiles the patterns.
+
+        Args:
+            base (Path): The directory the patterns are relative to.
+            patterns (Sequence[str]): The lines of the .gitignore file.
+
+        Returns:
+            None
+        """
+        self.base = base
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        for line in patterns:
+            pattern = line.rstrip("\n").rstrip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            pattern = pattern[1:] if negated else pattern
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            regex = _translate_gitignore_pattern(pattern.lstrip("/"))
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            self.rules.append((re.compile(regex + r"\Z"), negated, dir_only))
+
+    @classmethod
+    def from_file(cls, file_path: Path) -> "GitIgnore":
+        """
+        Loads the patterns of a .gitignore file.
+
+        Args:
+            file_path (Path): The path of the .gitignore file.
+
+        Returns:
+            GitIgnore: The matcher of the file.
+        """
+        with open(file_path, "r", encoding="utf-8", errors="replace") as gitignore_file:
+            return cls(file_path.parent, gitignore_file.readlines())
+
+    def match(self, path: Path, is_dir: bool) -> Optional[bool]:
+        """
+        Matches a path against the patterns; the last matching pattern wins.
+
+        Args:
+            path (Path): The path to match, inside the base directory.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            Optional[bool]: True if the path is ignored, False if it is explicitly re-included,
+            and None if no pattern matches.
+        """
+        relative_path = path.relative_to(self.base).as_posix()
+        result = None
+        for regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                result = not negated
+        return result
+
+
+def _ancestor_gitignores(directory: Path) -> list[GitIgnore]:
+    """
+    Loads the .gitignore files of the ancestors of a directory, up to the root of its git
+    repository, ordered from the outermost to the innermost.
+
+    Args:
+        directory (Path): The directory to start from.
+
+    Returns:
+        list[GitIgnore]: The matchers of the ancestor .gitignore files.
+    """
+    ancestors = []
+    for ancestor in Path(os.path.abspath(directory)).parents:
+        if (ancestor / ".gitignore").is_file():
+            ancestors.append(GitIgnore.from_file(ancestor / ".gitignore"))
+        if (ancestor / ".git").exists():
+            break
+    else:
+        return []
+    return ancestors[::-1]
+
+
+def _is_ignored(path: Path, is_dir: bool, gitignores: Sequence[GitIgnore]) -> bool:
+    ignored = False
+    for gitignore in gitignores:
+        result = gitignore.match(path, is_dir)
+        if result is not None:
+            ignored = result
+    return ignored
+
+
+def _matches_any(relative_path: str, globs: Sequence[str]) -> bool:
+    file_name = relative_path.rsplit("/", 1)[-1]
+    return any(
+        fnmatch.fnmatchcase(relative_path, glob) or fnmatch.fnmatchcase(file_name, glob)
+        for glob in globs
+    )
+
+
+def discover_python_files(
+        directory: Path,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        use_gitignore: bool = True,
+        stem_suffix: Optional[str] = "_doc",
+) -> Iterator[Path]:
+    """
+    Yields every Python file to process in a directory tree exactly once, in a stable order.
+
+    The tree is walked a single time. `__init__.py` files and the generated outputs of earlier
+    runs (files whose stem ends with the suffix) are skipped, and so are paths ignored by the
+    .gitignore files found along the way or in the enclosing git repository. Globs are matched
+    against the path relative to the directory and against the file name.
+
+    Args:
+        directory (Path): The directory to walk.
+        include (Optional[Sequence[str]], optional): Globs a file must match. Defaults to "*.py".
+        exclude (Optional[Sequence[str]], optional): Globs of files and directories to skip.
+        use_gitignore (bool, optional): Whether to honour .gitignore files. Defaults to True.
+        stem_suffix (Optional[str], optional): The suffix of generated output files to skip.
+        Defaults to "_doc".
+
+    Returns:
+        Iterator[Path]: The paths of the Python files.
+    """
+    include = include or ["*.py"]
+    exclude = exclude or []
+    gitignores: dict[Path, list[GitIgnore]] = {}
+    directory = Path(directory)
+    root_gitignores = []
+    if use_gitignore and not (directory / ".git").exists():
+        root_gitignores = _ancestor_gitignores(directory)
+    for root, dirs, files in os.walk(directory):
+        root_path = Path(root)
+        if root_path == directory:
+            active = list(root_gitignores)
+        else:
+            active = list(gitignores[root_path.parent])
+        if use_gitignore and (root_path / ".gitignore").is_file():
+            active.append(GitIgnore.from_file(Path(os.path.abspath(root_path / ".gitignore"))))
+        gitignores[root_path] = active
+
+        kept_dirs = []
+        for dir_name in sorted(dirs):
+            dir_path = root_path / dir_name
+            relative_dir = dir_path.relative_to(directory).as_posix()
+            if dir_name == ".git" or _matches_any(relative_dir, exclude):
+                continue
+            if _is_ignored(Path(os.path.abspath(dir_path)), True, active):
+                continue
+            kept_dirs.append(dir_name)
+        dirs[:] = kept_dirs
+
+        for file_name in sorted(files):
+            file_path = root_path / file_name
+            if file_path.suffix != ".py" or file_name == "__init__.py":
+                continue
+            if stem_suffix and file_path.stem.endswith(stem_suffix):
+                continue
+            relative_file = file_path.relative_to(directory).as_posix()
+            if not _matches_any(relative_file, include) or _matches_any(relative_file, exclude):
+                continue
+            if _is_ignored(Path(os.path.abspath(file_path)), False, active):
+                continue
+            yield file_path
@@ -1,157 +1,592 @@
 import ast
-from _ast import FunctionDef, ClassDef, AST
+from _ast import AST
 import logging
-import random
-import time
-import astor
+from .prompt_builder import PromptBuilder
+from typing import Awaitable, Callable, ContextManager, Optional, TYPE_CHECKING
 
-from openai.error import RateLimitError, APIConnectionError
-from typing import TYPE_CHECKING
+from .batching import build_batch_prompt, pack_batches, parse_batch_response
+from .fingerprint import Fingerprint, FingerprintIndex, structural_fingerprint
+from .metrics import MetricsCollector, NodeMetric
+from .node_index import NodeIndex, module_name
+from .tracing import span
+from .scheduler import rank_defs
+from .streaming import extract_docstring
+from .tokens import estimate_tokens
 
 if TYPE_CHECKING:
+    import asyncio
     from . import DocGenDef
     from . import ASTAnalyzer
+    from .cache import DocstringCache
+    from .journal import CheckpointJournal
 
 
-class MethodVisitor(ast.NodeTransformer):
+def collect_defs(
+        tree: AST, node_filter: Optional[Callable[["DocGenDef"], bool]] = None
+) -> list[tuple["DocGenDef", str]]:
+    """
+    collect_defs(tree: AST, node_filter: Optional[Callable[[DocGenDef], bool]] = None)
+     -> list[tuple[DocGenDef, str]]
+
+        Collects the class and function nodes of an AST object in the order in which
+        FileVisitor.visit would document them, see NodeIndex.
+
+        Parameters:
+        -----------
+        tree: AST
+            An AST object to collect the nodes of.
+        node_filter: Optional[Callable[[DocGenDef], bool]]
+            A predicate selecting the nodes to collect. When None, every node is collected.
+
+        Returns:
+        --------
+        list[tuple[DocGenDef, str]]
+            The collected nodes, each paired with a string representing its type."""
+    return NodeIndex(tree).defs(node_filter)
+
+
+class FileVisitor:
     """
     A class that visits and transforms the AST nodes of a Python module.
 
     Attributes:
     -----------
-    file_visitor : 'FileVisitor'
-        An instance of the FileVisitor class.
+    ast_analyzer : ASTAnalyzer
+        An instance of the ASTAnalyzer class.
+    cache : Optional[DocstringCache]
+        The docstring cache consulted before calling the model, if any.
+    node_filter : Optional[Callable[[DocGenDef], bool]]
+        A predicate selecting the nodes to document, if any.
+    prompt_builder : PromptBuilder
+        The builder of the source code sent to the model for every node.
+    saved_prompt_tokens : int
+        The estimated number of prompt tokens saved by the prompt builder.
+    batch_token_budget : int
+        The maximum estimated number of prompt tokens of a batch request, or 0 to send every
+        node in its own request.
+    metrics : MetricsCollector
+        The collector of the per-node metrics.
+    journal : Optional[CheckpointJournal]
+        The journal every response is checkpointed to and replayed from, if any.
+    skipped_nodes : list[str]
+        The names of the nodes left undocumented because the budget of the run ran out.
+    fingerprints : Optional[FingerprintIndex]
+        The index of the structural fingerprints of the documented nodes, if any.
+    deferred_duplicates : list[int]
+        The indices of the nodes planned by plan_batches that wait for the docstring of a
+        structurally identical node.
+    node_index : Optional[NodeIndex]
+        The index of the nodes of the AST object last visited, built once by index.
+
+    Methods: -------- obtain_pydoc_wrapper(node: DocGenDef, source_code: str) -> str: Wraps the
+    obtain_pydoc method of the ASTAnalyzer class and handles RateLimitError exceptions.
+
+    visit_def(node: DocGenDef, str_type: str) -> DocGenDef:
+        Visits and transforms the DocGenDef node of the AST.
+
+    visit(tree: AST):
+        Visits and transforms the AST nodes of a Python module.
+
+    collect_defs(tree: AST) -> list[tuple[DocGenDef, str]]:
+        Collects the DocGenDef nodes in the order in which visit would document them.
+
+    avisit(tree: AST, concurrency: int):
+        Documents the AST nodes of a Python module with concurrent requests.
 
-    Methods:
-    --------
-    visit_FunctionDef(node: FunctionDef) -> FunctionDef:
-        Visits and transforms the FunctionDef node of the AST.
+    visit_batched(tree: AST):
+        Documents the AST nodes of a Python module, packing small nodes into batch requests.
+
+    prepare_prompts(tree: AST):
+        Builds the prompts of the AST nodes of a Python module ahead of their visit.
+
+    replay(node: DocGenDef) -> Optional[str]:
+        Looks up the response of a node in the checkpoint journal.
+
+    checkpoint(node: DocGenDef, response: str):
+        Records the response of a node in the checkpoint journal.
+
+    journal_name(node: DocGenDef) -> str:
+        Names a node in the checkpoint journal.
+
+    within_budget(*names: str) -> bool:
+        Checks whether the budget of the run allows requesting the docstrings of nodes.
+
+    index_fingerprints(tree: AST):
+        Computes the structural fingerprints of the nodes of a Python module.
+
+    reuse(node: DocGenDef, name: str, str_type: str) -> Optional[str]:
+        Looks up the docstring of a structurally identical node.
+
+    remember(node: DocGenDef, response: str):
+        Records the docstring of a node in the fingerprint index.
+
+    index(tree: AST) -> NodeIndex:
+        Indexes the nodes of a Python module to document, once.
 
     """
 
-    def __init__(self, file_visitor: "FileVisitor"):
+    def __init__(
+            self,
+            ast_analyzer: "ASTAnalyzer",
+            cache: Optional["DocstringCache"] = None,
+            node_filter: Optional[Callable[["DocGenDef"], bool]] = None,
+            prompt_builder: Optional[PromptBuilder] = None,
+            batch_token_budget: int = 0,
+            metrics: Optional[MetricsCollector] = None,
+            journal: Optional["CheckpointJournal"] = None,
+            fingerprints: Optional[FingerprintIndex] = None,
+    ):
         """
-        __init__(self, file_visitor: 'FileVisitor')
+        __init__(self, ast_analyzer: ASTAnalyzer, cache: Optional[DocstringCache] = None,
+         node_filter: Optional[Callable[[DocGenDef], bool]] = None,
+         prompt_builder: Optional[PromptBuilder] = None, batch_token_budget: int = 0,
+         metrics: Optional[MetricsCollector] = None,
+         journal: Optional[CheckpointJournal] = None,
+         fingerprints: Optional[FingerprintIndex] = None)
 
-            Initializes an instance of the class with a given file visitor object.
+            Initializes an instance of the class with a given ASTAnalyzer object.
 
             Parameters:
             -----------
-            file_visitor: 'FileVisitor'
-                An object of the FileVisitor class."""
-        self.file_visitor = file_visitor
+            ast_analyzer: ASTAnalyzer
+                An object of the ASTAnalyzer class.
+            cache: Optional[DocstringCache]
+                A docstring cache to consult before calling the model.
+            node_filter: Optional[Callable[[DocGenDef], bool]]
+                A predicate selecting the nodes to document. Nodes it rejects are left
+                untouched. When None, every node is documented.
+            prompt_builder: Optional[PromptBuilder]
+                The builder of the source code sent for every node. When None, a PromptBuilder
+                with the default token budget is used.
+            batch_token_budget: int
+                The maximum estimated number of prompt tokens of a batch request. When 0,
+                every node is sent in its own request.
+            metrics: Optional[MetricsCollector]
+                The collector of the per-node metrics. When None, a new collector is used.
+            journal: Optional[CheckpointJournal]
+                The journal every response is checkpointed to as soon as it is obtained, and
+                replayed from before the cache and the model are consulted.
+            fingerprints: Optional[FingerprintIndex]
+                The index reusing the docstrings of structurally identical nodes, consulted
+                after the journal and the cache. When None, every node is sent to the model."""
+        self.ast_analyzer = ast_analyzer
+        self.cache = cache
+        self.node_filter = node_filter
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.saved_prompt_tokens = 0
+        self.batch_token_budget = batch_token_budget
+        self.metrics = metrics or MetricsCollector()
+        self.journal = journal
+        self.journal_file_hash: Optional[str] = None
+        self.prepared_prompts: dict[int, str] = {}
+        self.skipped_nodes: list[str] = []
+        self.fingerprints = fingerprints
+        self.node_fingerprints: dict[int, Fingerprint] = {}
+        self.deferred_duplicates: list[int] = []
+        self.node_index: Optional[NodeIndex] = None
 
-    def visit_FunctionDef(self, node: FunctionDef) -> FunctionDef:  # pylint: disable=invalid-name
+    def call_with_retries(self, request: Callable[[], str]) -> str:
         """
-        visit_FunctionDef(self, node: FunctionDef) -> FunctionDef
+        call_with_retries(self, request: Callable[[], str]) -> str
 
-            Visits a FunctionDef node and
-             returns the result of the visit_def method of the file visitor object.
+            Calls a request function with the retry executor of the ASTAnalyzer, which retries
+            failed requests with an exponential backoff up to its maximum number of attempts and
+            lowers the rate of the shared rate limiter on RateLimitError exceptions.
 
             Parameters:
             -----------
-            node: FunctionDef
-                A FunctionDef node to be visited.
+            request: Callable[[], str]
+                A function sending the request and returning the response.
 
             Returns:
             --------
-            FunctionDef
-                The result of the visit_def method of the file visitor object."""
-        return self.file_visitor.visit_def(node, "Function")
+            str
+                The response of the request."""
+        return self.ast_analyzer.retry_executor.call(request, self.ast_analyzer.rate_limiter)
 
+    async def acall_with_retries(self, request: Callable[[], Awaitable[str]]) -> str:
+        """
+        acall_with_retries(self, request: Callable[[], Awaitable[str]]) -> str
 
-class ClassVisitor(ast.NodeTransformer):
-    """
-    A class that visits and transforms the AST nodes of a Python module.
+            Awaits a request coroutine function and retries it like call_with_retries, without
+            blocking the other requests while waiting.
 
-    Attributes:
-    -----------
-    file_visitor : 'FileVisitor'
-        An instance of the FileVisitor class.
+            Parameters:
+            -----------
+            request: Callable[[], Awaitable[str]]
+                A coroutine function sending the request and returning the response.
+
+            Returns:
+            --------
+            str
+                The response of the request."""
+        return await self.ast_analyzer.retry_executor.acall(
+            request, self.ast_analyzer.rate_limiter
+        )
+
+    def obtain_pydoc_wrapper(self, node: "DocGenDef", source_code: str) -> str:
+        """
+        obtain_pydoc_wrapper(self, node: DocGenDef, source_code: str) -> str
 
-    Methods:
-    --------
-    visit_ClassDef(node: ClassDef) -> ClassDef:
-        Visits and transforms the ClassDef node of the AST.
+            Wraps the obtain_pydoc method of the ASTAnalyzer class and retries it with
+            call_with_retries.
 
-    """
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node.
+            source_code: str
+                A string containing the source code.
+
+            Returns:
+            --------
+            str
+                The PyDoc string obtained from the source code."""
+        return self.call_with_retries(lambda: self.ast_analyzer.obtain_pydoc(source_code))
+
+    def visit_def(self, node: "DocGenDef", str_type: str) -> "DocGenDef":
+        """
+        visit_def(self, node: DocGenDef, str_type: str) -> DocGenDef
+
+            Visits a DocGenDef node and adds a new docstring obtained from the source code to the
+            node. The checkpoint journal, the docstring cache and the fingerprint index, if any,
+            are consulted before the model is called. Nodes rejected by the node filter, and
+            nodes that would need a request once the budget of the run has run out, are
+            returned unchanged.
+
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node to be visited.
+            str_type: str
+                A string representing the type of the node.
+
+            Returns:
+            --------
+            DocGenDef
+                The visited DocGenDef node with the new docstring added."""
+        if self.node_filter is not None and not self.node_filter(node):
+            logging.debug("Skipping %s name: %s", str_type, node.name)
+            return node
+        with span("visit_def", node=node.name, kind=str_type):
+            source_code = self.build_prompt(node)
+            response, cache_key = self.lookup(node, source_code)
+            if response is not None:
+                self.track_hit(node.name, str_type)
+            else:
+                response = self.reuse(node, node.name, str_type)
+            if response is None:
+                if not self.within_budget(node.name):
+                    return node
+                logging.info("%s name: %s", str_type, node.name)
+                with self.track_node(node.name, str_type):
+                    response = self.obtain_pydoc_wrapper(node, source_code)
+                self.checkpoint(node, response)
+                if cache_key is not None:
+                    self.cache.put(cache_key, response)
+            logging.info(response)
+            self.remember(node, response)
+            self.ast_analyzer.add_docstring_to_ast(node, new_docstring=response)
+        return node
+
+    def track_hit(self, name: str, kind: str, reused: bool = False):
+        """
+        track_hit(self, name: str, kind: str, reused: bool = False)
 
-    def __init__(self, file_visitor: "FileVisitor"):
+            Records the metric of a node whose docstring was obtained without a request.
+
+            Parameters:
+            -----------
+            name: str
+                The name of the node.
+            kind: str
+                A string representing the type of the node.
+            reused: bool
+                True if the docstring was reused from a structurally identical node, False if
+                it came from the checkpoint journal or the docstring cache."""
+        with self.track_node(name, kind) as metric:
+            metric["cache_hit"] = not reused
+            metric["reused"] = reused
+
+    def index_fingerprints(self, tree: AST):
         """
-        __init__(self, file_visitor: 'FileVisitor')
+        index_fingerprints(self, tree: AST)
 
-            Initializes an instance of the class with a given file visitor object.
+            Computes the structural fingerprints of the nodes of an AST object, if there is a
+            fingerprint index. The docstrings of the nodes rejected by the node filter are final,
+            so they are added to the index for the other nodes to reuse.
 
             Parameters:
             -----------
-            file_visitor: 'FileVisitor'
-                An object of the FileVisitor class."""
-        self.file_visitor = file_visitor
+            tree: AST
+                An AST object to fingerprint the nodes of."""
+        if self.fingerprints is None:
+            return
+        for entry in self.index(tree):
+            fingerprint = structural_fingerprint(entry.node)
+            self.node_fingerprints[id(entry.node)] = fingerprint
+            if (
+                    entry.docstring
+                    and self.node_filter is not None
+                    and not self.node_filter(entry.node)
+            ):
+                self.fingerprints.add(fingerprint, entry.docstring)
 
-    def visit_ClassDef(self, node: ClassDef) -> ClassDef:  # pylint: disable=invalid-name
+    def reuse(self, node: "DocGenDef", name: str, str_type: str) -> Optional[str]:
         """
-        visit_ClassDef(self, node: ClassDef) -> ClassDef
+        reuse(self, node: DocGenDef, name: str, str_type: str) -> Optional[str]
 
-            Visits a ClassDef node
-             and returns the result of the visit_def method of the file visitor object.
+            Looks up the docstring of a structurally identical node in the fingerprint index,
+            adapted to the identifiers of the node, and records its metric.
 
             Parameters:
             -----------
-            node: ClassDef
-                A ClassDef node to be visited.
+            node: DocGenDef
+                A DocGenDef node of the fingerprinted AST object.
+            name: str
+                The name of the node in the metrics.
+            str_type: str
+                A string representing the type of the node.
 
             Returns:
             --------
-            ClassDef
-                The result of the visit_def method of the file visitor object."""
-        return self.file_visitor.visit_def(node, "Class")
+            Optional[str]
+                A response holding the reused docstring, or None."""
+        fingerprint = self.node_fingerprints.get(id(node))
+        if fingerprint is None:
+            return None
+        docstring = self.fingerprints.lookup(fingerprint)
+        if docstring is None:
+            return None
+        logging.info("Reusing the docstring of a structurally identical node for %s", name)
+        self.track_hit(name, str_type, reused=True)
+        return f'"""{docstring}"""'
 
+    def remember(self, node: "DocGenDef", response: str):
+        """
+        remember(self, node: DocGenDef, response: str)
 
-class FileVisitor:
-    """
-    A class that visits and transforms the AST nodes of a Python module.
+            Records the docstring of a response in the fingerprint index, if any.
 
-    Attributes:
-    -----------
-    ast_analyzer : ASTAnalyzer
-        An instance of the ASTAnalyzer class.
-    class_visitor : ClassVisitor
-        An instance of the ClassVisitor class.
-    method_visitor : MethodVisitor
-        An instance of the MethodVisitor class.
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node of the fingerprinted AST object.
+            response: str
+                The response obtained for the node."""
+        fingerprint = self.node_fingerprints.get(id(node))
+        if fingerprint is not None:
+            self.fingerprints.add(fingerprint, extract_docstring(response)[0])
 
-    Methods: -------- obtain_pydoc_wrapper(node: DocGenDef, source_code: str) -> str: Wraps the
-    obtain_pydoc method of the ASTAnalyzer class and handles RateLimitError exceptions.
+    def split_duplicates(
+            self, indices: list[int], collected: list[tuple["DocGenDef", str]]
+    ) -> tuple[list[int], list[int]]:
+        """
+        split_duplicates(self, indices: list[int], collected: list[tuple[DocGenDef, str]])
+         -> tuple[list[int], list[int]]
 
-    visit_def(node: DocGenDef, str_type: str) -> DocGenDef:
-        Visits and transforms the DocGenDef node of the AST.
+            Splits the indices of nodes documented concurrently into the first node of every
+            structural fingerprint and the nodes that can wait for its docstring to reuse it.
 
-    visit(tree: AST):
-        Visits and transforms the AST nodes of a Python module.
+            Parameters:
+            -----------
+            indices: list[int]
+                The indices of the nodes.
+            collected: list[tuple[DocGenDef, str]]
+                All collected nodes.
 
-    """
+            Returns:
+            --------
+            tuple[list[int], list[int]]
+                The indices to document first and the deferred indices."""
+        seen: set[str] = set()
+        first, deferred = [], []
+        for index in indices:
+            fingerprint = self.node_fingerprints.get(id(collected[index][0]))
+            if fingerprint is not None and fingerprint.digest in seen:
+                deferred.append(index)
+                continue
+            if fingerprint is not None:
+                seen.add(fingerprint.digest)
+            first.append(index)
+        return first, deferred
 
-    def __init__(self, ast_analyzer: "ASTAnalyzer"):
+    def build_prompt(self, node: "DocGenDef") -> str:
         """
-        __init__(self, ast_analyzer: ASTAnalyzer)
+        build_prompt(self, node: DocGenDef) -> str
 
-            Initializes an instance of the class with a given ASTAnalyzer object and creates
-            instances of ClassVisitor and MethodVisitor classes.
+            Builds the source code sent to the model for a node with the prompt builder, and
+            logs and accumulates the number of tokens it saved, estimated from the lines of the
+            node in the node index. A prompt built ahead by prepare_prompts is returned instead.
 
             Parameters:
             -----------
-            ast_analyzer: ASTAnalyzer
-                An object of the ASTAnalyzer class."""
-        self.ast_analyzer = ast_analyzer
-        self.class_visitor = ClassVisitor(self)
-        self.method_visitor = MethodVisitor(self)
+            node: DocGenDef
+                A DocGenDef node.
 
-    def obtain_pydoc_wrapper(self, node: "DocGenDef", source_code: str) -> str:
+            Returns:
+            --------
+            str
+                The source code to send for the node."""
+        prepared_prompt = self.prepared_prompts.pop(id(node), None)
+        if prepared_prompt is not None:
+            return prepared_prompt
+        entry = None if self.node_index is None else self.node_index.get(node)
+        with span("build_prompt", node=node.name):
+            prompt = self.prompt_builder.build(
+                node, None if entry is None else self.node_index.source_segment(entry)
+            )
+        self.saved_prompt_tokens += prompt.saved_tokens
+        logging.info(
+            "Prompt for %s: ~%d tokens (~%d saved)",
+            node.name,
+            prompt.prompt_tokens,
+            prompt.saved_tokens,
+        )
+        return prompt.source
+
+    def lookup(self, node: "DocGenDef", source_code: str) -> tuple[Optional[str], Optional[str]]:
         """
-        obtain_pydoc_wrapper(self, node: DocGenDef, source_code: str) -> str
+        lookup(self, node: DocGenDef, source_code: str) -> tuple[Optional[str], Optional[str]]
+
+            Looks up the response of a node in the checkpoint journal and then in the docstring
+            cache, if any. A docstring cache lookup that misses is recorded in the metrics.
+
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node.
+            source_code: str
+                The prompt source code of the node.
+
+            Returns:
+            --------
+            tuple[Optional[str], Optional[str]]
+                The response, or None on a miss, and the cache key of the node, or None if there
+                is no docstring cache."""
+        response = self.replay(node)
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache_key(source_code)
+            if response is None:
+                response = self.cache.get(cache_key)
+                if response is None:
+                    self.metrics.record_cache_miss(str(self.ast_analyzer.file_path or "<unknown>"))
+        return response, cache_key
+
+    def within_budget(self, *names: str) -> bool:
+        """
+        within_budget(self, *names: str) -> bool
+
+            Checks whether the budget of the run, if any, allows requesting the docstrings of
+            nodes. Once it has run out, the nodes are recorded as skipped instead.
+
+            Parameters:
+            -----------
+            *names: str
+                The names of the nodes.
+
+            Returns:
+            --------
+            bool
+                True if the request may be sent."""
+        budget = self.ast_analyzer.budget
+        if budget is None or not budget.exhausted():
+            return True
+        for name in names:
+            logging.info("Budget exhausted (%s), skipping %s", budget.exhausted_reason(), name)
+        self.skipped_nodes.extend(names)
+        return False
+
+    def visit(self, tree: AST):
+        """
+        visit(self, tree: AST)
+
+            Visits an AST object and documents its classes, then its functions, in the order of
+            its node index. Removes any messages from the ASTAnalyzer object after the classes
+            and after the functions. When a batch token budget is set, visit_batched is used
+            instead. When the run has a budget, the nodes are visited in the order of
+            collect_defs instead, the most valuable first.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to be visited."""
+        if self.batch_token_budget > 0:
+            self.visit_batched(tree)
+            return
+        self.index_journal(tree)
+        self.index_fingerprints(tree)
+        if self.ast_analyzer.budget is not None:
+            for node, str_type in self.collect_defs(tree):
+                self.visit_def(node, str_type)
+            self.ast_analyzer.remove_messages()
+            return
+        index = self.index(tree)
+        for str_type in ("Class", "Function"):
+            for entry in index:
+                if entry.kind == str_type:
+                    self.visit_def(entry.node, str_type)
+            self.ast_analyzer.remove_messages()
+
+    def index(self, tree: AST) -> NodeIndex:
+        """
+        index(self, tree: AST) -> NodeIndex
+
+            Indexes the classes and functions of an AST object to document in a single
+            traversal, named after the module of the file of the ASTAnalyzer object, and
+            returns the index. The index is kept, so every later stage of the visit looks the
+            nodes up in it instead of walking the tree again; it must be built before any
+            docstring is added.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to index.
+
+            Returns:
+            --------
+            NodeIndex
+                The index of the AST object."""
+        if self.node_index is None or self.node_index.tree is not tree:
+            file_path = self.ast_analyzer.file_path
+            with span("node_index"):
+                self.node_index = NodeIndex(
+                    tree,
+                    module_name(file_path) if file_path is not None else "",
+                    self.ast_analyzer.source_code if tree is self.ast_analyzer.tree else None,
+                )
+        return self.node_index
+
+    def collect_defs(self, tree: AST) -> list[tuple["DocGenDef", str]]:
+        """
+        collect_defs(self, tree: AST) -> list[tuple[DocGenDef, str]]
+
+            Collects the class and function nodes of the index of an AST object in the order in
+            which visit would document them, or by priority when the run has a budget (see
+            rank_defs). Nodes rejected by the node filter are left out.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to collect the nodes of.
+
+            Returns:
+            --------
+            list[tuple[DocGenDef, str]]
+                The collected nodes, each paired with a string representing its type."""
+        index = self.index(tree)
+        collected = index.defs(self.node_filter)
+        if self.ast_analyzer.budget is not None:
+            return rank_defs(index, collected)
+        return collected
+
+    async def aobtain_pydoc_wrapper(self, node: "DocGenDef", source_code: str) -> str:
+        """
+        aobtain_pydoc_wrapper(self, node: DocGenDef, source_code: str) -> str
 
-            Wraps the obtain_pydoc method of the ASTAnalyzer class and handles RateLimitError
-            exceptions by retrying the method after a random delay.
+            Wraps the aobtain_pydoc coroutine of the ASTAnalyzer class and retries it with
+            acall_with_retries.
 
             Parameters:
             -----------
@@ -164,56 +599,549 @@ class FileVisitor:
             --------
             str
                 The PyDoc string obtained from the source code."""
-        try:
-            return self.ast_analyzer.obtain_pydoc(source_code)
-        except RateLimitError:
-            time.sleep(random.randint(5, 10))
-            return self.obtain_pydoc_wrapper(node, source_code)
-        except APIConnectionError as api_conn_error:
-            logging.warning(
-                "An api connection error has occurred: " + api_conn_error.error + "\nWaiting 30s to retry\n")
-            time.sleep(30)
-            return self.obtain_pydoc_wrapper(node, source_code)
+        return await self.acall_with_retries(lambda: self.ast_analyzer.aobtain_pydoc(source_code))
 
-    def visit_def(self, node: "DocGenDef", str_type: str) -> "DocGenDef":
+    async def aobtain_docstring(
+            self,
+            node: "DocGenDef",
+            str_type: str,
+            source_code: str,
+            semaphore: "asyncio.Semaphore",
+    ) -> Optional[str]:
         """
-        visit_def(self, node: DocGenDef, str_type: str) -> DocGenDef
+        aobtain_docstring(self, node: DocGenDef, str_type: str, source_code: str,
+         semaphore: asyncio.Semaphore) -> Optional[str]
 
-            Visits a DocGenDef node and adds a new docstring obtained from the source code to the
-            node.
+            Obtains the response for a single node from the checkpoint journal, the docstring
+            cache or the fingerprint index or, on a miss, from the model while holding the
+            semaphore. The budget of the run is checked once the semaphore is acquired.
 
             Parameters:
             -----------
             node: DocGenDef
-                A DocGenDef node to be visited.
+                A DocGenDef node.
             str_type: str
                 A string representing the type of the node.
+            source_code: str
+                A string containing the source code of the node.
+            semaphore: asyncio.Semaphore
+                The semaphore limiting the number of concurrent requests.
 
             Returns:
             --------
-            DocGenDef
-                The visited DocGenDef node with the new docstring added."""
-        time.sleep(random.randint(2, 5))
-        logging.info("%s name: %s", str_type, node.name)
-        source_code = astor.to_source(node)
-        response = self.obtain_pydoc_wrapper(node, source_code)
-        logging.info(response)
-        self.ast_analyzer.add_docstring_to_ast(node, new_docstring=response)
-        return node
+            Optional[str]
+                The response obtained for the node, or None if the budget ran out."""
+        with span("obtain_docstring", node=node.name, kind=str_type):
+            response, cache_key = self.lookup(node, source_code)
+            if response is not None:
+                self.track_hit(node.name, str_type)
+                return response
+            response = self.reuse(node, node.name, str_type)
+            if response is not None:
+                return response
+            async with semaphore:
+                if not self.within_budget(node.name):
+                    return None
+                with self.track_node(node.name, str_type):
+                    logging.info("%s name: %s", str_type, node.name)
+                    response = await self.aobtain_pydoc_wrapper(node, source_code)
+            self.checkpoint(node, response)
+            if cache_key is not None:
+                self.cache.put(cache_key, response)
+            return response
 
-    def visit(self, tree: AST):
+    async def avisit(self, tree: AST, concurrency: int = 4):
         """
-        visit(self, tree: AST)
+        avisit(self, tree: AST, concurrency: int = 4)
+
+            Documents an AST object in two phases. First, every class and function node is
+            collected and its prompt is built. Then the prompts are dispatched with at
+            most `concurrency` requests in flight, and the docstrings are added to the nodes in
+            the order in which visit would add them. When a batch token budget is set, the
+            batches planned by plan_batches are dispatched instead of single nodes.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to be visited.
+            concurrency: int
+                The maximum number of concurrent requests."""
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        if self.batch_token_budget > 0:
+            collected, sources, names, responses, batches = self.plan_batches(tree)
+            for batch_responses in await asyncio.gather(
+                    *(
+                        self.aobtain_batch(batch, collected, sources, names, semaphore)
+                        for batch in batches
+                    )
+            ):
+                responses.update(batch_responses)
+            for batch_responses in await asyncio.gather(
+                    *(
+                        self.aobtain_batch([index], collected, sources, names, semaphore)
+                        for index in self.resolve_duplicates(collected, names, responses)
+                    )
+            ):
+                responses.update(batch_responses)
+            self.add_responses(collected, responses)
+            return
+        self.index_journal(tree)
+        self.index_fingerprints(tree)
+        collected = self.collect_defs(tree)
+        sources = [self.build_prompt(node) for node, _ in collected]
+        responses: list[Optional[str]] = [None] * len(collected)
+        # Structurally identical nodes wait for the first of them, to reuse its docstring.
+        for indices in self.split_duplicates(list(range(len(collected))), collected):
+            for index, response in zip(
+                    indices,
+                    await asyncio.gather(
+                        *(
+                            self.aobtain_docstring(
+                                collected[index][0], collected[index][1], sources[index], semaphore
+                            )
+                            for index in indices
+                        )
+                    ),
+            ):
+                if response is not None:
+                    responses[index] = response
+                    self.remember(collected[index][0], response)
+        for (node, _), response in zip(collected, responses):
+            if response is not None:
+                logging.info(response)
+                self.ast_analyzer.add_docstring_to_ast(node, new_docstring=response)
+
+    def batch_names(self, tree: AST, collected: list[tuple["DocGenDef", str]]) -> list[str]:
+        """
+        batch_names(self, tree: AST, collected: list[tuple[DocGenDef, str]]) -> list[str]
+
+            Names the collected nodes by the unique name of their entry in the node index: their
+            qualified name, numbered if another node of the module has the same one (e.g. a
+            function defined in both branches of an if statement).
+
+            Parameters:
+            -----------
+            tree: AST
+                The AST object the nodes were collected from.
+            collected: list[tuple[DocGenDef, str]]
+                The collected nodes.
+
+            Returns:
+            --------
+            list[str]
+                The unique names of the nodes."""
+        index = self.index(tree)
+        return [index.get(node).unique_name for node, _ in collected]
+
+    def plan_batches(self, tree: AST) -> tuple[
+        list[tuple["DocGenDef", str]], list[str], list[str], dict[int, str], list[list[int]]
+    ]:
+        """
+        plan_batches(self, tree: AST) -> tuple[list[tuple[DocGenDef, str]], list[str],
+         list[str], dict[int, str], list[list[int]]]
+
+            Collects the nodes of an AST object, builds their prompts, looks them up in the
+            checkpoint journal, the docstring cache and the fingerprint index and packs the
+            remaining nodes into batches within the batch token budget. Nodes structurally
+            identical to a node of a batch are deferred to deferred_duplicates instead.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to plan the batches of.
+
+            Returns:
+            --------
+            tuple
+                The collected nodes, their prompt source code, their unique names, the cached
+                responses keyed by node index, and the node indices of every batch."""
+        self.index_journal(tree)
+        self.index_fingerprints(tree)
+        collected = self.collect_defs(tree)
+        sources = [self.build_prompt(node) for node, _ in collected]
+        names = self.batch_names(tree, collected)
+        responses: dict[int, str] = {}
+        for index, source_code in enumerate(sources):
+            response, _ = self.lookup(collected[index][0], source_code)
+            if response is not None:
+                self.track_hit(names[index], collected[index][1])
+            else:
+                response = self.reuse(collected[index][0], names[index], collected[index][1])
+            if response is not None:
+                responses[index] = response
+                self.remember(collected[index][0], response)
+        pending, self.deferred_duplicates = self.split_duplicates(
+            [index for index in range(len(collected)) if index not in responses], collected
+        )
+        batches = [
+            [pending[position] for position in batch]
+            for batch in pack_batches(
+                [estimate_tokens(sources[index]) for index in pending], self.batch_token_budget
+            )
+        ]
+        return collected, sources, names, responses, batches
+
+    def track_node(self, name: str, kind: str) -> ContextManager[NodeMetric]:
+        """
+        track_node(self, name: str, kind: str) -> ContextManager[NodeMetric]
+
+            Tracks the metrics of a node of the file of the ASTAnalyzer object.
+
+            Parameters:
+            -----------
+            name: str
+                The name of the node.
+            kind: str
+                A string representing the type of the node.
+
+            Returns:
+            --------
+            ContextManager[NodeMetric]
+                A context manager yielding the metric of the node."""
+        return self.metrics.track_node(
+            str(self.ast_analyzer.file_path or "<unknown>"),
+            name,
+            kind,
+            self.ast_analyzer.backend_identity.model,
+        )
+
+    def prepare_prompts(self, tree: AST):
+        """
+        prepare_prompts(self, tree: AST)
+
+            Builds the prompts of the nodes that visit will document, before any docstring is
+            added, like avisit does, so the CPU work of the prompt builder can be done apart
+            from the requests, e.g. in another thread while the previous file is documented.
+
+            Parameters:
+            -----------
+            tree: AST
+                An AST object to build the prompts of."""
+        for node, _ in self.collect_defs(tree):
+            self.prepared_prompts[id(node)] = self.build_prompt(node)
+
+    def index_journal(self, tree: AST):
+        """
+        index_journal(self, tree: AST)
+
+            Indexes the nodes of an AST object, whose unique names (see batch_names) name them in
+            the checkpoint journal, and hashes the source code of the file. Every node is named,
+            whatever the node filter, so the names do not depend on the options of a run.
+
+            Parameters:
+            -----------
+            tree: AST
+                The AST object loaded from the source code of the ASTAnalyzer object."""
+        if self.journal is None or self.ast_analyzer.source_code is None:
+            return
+        self.index(tree)
+        self.journal_file_hash = self.journal.file_hash(self.ast_analyzer.source_code)
+
+    def replay(self, node: "DocGenDef") -> Optional[str]:
+        """
+        replay(self, node: DocGenDef) -> Optional[str]
+
+            Looks up the response of a node in the checkpoint journal.
+
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node of the indexed AST object.
+
+            Returns:
+            --------
+            Optional[str]
+                The journaled response, or None if there is none or no journal."""
+        if self.journal is None or self.journal_file_hash is None:
+            return None
+        return self.journal.get(self.journal_file_hash, self.journal_name(node))
+
+    def checkpoint(self, node: "DocGenDef", response: str):
+        """
+        checkpoint(self, node: DocGenDef, response: str)
+
+            Records the response of a node in the checkpoint journal, if any.
+
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node of the indexed AST object.
+            response: str
+                The response obtained from the model for the node."""
+        if self.journal is None or self.journal_file_hash is None:
+            return
+        self.journal.record(self.journal_file_hash, self.journal_name(node), response)
+
+    def journal_name(self, node: "DocGenDef") -> str:
+        """
+        journal_name(self, node: DocGenDef) -> str
+
+            Names a node in the checkpoint journal by the unique name of its entry in the node
+            index, or by its name if it is not indexed.
+
+            Parameters:
+            -----------
+            node: DocGenDef
+                A DocGenDef node.
+
+            Returns:
+            --------
+            str
+                The name of the node in the journal."""
+        entry = None if self.node_index is None else self.node_index.get(node)
+        return node.name if entry is None else entry.unique_name
+
+    def cache_key(self, source_code: str) -> str:
+        """
+        cache_key(self, source_code: str) -> str
+
+            Computes the docstring cache key of the prompt source code of a node.
+
+            Parameters:
+            -----------
+            source_code: str
+                The prompt source code of the node.
+
+            Returns:
+            --------
+            str
+                The cache key."""
+        return self.cache.make_key(
+            source_code,
+            self.ast_analyzer.model_kwargs,
+            self.ast_analyzer.prepend_prompt,
+            self.ast_analyzer.backend_identity,
+        )
+
+    def split_batch_response(
+            self, batch: list[int], names: list[str], response: str
+    ) -> dict[int, str]:
+        """
+        split_batch_response(self, batch: list[int], names: list[str], response: str)
+         -> dict[int, str]
+
+            Splits the response to a batch prompt into the docstrings of its nodes and stores
+            them in the docstring cache.
+
+            Parameters:
+            -----------
+            batch: list[int]
+                The node indices of the batch.
+            names: list[str]
+                The unique names of all nodes.
+            response: str
+                The response to the batch prompt.
+
+            Returns:
+            --------
+            dict[int, str]
+                The docstrings found in the response, keyed by node index."""
+        docstrings = parse_batch_response(response, [names[index] for index in batch])
+        results = {index: docstrings[names[index]] for index in batch if names[index] in docstrings}
+        missing = [names[index] for index in batch if index not in results]
+        if missing:
+            logging.warning(
+                "Malformed batch response, requesting separately: %s", ", ".join(missing)
+            )
+        return results
+
+    def obtain_batch(
+            self,
+            batch: list[int],
+            collected: list[tuple["DocGenDef", str]],
+            sources: list[str],
+            names: list[str],
+    ) -> dict[int, str]:
+        """
+        obtain_batch(self, batch: list[int], collected: list[tuple[DocGenDef, str]],
+         sources: list[str], names: list[str]) -> dict[int, str]
+
+            Obtains the docstrings of a batch of nodes in a single request. Nodes missing from a
+            malformed response, and batches of a single node, are requested separately. Nodes
+            are skipped once the budget of the run has run out.
+
+            Parameters:
+            -----------
+            batch: list[int]
+                The node indices of the batch.
+            collected: list[tuple[DocGenDef, str]]
+                All collected nodes.
+            sources: list[str]
+                The prompt source code of all nodes.
+            names: list[str]
+                The unique names of all nodes.
+
+            Returns:
+            --------
+            dict[int, str]
+                The responses of the nodes of the batch, keyed by node index, without the
+                skipped nodes."""
+        if not self.within_budget(*(names[index] for index in batch)):
+            return {}
+        results: dict[int, str] = {}
+        if len(batch) > 1:
+            logging.info("Batch: %s", ", ".join(names[index] for index in batch))
+            batch_prompt = build_batch_prompt([(names[index], sources[index]) for index in batch])
+            with self.track_node(",".join(names[index] for index in batch), "Batch") as metric:
+                response = self.call_with_retries(
+                    lambda: self.ast_analyzer.obtain_pydoc_batch(batch_prompt, len(batch))
+                )
+                results = self.split_batch_response(batch, names, response)
+                # The nodes missing from a malformed response are counted by their own requests.
+                metric["nodes"] = len(results)
+            for index, node_response in results.items():
+                self.checkpoint(collected[index][0], node_response)
+        for index in batch:
+            if index not in results and self.within_budget(names[index]):
+                logging.info("%s name: %s", collected[index][1], names[index])
+                with self.track_node(names[index], collected[index][1]):
+                    results[index] = self.obtain_pydoc_wrapper(collected[index][0], sources[index])
+                self.checkpoint(collected[index][0], results[index])
+        if self.cache is not None:
+            for index, response in results.items():
+                self.cache.put(self.cache_key(sources[index]), response)
+        return results
+
+    async def aobtain_batch(
+            self,
+            batch: list[int],
+            collected: list[tuple["DocGenDef", str]],
+            sources: list[str],
+            names: list[str],
+            semaphore: "asyncio.Semaphore",
+    ) -> dict[int, str]:
+        """
+        aobtain_batch(self, batch: list[int], collected: list[tuple[DocGenDef, str]],
+         sources: list[str], names: list[str], semaphore: asyncio.Semaphore) -> dict[int, str]
+
+            Obtains the docstrings of a batch of nodes like obtain_batch, holding the semaphore
+            for every request. The budget of the run is checked once the semaphore is acquired.
+
+            Parameters:
+            -----------
+            batch: list[int]
+                The node indices of the batch.
+            collected: list[tuple[DocGenDef, str]]
+                All collected nodes.
+            sources: list[str]
+                The prompt source code of all nodes.
+            names: list[str]
+                The unique names of all nodes.
+            semaphore: asyncio.Semaphore
+                The semaphore limiting the number of concurrent requests.
 
-            Visits an AST object and visits its ClassDef and FunctionDef nodes using the
-            ClassVisitor and MethodVisitor objects respectively. Removes any messages from the
-            ASTAnalyzer object after each visit.
+            Returns:
+            --------
+            dict[int, str]
+                The responses of the nodes of the batch, keyed by node index, without the
+                skipped nodes."""
+        results: dict[int, str] = {}
+        if len(batch) > 1:
+            batch_prompt = build_batch_prompt([(names[index], sources[index]) for index in batch])
+            async with semaphore:
+                if not self.within_budget(*(names[index] for index in batch)):
+                    return {}
+                with self.track_node(
+                        ",".join(names[index] for index in batch), "Batch"
+                ) as metric:
+                    logging.info("Batch: %s", ", ".join(names[index] for index in batch))
+                    response = await self.acall_with_retries(
+                        lambda: self.ast_analyzer.aobtain_pydoc_batch(batch_prompt, len(batch))
+                    )
+                    results = self.split_batch_response(batch, names, response)
+                    metric["nodes"] = len(results)
+            for index, node_response in results.items():
+                self.checkpoint(collected[index][0], node_response)
+        for index in batch:
+            if index in results:
+                continue
+            async with semaphore:
+                if not self.within_budget(names[index]):
+                    continue
+                with self.track_node(names[index], collected[index][1]):
+                    logging.info("%s name: %s", collected[index][1], names[index])
+                    results[index] = await self.aobtain_pydoc_wrapper(
+                        collected[index][0], sources[index]
+                    )
+            self.checkpoint(collected[index][0], results[index])
+        if self.cache is not None:
+            for index, response in results.items():
+                self.cache.put(self.cache_key(sources[index]), response)
+        return results
+
+    def visit_batched(self, tree: AST):
+        """
+        visit_batched(self, tree: AST)
+
+            Documents an AST object, packing small nodes into batch requests that ask for a JSON
+            object mapping qualified names to docstrings. The docstrings are added to the nodes
+            in the order in which visit would add them.
 
             Parameters:
             -----------
             tree: AST
                 An AST object to be visited."""
-        self.class_visitor.visit(tree)
-        self.ast_analyzer.remove_messages()
-        self.method_visitor.visit(tree)
-        self.ast_analyzer.remove_messages()
+        collected, sources, names, responses, batches = self.plan_batches(tree)
+        for batch in batches:
+            responses.update(self.obtain_batch(batch, collected, sources, names))
+        for index in self.resolve_duplicates(collected, names, responses):
+            responses.update(self.obtain_batch([index], collected, sources, names))
+        self.add_responses(collected, responses)
+
+    def resolve_duplicates(
+            self,
+            collected: list[tuple["DocGenDef", str]],
+            names: list[str],
+            responses: dict[int, str],
+    ) -> list[int]:
+        """
+        resolve_duplicates(self, collected: list[tuple[DocGenDef, str]], names: list[str],
+         responses: dict[int, str]) -> list[int]
+
+            Records the responses of the batches in the fingerprint index and reuses them for
+            the nodes deferred by plan_batches.
+
+            Parameters:
+            -----------
+            collected: list[tuple[DocGenDef, str]]
+                All collected nodes.
+            names: list[str]
+                The unique names of all nodes.
+            responses: dict[int, str]
+                The responses obtained so far, keyed by node index. The reused responses are
+                added to it.
+
+            Returns:
+            --------
+            list[int]
+                The indices of the deferred nodes that still need a request."""
+        for index, response in responses.items():
+            self.remember(collected[index][0], response)
+        unresolved = []
+        for index in self.deferred_duplicates:
+            response = self.reuse(collected[index][0], names[index], collected[index][1])
+            if response is None:
+                unresolved.append(index)
+            else:
+                responses[index] = response
+        self.deferred_duplicates = []
+        return unresolved
+
+    def add_responses(self, collected: list[tuple["DocGenDef", str]], responses: dict[int, str]):
+        """
+        add_responses(self, collected: list[tuple[DocGenDef, str]], responses: dict[int, str])
+
+            Adds the docstrings of the responses to the collected nodes. Nodes without a
+            response, skipped because the budget of the run ran out, are left untouched.
+
+            Parameters:
+            -----------
+            collected: list[tuple[DocGenDef, str]]
+                The collected nodes.
+            responses: dict[int, str]
+                The responses, keyed by node index."""
+        for index, (node, _) in enumerate(collected):
+            if index in responses:
+                self.ast_analyzer.add_docstring_to_ast(node, new_docstring=responses[index])
@@ -0,0 +1,318 @@
+import ast
+import builtins
+import copy
+import difflib
+import hashlib
+import re
+from typing import NamedTuple, Optional, Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+
+# Builtin names keep their meaning whatever the surrounding identifiers, so they are not
+# canonicalized: `len(items)` and `sum(items)` do not share a fingerprint.
+_BUILTIN_NAMES = frozenset(dir(builtins))
+# Literals are canonicalized to their type, except the singletons, which change the logic.
+_CANONICAL_LITERAL_TYPES = (str, bytes, int, float, complex)
+_IDENTIFIER_PART = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+# The number of docstrings kept per fingerprint, to choose the most similar from.
+_MAX_ENTRIES_PER_FINGERPRINT = 8
+
+
+class Fingerprint(NamedTuple):
+    """
+    Fingerprint class for the structural fingerprint of a node
+
+    Attributes:
+    -----------
+    digest : str
+        The SHA-256 hash of the canonicalized AST of the node, without docstrings.
+    identifiers : tuple[str, ...]
+        The identifiers of the node, in the order in which they were canonicalized.
+    source : str
+        The source code of the node without docstrings, to compute similarities with.
+    """
+
+    digest: str
+    identifiers: tuple[str, ...]
+    source: str
+
+
+class _Canonicalizer(ast.NodeTransformer):
+    """
+    _Canonicalizer class for replacing the identifiers of a tree by their order of first
+    appearance and its literals by their type.
+
+    Called attributes are the API a node uses, which its docstring describes, so they keep
+    their name: `items.append(x)` and `items.remove(x)` do not share a fingerprint. Only the
+    words they share with the name of the node are canonicalized, so `service.get_user` in
+    handle_user and `service.get_order` in handle_order still do.
+    """
+
+    def __init__(self, name: str):
+        self.identifiers: list[str] = []
+        self._indices: dict[str, int] = {}
+        self._name_words = [word.lower() for word in _split_identifier(name)]
+        self._called: set[int] = set()
+
+    def _name_word(self, match: "re.Match") -> str:
+        word = match.group(0).lower()
+        if word in self._name_words:
+            return f"<{self._name_words.index(word)}>"
+        return match.group(0)
+
+    def canonical(self, name: str) -> str:
+        if name in _BUILTIN_NAMES:
+            return name
+        if name not in self._indices:
+            self._indices[name] = len(self.identifiers)
+            self.identifiers.append(name)
+        return f"_{self._indices[name]}"
+
+    def visit_def(self, node):
+        node.name = self.canonical(node.name)
+        return self.generic_visit(node)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_def
+
+    def visit_Name(self, node: ast.Name):  # pylint: disable=invalid-name
+        node.id = self.canonical(node.id)
+        return node
+
+    def visit_arg(self, node: ast.arg):
+        node.arg = self.canonical(node.arg)
+        return self.generic_visit(node)
+
+    def visit_keyword(self, node: ast.keyword):
+        if node.arg is not None:
+            node.arg = self.canonical(node.arg)
+        return self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call):  # pylint: disable=invalid-name
+        self._called.add(id(node.func))
+        return self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):  # pylint: disable=invalid-name
+        self.generic_visit(node)
+        if id(node) in self._called:
+            # Recorded for substitute_identifiers, but kept apart from the name words.
+            self.canonical(node.attr)
+            node.attr = _IDENTIFIER_PART.sub(self._name_word, node.attr)
+        else:
+            node.attr = self.canonical(node.attr)
+        return node
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler):  # pylint: disable=invalid-name
+        if node.name is not None:
+            node.name = self.canonical(node.name)
+        return self.generic_visit(node)
+
+    def visit_Constant(self, node: ast.Constant):  # pylint: disable=invalid-name
+        if isinstance(node.value, _CANONICAL_LITERAL_TYPES) and not isinstance(node.value, bool):
+            node.value = type(node.value).__name__
+        node.kind = None
+        return node
+
+
+def _without_docstring(body: list[ast.stmt]) -> list[ast.stmt]:
+    if (
+            body
+            and isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+    ):
+        return body[1:]
+    return body
+
+
+def structural_fingerprint(node: "DocGenDef") -> Fingerprint:
+    """
+    Computes the structural fingerprint of a node. Nodes that differ only in their
+    identifiers, literals and docstrings share the digest of their fingerprint, unless they
+    call different methods.
+
+    Args:
+        node (DocGenDef): The node.
+
+    Returns:
+        Fingerprint: The fingerprint of the node.
+    """
+    stripped = copy.deepcopy(node)
+    for child in ast.walk(stripped):
+        if isinstance(child, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            child.body = _without_docstring(child.body)
+    source = ast.unparse(stripped)
+    canonicalizer = _Canonicalizer(node.name)
+    canonical = canonicalizer.visit(stripped)
+    digest = hashlib.sha256(ast.dump(canonical).encode("utf-8")).hexdigest()
+    return Fingerprint(digest, tuple(canonicalizer.identifiers), source)
+
+
+def _split_identifier(identifier: str) -> list[str]:
+    return _IDENTIFIER_PART.findall(identifier)
+
+
+def substitute_identifiers(
+        docstring: str, old_identifiers: Sequence[str], new_identifiers: Sequence[str]
+) -> str:
+    """
+    Adapts the docstring of a node to a structurally identical node, replacing the identifiers
+    of the first node by the corresponding identifiers of the second one. Whole identifiers
+    are replaced first. The words of the identifiers (split at underscores and case changes)
+    that differ consistently are also replaced, keeping their capitalization, so the
+    docstring of handle_user mentions orders once adapted to handle_order.
+
+    Args:
+        docstring (str): The docstring of the first node.
+        old_identifiers (Sequence[str]): The identifiers of the first node.
+        new_identifiers (Sequence[str]): The identifiers of the second node, in the same order.
+
+    Returns:
+        str: The adapted docstring.
+    """
+    exact = {old: new for old, new in zip(old_identifiers, new_identifiers) if old != new}
+    if not exact:
+        return docstring
+    words: dict[str, Optional[str]] = {}
+    for old, new in exact.items():
+        old_parts, new_parts = _split_identifier(old), _split_identifier(new)
+        if len(old_parts) != len(new_parts):
+            continue
+        for old_part, new_part in zip(old_parts, new_parts):
+            old_part, new_part = old_part.lower(), new_part.lower()
+            if old_part == new_part or not old_part.isalpha():
+                continue
+            # A word replaced differently by two identifiers is ambiguous and kept.
+            words[old_part] = new_part if words.get(old_part, new_part) == new_part else None
+    replacements = {word: new for word, new in words.items() if new is not None}
+    names = sorted({*exact, *replacements}, key=len, reverse=True)
+    pattern = re.compile(
+        r"\b(?:" + "|".join(re.escape(name) for name in names) + r")\b", re.IGNORECASE
+    )
+
+    def replace(match: "re.Match") -> str:
+        found = match.group(0)
+        if found in exact:
+            return exact[found]
+        new = replacements.get(found.lower())
+        if new is None:
+            return found
+        if found.isupper() and len(found) > 1:
+            return new.upper()
+        if found[0].isupper():
+            return new[0].upper() + new[1:]
+        return new
+
+    return pattern.sub(replace, docstring)
+
+
+class FingerprintIndex:
+    """
+    FingerprintIndex class for reusing the docstrings of structurally identical nodes.
+
+    Generated handlers, overloads and copy-pasted adapters often differ only in their
+    identifiers. The index maps the structural fingerprint of every documented node to its
+    docstring, so a node with the same fingerprint reuses that docstring, adapted to its own
+    identifiers, instead of being sent to the model. One instance is meant to be shared by
+    all files of a run.
+
+    Attributes:
+    -----------
+    threshold : float
+        The minimum similarity of the source code of two nodes, between 0 and 1, for a
+        docstring to be reused. 0 reuses the docstrings of all structurally identical nodes.
+    entries : dict[str, list[tuple[Fingerprint, str]]]
+        The fingerprints and docstrings of the documented nodes, keyed by digest.
+    lookups : int
+        The number of lookups.
+    reused : int
+        The number of lookups that returned a docstring.
+
+    Methods:
+    --------
+    similarity(first: Fingerprint, second: Fingerprint) -> float
+        Computes the similarity of the source code of two nodes.
+    add(self, fingerprint: Fingerprint, docstring: str)
+        Records the docstring of a documented node.
+    lookup(self, fingerprint: Fingerprint) -> Optional[str]
+        Returns the adapted docstring of the most similar structurally identical node.
+    """
+
+    def __init__(self, threshold: float = 0.0):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            threshold (float, optional): The minimum similarity for a docstring to be reused.
+            Defaults to 0.0.
+
+        Returns:
+            None
+        """
+        self.threshold = threshold
+        self.entries: dict[str, list[tuple[Fingerprint, str]]] = {}
+        self.lookups = 0
+        self.reused = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def similarity(first: Fingerprint, second: Fingerprint) -> float:
+        """
+        Computes the similarity of the source code of two nodes.
+
+        Args:
+            first (Fingerprint): The fingerprint of the first node.
+            second (Fingerprint): The fingerprint of the second node.
+
+        Returns:
+            float: The similarity ratio, from 0 for unrelated code to 1 for identical code.
+        """
+        if first.source == second.source:
+            return 1.0
+        return difflib.SequenceMatcher(None, first.source, second.source).ratio()
+
+    def add(self, fingerprint: Fingerprint, docstring: str):
+        """
+        Records the docstring of a documented node.
+
+        Args:
+            fingerprint (Fingerprint): The fingerprint of the node.
+            docstring (str): The docstring of the node.
+
+        Returns:
+            None
+        """
+        entries = self.entries.setdefault(fingerprint.digest, [])
+        if len(entries) >= _MAX_ENTRIES_PER_FINGERPRINT or any(
+                entry.identifiers == fingerprint.identifiers for entry, _ in entries
+        ):
+            return
+        entries.append((fingerprint, docstring))
+
+    def lookup(self, fingerprint: Fingerprint) -> Optional[str]:
+        """
+        Returns the docstring of the most similar structurally identical node, adapted to the
+        identifiers of the node.
+
+        Args:
+            fingerprint (Fingerprint): The fingerprint of the node.
+
+        Returns:
+            Optional[str]: The adapted docstring, or None if no structurally identical node
+            is similar enough.
+        """
+        self.lookups += 1
+        entries = self.entries.get(fingerprint.digest)
+        if not entries:
+            return None
+        best, docstring = entries[0]
+        if len(entries) > 1 or self.threshold > 0:
+            best, docstring = max(
+                entries, key=lambda entry: self.similarity(entry[0], fingerprint)
+            )
+            if self.similarity(best, fingerprint) < self.threshold:
+                return None
+        self.reused += 1
+        return substitute_identifiers(docstring, best.identifiers, fingerprint.identifiers)
@@ -0,0 +1,226 @@
+import functools
+import re
+import subprocess
+from pathlib import Path
+from typing import Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .node_index import NodeIndex
+
+# A range of lines of a file, first and last included.
+LineRange = tuple[int, int]
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+_WHOLE_FILE: LineRange = (1, 2 ** 31)
+
+
+class GitDiffError(Exception):
+    """
+    GitDiffError class for a revision or range that git cannot diff, or a missing git binary.
+    """
+
+
+def parse_unified_diff(diff: str) -> dict[str, list[LineRange]]:
+    """
+    Extracts the changed lines of every file of a unified diff, on the new side. A hunk only
+    deleting lines marks the line they followed, which is within the class or function they
+    were removed from.
+
+    Args:
+        diff (str): The output of git diff, with the a/ and b/ prefixes.
+
+    Returns:
+        dict[str, list[LineRange]]: The changed lines of every added or modified file, keyed
+        by the path of the file relative to the root of the repository.
+    """
+    changes: dict[str, list[LineRange]] = {}
+    lines: Optional[list[LineRange]] = None
+    for line in diff.splitlines():
+        if line.startswith("+++ "):
+            target = line[4:].rstrip("\t")
+            lines = None
+            if target.startswith("b/"):
+                lines = changes.setdefault(target[2:], [])
+            continue
+        match = _HUNK_HEADER.match(line)
+        if match is None or lines is None:
+            continue
+        start = int(match.group(1))
+        count = 1 if match.group(2) is None else int(match.group(2))
+        if count == 0:
+            lines.append((max(start, 1), max(start, 1)))
+        else:
+            lines.append((start, start + count - 1))
+    return changes
+
+
+def _git(cwd: Path, *args: str) -> str:
+    try:
+        completed = subprocess.run(
+            ["git", *args], cwd=cwd, capture_output=True, text=True, check=False
+        )
+    except FileNotFoundError as error:
+        raise GitDiffError("git is not installed") from error
+    if completed.returncode != 0:
+        raise GitDiffError(completed.stderr.strip() or f"git {args[0]} failed")
+    return completed.stdout
+
+
+class DiffScope:
+    """
+    DiffScope class for the lines changed in a revision range, mapped to the classes and
+    functions to document.
+
+    A changed line selects the innermost indexed class or function enclosing it (see
+    NodeIndex): changing a method selects the method, not its class, and changing the
+    header or the attributes of a class selects the class. Lines outside of any class and
+    function select nothing, and a file of the scope with no changed line in a class or
+    function is not documented at all. Instances pickle, so the scope can be sent to worker
+    processes.
+
+    Attributes:
+    -----------
+    root : Path
+        The root of the repository.
+    changes : dict[Path, list[LineRange]]
+        The changed lines of every added or modified file, keyed by resolved path.
+
+    Methods:
+    --------
+    from_git(cls, path: Path, since: Optional[str]=None, diff: Optional[str]=None)
+     -> DiffScope
+        Creates the scope of the changes of a revision range with git.
+    covers(self, file_path: Path) -> bool
+        Returns whether a file has changed lines.
+    select_nodes(self, file_path: Path, index: NodeIndex) -> set[str]
+        Returns the unique names of the changed classes and functions of a file.
+    selector(self, file_path: Path) -> Callable[[NodeIndex], set[str]]
+        Returns select_nodes bound to a file.
+    """
+
+    def __init__(self, root: Path, changes: dict[Path, list[LineRange]]):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            root (Path): The root of the repository.
+            changes (dict[Path, list[LineRange]]): The changed lines of every file, keyed by
+            path.
+
+        Returns:
+            None
+        """
+        self.root = Path(root).resolve()
+        self.changes = {Path(path).resolve(): lines for path, lines in changes.items()}
+
+    @classmethod
+    def from_git(
+            cls, path: Path, since: Optional[str] = None, diff: Optional[str] = None
+    ) -> "DiffScope":
+        """
+        Creates the scope of the changes of a revision range under a path with git. With
+        since, the working tree is compared with the revision the current branch forked from
+        (the merge base of since and HEAD), so the scope includes uncommitted changes, and
+        untracked files are entirely in the scope. With diff, the range is passed to git diff
+        as is (e.g. main...HEAD); it should end at the checked-out revision, whose lines the
+        changed lines refer to.
+
+        Args:
+            path (Path): The file or directory to document.
+            since (Optional[str], optional): The revision the changes are compared to.
+            Defaults to None.
+            diff (Optional[str], optional): The revision range of the changes.
+            Defaults to None.
+
+        Raises:
+            GitDiffError: If git is not installed, the path is not in a repository or the
+            revisions are unknown.
+
+        Returns:
+            DiffScope: The scope.
+        """
+        path = Path(path).resolve()
+        cwd = path if path.is_dir() else path.parent
+        root = Path(_git(cwd, "rev-parse", "--show-toplevel").strip())
+        options = ["--no-color", "--no-ext-diff", "--unified=0", "--src-prefix=a/",
+                   "--dst-prefix=b/", "--diff-filter=AMR"]
+        if since is not None:
+            base = _git(cwd, "merge-base", since, "HEAD").strip()
+            output = _git(root, "diff", *options, base, "--", str(path))
+            untracked = _git(
+                root, "ls-files", "--others", "--exclude-standard", "--full-name", "--", str(path)
+            ).splitlines()
+        elif diff is not None:
+            output = _git(root, "diff", *options, diff, "--", str(path))
+            untracked = []
+        else:
+            raise ValueError("Either since or diff is required")
+        changes = parse_unified_diff(output)
+        for relative_path in untracked:
+            changes[relative_path] = [_WHOLE_FILE]
+        return cls(root, {root / relative_path: lines for relative_path, lines in changes.items()})
+
+    def __len__(self) -> int:
+        return len(self.changes)
+
+    def covers(self, file_path: Path) -> bool:
+        """
+        Returns whether a file has changed lines.
+
+        Args:
+            file_path (Path): The path of the file.
+
+        Returns:
+            bool: True if the file was added or modified.
+        """
+        return Path(file_path).resolve() in self.changes
+
+    def select_nodes(self, file_path: Path, index: "NodeIndex") -> set[str]:
+        """
+        Returns the unique names of the classes and functions of a file that are the innermost
+        indexed node enclosing a changed line.
+
+        Args:
+            file_path (Path): The path of the file.
+            index (NodeIndex): The index of the file.
+
+        Returns:
+            set[str]: The unique names of the selected nodes.
+        """
+        changed = self.changes.get(Path(file_path).resolve(), [])
+        spans = {
+            entry.unique_name: (
+                min([entry.lineno] + [decorator.lineno for decorator in entry.node.decorator_list]),
+                entry.end_lineno,
+            )
+            for entry in index
+        }
+        selected = set()
+        for name, (start, end) in spans.items():
+            nested = sorted(
+                span for other, span in spans.items()
+                if other != name and start <= span[0] and span[1] <= end
+            )
+            for first, last in changed:
+                first, last = max(first, start), min(last, end)
+                # The overlap selects the node unless nested nodes cover all of it.
+                for nested_start, nested_end in nested:
+                    if nested_start <= first <= nested_end:
+                        first = nested_end + 1
+                if first <= last:
+                    selected.add(name)
+                    break
+        return selected
+
+    def selector(self, file_path: Path) -> Callable[["NodeIndex"], set[str]]:
+        """
+        Returns select_nodes bound to a file, e.g. for the select_nodes argument of
+        prepare_python_file.
+
+        Args:
+            file_path (Path): The path of the file.
+
+        Returns:
+            Callable[[NodeIndex], set[str]]: The selector, which pickles.
+        """
+        return functools.partial(self.select_nodes, Path(file_path).resolve())
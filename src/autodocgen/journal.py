@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Optional, TypedDict, Union
+
+from .cache import DEFAULT_CACHE_DIR
+
+
+class JournalEntry(TypedDict):
+    """
+    JournalEntry class for type hints of a line of the checkpoint journal
+
+    Attributes:
+    -----------
+    file : str
+        The SHA-256 hash of the source code of the file the node was loaded from.
+    node : str
+        The qualified name of the node, numbered when it is not unique in the file.
+    response : str
+        The response obtained for the node.
+    """
+
+    file: str
+    node: str
+    response: str
+
+
+def default_journal_path(target: Union[str, Path]) -> Path:
+    """
+    Computes the default journal path of a run, in the journals directory of the default
+    cache directory. Runs on the same file or directory share the journal, so a run can be
+    resumed without naming it, while runs on other targets do not interfere.
+
+    Args:
+        target (Union[str, Path]): The file or directory processed by the run.
+
+    Returns:
+        Path: The path of the journal.
+    """
+    digest = hashlib.sha256(str(Path(target).resolve()).encode("utf-8")).hexdigest()[:16]
+    return DEFAULT_CACHE_DIR / "journals" / f"{digest}.jsonl"
+
+
+class CheckpointJournal:
+    """
+    CheckpointJournal class for making long runs resumable.
+
+    Every response is appended to a JSON lines file as soon as it is obtained, keyed by the
+    hash of the source code of its file and the qualified name of its node, and synced to disk.
+    If the run dies, the next run replays the journal and only requests the missing nodes of
+    files that did not change. Every entry is written by a single append, so worker processes
+    can share the journal, and a line torn by a crash is ignored when the journal is replayed.
+
+    Attributes:
+    -----------
+    path : Path
+        The path of the journal.
+    entries : dict[tuple[str, str], str]
+        The replayed responses, keyed by file hash and node name.
+    replayed : int
+        The number of responses returned by get.
+
+    Methods:
+    --------
+    file_hash(source_code: str) -> str
+        Computes the key of the source code of a file.
+    get(self, file_hash: str, node: str) -> Optional[str]
+        Looks up the response of a node.
+    record(self, file_hash: str, node: str, response: str)
+        Appends the response of a node.
+    close(self)
+        Closes the journal file.
+    discard(self)
+        Closes and deletes the journal, after a completed run.
+    """
+
+    def __init__(self, path: Union[str, Path], replay: bool = True):
+        """
+        Initializes an instance of the class and opens (or creates) the journal.
+
+        Args:
+            path (Union[str, Path]): The path of the journal.
+            replay (bool, optional): Whether to load the responses of the existing journal.
+            When False, the existing journal is discarded. Defaults to True.
+
+        Returns:
+            None
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.entries: dict[tuple[str, str], str] = {}
+        self.replayed = 0
+        if replay and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        entry: JournalEntry = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning("Ignoring a torn line of the journal %s", self.path)
+                        continue
+                    self.entries[(entry["file"], entry["node"])] = entry["response"]
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (0 if replay else os.O_TRUNC)
+        self._fd: Optional[int] = os.open(self.path, flags, 0o644)
+
+    @staticmethod
+    def file_hash(source_code: str) -> str:
+        """
+        Computes the key of the source code of a file.
+
+        Args:
+            source_code (str): The source code of the file.
+
+        Returns:
+            str: The hexadecimal SHA-256 hash of the source code.
+        """
+        return hashlib.sha256(source_code.encode("utf-8")).hexdigest()
+
+    def get(self, file_hash: str, node: str) -> Optional[str]:
+        """
+        Looks up the response of a node.
+
+        Args:
+            file_hash (str): The hash of the source code of the file of the node.
+            node (str): The qualified name of the node.
+
+        Returns:
+            Optional[str]: The journaled response, or None if the node is not in the journal.
+        """
+        response = self.entries.get((file_hash, node))
+        if response is not None:
+            self.replayed += 1
+        return response
+
+    def record(self, file_hash: str, node: str, response: str):
+        """
+        Appends the response of a node to the journal and syncs it to disk.
+
+        Args:
+            file_hash (str): The hash of the source code of the file of the node.
+            node (str): The qualified name of the node.
+            response (str): The response obtained for the node.
+
+        Returns:
+            None
+        """
+        self.entries[(file_hash, node)] = response
+        if self._fd is None:
+            return
+        line = json.dumps(JournalEntry(file=file_hash, node=node, response=response)) + "\n"
+        os.write(self._fd, line.encode("utf-8"))
+        os.fsync(self._fd)
+
+    def close(self):
+        """
+        Closes the journal file. Responses recorded afterwards are only kept in memory.
+
+        Returns:
+            None
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def discard(self):
+        """
+        Closes and deletes the journal, once the run it checkpoints has completed.
+
+        Returns:
+            None
+        """
+        self.close()
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,248 @@
+import ast
+import copy
+import hashlib
+import json
+import os
+from _ast import AsyncFunctionDef, ClassDef, FunctionDef
+from pathlib import Path
+from typing import Callable, Literal, Optional, TypedDict, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+    from .node_index import NodeIndex
+
+Policy = Union[Literal["all"], Literal["only-missing"], Literal["refresh-stale"]]
+
+
+class FileRecord(TypedDict):
+    """
+    FileRecord class for type hints of a manifest entry
+
+    Attributes:
+    -----------
+    sha256 : str
+        The content hash of the file after it was processed.
+    mtime_ns : int
+        The modification time of the file after it was processed.
+    size : int
+        The size of the file in bytes after it was processed.
+    nodes : dict[str, str]
+        The body fingerprint of every documented node, keyed by unique name (see
+        DocNode.unique_name).
+    """
+
+    sha256: str
+    mtime_ns: int
+    size: int
+    nodes: dict[str, str]
+
+
+def node_fingerprint(node: "DocGenDef") -> str:
+    """
+    Computes a fingerprint of the body of a node, ignoring every docstring inside it.
+
+    Args:
+        node (DocGenDef): The node to fingerprint.
+
+    Returns:
+        str: The hexadecimal fingerprint of the node.
+    """
+    stripped = copy.deepcopy(node)
+    for inner_node in ast.walk(stripped):
+        if not isinstance(inner_node, (ClassDef, FunctionDef, AsyncFunctionDef)):
+            continue
+        if ast.get_docstring(inner_node) is not None:
+            inner_node.body = inner_node.body[1:] or [ast.Pass()]
+    return hashlib.sha256(ast.dump(stripped).encode("utf-8")).hexdigest()[:32]
+
+
+class RunManifest:
+    """
+    RunManifest class for incremental runs.
+
+    The manifest records the content hash and modification time of every processed file and
+    the body fingerprint of every documented node, so unchanged files can be skipped without
+    being parsed and only stale nodes are regenerated.
+
+    Attributes:
+    -----------
+    path : Path
+        The path of the JSON manifest file.
+    files : dict[str, FileRecord]
+        The manifest entries, keyed by resolved file path.
+
+    Methods:
+    --------
+    only_missing(node: DocGenDef) -> bool
+        Selects the nodes that do not have a docstring yet.
+    get_record(self, file_path: Path) -> Optional[FileRecord]
+        Returns the manifest entry of a file.
+    set_record(self, file_path: Path, record: FileRecord)
+        Replaces the manifest entry of a file.
+    is_unchanged(self, file_path: Path) -> bool
+        Checks whether a file is unchanged since it was last processed.
+    node_filter(self, file_path: Path, index: NodeIndex, policy: Policy) -> Optional[Callable]
+        Builds a predicate selecting the nodes to document.
+    record(self, file_path: Path, index: NodeIndex)
+        Records a processed file.
+    save(self)
+        Writes the manifest to disk.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Initializes an instance of the class and loads the manifest if it exists.
+
+        Args:
+            path (Union[str, Path]): The path of the JSON manifest file.
+
+        Returns:
+            None
+        """
+        self.path = Path(path)
+        self.files: dict[str, FileRecord] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as manifest_file:
+                self.files = json.load(manifest_file)
+
+    @staticmethod
+    def only_missing(node: "DocGenDef") -> bool:
+        """
+        Selects the nodes that do not have a docstring yet.
+
+        Args:
+            node (DocGenDef): The node to check.
+
+        Returns:
+            bool: True if the node has no docstring.
+        """
+        return ast.get_docstring(node) is None
+
+    @staticmethod
+    def _key(file_path: Path) -> str:
+        return str(Path(file_path).resolve())
+
+    def get_record(self, file_path: Path) -> Optional[FileRecord]:
+        """
+        Returns the manifest entry of a file.
+
+        Args:
+            file_path (Path): The path of the file.
+
+        Returns:
+            Optional[FileRecord]: The entry, or None if the file was never processed.
+        """
+        return self.files.get(self._key(file_path))
+
+    def set_record(self, file_path: Path, record: FileRecord):
+        """
+        Replaces the manifest entry of a file, e.g. with an entry recorded by a worker process.
+
+        Args:
+            file_path (Path): The path of the file.
+            record (FileRecord): The new entry.
+
+        Returns:
+            None
+        """
+        self.files[self._key(file_path)] = record
+
+    def is_unchanged(self, file_path: Path) -> bool:
+        """
+        Checks whether a file is unchanged since it was last processed.
+
+        The modification time and size are compared first, so unchanged files are not read;
+        the content hash is only computed when the modification time differs.
+
+        Args:
+            file_path (Path): The path of the file.
+
+        Returns:
+            bool: True if the file content matches the manifest entry.
+        """
+        record = self.files.get(self._key(file_path))
+        if record is None:
+            return False
+        stat = os.stat(file_path)
+        if stat.st_mtime_ns == record["mtime_ns"] and stat.st_size == record["size"]:
+            return True
+        if hashlib.sha256(Path(file_path).read_bytes()).hexdigest() != record["sha256"]:
+            return False
+        record["mtime_ns"] = stat.st_mtime_ns
+        return True
+
+    def node_filter(
+            self, file_path: Path, index: "NodeIndex", policy: Policy
+    ) -> Optional[Callable[["DocGenDef"], bool]]:
+        """
+        Builds a predicate selecting the nodes to document under a policy.
+
+        With "only-missing", only nodes without a docstring are selected. With "refresh-stale",
+        nodes whose body fingerprint differs from the one recorded when their docstring was
+        generated are selected as well.
+
+        Args:
+            file_path (Path): The path of the file the tree was loaded from.
+            index (NodeIndex): The index of the tree of the file.
+            policy (Policy): The policy to apply.
+
+        Returns:
+            Optional[Callable[[DocGenDef], bool]]: The predicate, or None to document every node.
+        """
+        if policy == "all":
+            return None
+        if policy == "only-missing":
+            return self.only_missing
+        record = self.files.get(self._key(file_path))
+        recorded_nodes = record["nodes"] if record is not None else {}
+
+        def should_document(node: "DocGenDef") -> bool:
+            if self.only_missing(node):
+                return True
+            entry = index.get(node)
+            if entry is None:
+                return False
+            fingerprint = recorded_nodes.get(entry.unique_name)
+            return fingerprint is not None and fingerprint != entry.source_hash
+
+        return should_document
+
+    def record(self, file_path: Path, index: "NodeIndex"):
+        """
+        Records a processed file.
+
+        The file is hashed as it is on disk after processing, so a file that was overwritten
+        in place is recorded with its documented content.
+
+        Args:
+            file_path (Path): The path of the processed file.
+            index (NodeIndex): The index of the documented tree of the file.
+
+        Returns:
+            None
+        """
+        nodes = {
+            entry.unique_name: entry.source_hash
+            for entry in index
+            if ast.get_docstring(entry.node) is not None
+        }
+        stat = os.stat(file_path)
+        self.files[self._key(file_path)] = FileRecord(
+            sha256=hashlib.sha256(Path(file_path).read_bytes()).hexdigest(),
+            mtime_ns=stat.st_mtime_ns,
+            size=stat.st_size,
+            nodes=nodes,
+        )
+
+    def save(self):
+        """
+        Writes the manifest to disk atomically.
+
+        Returns:
+            None
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump(self.files, manifest_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,476 @@
+import contextlib
+import json
+import math
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Iterator, Optional, TypedDict, Union
+
+
+class ModelPrices(TypedDict):
+    """
+    ModelPrices class for type hints of the prices of a model
+
+    Attributes:
+    -----------
+    prompt : float
+        The price in USD per 1000 prompt tokens.
+    completion : float
+        The price in USD per 1000 completion tokens.
+    """
+
+    prompt: float
+    completion: float
+
+
+MODEL_PRICES: dict[str, ModelPrices] = {
+    "gpt-3.5-turbo": ModelPrices(prompt=0.0015, completion=0.002),
+    "gpt-3.5-turbo-16k": ModelPrices(prompt=0.003, completion=0.004),
+    "gpt-4": ModelPrices(prompt=0.03, completion=0.06),
+    "gpt-4-32k": ModelPrices(prompt=0.06, completion=0.12),
+}
+
+
+class NodeMetric(TypedDict):
+    """
+    NodeMetric class for type hints of the metrics of a documented node (or batch of nodes)
+
+    Attributes:
+    -----------
+    file : str
+        The file the node was loaded from.
+    name : str
+        The name of the node, or the comma-separated names of a batch.
+    kind : str
+        The type of the node: "Class", "Function" or "Batch".
+    nodes : int
+        The number of nodes the docstrings were obtained for: 1, or the number of nodes of a
+        batch found in its response (the others are requested, and counted, separately).
+    model : str
+        The model the docstring was requested from.
+    latency_secs : float
+        The time spent obtaining the docstring, including retries and rate limit waits.
+    prompt_tokens : int
+        The prompt tokens reported by the API.
+    completion_tokens : int
+        The completion tokens reported by the API.
+    requests : int
+        The number of successful requests.
+    retries : int
+        The number of failed requests that were retried.
+    rate_limit_wait_secs : float
+        The time spent waiting for the rate limiter.
+    cache_hit : bool
+        Whether the docstring came from the docstring cache or the checkpoint journal.
+    reused : bool
+        Whether the docstring was reused from a structurally identical node.
+    early_stops : int
+        The number of streamed requests stopped once the docstring was complete.
+    saved_completion_tokens : int
+        The completion tokens left unused by the early stops, an upper bound of the tokens
+        they saved.
+    """
+
+    file: str
+    name: str
+    kind: str
+    nodes: int
+    model: str
+    latency_secs: float
+    prompt_tokens: int
+    completion_tokens: int
+    requests: int
+    retries: int
+    rate_limit_wait_secs: float
+    cache_hit: bool
+    reused: bool
+    early_stops: int
+    saved_completion_tokens: int
+
+
+class FileMetric(TypedDict):
+    """
+    FileMetric class for type hints of the metrics of a processed file
+
+    Attributes:
+    -----------
+    file : str
+        The processed file.
+    wall_secs : float
+        The time spent processing the file.
+    """
+
+    file: str
+    wall_secs: float
+
+
+_current_node_metric: ContextVar[Optional[NodeMetric]] = ContextVar(
+    "autodocgen_current_node_metric", default=None
+)
+
+
+def record_request_usage(usage: dict):
+    """
+    Adds the token usage of a successful request to the node currently being tracked, if any.
+
+    Args:
+        usage (dict): The usage object of the API response.
+
+    Returns:
+        None
+    """
+    metric = _current_node_metric.get()
+    if metric is not None:
+        metric["requests"] += 1
+        metric["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        metric["completion_tokens"] += usage.get("completion_tokens", 0)
+
+
+def record_rate_limit_wait(wait_secs: float):
+    """
+    Adds a rate limiter wait to the node currently being tracked, if any.
+
+    Args:
+        wait_secs (float): The number of seconds waited.
+
+    Returns:
+        None
+    """
+    metric = _current_node_metric.get()
+    if metric is not None:
+        metric["rate_limit_wait_secs"] += wait_secs
+
+
+def record_early_stop(saved_completion_tokens: int):
+    """
+    Counts a streamed request stopped early for the node currently being tracked, if any.
+
+    Args:
+        saved_completion_tokens (int): The completion tokens left unused by the stop.
+
+    Returns:
+        None
+    """
+    metric = _current_node_metric.get()
+    if metric is not None:
+        metric["early_stops"] += 1
+        metric["saved_completion_tokens"] += saved_completion_tokens
+
+
+def record_retry():
+    """
+    Counts a retried request for the node currently being tracked, if any.
+
+    Returns:
+        None
+    """
+    metric = _current_node_metric.get()
+    if metric is not None:
+        metric["retries"] += 1
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Computes a nearest-rank percentile.
+
+    Args:
+        values (list[float]): The values.
+        fraction (float): The percentile as a fraction, e.g. 0.95.
+
+    Returns:
+        float: The percentile, or 0 if there are no values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """
+    Estimates the cost of a number of tokens.
+
+    Args:
+        model (str): The name of the model.
+        prompt_tokens (int): The number of prompt tokens.
+        completion_tokens (int): The number of completion tokens.
+
+    Returns:
+        float: The estimated cost in USD, or 0 for models with unknown prices.
+    """
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    return (prompt_tokens * prices["prompt"] + completion_tokens * prices["completion"]) / 1000
+
+
+def aggregate(nodes: list[NodeMetric], wall_secs: float, cache_misses: int = 0) -> dict:
+    """
+    Aggregates node metrics.
+
+    Args:
+        nodes (list[NodeMetric]): The node metrics.
+        wall_secs (float): The wall time the nodes were processed in.
+        cache_misses (int, optional): The number of docstring cache lookups that missed.
+        Defaults to 0.
+
+    Returns:
+        dict: The totals, latency percentiles of the requested nodes, reuse rate and estimated
+        cost.
+    """
+    requested = [node for node in nodes if not node["cache_hit"] and not node["reused"]]
+    latencies = [node["latency_secs"] for node in requested]
+    cache_hits = sum(node["cache_hit"] for node in nodes)
+    reused = sum(node["reused"] for node in nodes)
+    node_count = sum(node["nodes"] for node in nodes)
+    return {
+        "nodes": node_count,
+        "requests": sum(node["requests"] for node in nodes),
+        "cache_hits": cache_hits,
+        "cache_misses": cache_misses,
+        "reused": reused,
+        "reuse_rate": reused / node_count if node_count else 0.0,
+        "prompt_tokens": sum(node["prompt_tokens"] for node in nodes),
+        "completion_tokens": sum(node["completion_tokens"] for node in nodes),
+        "retries": sum(node["retries"] for node in nodes),
+        "rate_limit_wait_secs": sum(node["rate_limit_wait_secs"] for node in nodes),
+        "early_stops": sum(node["early_stops"] for node in nodes),
+        "saved_completion_tokens": sum(node["saved_completion_tokens"] for node in nodes),
+        "latency_secs": {
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies, default=0.0),
+        },
+        "estimated_cost_usd": sum(
+            estimate_cost(node["model"], node["prompt_tokens"], node["completion_tokens"])
+            for node in nodes
+        ),
+        "wall_secs": wall_secs,
+    }
+
+
+class MetricsCollector:
+    """
+    MetricsCollector class for collecting per-node and per-file metrics of a run.
+
+    Attributes:
+    -----------
+    nodes : list[NodeMetric]
+        The metrics of every documented node.
+    files : list[FileMetric]
+        The metrics of every processed file.
+    cache_misses : dict[str, int]
+        The number of docstring cache lookups that missed, keyed by file.
+    started_at : float
+        The time the collector was created, used for the wall time of the run.
+
+    Methods:
+    --------
+    track_node(self, file: str, name: str, kind: str, model: str, nodes: int=1)
+     -> Iterator[NodeMetric]
+        Tracks the metrics of a node while it is documented.
+    record_cache_miss(self, file: str)
+        Records a docstring cache lookup that missed.
+    record_file(self, file: str, wall_secs: float)
+        Records the wall time of a processed file.
+    merge(self, other: dict)
+        Merges the metrics exported by another collector.
+    export(self) -> dict
+        Exports the raw metrics.
+    report(self) -> dict
+        Aggregates the metrics per file and for the whole run.
+    write_json(self, path: Union[str, Path])
+        Writes the report as JSON.
+    write_prometheus(self, path: Union[str, Path])
+        Writes the run totals as a Prometheus textfile.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of the class.
+
+        Returns:
+            None
+        """
+        self.nodes: list[NodeMetric] = []
+        self.files: list[FileMetric] = []
+        self.cache_misses: dict[str, int] = {}
+        self.started_at = time.perf_counter()
+
+    @contextlib.contextmanager
+    def track_node(
+            self, file: str, name: str, kind: str, model: str, nodes: int = 1
+    ) -> Iterator[NodeMetric]:
+        """
+        Tracks the metrics of a node while it is documented. The requests made inside the
+        block, including from coroutines, report their usage, retries and waits to it.
+
+        Args:
+            file (str): The file the node was loaded from.
+            name (str): The name of the node.
+            kind (str): The type of the node.
+            model (str): The model the docstring is requested from.
+            nodes (int, optional): The number of nodes of a batch. Defaults to 1.
+
+        Returns:
+            Iterator[NodeMetric]: The metric of the node, recorded when the block exits.
+        """
+        metric = NodeMetric(
+            file=file,
+            name=name,
+            kind=kind,
+            nodes=nodes,
+            model=model,
+            latency_secs=0.0,
+            prompt_tokens=0,
+            completion_tokens=0,
+            requests=0,
+            retries=0,
+            rate_limit_wait_secs=0.0,
+            cache_hit=False,
+            reused=False,
+            early_stops=0,
+            saved_completion_tokens=0,
+        )
+        token = _current_node_metric.set(metric)
+        start_time = time.perf_counter()
+        try:
+            yield metric
+        finally:
+            metric["latency_secs"] = time.perf_counter() - start_time
+            _current_node_metric.reset(token)
+            self.nodes.append(metric)
+
+    def record_cache_miss(self, file: str):
+        """
+        Records a docstring cache lookup that missed.
+
+        Args:
+            file (str): The file of the node that was looked up.
+
+        Returns:
+            None
+        """
+        self.cache_misses[file] = self.cache_misses.get(file, 0) + 1
+
+    def record_file(self, file: str, wall_secs: float):
+        """
+        Records the wall time of a processed file.
+
+        Args:
+            file (str): The processed file.
+            wall_secs (float): The time spent processing the file.
+
+        Returns:
+            None
+        """
+        self.files.append(FileMetric(file=file, wall_secs=wall_secs))
+
+    def merge(self, other: dict):
+        """
+        Merges the metrics exported by another collector, e.g. in a worker process.
+
+        Args:
+            other (dict): The output of export of the other collector.
+
+        Returns:
+            None
+        """
+        self.nodes.extend(other["nodes"])
+        self.files.extend(other["files"])
+        for file, misses in other["cache_misses"].items():
+            self.cache_misses[file] = self.cache_misses.get(file, 0) + misses
+
+    def export(self) -> dict:
+        """
+        Exports the raw metrics so they can be sent to another process.
+
+        Returns:
+            dict: The node and file metrics and the cache misses.
+        """
+        return {"nodes": self.nodes, "files": self.files, "cache_misses": self.cache_misses}
+
+    def report(self) -> dict:
+        """
+        Aggregates the metrics per file and for the whole run.
+
+        Returns:
+            dict: The run aggregate, the aggregate of every file and the node metrics.
+        """
+        files = {}
+        for file_metric in self.files:
+            file_nodes = [node for node in self.nodes if node["file"] == file_metric["file"]]
+            files[file_metric["file"]] = aggregate(
+                file_nodes,
+                file_metric["wall_secs"],
+                self.cache_misses.get(file_metric["file"], 0),
+            )
+        return {
+            "run": aggregate(
+                self.nodes,
+                time.perf_counter() - self.started_at,
+                sum(self.cache_misses.values()),
+            ),
+            "files": files,
+            "nodes": self.nodes,
+        }
+
+    def write_json(self, path: Union[str, Path]):
+        """
+        Writes the report as JSON.
+
+        Args:
+            path (Union[str, Path]): The path of the JSON file.
+
+        Returns:
+            None
+        """
+        with open(path, "w", encoding="utf-8") as report_file:
+            json.dump(self.report(), report_file, indent=2)
+
+    def write_prometheus(self, path: Union[str, Path]):
+        """
+        Writes the run totals as a Prometheus textfile, for the node exporter textfile collector.
+
+        Args:
+            path (Union[str, Path]): The path of the textfile.
+
+        Returns:
+            None
+        """
+        run = self.report()["run"]
+        lines = [
+            "# TYPE autodocgen_nodes gauge",
+            f"autodocgen_nodes {run['nodes']}",
+            "# TYPE autodocgen_requests gauge",
+            f"autodocgen_requests {run['requests']}",
+            "# TYPE autodocgen_cache_lookups gauge",
+            f'autodocgen_cache_lookups{{result="hit"}} {run["cache_hits"]}',
+            f'autodocgen_cache_lookups{{result="miss"}} {run["cache_misses"]}',
+            "# TYPE autodocgen_reused_nodes gauge",
+            f"autodocgen_reused_nodes {run['reused']}",
+            "# TYPE autodocgen_tokens gauge",
+            f'autodocgen_tokens{{type="prompt"}} {run["prompt_tokens"]}',
+            f'autodocgen_tokens{{type="completion"}} {run["completion_tokens"]}',
+            "# TYPE autodocgen_retries gauge",
+            f"autodocgen_retries {run['retries']}",
+            "# TYPE autodocgen_rate_limit_wait_seconds gauge",
+            f"autodocgen_rate_limit_wait_seconds {run['rate_limit_wait_secs']}",
+            "# TYPE autodocgen_early_stops gauge",
+            f"autodocgen_early_stops {run['early_stops']}",
+            "# TYPE autodocgen_saved_completion_tokens gauge",
+            f"autodocgen_saved_completion_tokens {run['saved_completion_tokens']}",
+            "# TYPE autodocgen_latency_seconds gauge",
+            *(
+                f'autodocgen_latency_seconds{{quantile="{quantile}"}} {run["latency_secs"][key]}'
+                for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99"))
+            ),
+            "# TYPE autodocgen_estimated_cost_usd gauge",
+            f"autodocgen_estimated_cost_usd {run['estimated_cost_usd']}",
+            "# TYPE autodocgen_wall_seconds gauge",
+            f"autodocgen_wall_seconds {run['wall_secs']}",
+        ]
+        temp_path = Path(str(path) + ".tmp")
+        temp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        temp_path.replace(path)
@@ -0,0 +1,271 @@
+import ast
+from _ast import AST, AsyncFunctionDef, ClassDef, FunctionDef
+from pathlib import Path
+from typing import Callable, Collection, Iterator, Optional, Union, TYPE_CHECKING
+
+from .manifest import node_fingerprint
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+
+_DEF_TYPES = (ClassDef, FunctionDef, AsyncFunctionDef)
+
+
+def module_name(file_path: Union[str, Path]) -> str:
+    """
+    Computes the dotted name of the module of a file, including the packages (directories
+    with an __init__.py file) it belongs to, e.g. pkg.mod for pkg/mod.py. A package is named
+    after its directory.
+
+    Args:
+        file_path (Union[str, Path]): The path of the file.
+
+    Returns:
+        str: The dotted module name.
+    """
+    file_path = Path(file_path).resolve()
+    parts = [] if file_path.stem == "__init__" else [file_path.stem]
+    directory = file_path.parent
+    while (directory / "__init__.py").is_file() and directory != directory.parent:
+        parts.insert(0, directory.name)
+        directory = directory.parent
+    return ".".join(parts)
+
+
+class DocNode:
+    """
+    DocNode class for an entry of a NodeIndex, a class or function to document.
+
+    Attributes:
+    -----------
+    node : DocGenDef
+        The node.
+    kind : str
+        The type of the node: "Class" or "Function" (including async functions).
+    qualname : str
+        The dotted name of the node within its module, e.g. Class.method.
+    qualified_name : str
+        The dotted name of the node prefixed with its module, e.g. pkg.mod.Class.method.
+    unique_name : str
+        The qualname, numbered if another node of the module has the same one (e.g. a function
+        defined in both branches of an if statement), e.g. handler#2.
+    parent : Optional[str]
+        The qualname of the class or function the node is defined in, or None at module level.
+    lineno : int
+        The first line of the node, after its decorators.
+    end_lineno : int
+        The last line of the node.
+    docstring : Optional[str]
+        The docstring of the node when it was indexed, if any.
+    first_statement : ast.stmt
+        The first statement of the body of the node when it was indexed, which keeps its
+        position in the source code once a docstring is added or replaced.
+    source_hash : str
+        The fingerprint of the body of the node, ignoring docstrings (see
+        manifest.node_fingerprint), computed on first access.
+    """
+
+    __slots__ = (
+        "node",
+        "kind",
+        "qualname",
+        "qualified_name",
+        "unique_name",
+        "parent",
+        "lineno",
+        "end_lineno",
+        "docstring",
+        "first_statement",
+        "_source_hash",
+    )
+
+    def __init__(self, node: "DocGenDef", qualname: str, parent: Optional[str], module: str):
+        self.node = node
+        self.kind = "Class" if isinstance(node, ClassDef) else "Function"
+        self.qualname = qualname
+        self.qualified_name = f"{module}.{qualname}" if module else qualname
+        self.unique_name = qualname
+        self.parent = parent
+        self.lineno: int = node.lineno
+        self.end_lineno: int = getattr(node, "end_lineno", None) or node.lineno
+        self.docstring = ast.get_docstring(node)
+        self.first_statement: ast.stmt = node.body[0]
+        self._source_hash: Optional[str] = None
+
+    @property
+    def source_hash(self) -> str:
+        if self._source_hash is None:
+            self._source_hash = node_fingerprint(self.node)
+        return self._source_hash
+
+    def __repr__(self) -> str:
+        return f"DocNode({self.kind} {self.qualified_name}, lines {self.lineno}-{self.end_lineno})"
+
+
+class NodeIndex:
+    """
+    NodeIndex class for the classes and functions of a module to document, built in a single
+    traversal of its tree.
+
+    A class is indexed wherever it is defined, and a function or async function when it is
+    defined at module level or in a class; functions defined inside other functions are left
+    out, although they are part of the qualname of the classes defined in them. The entries are
+    ordered like the documentation passes: every class first, then every function, each in
+    the order of the source code. Every stage documenting a module (prompting, caching,
+    journaling, filtering and writing) looks its nodes up in the index instead of walking the
+    tree again.
+
+    Attributes:
+    -----------
+    tree : AST
+        The indexed tree.
+    module : str
+        The dotted name of the module, or an empty string if unknown.
+    entries : list[DocNode]
+        The indexed nodes, in documentation order.
+
+    Methods:
+    --------
+    get(self, node: DocGenDef) -> Optional[DocNode]
+        Returns the entry of a node.
+    defs(self, node_filter: Optional[Callable[[DocGenDef], bool]]=None)
+     -> list[tuple[DocGenDef, str]]
+        Returns the indexed nodes and their types.
+    select_filter(self, names: Collection[str],
+     node_filter: Optional[Callable[[DocGenDef], bool]]=None) -> Callable[[DocGenDef], bool]
+        Creates a node filter accepting the nodes with one of the given unique names.
+    qualnames(self) -> dict[int, str]
+        Returns the qualnames of the indexed nodes, keyed by the id of the node.
+    source_segment(self, entry: DocNode) -> Optional[str]
+        Returns the source code of the lines of an entry.
+    """
+
+    def __init__(self, tree: AST, module: str = "", source_code: Optional[str] = None):
+        """
+        Initializes an instance of the class and indexes the tree.
+
+        Args:
+            tree (AST): The tree of the module.
+            module (str, optional): The dotted name of the module, see module_name.
+            Defaults to an empty string.
+            source_code (Optional[str], optional): The source code the tree was parsed from,
+            for source_segment. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.tree = tree
+        self.module = module
+        self._lines = None if source_code is None else source_code.splitlines(keepends=True)
+        classes: list[DocNode] = []
+        functions: list[DocNode] = []
+        # A preorder traversal of (node, prefix of its qualname, qualname of the enclosing
+        # class or function, whether that is a function), without recursion.
+        stack: list[tuple[AST, str, Optional[str], bool]] = [(tree, "", None, False)]
+        while stack:
+            node, prefix, parent, in_function = stack.pop()
+            if isinstance(node, _DEF_TYPES):
+                qualname = prefix + node.name
+                if isinstance(node, ClassDef):
+                    classes.append(DocNode(node, qualname, parent, module))
+                elif not in_function:
+                    functions.append(DocNode(node, qualname, parent, module))
+                prefix, parent = qualname + ".", qualname
+                in_function = not isinstance(node, ClassDef)
+            stack.extend(
+                (child, prefix, parent, in_function)
+                for child in reversed(list(ast.iter_child_nodes(node)))
+            )
+        self.entries = classes + functions
+        counts: dict[str, int] = {}
+        for entry in self.entries:
+            counts[entry.qualname] = counts.get(entry.qualname, 0) + 1
+            if counts[entry.qualname] > 1:
+                entry.unique_name = f"{entry.qualname}#{counts[entry.qualname]}"
+        self._by_id = {id(entry.node): entry for entry in self.entries}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self) -> Iterator[DocNode]:
+        return iter(self.entries)
+
+    def get(self, node: "DocGenDef") -> Optional[DocNode]:
+        """
+        Returns the entry of a node.
+
+        Args:
+            node (DocGenDef): The node.
+
+        Returns:
+            Optional[DocNode]: The entry, or None if the node is not indexed.
+        """
+        return self._by_id.get(id(node))
+
+    def defs(
+            self, node_filter: Optional[Callable[["DocGenDef"], bool]] = None
+    ) -> list[tuple["DocGenDef", str]]:
+        """
+        Returns the indexed nodes and their types, in documentation order.
+
+        Args:
+            node_filter (Optional[Callable[[DocGenDef], bool]], optional): A predicate
+            selecting the nodes to return. Defaults to every node.
+
+        Returns:
+            list[tuple[DocGenDef, str]]: The nodes, each paired with its type.
+        """
+        return [
+            (entry.node, entry.kind)
+            for entry in self.entries
+            if node_filter is None or node_filter(entry.node)
+        ]
+
+    def select_filter(
+            self,
+            names: Collection[str],
+            node_filter: Optional[Callable[["DocGenDef"], bool]] = None,
+    ) -> Callable[["DocGenDef"], bool]:
+        """
+        Creates a node filter accepting the indexed nodes with one of the given unique names
+        that are also accepted by another filter.
+
+        Args:
+            names (Collection[str]): The unique names of the nodes to accept.
+            node_filter (Optional[Callable[[DocGenDef], bool]], optional): The other filter.
+            Defaults to None.
+
+        Returns:
+            Callable[[DocGenDef], bool]: The node filter.
+        """
+
+        def accept(node: "DocGenDef") -> bool:
+            entry = self.get(node)
+            if entry is None or entry.unique_name not in names:
+                return False
+            return node_filter is None or node_filter(node)
+
+        return accept
+
+    def qualnames(self) -> dict[int, str]:
+        """
+        Returns the qualnames of the indexed nodes.
+
+        Returns:
+            dict[int, str]: The qualnames, keyed by the id of the node.
+        """
+        return {node_id: entry.qualname for node_id, entry in self._by_id.items()}
+
+    def source_segment(self, entry: DocNode) -> Optional[str]:
+        """
+        Returns the source code of the lines of an entry, without its decorators.
+
+        Args:
+            entry (DocNode): The entry.
+
+        Returns:
+            Optional[str]: The source code, or None if the index has no source code.
+        """
+        if self._lines is None:
+            return None
+        return "".join(self._lines[entry.lineno - 1:entry.end_lineno])
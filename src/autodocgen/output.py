@@ -0,0 +1,346 @@
+import ast
+import inspect
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from _ast import AST
+from pathlib import Path
+from typing import Literal, NamedTuple, Optional, TextIO, Union
+
+from .node_index import NodeIndex
+from .splice import is_new_docstring, splice_docstrings
+
+OutputFormat = Union[Literal["patch"], Literal["jsonl"]]
+
+
+class DocstringRecord(NamedTuple):
+    """
+    DocstringRecord class for a line of a JSONL sidecar: a docstring generated for a class or
+    function, to be applied later by apply_sidecar.
+
+    Attributes:
+    -----------
+    file : str
+        The path of the file, relative to the working directory of the run if possible.
+    qualname : str
+        The unique name of the node within its file (see DocNode.unique_name).
+    line : int
+        The line of the node (after its decorators) in the file the docstring was generated
+        for.
+    docstring : str
+        The docstring, without quotes or indentation.
+    """
+
+    file: str
+    qualname: str
+    line: int
+    docstring: str
+
+
+def write_atomic(file_path: Union[str, Path], text: str):
+    """
+    Writes a file atomically: a temporary file is written next to the target and renamed, so an
+    interrupted run never leaves a truncated file behind. The mode of an existing file is kept.
+
+    Args:
+        file_path (Union[str, Path]): The path of the file.
+        text (str): The content of the file.
+
+    Returns:
+        None
+    """
+    file_path = Path(file_path)
+    file_descriptor, temp_name = tempfile.mkstemp(
+        prefix=file_path.name + ".", suffix=".tmp", dir=file_path.parent
+    )
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            file.write(text)
+        if file_path.exists():
+            shutil.copymode(file_path, temp_name)
+        os.replace(temp_name, file_path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
+def display_path(file_path: Union[str, Path]) -> str:
+    """
+    Returns the POSIX path of a file relative to the working directory, or its absolute path if
+    it is on another drive.
+
+    Args:
+        file_path (Union[str, Path]): The path of the file.
+
+    Returns:
+        str: The path.
+    """
+    try:
+        return Path(os.path.relpath(file_path)).as_posix()
+    except ValueError:
+        return Path(file_path).resolve().as_posix()
+
+
+def new_docstrings(
+        tree: AST, file_path: Union[str, Path], index: Optional[NodeIndex] = None
+) -> list[DocstringRecord]:
+    """
+    Lists the docstrings added to a tree since it was parsed, in documentation order.
+
+    Args:
+        tree (AST): The documented tree.
+        file_path (Union[str, Path]): The path of the file of the tree.
+        index (Optional[NodeIndex], optional): The index of the tree. Defaults to indexing it.
+
+    Returns:
+        list[DocstringRecord]: The records of the docstrings.
+    """
+    if index is None or index.tree is not tree:
+        index = NodeIndex(tree)
+    file = display_path(file_path)
+    return [
+        DocstringRecord(
+            file,
+            entry.unique_name,
+            entry.lineno,
+            inspect.cleandoc(entry.node.body[0].value.value),
+        )
+        for entry in index
+        if is_new_docstring(entry.node)
+    ]
+
+
+class OutputWriter:
+    """
+    OutputWriter class for the output of a run that leaves the source files untouched: a single
+    unified diff of all documented files (patch), to be applied with git apply or patch -p1, or
+    a JSONL sidecar with a DocstringRecord per generated docstring (jsonl), to be applied with
+    autodocgen apply. Either way, the output grows with the number of docstrings rather than
+    with the size of the documented files.
+
+    Files are written to the output as soon as they are documented, by any thread. Worker
+    processes render their files with render and send the text to the writer of the run.
+
+    Attributes:
+    -----------
+    output_format : OutputFormat
+        The format of the output: "patch" or "jsonl".
+    stream : TextIO
+        The stream the output is written to.
+    files : int
+        The number of files written to the output with at least one docstring.
+    docstrings : int
+        The number of docstrings written to the output.
+
+    Methods:
+    --------
+    open(cls, output_format: OutputFormat, path: Union[str, Path]) -> OutputWriter
+        Creates a writer to a file.
+    render(output_format: OutputFormat, file_path: Path, source_code: Optional[str],
+     new_code: str, tree: AST, index: Optional[NodeIndex]=None) -> tuple[str, int]
+        Renders the output of a documented file.
+    write(self, file_path: Path, source_code: Optional[str], new_code: str, tree: AST,
+     index: Optional[NodeIndex]=None)
+        Renders and writes the output of a documented file.
+    write_text(self, text: str, docstrings: int)
+        Writes rendered output.
+    close(self)
+        Closes the stream.
+    """
+
+    def __init__(self, output_format: OutputFormat, stream: TextIO):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            output_format (OutputFormat): The format of the output: "patch" or "jsonl".
+            stream (TextIO): The stream to write the output to.
+
+        Returns:
+            None
+        """
+        if output_format not in ("patch", "jsonl"):
+            raise ValueError(f"Unknown output format: {output_format}")
+        self.output_format = output_format
+        self.stream = stream
+        self.files = 0
+        self.docstrings = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, output_format: OutputFormat, path: Union[str, Path]) -> "OutputWriter":
+        """
+        Creates a writer to a file, truncating it.
+
+        Args:
+            output_format (OutputFormat): The format of the output.
+            path (Union[str, Path]): The path of the output file.
+
+        Returns:
+            OutputWriter: The writer.
+        """
+        return cls(output_format, open(path, "w", encoding="utf-8", newline=""))
+
+    @staticmethod
+    def render(
+            output_format: OutputFormat,
+            file_path: Path,
+            source_code: Optional[str],
+            new_code: str,
+            tree: AST,
+            index: Optional[NodeIndex] = None,
+    ) -> tuple[str, int]:
+        """
+        Renders the output of a documented file: the unified diff from its source code to its
+        new code, or the JSONL records of its new docstrings.
+
+        Args:
+            output_format (OutputFormat): The format of the output.
+            file_path (Path): The path of the file.
+            source_code (Optional[str]): The source code of the file before it was documented.
+            If None, it is read from the file.
+            new_code (str): The documented source code of the file.
+            tree (AST): The documented tree of the file.
+            index (Optional[NodeIndex], optional): The index of the tree. Defaults to
+            indexing it.
+
+        Returns:
+            tuple[str, int]: The output and the number of docstrings it contains.
+        """
+        records = new_docstrings(tree, file_path, index)
+        if not records:
+            return "", 0
+        if output_format == "jsonl":
+            text = "".join(
+                json.dumps(record._asdict(), ensure_ascii=False) + "\n" for record in records
+            )
+            return text, len(records)
+        import difflib  # pylint: disable=import-outside-toplevel
+
+        if source_code is None:
+            source_code = Path(file_path).read_text(encoding="utf-8")
+        path = display_path(file_path)
+        lines = difflib.unified_diff(
+            source_code.splitlines(keepends=True),
+            new_code.splitlines(keepends=True),
+            fromfile="a/" + path,
+            tofile="b/" + path,
+        )
+        text = "".join(
+            line if line.endswith("\n") else line + "\n\\ No newline at end of file\n"
+            for line in lines
+        )
+        return text, len(records)
+
+    def write(
+            self,
+            file_path: Path,
+            source_code: Optional[str],
+            new_code: str,
+            tree: AST,
+            index: Optional[NodeIndex] = None,
+    ):
+        """
+        Renders and writes the output of a documented file.
+
+        Args:
+            file_path (Path): The path of the file.
+            source_code (Optional[str]): The source code of the file before it was documented.
+            new_code (str): The documented source code of the file.
+            tree (AST): The documented tree of the file.
+            index (Optional[NodeIndex], optional): The index of the tree. Defaults to
+            indexing it.
+
+        Returns:
+            None
+        """
+        self.write_text(
+            *self.render(self.output_format, file_path, source_code, new_code, tree, index)
+        )
+
+    def write_text(self, text: str, docstrings: int):
+        """
+        Writes the rendered output of a file, e.g. received from a worker process.
+
+        Args:
+            text (str): The output of the file, see render.
+            docstrings (int): The number of docstrings it contains.
+
+        Returns:
+            None
+        """
+        if not text:
+            return
+        with self._lock:
+            self.stream.write(text)
+            self.stream.flush()
+            self.files += 1
+            self.docstrings += docstrings
+
+    def close(self):
+        """
+        Closes the stream.
+
+        Returns:
+            None
+        """
+        self.stream.close()
+
+
+def apply_sidecar(sidecar_path: Union[str, Path]) -> tuple[int, int]:
+    """
+    Applies the docstrings of a JSONL sidecar to their files in bulk: every file is read,
+    parsed and written once, with its docstrings spliced in like a run would. The paths of
+    the sidecar are relative to the working directory of the run that wrote it. A record is
+    skipped, with a warning, if its file or node no longer exists; a node that moved is still
+    found by its unique name.
+
+    Args:
+        sidecar_path (Union[str, Path]): The path of the sidecar.
+
+    Returns:
+        tuple[int, int]: The number of applied and skipped docstrings.
+    """
+    by_file: dict[str, list[DocstringRecord]] = {}
+    with open(sidecar_path, encoding="utf-8") as sidecar:
+        for line in sidecar:
+            if line.strip():
+                record = DocstringRecord(**json.loads(line))
+                by_file.setdefault(record.file, []).append(record)
+    applied = skipped = 0
+    for file, records in by_file.items():
+        try:
+            source_code = Path(file).read_text(encoding="utf-8")
+            tree = ast.parse(source_code)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as error:
+            logging.warning("Skipping %d docstring(s) of %s: %s", len(records), file, error)
+            skipped += len(records)
+            continue
+        index = NodeIndex(tree)
+        entries = {entry.unique_name: entry for entry in index}
+        applied_to_file = 0
+        for record in records:
+            entry = entries.get(record.qualname)
+            if entry is None:
+                logging.warning("Skipping %s of %s, which no longer exists", record.qualname, file)
+                skipped += 1
+                continue
+            docstring_node = ast.Expr(value=ast.Constant(value=record.docstring))
+            if entry.docstring is not None:
+                entry.node.body[0] = docstring_node
+            else:
+                entry.node.body.insert(0, docstring_node)
+            applied_to_file += 1
+        if applied_to_file:
+            try:
+                new_code = splice_docstrings(source_code, tree, index)
+            except ValueError as error:
+                logging.error("Skipping %d docstring(s) of %s: %s", applied_to_file, file, error)
+                skipped += applied_to_file
+                continue
+            write_atomic(file, new_code)
+        applied += applied_to_file
+    return applied, skipped
@@ -0,0 +1,148 @@
+import queue
+import threading
+from typing import Callable, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+U = TypeVar("U")
+
+_DONE = object()
+_POLL_SECS = 0.1
+
+
+class _Stage(threading.Thread):
+    """
+    _Stage class for a pipeline stage running in a background thread, keeping the first
+    exception it raises so the caller can re-raise it.
+    """
+
+    def __init__(self, name: str, target: Callable[[], None]):
+        super().__init__(name=name, daemon=True)
+        self.stage_target = target
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        try:
+            self.stage_target()
+        except BaseException as error:  # pylint: disable=broad-except
+            self.error = error
+
+
+def _put(target: "queue.Queue", item, cancelled: Callable[[], bool]) -> bool:
+    """
+    Puts an item into a bounded queue, waiting for space until the put is cancelled.
+
+    Args:
+        target (queue.Queue): The queue.
+        item: The item.
+        cancelled (Callable[[], bool]): Returns whether to stop waiting.
+
+    Returns:
+        bool: True if the item was put, False if the put was cancelled.
+    """
+    while not cancelled():
+        try:
+            target.put(item, timeout=_POLL_SECS)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(source: "queue.Queue", finisher: _Stage):
+    """
+    Gets the next item from a queue, raising the error of the finishing stage if it fails
+    while waiting.
+
+    Args:
+        source (queue.Queue): The queue.
+        finisher (_Stage): The finishing stage.
+
+    Returns:
+        The next item.
+    """
+    while True:
+        if finisher.error is not None:
+            raise finisher.error
+        try:
+            return source.get(timeout=_POLL_SECS)
+        except queue.Empty:
+            continue
+
+
+def run_pipeline(
+        items: Iterable[T],
+        prepare: Callable[[T], Optional[U]],
+        generate: Callable[[U], None],
+        finish: Callable[[U], None],
+        depth: int = 2,
+):
+    """
+    Runs three stages over a sequence of items concurrently, connected by bounded queues.
+
+    prepare runs in a background thread and finish in another one, while generate runs in the
+    calling thread, which owns the resources that cannot be shared between threads, such as
+    the SQLite connection of the docstring cache and the event loop of the backend. While the
+    model is generating the docstrings of one file, the next files are parsed and the previous
+    ones are formatted and written. The queues hold at most depth items each, so memory is
+    bounded by the depth rather than by the number of items. Items keep their order.
+
+    Args:
+        items (Iterable[T]): The items to process.
+        prepare (Callable[[T], Optional[U]]): The first stage. Returning None skips the item.
+        generate (Callable[[U], None]): The second stage, run in the calling thread.
+        finish (Callable[[U], None]): The last stage.
+        depth (int, optional): The maximum number of items waiting between two stages.
+        Defaults to 2.
+
+    Raises:
+        BaseException: The first exception raised by a stage. The items generated before it
+        are still finished.
+
+    Returns:
+        None
+    """
+    prepared: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    generated: "queue.Queue" = queue.Queue(maxsize=max(1, depth))
+    stopping = threading.Event()
+
+    def prepare_all():
+        try:
+            for item in items:
+                prepared_item = prepare(item)
+                if prepared_item is not None and not _put(
+                        prepared, prepared_item, stopping.is_set
+                ):
+                    return
+        finally:
+            _put(prepared, _DONE, stopping.is_set)
+
+    def finish_all():
+        while True:
+            generated_item = generated.get()
+            if generated_item is _DONE:
+                return
+            finish(generated_item)
+
+    preparer = _Stage("autodocgen-prepare", prepare_all)
+    finisher = _Stage("autodocgen-finish", finish_all)
+    preparer.start()
+    finisher.start()
+    try:
+        while True:
+            prepared_item = _get(prepared, finisher)
+            if prepared_item is _DONE:
+                break
+            generate(prepared_item)
+            if not _put(generated, prepared_item, lambda: not finisher.is_alive()):
+                break
+        if preparer.error is not None:
+            raise preparer.error
+    finally:
+        stopping.set()
+        # The finisher is not stopped: it drains the items generated so far, so their work is
+        # not lost, and then receives the end marker.
+        _put(generated, _DONE, lambda: not finisher.is_alive())
+        finisher.join()
+    if finisher.error is not None:
+        raise finisher.error
+
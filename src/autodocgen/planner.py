@@ -0,0 +1,378 @@
+import ast
+import json
+import os
+from _ast import AST
+from pathlib import Path
+from typing import Callable, Optional, Sequence, TypedDict, TYPE_CHECKING
+
+from .ast_analyzer import ASTAnalyzer
+from .backends import BackendIdentity, resolve_backend_identity
+from .batching import build_batch_prompt, pack_batches
+from .cache import DocstringCache
+from .context import ContextPolicy
+from .discovery import discover_python_files
+from .manifest import Policy, RunManifest
+from .metrics import estimate_cost
+from .node_index import NodeIndex
+from .prompt_builder import PromptBuilder
+from .rate_limiter import RateLimiter
+from .tokens import estimate_tokens
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+    from .git_diff import DiffScope
+
+COMPLETION_TOKENS_PER_PROMPT_TOKEN = 0.5
+MIN_COMPLETION_TOKENS = 48
+
+
+class FilePlan(TypedDict):
+    """
+    FilePlan class for type hints of the estimated work of a file
+
+    Attributes:
+    -----------
+    file : str
+        The planned file.
+    nodes : int
+        The number of classes and functions that would be documented.
+    cached : int
+        The number of those nodes whose docstring is already in the docstring cache.
+    requests : int
+        The estimated number of requests.
+    prompt_tokens : int
+        The estimated number of prompt tokens, including the conversation history.
+    completion_tokens : int
+        The estimated number of completion tokens.
+    """
+
+    file: str
+    nodes: int
+    cached: int
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+
+
+def estimate_completion_tokens(source_tokens: int, max_tokens: int) -> int:
+    """
+    Estimates the number of tokens of the docstring generated for a node. Docstrings grow with
+    the size of the code they document, so the estimate is a fraction of the source tokens.
+
+    Args:
+        source_tokens (int): The estimated number of tokens of the source code sent.
+        max_tokens (int): The max_tokens of the request.
+
+    Returns:
+        int: The estimated number of completion tokens.
+    """
+    estimate = int(source_tokens * COMPLETION_TOKENS_PER_PROMPT_TOKEN)
+    return min(max_tokens, max(MIN_COMPLETION_TOKENS, estimate))
+
+
+def plan_file(
+        file_path: Path,
+        tree: AST,
+        prompt_builder: PromptBuilder,
+        context_policy: ContextPolicy,
+        node_filter: Optional[Callable[["DocGenDef"], bool]] = None,
+        cache: Optional[DocstringCache] = None,
+        concurrency: int = 1,
+        batch_token_budget: int = 0,
+        backend: Optional[BackendIdentity] = None,
+        index: Optional[NodeIndex] = None,
+) -> FilePlan:
+    """
+    Estimates the requests and tokens needed to document a file, by building the prompts of
+    its nodes like a real run, without calling the model.
+
+    Serial runs send the conversation history allowed by the context policy, which is reset
+    between the class pass and the function pass. Concurrent and batched requests are
+    stateless. Nodes found in the docstring cache do not need a request.
+
+    Args:
+        file_path (Path): The file to plan.
+        tree (AST): The parsed file.
+        prompt_builder (PromptBuilder): The builder of the source code sent for every node.
+        context_policy (ContextPolicy): The policy bounding the conversation history.
+        node_filter (Optional[Callable[[DocGenDef], bool]], optional): A predicate selecting
+        the nodes to document. Defaults to every node.
+        cache (Optional[DocstringCache], optional): The docstring cache, if any.
+        concurrency (int, optional): The maximum number of concurrent requests. Defaults to 1.
+        batch_token_budget (int, optional): The maximum number of prompt tokens of a batch
+        request, or 0 to disable batching. Defaults to 0.
+        backend (Optional[BackendIdentity], optional): The backend of the run, part of the
+        cache keys. Defaults to the OpenAI API with the default model.
+        index (Optional[NodeIndex], optional): The index of the tree, e.g. the one the node
+        filter was built from. Defaults to indexing the tree.
+
+    Returns:
+        FilePlan: The estimated work of the file.
+    """
+    model_kwargs = ASTAnalyzer.default_model_kwargs
+    prepend_prompt = ASTAnalyzer.default_prepend_prompt
+    if backend is None:
+        backend = resolve_backend_identity("openai", None, None, model_kwargs["model"])
+    instruction_tokens = estimate_tokens(model_kwargs["messages"][0]["content"])
+    if index is None or index.tree is not tree:
+        index = NodeIndex(tree)
+    collected = index.defs(node_filter)
+    sources = [prompt_builder.build(node).source for node, _ in collected]
+    cached = set()
+    if cache is not None:
+        cached = {
+            index
+            for index, source in enumerate(sources)
+            if cache.contains(
+                DocstringCache.make_key(source, model_kwargs, prepend_prompt, backend)
+            )
+        }
+    pending = [index for index in range(len(collected)) if index not in cached]
+    plan = FilePlan(
+        file=str(file_path),
+        nodes=len(collected),
+        cached=len(cached),
+        requests=0,
+        prompt_tokens=0,
+        completion_tokens=0,
+    )
+    if batch_token_budget > 0:
+        batches = pack_batches(
+            [estimate_tokens(sources[index]) for index in pending], batch_token_budget
+        )
+        for batch in batches:
+            indices = [pending[position] for position in batch]
+            batch_prompt = build_batch_prompt(
+                [(collected[index][0].name, sources[index]) for index in indices]
+            )
+            plan["requests"] += 1
+            plan["prompt_tokens"] += instruction_tokens + estimate_tokens(batch_prompt)
+            plan["completion_tokens"] += sum(
+                estimate_completion_tokens(
+                    estimate_tokens(sources[index]), model_kwargs["max_tokens"]
+                )
+                for index in indices
+            )
+        return plan
+    exchange_tokens: list[int] = []
+    previous_type = None
+    for index in pending:
+        str_type = collected[index][1]
+        if str_type != previous_type:
+            exchange_tokens = []
+            previous_type = str_type
+        prompt_tokens = estimate_tokens(prepend_prompt + sources[index])
+        completion_tokens = estimate_completion_tokens(
+            estimate_tokens(sources[index]), model_kwargs["max_tokens"]
+        )
+        history_tokens = 0
+        if concurrency <= 1:
+            kept = context_policy.kept_exchanges(
+                exchange_tokens, instruction_tokens + prompt_tokens
+            )
+            history_tokens = sum(exchange_tokens[len(exchange_tokens) - kept:]) if kept else 0
+            exchange_tokens.append(prompt_tokens + completion_tokens)
+        plan["requests"] += 1
+        plan["prompt_tokens"] += instruction_tokens + history_tokens + prompt_tokens
+        plan["completion_tokens"] += completion_tokens
+    return plan
+
+
+def project_wall_secs(
+        requests: int,
+        tokens: int,
+        rate_limiter: RateLimiter,
+        parallel_requests: int = 1,
+        latency_secs: float = 2.0,
+) -> float:
+    """
+    Projects the wall time of a run. The rate limiter starts with a minute worth of requests
+    and tokens and then refills at the configured rates, and every request takes at least
+    the typical latency of the model.
+
+    Args:
+        requests (int): The number of requests.
+        tokens (int): The number of prompt and completion tokens.
+        rate_limiter (RateLimiter): The rate limiter holding the configured limits.
+        parallel_requests (int, optional): The maximum number of requests in flight.
+        Defaults to 1.
+        latency_secs (float, optional): The typical latency of a request. Defaults to 2.
+
+    Returns:
+        float: The projected wall time in seconds.
+    """
+    rate_limited_secs = 60 * max(
+        0.0,
+        (requests - rate_limiter.rpm) / rate_limiter.rpm,
+        (tokens - rate_limiter.tpm) / rate_limiter.tpm,
+    )
+    return max(rate_limited_secs, requests * latency_secs / max(1, parallel_requests))
+
+
+def plan_run(
+        path: Path,
+        prompt_builder: PromptBuilder,
+        context_policy: ContextPolicy,
+        rate_limiter: RateLimiter,
+        cache: Optional[DocstringCache] = None,
+        manifest: Optional[RunManifest] = None,
+        policy: Policy = "all",
+        concurrency: int = 1,
+        jobs: int = 1,
+        batch_token_budget: int = 0,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        use_gitignore: bool = True,
+        stem_suffix: Optional[str] = "_doc",
+        backend: Optional[BackendIdentity] = None,
+        scope: Optional["DiffScope"] = None,
+) -> dict:
+    """
+    Plans a run on a file or directory without calling the model or needing an API key.
+
+    Args:
+        path (Path): The Python file or directory to plan.
+        prompt_builder (PromptBuilder): The builder of the source code sent for every node.
+        context_policy (ContextPolicy): The policy bounding the conversation history.
+        rate_limiter (RateLimiter): The rate limiter holding the configured limits.
+        cache (Optional[DocstringCache], optional): The docstring cache, if any.
+        manifest (Optional[RunManifest], optional): The run manifest, if any. Unchanged files
+        are left out of the plan.
+        policy (Policy, optional): Which nodes to document. Defaults to "all".
+        concurrency (int, optional): The maximum number of concurrent requests per file.
+        Defaults to 1.
+        jobs (int, optional): The number of worker processes. Defaults to 1.
+        batch_token_budget (int, optional): The maximum number of prompt tokens of a batch
+        request, or 0 to disable batching. Defaults to 0.
+        include (Optional[Sequence[str]], optional): Globs a file must match.
+        exclude (Optional[Sequence[str]], optional): Globs of files and directories to skip.
+        use_gitignore (bool, optional): Whether to skip paths ignored by .gitignore files.
+        Defaults to True.
+        stem_suffix (Optional[str], optional): The suffix of generated files, which are
+        skipped. Defaults to "_doc".
+        backend (Optional[BackendIdentity], optional): The backend of the run, whose model
+        the run is costed for. Defaults to the OpenAI API with the default model.
+        scope (Optional[DiffScope], optional): The lines changed in a revision range, limiting
+        the plan to the classes and functions enclosing them, like the run. Defaults to None.
+
+    Returns:
+        dict: The totals of the run, the totals of every directory and the plan of every file.
+    """
+    if backend is None:
+        backend = resolve_backend_identity(
+            "openai", None, None, ASTAnalyzer.default_model_kwargs["model"]
+        )
+    if path.is_dir():
+        files = list(
+            discover_python_files(
+                path,
+                include=include,
+                exclude=exclude,
+                use_gitignore=use_gitignore,
+                stem_suffix=stem_suffix,
+            )
+        )
+    else:
+        files = [path]
+    if scope is not None:
+        files = [file_path for file_path in files if scope.covers(file_path)]
+    file_plans = []
+    for file_path in files:
+        if manifest is not None and manifest.is_unchanged(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as file:
+            tree = ast.parse(file.read())
+        index = NodeIndex(tree)
+        node_filter = None
+        if manifest is not None:
+            node_filter = manifest.node_filter(file_path, index, policy)
+        elif policy == "only-missing":
+            node_filter = RunManifest.only_missing
+        if scope is not None:
+            names = scope.select_nodes(file_path, index)
+            if not names:
+                continue
+            node_filter = index.select_filter(names, node_filter)
+        file_plans.append(
+            plan_file(
+                file_path,
+                tree,
+                prompt_builder,
+                context_policy,
+                node_filter=node_filter,
+                cache=cache,
+                concurrency=concurrency,
+                batch_token_budget=batch_token_budget,
+                backend=backend,
+                index=index,
+            )
+        )
+    root = os.path.abspath(path if path.is_dir() else path.parent)
+    directories: dict[str, dict] = {}
+    for file_plan in file_plans:
+        directory = os.path.relpath(os.path.dirname(os.path.abspath(file_plan["file"])), root)
+        totals = directories.setdefault(
+            Path(directory).as_posix(),
+            {"files": 0, "nodes": 0, "cached": 0, "requests": 0,
+             "prompt_tokens": 0, "completion_tokens": 0},
+        )
+        totals["files"] += 1
+        for name in ("nodes", "cached", "requests", "prompt_tokens", "completion_tokens"):
+            totals[name] += file_plan[name]
+    model = backend.model
+    run = {
+        "model": model,
+        "files": len(file_plans),
+        "nodes": sum(file_plan["nodes"] for file_plan in file_plans),
+        "cached": sum(file_plan["cached"] for file_plan in file_plans),
+        "requests": sum(file_plan["requests"] for file_plan in file_plans),
+        "prompt_tokens": sum(file_plan["prompt_tokens"] for file_plan in file_plans),
+        "completion_tokens": sum(file_plan["completion_tokens"] for file_plan in file_plans),
+    }
+    run["estimated_cost_usd"] = estimate_cost(
+        model, run["prompt_tokens"], run["completion_tokens"]
+    )
+    run["projected_wall_secs"] = project_wall_secs(
+        run["requests"],
+        run["prompt_tokens"] + run["completion_tokens"],
+        rate_limiter,
+        parallel_requests=max(1, concurrency) * max(1, jobs),
+    )
+    return {"run": run, "directories": directories, "files": file_plans}
+
+
+def format_plan(plan: dict, as_json: bool = False) -> str:
+    """
+    Formats a plan as a per-directory summary table or as JSON.
+
+    Args:
+        plan (dict): The output of plan_run.
+        as_json (bool, optional): Whether to format the plan as JSON. Defaults to False.
+
+    Returns:
+        str: The formatted plan.
+    """
+    if as_json:
+        return json.dumps(plan, indent=2)
+    header = (
+        f"{'directory':<40} {'files':>6} {'nodes':>7} {'cached':>7} {'requests':>9} "
+        f"{'prompt tok':>11} {'compl. tok':>11}"
+    )
+    lines = [header, "-" * len(header)]
+    for directory, totals in sorted(plan["directories"].items()):
+        lines.append(
+            f"{directory:<40} {totals['files']:>6} {totals['nodes']:>7} {totals['cached']:>7} "
+            f"{totals['requests']:>9} {totals['prompt_tokens']:>11} "
+            f"{totals['completion_tokens']:>11}"
+        )
+    run = plan["run"]
+    lines.append("-" * len(header))
+    lines.append(
+        f"{'total':<40} {run['files']:>6} {run['nodes']:>7} {run['cached']:>7} "
+        f"{run['requests']:>9} {run['prompt_tokens']:>11} {run['completion_tokens']:>11}"
+    )
+    lines.append(
+        f"Estimated cost with {run['model']}: ${run['estimated_cost_usd']:.2f}, "
+        f"projected wall time: {run['projected_wall_secs'] / 60:.1f} min"
+    )
+    return "\n".join(lines)
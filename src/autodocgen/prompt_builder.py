@@ -0,0 +1,179 @@
+import ast
+import copy
+from _ast import AsyncFunctionDef, ClassDef, FunctionDef
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+from .tokens import estimate_tokens
+from .tracing import span
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+
+_ATTRIBUTE_STATEMENTS = (ast.Assign, ast.AnnAssign)
+
+
+class Prompt(NamedTuple):
+    """
+    Prompt class for the source code sent to the model for a node
+
+    Attributes:
+    -----------
+    source : str
+        The source code to send.
+    original_tokens : int
+        The estimated number of tokens of the full source code of the node.
+    prompt_tokens : int
+        The estimated number of tokens of the source code to send.
+    """
+
+    source: str
+    original_tokens: int
+    prompt_tokens: int
+
+    @property
+    def saved_tokens(self) -> int:
+        """
+        The estimated number of tokens saved by not sending the full source code.
+
+        Returns:
+            int: The number of saved tokens.
+        """
+        return self.original_tokens - self.prompt_tokens
+
+
+def _stub_docstring(node: "DocGenDef") -> list[ast.stmt]:
+    docstring = ast.get_docstring(node, clean=False)
+    body: list[ast.stmt] = []
+    if docstring is not None:
+        body.append(ast.Expr(value=ast.Constant(value=docstring)))
+    body.append(ast.Expr(value=ast.Constant(value=Ellipsis)))
+    return body
+
+
+def skeletonize_class(node: ClassDef) -> ClassDef:
+    """
+    Builds the skeleton of a class: its decorators, bases, docstring and attributes, and the
+    signatures and existing docstrings of its methods. Method bodies are replaced by `...`
+    and nested classes are skeletonized as well. The original node is left untouched.
+
+    Args:
+        node (ClassDef): The class to skeletonize.
+
+    Returns:
+        ClassDef: The skeleton of the class.
+    """
+    skeleton = copy.copy(node)
+    skeleton.body = []
+    for index, statement in enumerate(node.body):
+        if index == 0 and ast.get_docstring(node, clean=False) is not None:
+            skeleton.body.append(statement)
+        elif isinstance(statement, (FunctionDef, AsyncFunctionDef)):
+            method = copy.copy(statement)
+            method.body = _stub_docstring(statement)
+            skeleton.body.append(method)
+        elif isinstance(statement, ClassDef):
+            skeleton.body.append(skeletonize_class(statement))
+        elif isinstance(statement, _ATTRIBUTE_STATEMENTS):
+            skeleton.body.append(statement)
+    if not skeleton.body:
+        skeleton.body.append(ast.Pass())
+    return skeleton
+
+
+def trim_source(source: str, max_tokens: int) -> str:
+    """
+    Trims source code to a token budget by keeping its leading lines and replacing the rest
+    with a comment stating how many lines were left out.
+
+    Args:
+        source (str): The source code to trim.
+        max_tokens (int): The token budget.
+
+    Returns:
+        str: The source code, trimmed if it exceeds the budget.
+    """
+    if estimate_tokens(source) <= max_tokens:
+        return source
+    lines = source.splitlines()
+    kept_lines: list[str] = []
+    used_tokens = 0
+    for line in lines:
+        line_tokens = estimate_tokens(line + "\n")
+        if kept_lines and used_tokens + line_tokens > max_tokens:
+            break
+        kept_lines.append(line)
+        used_tokens += line_tokens
+    omitted = len(lines) - len(kept_lines)
+    last_line = kept_lines[-1]
+    indent = last_line[: len(last_line) - len(last_line.lstrip())]
+    if last_line.rstrip().endswith(":"):
+        indent += "    "
+    kept_lines.append(f"{indent}# ... {omitted} more lines omitted")
+    return "\n".join(kept_lines) + "\n"
+
+
+class PromptBuilder:
+    """
+    PromptBuilder class for building compact prompts for classes and functions.
+
+    Classes are sent as a skeleton (see skeletonize_class), since every method is documented
+    separately, and any prompt exceeding the token budget is trimmed with trim_source.
+
+    Attributes:
+    -----------
+    max_prompt_tokens : int
+        The maximum estimated number of tokens of the source code sent for a node.
+    skeletonize_classes : bool
+        Whether classes are sent as a skeleton instead of their full source code.
+
+    Methods:
+    --------
+    build(self, node: DocGenDef, full_source: Optional[str]=None) -> Prompt
+        Builds the prompt source code of a node.
+    """
+
+    def __init__(self, max_prompt_tokens: int = 2048, skeletonize_classes: bool = True):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            max_prompt_tokens (int, optional): The maximum estimated number of tokens of the
+            source code sent for a node. Defaults to 2048.
+            skeletonize_classes (bool, optional): Whether classes are sent as a skeleton.
+            Defaults to True.
+
+        Returns:
+            None
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.skeletonize_classes = skeletonize_classes
+
+    def build(self, node: "DocGenDef", full_source: Optional[str] = None) -> Prompt:
+        """
+        Builds the prompt source code of a node.
+
+        Args:
+            node (DocGenDef): The node to build the prompt for.
+            full_source (Optional[str], optional): The full source code of the node, e.g. its
+            lines in the file, to estimate the tokens saved by a class skeleton without
+            generating the source code of the whole class. Defaults to the source code
+            generated from the node.
+
+        Returns:
+            Prompt: The source code to send, with its estimated token savings.
+        """
+        import astor  # pylint: disable=import-outside-toplevel
+
+        with span("astor.to_source"):
+            if self.skeletonize_classes and isinstance(node, ClassDef):
+                source = astor.to_source(skeletonize_class(node))
+                if full_source is None:
+                    full_source = astor.to_source(node)
+            else:
+                source = full_source = astor.to_source(node)
+        source = trim_source(source, self.max_prompt_tokens)
+        return Prompt(
+            source=source,
+            original_tokens=estimate_tokens(full_source),
+            prompt_tokens=estimate_tokens(source),
+        )
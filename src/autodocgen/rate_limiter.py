@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+from typing import Optional, TypedDict
+
+
+class ModelLimits(TypedDict):
+    """
+    ModelLimits class for type hints of the rate limits of a model
+
+    Attributes:
+    -----------
+    rpm : int
+        The maximum number of requests per minute.
+    tpm : int
+        The maximum number of tokens per minute.
+    """
+
+    rpm: int
+    tpm: int
+
+
+DEFAULT_MODEL_LIMITS: dict[str, ModelLimits] = {
+    "gpt-3.5-turbo": ModelLimits(rpm=3500, tpm=90_000),
+    "gpt-3.5-turbo-16k": ModelLimits(rpm=3500, tpm=180_000),
+    "gpt-4": ModelLimits(rpm=200, tpm=10_000),
+    "gpt-4-32k": ModelLimits(rpm=200, tpm=20_000),
+}
+FALLBACK_MODEL_LIMITS = ModelLimits(rpm=60, tpm=40_000)
+
+
+class RateLimiter:
+    """
+    RateLimiter class for staying under the requests-per-minute and tokens-per-minute limits.
+
+    The limiter keeps two token buckets that refill continuously at the configured rates.
+    Every request reserves one request and its estimated number of tokens before it is sent,
+    and the reservation is reconciled with the actual token usage afterwards. When the API
+    answers with a RateLimitError anyway, the rates are halved and then recover gradually
+    with every successful request. One instance is meant to be shared by all requests of a run.
+
+    Attributes:
+    -----------
+    rpm : int
+        The configured maximum number of requests per minute.
+    tpm : int
+        The configured maximum number of tokens per minute.
+    rate_factor : float
+        The fraction of the configured rates currently in use.
+    total_wait_secs : float
+        The total time spent waiting for capacity.
+
+    Methods:
+    --------
+    for_model(model: str, rpm: Optional[int]=None, tpm: Optional[int]=None) -> RateLimiter
+        Creates a rate limiter with the limits of a model.
+    acquire(self, tokens: int) -> float
+        Blocks until a request of the given size may be sent.
+    aacquire(self, tokens: int) -> float
+        Waits without blocking the event loop until a request of the given size may be sent.
+    record_usage(self, used_tokens: int, reserved_tokens: int)
+        Reconciles a reservation with the actual token usage.
+    on_rate_limit(self, retry_after: Optional[float]=None)
+        Lowers the rates after a RateLimitError.
+    """
+
+    min_rate_factor = 0.1
+    decrease_factor = 0.5
+    recovery_step = 0.05
+
+    def __init__(self, rpm: int, tpm: int):
+        """
+        Initializes an instance of the class with full buckets.
+
+        Args:
+            rpm (int): The maximum number of requests per minute.
+            tpm (int): The maximum number of tokens per minute.
+
+        Returns:
+            None
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.rate_factor = 1.0
+        self.total_wait_secs = 0.0
+        self.request_level = float(rpm)
+        self.token_level = float(tpm)
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def for_model(
+            cls, model: str, rpm: Optional[int] = None, tpm: Optional[int] = None
+    ) -> "RateLimiter":
+        """
+        Creates a rate limiter with the limits of a model.
+
+        Args:
+            model (str): The name of the model.
+            rpm (Optional[int], optional): Overrides the requests per minute of the model.
+            tpm (Optional[int], optional): Overrides the tokens per minute of the model.
+
+        Returns:
+            RateLimiter: The rate limiter.
+        """
+        limits = DEFAULT_MODEL_LIMITS.get(model, FALLBACK_MODEL_LIMITS)
+        return cls(rpm=rpm or limits["rpm"], tpm=tpm or limits["tpm"])
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.request_level = min(
+            self.rpm, self.request_level + elapsed * self.rpm * self.rate_factor / 60
+        )
+        self.token_level = min(
+            self.tpm, self.token_level + elapsed * self.tpm * self.rate_factor / 60
+        )
+
+    def _reserve(self, tokens: int) -> float:
+        """
+        Reserves capacity for a request if it is available.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+
+        Returns:
+            float: 0 if the capacity was reserved, otherwise the number of seconds to wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            tokens = min(tokens, self.tpm)
+            wait = max(
+                self.blocked_until - now,
+                (1 - self.request_level) * 60 / (self.rpm * self.rate_factor),
+                (tokens - self.token_level) * 60 / (self.tpm * self.rate_factor),
+            )
+            if wait > 0:
+                return wait
+            self.request_level -= 1
+            self.token_level -= tokens
+            return 0.0
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Blocks until a request of the given size may be sent and reserves its capacity.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+            waited += wait
+        self.total_wait_secs += waited
+        return waited
+
+    async def aacquire(self, tokens: int) -> float:
+        """
+        Waits without blocking the event loop until a request of the given size may be sent
+        and reserves its capacity.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+
+        Returns:
+            float: The number of seconds spent waiting.
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        waited = 0.0
+        while (wait := self._reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+        self.total_wait_secs += waited
+        return waited
+
+    def record_usage(self, used_tokens: int, reserved_tokens: int):
+        """
+        Reconciles a reservation with the actual token usage of a successful request and lets
+        the rates recover towards the configured limits.
+
+        Args:
+            used_tokens (int): The total tokens reported by the API.
+            reserved_tokens (int): The number of tokens reserved for the request.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.token_level += min(reserved_tokens, self.tpm) - used_tokens
+            self.rate_factor = min(1.0, self.rate_factor + self.recovery_step)
+
+    def on_rate_limit(self, retry_after: Optional[float] = None):
+        """
+        Lowers the rates after a RateLimitError and pauses all requests for a moment.
+
+        Args:
+            retry_after (Optional[float], optional): The number of seconds the API asked to
+            wait. Defaults to the time needed to refill one request at the lowered rate.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.rate_factor = max(self.min_rate_factor, self.rate_factor * self.decrease_factor)
+            pause = retry_after if retry_after is not None else 60 / (self.rpm * self.rate_factor)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            self.request_level = min(self.request_level, 0.0)
+            logging.warning(
+                "Rate limit reached: lowering the rate to %d%% of the configured limits",
+                self.rate_factor * 100,
+            )
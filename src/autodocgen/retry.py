@@ -0,0 +1,571 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar, TYPE_CHECKING
+
+from .metrics import percentile, record_retry
+from .tracing import span
+
+if TYPE_CHECKING:
+    from .rate_limiter import RateLimiter
+
+T = TypeVar("T")
+
+# The latencies of the last successful requests, from which the hedging delay is computed,
+# and the number of them needed before requests are hedged.
+_LATENCY_WINDOW = 200
+_MIN_LATENCY_SAMPLES = 20
+
+
+class RequestTimeout(Exception):
+    """
+    RequestTimeout class for a request that did not complete within the timeout.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    CircuitOpenError class for a request refused because the circuit breaker is open.
+
+    Attributes:
+    -----------
+    retry_after : float
+        The number of seconds until the circuit breaker lets a trial request through.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit breaker open, retrying in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def retry_after_secs(error: BaseException) -> Optional[float]:
+    """
+    Reads the Retry-After header of the HTTP response of a failed request, given in seconds or
+    as an HTTP date.
+
+    Args:
+        error (BaseException): The error raised by the request.
+
+    Returns:
+        Optional[float]: The number of seconds the API asked to wait, or None.
+    """
+    if isinstance(error, CircuitOpenError):
+        return error.retry_after
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_rate_limit(error: BaseException) -> bool:
+    from openai.error import RateLimitError  # pylint: disable=import-outside-toplevel
+
+    return isinstance(error, RateLimitError)
+
+
+def _is_retryable(error: BaseException) -> bool:
+    from openai.error import (  # pylint: disable=import-outside-toplevel
+        APIConnectionError,
+        APIError,
+        RateLimitError,
+        ServiceUnavailableError,
+        Timeout,
+        TryAgain,
+    )
+
+    if isinstance(error, APIError):
+        return error.http_status is None or error.http_status >= 500
+    return isinstance(
+        error,
+        (
+            RequestTimeout,
+            CircuitOpenError,
+            APIConnectionError,
+            RateLimitError,
+            ServiceUnavailableError,
+            Timeout,
+            TryAgain,
+        ),
+    )
+
+
+class CircuitBreaker:
+    """
+    CircuitBreaker class for pausing all requests while the API is failing.
+
+    After failure_threshold consecutive failures, the breaker opens and refuses requests for
+    reset_secs. It then lets a single trial request through: a success closes the breaker,
+    a failure opens it again. Rate limit errors do not count as failures, as the API is up.
+
+    Attributes:
+    -----------
+    failure_threshold : int
+        The number of consecutive failures opening the breaker.
+    reset_secs : float
+        The time the breaker stays open before a trial request.
+    failures : int
+        The number of consecutive failures.
+    opened_until : float
+        The time (as returned by time.monotonic) until which requests are refused.
+
+    Methods:
+    --------
+    before_request(self)
+        Raises a CircuitOpenError if the request may not be sent.
+    record_success(self)
+        Closes the breaker.
+    record_failure(self)
+        Counts a failure and opens the breaker after too many.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_secs: float = 30.0):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            failure_threshold (int, optional): The number of consecutive failures opening the
+            breaker. Defaults to 5.
+            reset_secs (float, optional): The time the breaker stays open. Defaults to 30.
+
+        Returns:
+            None
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_secs = reset_secs
+        self.failures = 0
+        self.opened_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """
+        Raises a CircuitOpenError if the breaker is open, or if it is half-open and a trial
+        request is already running.
+
+        Raises:
+            CircuitOpenError: If the request may not be sent.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            if self.failures < self.failure_threshold:
+                return
+            remaining = self.opened_until - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            if self._trial_running:
+                raise CircuitOpenError(min(1.0, self.reset_secs))
+            self._trial_running = True
+
+    def record_success(self):
+        """
+        Closes the breaker.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        """
+        Counts a failure and opens the breaker once there are failure_threshold consecutive
+        failures, or when a trial request fails.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold:
+                if self.failures == self.failure_threshold:
+                    logging.warning(
+                        "%d consecutive failed requests: pausing requests for %ss",
+                        self.failures,
+                        self.reset_secs,
+                    )
+                self.opened_until = time.monotonic() + self.reset_secs
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class RetryExecutor:
+    """
+    RetryExecutor class for sending requests with timeouts, retries and hedging.
+
+    Synchronous attempts are bounded by the timeout of the HTTP layer of the backend (see
+    create_backend), so no thread is left behind with a request still in flight; asynchronous
+    attempts are bounded by timeout_secs and cancelled once it has passed. A failed attempt is
+    retried after an exponential backoff with full jitter, or after the delay of the Retry-After
+    header of the response, up to max_attempts attempts, after which the last error is raised.
+    Errors that cannot succeed on a retry, such as invalid requests, are raised immediately. A
+    circuit breaker pauses all requests while the API is failing. With hedging, an attempt still
+    running after the 95th percentile of the observed latencies is duplicated, and the first
+    response is used; a synchronous attempt is only sent from a background thread to be hedged.
+    One instance is meant to be shared by all requests of a run.
+
+    Attributes:
+    -----------
+    timeout_secs : Optional[float]
+        The maximum duration of an asynchronous attempt, or None for no timeout.
+    max_attempts : int
+        The maximum number of attempts of a request.
+    base_delay_secs : float
+        The maximum delay before the first retry, doubled for every further retry.
+    max_delay_secs : float
+        The upper bound of the maximum delay before a retry.
+    hedge : bool
+        Whether to duplicate slow attempts.
+    hedge_min_secs : float
+        The minimum duration of an attempt before it is duplicated.
+    breaker : CircuitBreaker
+        The circuit breaker shared by the requests.
+    hedges : int
+        The number of duplicated attempts.
+
+    Methods:
+    --------
+    backoff_secs(self, attempt: int) -> float
+        Computes the delay before retrying an attempt.
+    hedge_delay_secs(self) -> Optional[float]
+        Computes the duration of an attempt after which it is duplicated.
+    attempt(self, send: Callable[[], T], hedge_send: Optional[Callable[[], T]]=None) -> T
+        Sends a request once, with hedging.
+    aattempt(self, send: Callable[[], Awaitable[T]],
+     hedge_send: Optional[Callable[[], Awaitable[T]]]=None) -> T
+        Sends a request once without blocking the event loop, with the timeout and hedging.
+    call(self, request: Callable[[], T], rate_limiter: Optional[RateLimiter]=None) -> T
+        Calls a request function, retrying it.
+    acall(self, request: Callable[[], Awaitable[T]],
+     rate_limiter: Optional[RateLimiter]=None) -> T
+        Awaits a request coroutine function, retrying it.
+    """
+
+    def __init__(
+            self,
+            timeout_secs: Optional[float] = 120.0,
+            max_attempts: int = 6,
+            base_delay_secs: float = 1.0,
+            max_delay_secs: float = 60.0,
+            hedge: bool = False,
+            hedge_min_secs: float = 1.0,
+            breaker: Optional[CircuitBreaker] = None,
+    ):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            timeout_secs (Optional[float], optional): The maximum duration of an asynchronous
+            attempt, or None for no timeout. Defaults to 120.
+            max_attempts (int, optional): The maximum number of attempts. Defaults to 6.
+            base_delay_secs (float, optional): The maximum delay before the first retry.
+            Defaults to 1.
+            max_delay_secs (float, optional): The upper bound of the delay before a retry.
+            Defaults to 60.
+            hedge (bool, optional): Whether to duplicate slow attempts. Defaults to False.
+            hedge_min_secs (float, optional): The minimum duration of an attempt before it is
+            duplicated. Defaults to 1.
+            breaker (Optional[CircuitBreaker], optional): The circuit breaker. Defaults to a
+            breaker opening after 5 consecutive failures for 30s.
+
+        Returns:
+            None
+        """
+        self.timeout_secs = timeout_secs
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_secs = base_delay_secs
+        self.max_delay_secs = max_delay_secs
+        self.hedge = hedge
+        self.hedge_min_secs = hedge_min_secs
+        self.breaker = breaker or CircuitBreaker()
+        self.hedges = 0
+        self._latencies: deque = deque(maxlen=_LATENCY_WINDOW)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def backoff_secs(self, attempt: int) -> float:
+        """
+        Computes the delay before retrying an attempt: a random duration up to the base delay
+        doubled for every previous retry, bounded by max_delay_secs.
+
+        Args:
+            attempt (int): The number of the failed attempt, starting at 1.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        ceiling = min(self.max_delay_secs, self.base_delay_secs * 2 ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+    def hedge_delay_secs(self) -> Optional[float]:
+        """
+        Computes the duration of an attempt after which it is duplicated: the 95th percentile
+        of the latencies of the last successful attempts, but at least hedge_min_secs.
+
+        Returns:
+            Optional[float]: The delay, or None if hedging is disabled or too few latencies
+            were observed.
+        """
+        if not self.hedge or len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        return max(self.hedge_min_secs, percentile(list(self._latencies), 0.95))
+
+    def _record_latency(self, start_time: float):
+        self._latencies.append(time.perf_counter() - start_time)
+
+    def _executor(self):
+        from concurrent.futures import (  # pylint: disable=import-outside-toplevel
+            ThreadPoolExecutor,
+        )
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(thread_name_prefix="autodocgen-request")
+            return self._pool
+
+    def attempt(self, send: Callable[[], T], hedge_send: Optional[Callable[[], T]] = None) -> T:
+        """
+        Sends a request once, with hedging. The duration of the request is bounded by the
+        backend, which passes its timeout to the HTTP layer. A hedged request runs in a
+        background thread, which is left to complete (within that timeout) when it loses the
+        race, so send must not change shared state other than the usage of the request.
+
+        Args:
+            send (Callable[[], T]): A function sending the request and returning the response.
+            hedge_send (Optional[Callable[[], T]], optional): The function sending the
+            duplicate of a slow request, e.g. reserving rate limit capacity first. Defaults
+            to send.
+
+        Returns:
+            T: The first response, or the error of the last attempt if both failed.
+        """
+        hedge_delay = self.hedge_delay_secs()
+        start_time = time.perf_counter()
+        if hedge_delay is None:
+            response = send()
+            self._record_latency(start_time)
+            return response
+        import contextvars  # pylint: disable=import-outside-toplevel
+        from concurrent.futures import (  # pylint: disable=import-outside-toplevel
+            FIRST_COMPLETED,
+            wait,
+        )
+
+        executor = self._executor()
+        # The context is copied so the metrics of the node are updated from the thread.
+        futures = [executor.submit(contextvars.copy_context().run, send)]
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            logging.info("Hedging a request running for more than %.1fs", hedge_delay)
+            self.hedges += 1
+            futures.append(executor.submit(contextvars.copy_context().run, hedge_send or send))
+        while True:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None or not futures:
+                    self._record_latency(start_time)
+                    return future.result()
+
+    async def aattempt(
+            self,
+            send: Callable[[], Awaitable[T]],
+            hedge_send: Optional[Callable[[], Awaitable[T]]] = None,
+    ) -> T:
+        """
+        Sends a request once without blocking the event loop, with the timeout and hedging.
+        The losing or timed out attempts are cancelled.
+
+        Args:
+            send (Callable[[], Awaitable[T]]): A coroutine function sending the request and
+            returning the response.
+            hedge_send (Optional[Callable[[], Awaitable[T]]], optional): The coroutine
+            function sending the duplicate of a slow request. Defaults to send.
+
+        Raises:
+            RequestTimeout: If no response arrived within the timeout.
+
+        Returns:
+            T: The first response.
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        hedge_delay = self.hedge_delay_secs()
+        start_time = time.perf_counter()
+        tasks = [asyncio.ensure_future(send())]
+        try:
+            if hedge_delay is not None and (
+                    self.timeout_secs is None or hedge_delay < self.timeout_secs
+            ):
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    logging.info("Hedging a request running for more than %.1fs", hedge_delay)
+                    self.hedges += 1
+                    tasks.append(asyncio.ensure_future((hedge_send or send)()))
+            deadline = None if self.timeout_secs is None else start_time + self.timeout_secs
+            pending = list(tasks)
+            while pending:
+                remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+                done, pending_set = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise RequestTimeout(f"No response within {self.timeout_secs}s")
+                pending = list(pending_set)
+                for task in done:
+                    if task.exception() is None or not pending:
+                        self._record_latency(start_time)
+                        return task.result()
+            raise RequestTimeout(f"No response within {self.timeout_secs}s")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _on_failure(
+            self, error: Exception, attempt: int, rate_limiter: Optional["RateLimiter"]
+    ) -> float:
+        """
+        Handles a failed attempt and computes the delay before the next one.
+
+        Args:
+            error (Exception): The error of the attempt.
+            attempt (int): The number of the attempt, starting at 1.
+            rate_limiter (Optional[RateLimiter]): The rate limiter to notify of rate limits.
+
+        Raises:
+            Exception: The error, if it cannot succeed on a retry or it was the last attempt.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        if not _is_retryable(error):
+            raise error
+        retry_after = retry_after_secs(error)
+        rate_limited = _is_rate_limit(error)
+        if rate_limited and rate_limiter is not None:
+            rate_limiter.on_rate_limit(retry_after)
+        elif not rate_limited and not isinstance(error, CircuitOpenError):
+            self.breaker.record_failure()
+        if attempt >= self.max_attempts:
+            logging.error("Giving up after %d attempts: %s", attempt, error)
+            raise error
+        record_retry()
+        if rate_limited and rate_limiter is not None:
+            # The rate limiter pauses every request until the API accepts them again.
+            delay = 0.0
+        elif retry_after is not None:
+            delay = retry_after
+        else:
+            delay = self.backoff_secs(attempt)
+        logging.warning(
+            "Request failed (attempt %d of %d): %s\nRetrying in %.1fs",
+            attempt,
+            self.max_attempts,
+            error,
+            delay,
+        )
+        return delay
+
+    def call(self, request: Callable[[], T], rate_limiter: Optional["RateLimiter"] = None) -> T:
+        """
+        Calls a request function, retrying it when it fails with a retryable error.
+
+        Args:
+            request (Callable[[], T]): A function sending the request and returning the
+            response, typically through attempt.
+            rate_limiter (Optional[RateLimiter], optional): The rate limiter lowered on rate
+            limit errors. Defaults to None.
+
+        Returns:
+            T: The response.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.breaker.before_request()
+                response = request()
+            except Exception as error:  # pylint: disable=broad-except
+                delay_secs = self._on_failure(error, attempt, rate_limiter)
+                with span("retry.backoff", "wait", attempt=attempt):
+                    time.sleep(delay_secs)
+                continue
+            self.breaker.record_success()
+            return response
+        raise AssertionError("unreachable")
+
+    async def acall(
+            self,
+            request: Callable[[], Awaitable[T]],
+            rate_limiter: Optional["RateLimiter"] = None,
+    ) -> T:
+        """
+        Awaits a request coroutine function, retrying it like call without blocking the other
+        requests while waiting.
+
+        Args:
+            request (Callable[[], Awaitable[T]]): A coroutine function sending the request and
+            returning the response, typically through aattempt.
+            rate_limiter (Optional[RateLimiter], optional): The rate limiter lowered on rate
+            limit errors. Defaults to None.
+
+        Returns:
+            T: The response.
+        """
+        import asyncio  # pylint: disable=import-outside-toplevel
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self.breaker.before_request()
+                response = await request()
+            except Exception as error:  # pylint: disable=broad-except
+                delay_secs = self._on_failure(error, attempt, rate_limiter)
+                with span("retry.backoff", "wait", attempt=attempt):
+                    await asyncio.sleep(delay_secs)
+                continue
+            self.breaker.record_success()
+            return response
+        raise AssertionError("unreachable")
+
+    def close(self):
+        """
+        Stops the threads of the hedged attempts, without waiting for the requests that lost
+        the race.
+
+        Returns:
+            None
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
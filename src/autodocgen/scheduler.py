@@ -0,0 +1,281 @@
+import ast
+import logging
+import threading
+import time
+from _ast import AST
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Sequence, TYPE_CHECKING
+
+from .node_index import NodeIndex
+
+if TYPE_CHECKING:
+    from . import DocGenDef
+
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+NodePriority = tuple[bool, bool, int, int]
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parses a duration given in seconds, optionally with an s, m or h suffix, e.g. 90, 15m or
+    1.5h.
+
+    Args:
+        value (str): The duration.
+
+    Raises:
+        ValueError: If the duration is malformed or negative.
+
+    Returns:
+        float: The duration in seconds.
+    """
+    value = value.strip().lower()
+    factor = _DURATION_UNITS.get(value[-1:], None)
+    number = float(value[:-1] if factor is not None else value)
+    if number < 0:
+        raise ValueError(f"negative duration: {value}")
+    return number * (factor or 1)
+
+
+class RunBudget:
+    """
+    RunBudget class for bounding the spend and the duration of a run.
+
+    Every response is charged to the budget with its token usage. Once the maximum number of
+    tokens or requests is reached, or the deadline has passed, no further request is started:
+    the requests already in flight are completed, so a run can exceed its token budget by at
+    most the size of those requests. One instance is meant to be shared by all requests of a
+    run, and split between worker processes.
+
+    Attributes:
+    -----------
+    max_tokens : Optional[int]
+        The maximum number of tokens, or None for no limit.
+    max_requests : Optional[int]
+        The maximum number of requests, or None for no limit.
+    deadline : Optional[float]
+        The time (as returned by time.time) after which no request is started, or None.
+    used_tokens : int
+        The number of tokens charged so far.
+    used_requests : int
+        The number of requests charged so far.
+
+    Methods:
+    --------
+    charge(self, tokens: int)
+        Charges a response to the budget.
+    exhausted_reason(self) -> Optional[str]
+        Returns which limit has been reached, if any.
+    exhausted(self) -> bool
+        Returns whether no further request may be started.
+    split(self, parts: int) -> RunBudget
+        Creates the share of the budget of one of several worker processes.
+    """
+
+    def __init__(
+            self,
+            max_tokens: Optional[int] = None,
+            max_requests: Optional[int] = None,
+            deadline_secs: Optional[float] = None,
+    ):
+        """
+        Initializes an instance of the class. The deadline starts running immediately.
+
+        Args:
+            max_tokens (Optional[int], optional): The maximum number of tokens. Defaults to None.
+            max_requests (Optional[int], optional): The maximum number of requests.
+            Defaults to None.
+            deadline_secs (Optional[float], optional): The number of seconds after which no
+            request is started. Defaults to None.
+
+        Returns:
+            None
+        """
+        self.max_tokens = max_tokens
+        self.max_requests = max_requests
+        self.deadline = None if deadline_secs is None else time.time() + deadline_secs
+        self.used_tokens = 0
+        self.used_requests = 0
+        self._lock = threading.Lock()
+
+    def charge(self, tokens: int):
+        """
+        Charges a response to the budget.
+
+        Args:
+            tokens (int): The total number of tokens used by the request.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.used_tokens += tokens
+            self.used_requests += 1
+
+    def exhausted_reason(self) -> Optional[str]:
+        """
+        Returns which limit has been reached, if any.
+
+        Returns:
+            Optional[str]: "max tokens", "max requests" or "deadline", or None.
+        """
+        if self.max_tokens is not None and self.used_tokens >= self.max_tokens:
+            return "max tokens"
+        if self.max_requests is not None and self.used_requests >= self.max_requests:
+            return "max requests"
+        if self.deadline is not None and time.time() >= self.deadline:
+            return "deadline"
+        return None
+
+    def exhausted(self) -> bool:
+        """
+        Returns whether no further request may be started.
+
+        Returns:
+            bool: True once a limit has been reached.
+        """
+        return self.exhausted_reason() is not None
+
+    def split(self, parts: int) -> "RunBudget":
+        """
+        Creates the share of the budget of one of several worker processes, which cannot
+        charge a shared budget. The token and request limits are divided evenly, and the
+        deadline is kept.
+
+        Args:
+            parts (int): The number of worker processes.
+
+        Returns:
+            RunBudget: The share of one worker process.
+        """
+        parts = max(1, parts)
+        share = RunBudget(
+            None if self.max_tokens is None else max(1, self.max_tokens // parts),
+            None if self.max_requests is None else max(1, self.max_requests // parts),
+        )
+        share.deadline = self.deadline
+        return share
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+def _is_private(name: str) -> bool:
+    return name.startswith("_") and not (name.startswith("__") and name.endswith("__"))
+
+
+def count_references(tree: AST) -> Counter:
+    """
+    Counts the references to every name in a tree, as a variable or as an attribute.
+
+    Args:
+        tree (AST): The tree to walk.
+
+    Returns:
+        Counter: The number of references, keyed by name.
+    """
+    references: Counter = Counter()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            references[node.id] += 1
+        elif isinstance(node, ast.Attribute):
+            references[node.attr] += 1
+    return references
+
+
+def node_priority(node: "DocGenDef", qualified_name: str, references: Counter) -> NodePriority:
+    """
+    Computes the priority of a node. Priorities compare as tuples: public nodes come before
+    private ones (any part of the qualified name starting with an underscore, except dunder
+    names), then undocumented nodes before documented ones, then the most referenced nodes,
+    then the largest ones.
+
+    Args:
+        node (DocGenDef): The node.
+        qualified_name (str): The qualified name of the node.
+        references (Counter): The number of references to every name.
+
+    Returns:
+        NodePriority: The priority of the node, higher first.
+    """
+    public = not any(_is_private(part) for part in qualified_name.split("."))
+    size = (getattr(node, "end_lineno", None) or node.lineno) - node.lineno + 1
+    return public, ast.get_docstring(node) is None, references[node.name], size
+
+
+def rank_defs(
+        index: NodeIndex, collected: Sequence[tuple["DocGenDef", str]]
+) -> list[tuple["DocGenDef", str]]:
+    """
+    Orders the collected nodes of a tree by priority, highest first. Nodes of equal priority
+    keep their order.
+
+    Args:
+        index (NodeIndex): The index of the tree the nodes were collected from.
+        collected (Sequence[tuple[DocGenDef, str]]): The collected nodes and their types.
+
+    Returns:
+        list[tuple[DocGenDef, str]]: The nodes in the order to document them.
+    """
+    references = count_references(index.tree)
+
+    def priority(item: tuple["DocGenDef", str]) -> NodePriority:
+        entry = index.get(item[0])
+        return node_priority(
+            item[0], item[0].name if entry is None else entry.qualname, references
+        )
+
+    return sorted(collected, key=priority, reverse=True)
+
+
+def rank_files(files: Sequence[Path]) -> list[Path]:
+    """
+    Orders files by the value of documenting them, highest first: the number of public
+    undocumented nodes, then the number of undocumented nodes, then the number of references
+    to their nodes from all the files. Files that cannot be parsed come last, and files of
+    equal value keep their order.
+
+    Args:
+        files (Sequence[Path]): The files to order.
+
+    Returns:
+        list[Path]: The files in the order to document them.
+    """
+    defs: dict[Path, list[tuple[str, bool, bool]]] = {}
+    references: Counter = Counter()
+    for file_path in files:
+        try:
+            tree = ast.parse(Path(file_path).read_text(encoding="utf-8"))
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as error:
+            logging.debug("Cannot rank %s: %s", file_path, error)
+            continue
+        references.update(count_references(tree))
+        defs[file_path] = [
+            (
+                entry.node.name,
+                not any(_is_private(part) for part in entry.qualname.split(".")),
+                entry.docstring is None,
+            )
+            for entry in NodeIndex(tree)
+        ]
+
+    def score(file_path: Path) -> tuple[bool, int, int, int]:
+        if file_path not in defs:
+            return False, 0, 0, 0
+        nodes = defs[file_path]
+        return (
+            True,
+            sum(public and undocumented for _, public, undocumented in nodes),
+            sum(undocumented for _, _, undocumented in nodes),
+            sum(references[name] for name, _, _ in nodes),
+        )
+
+    return sorted(files, key=score, reverse=True)
@@ -0,0 +1,195 @@
+import ast
+import inspect
+import io
+from _ast import AST, AsyncFunctionDef, ClassDef, FunctionDef
+from typing import NamedTuple, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .node_index import NodeIndex
+
+_DEF_TYPES = (ClassDef, FunctionDef, AsyncFunctionDef)
+
+
+class SpliceEdit(NamedTuple):
+    """
+    SpliceEdit class for a replacement of a range of the source code
+
+    Attributes:
+    -----------
+    start : int
+        The offset of the first replaced character.
+    end : int
+        The offset after the last replaced character. Equal to start for an insertion.
+    text : str
+        The replacement text.
+    """
+
+    start: int
+    end: int
+    text: str
+
+
+def render_docstring(docstring: str, indent: str) -> str:
+    """
+    Renders a docstring as a triple-quoted string literal. Multi-line docstrings are cleaned
+    with inspect.cleandoc and re-indented, with the quotes on lines of their own.
+
+    Args:
+        docstring (str): The value of the docstring.
+        indent (str): The indentation of the statement holding the docstring.
+
+    Returns:
+        str: The string literal, without leading indentation or a trailing newline.
+    """
+    text = inspect.cleandoc(docstring).replace("\\", "\\\\").replace('"""', '\\"\\"\\"')
+    lines = text.splitlines()
+    if len(lines) <= 1:
+        if text.endswith('"'):
+            text = text[:-1] + '\\"'
+        return '"""' + text + '"""'
+    body = "\n".join(indent + line if line else "" for line in lines)
+    return '"""\n' + body + "\n" + indent + '"""'
+
+
+def is_new_docstring(node: "AST") -> bool:
+    """
+    Checks whether the docstring of a class or function was added to its tree after parsing,
+    by ASTAnalyzer.add_docstring_to_ast, which gives it no position.
+
+    Args:
+        node (AST): The node.
+
+    Returns:
+        bool: True if the node is a class or function with a new docstring.
+    """
+    if not isinstance(node, _DEF_TYPES) or not node.body:
+        return False
+    first = node.body[0]
+    return (
+        isinstance(first, ast.Expr)
+        and isinstance(first.value, ast.Constant)
+        and isinstance(first.value.value, str)
+        and not hasattr(first, "lineno")
+    )
+
+
+def _original_docstring(first: "ast.stmt") -> Optional[ast.Expr]:
+    if (
+            isinstance(first, ast.Expr)
+            and isinstance(first.value, ast.Constant)
+            and isinstance(first.value.value, str)
+    ):
+        return first
+    return None
+
+
+def _statement_lineno(statement: "AST", lines: list[str]) -> int:
+    # A decorated class or function starts at the @ of its first decorator, not at its header.
+    if not isinstance(statement, _DEF_TYPES) or not statement.decorator_list:
+        return statement.lineno
+    lineno = min(decorator.lineno for decorator in statement.decorator_list)
+    while not lines[lineno - 1].lstrip().startswith("@"):
+        lineno -= 1
+    return lineno
+
+
+def splice_docstrings(
+        source_code: str, tree: "AST", index: Optional["NodeIndex"] = None
+) -> str:
+    """
+    Writes the docstrings added to a tree into the source code it was parsed from, leaving
+    every other character of the source code, including comments and formatting, untouched.
+
+    Docstrings added by ASTAnalyzer.add_docstring_to_ast have no position, which is how they
+    are told apart from the docstrings parsed from the source code. Every new docstring
+    replaces the original docstring of its node, or is inserted right after the header of the
+    node, before any comments or decorators preceding the body. All edits are applied in a
+    single pass, and the result is parsed again so that a bad splice never reaches a file.
+
+    Args:
+        source_code (str): The source code the tree was parsed from.
+        tree (AST): The tree with the added docstrings.
+        index (Optional[NodeIndex], optional): The index of the tree, built before the
+        docstrings were added, whose entries keep the original first statement of every
+        node. Without it, the source code is parsed again to find them. Defaults to None.
+
+    Returns:
+        str: The source code with the new docstrings.
+
+    Raises:
+        ValueError: If the source code with the new docstrings is not valid Python.
+    """
+    # The new docstrings, with the node and the original first statement of their body.
+    spliced: list[tuple["AST", "ast.stmt", str]] = []
+    if index is not None and index.tree is tree:
+        spliced = [
+            (entry.node, entry.first_statement, entry.node.body[0].value.value)
+            for entry in index
+            if is_new_docstring(entry.node)
+        ]
+    else:
+        new_docstrings = {
+            (node.lineno, node.col_offset): node.body[0].value.value
+            for node in ast.walk(tree)
+            if is_new_docstring(node) and hasattr(node, "lineno")
+        }
+        if new_docstrings:
+            spliced = [
+                (node, node.body[0], new_docstrings[(node.lineno, node.col_offset)])
+                for node in ast.walk(ast.parse(source_code))
+                if isinstance(node, _DEF_TYPES)
+                and (node.lineno, node.col_offset) in new_docstrings
+            ]
+    if not spliced:
+        return source_code
+    lines = io.StringIO(source_code, newline="").readlines()
+    line_starts = [0]
+    for line in lines:
+        line_starts.append(line_starts[-1] + len(line))
+
+    def offset(lineno: int, col_offset: int) -> int:
+        line = lines[lineno - 1]
+        return line_starts[lineno - 1] + len(line.encode("utf-8")[:col_offset].decode("utf-8"))
+
+    def line_indent(lineno: int) -> str:
+        line = lines[lineno - 1]
+        return line[: len(line) - len(line.lstrip(" \t"))]
+
+    edits: list[SpliceEdit] = []
+    for node, first, docstring in spliced:
+        first_lineno = _statement_lineno(first, lines)
+        if first_lineno == first.lineno:
+            start = offset(first.lineno, first.col_offset)
+        else:
+            start = line_starts[first_lineno - 1] + len(line_indent(first_lineno))
+        own_line = not lines[first_lineno - 1][: start - line_starts[first_lineno - 1]].strip()
+        indent = line_indent(first_lineno) if own_line else line_indent(node.lineno) + "    "
+        literal = render_docstring(docstring, indent)
+        original = _original_docstring(first)
+        if original is not None:
+            end = offset(original.end_lineno, original.end_col_offset)
+            edits.append(SpliceEdit(start, end, literal))
+        elif own_line:
+            body_lineno = first_lineno
+            while body_lineno > node.lineno and lines[body_lineno - 2].strip()[:1] in ("", "#"):
+                body_lineno -= 1
+            line_start = line_starts[body_lineno - 1]
+            edits.append(SpliceEdit(line_start, line_start, indent + literal + "\n"))
+        else:
+            header_end = start
+            while source_code[header_end - 1] in " \t":
+                header_end -= 1
+            edits.append(SpliceEdit(header_end, start, "\n" + indent + literal + "\n" + indent))
+    pieces = []
+    position = 0
+    for edit in sorted(edits):
+        pieces.append(source_code[position:edit.start])
+        pieces.append(edit.text)
+        position = edit.end
+    pieces.append(source_code[position:])
+    new_code = "".join(pieces)
+    try:
+        ast.parse(new_code)
+    except SyntaxError as error:
+        raise ValueError(f"Splicing the docstrings produced invalid code: {error}") from error
+    return new_code
@@ -0,0 +1,168 @@
+import re
+from typing import Any, AsyncIterator, Iterator, Optional
+
+# The delimiters of the docstring in a response, in order of precedence. A block between
+# three double quotes wins over one between three backticks, which wins over three single
+# quotes, wherever they appear in the response.
+DOCSTRING_DELIMITERS: tuple[tuple[str, str], ...] = (
+    ('"""', "three double quotes"),
+    ("```", "three backticks"),
+    ("'''", "three single quotes"),
+)
+_DOCSTRING_PATTERNS = tuple(
+    (re.compile(re.escape(delimiter) + r"([\s\S]*?)" + re.escape(delimiter)), description)
+    for delimiter, description in DOCSTRING_DELIMITERS
+)
+
+
+def extract_docstring(response: str) -> tuple[str, Optional[str]]:
+    """
+    Extracts the docstring from a response: the first block between three double quotes,
+    or else between three backticks, or else between three single quotes.
+
+    Args:
+        response (str): The response of the model.
+
+    Returns:
+        tuple[str, Optional[str]]: The docstring, or the whole response if no block was found,
+        and the description of the delimiter it was extracted with, or None.
+    """
+    for pattern, description in _DOCSTRING_PATTERNS:
+        match = pattern.search(response)
+        if match:
+            return match.group(1), description
+    return response, None
+
+
+class DocstringScanner:
+    """
+    DocstringScanner class for detecting, while a response is streamed, that the docstring
+    extract_docstring would return is complete.
+
+    A block between three double quotes takes precedence over any other block, wherever it
+    appears, so the scanner only looks for those delimiters, looking at every character once.
+    As soon as the first block between three double quotes is closed, no later text can
+    change the extracted docstring. A block between backticks or single quotes never ends the
+    stream early, since a block between double quotes may still follow it: the whole response
+    is then read, and the docstring extracted from it, exactly as without streaming.
+
+    Attributes:
+    -----------
+    text : str
+        The text received so far.
+    end : Optional[int]
+        The length of the prefix of the text holding the complete docstring, once found.
+
+    Methods:
+    --------
+    feed(self, chunk: str) -> bool
+        Adds a chunk of the response and returns whether the docstring is complete.
+    result(self) -> str
+        Returns the text up to the end of the docstring, or all text if it is incomplete.
+    """
+
+    def __init__(self):
+        """
+        Initializes an instance of the class.
+
+        Returns:
+            None
+        """
+        self.text = ""
+        self.end: Optional[int] = None
+        self._opening: Optional[int] = None
+        self._position = 0
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Adds a chunk of the response and returns whether the docstring is complete.
+
+        Args:
+            chunk (str): The next chunk of the response.
+
+        Returns:
+            bool: True once a block between three double quotes is closed, after which the
+            rest of the response can be discarded.
+        """
+        if self.end is not None:
+            return True
+        delimiter = DOCSTRING_DELIMITERS[0][0]
+        # Only the last two characters of the previous chunks can start a delimiter that
+        # ends in this chunk, so the search window stays small.
+        window_start = max(self._position, len(self.text) - len(delimiter) + 1)
+        self.text += chunk
+        while self.end is None:
+            found = self.text.find(delimiter, window_start)
+            if found < 0:
+                break
+            if self._opening is None:
+                self._opening = found
+            else:
+                self.end = found + len(delimiter)
+            window_start = self._position = found + len(delimiter)
+        return self.end is not None
+
+    def result(self) -> str:
+        """
+        Returns the text up to the end of the docstring, or all text if it is incomplete.
+
+        Returns:
+            str: The text to extract the docstring from.
+        """
+        return self.text if self.end is None else self.text[: self.end]
+
+
+def _chunk_content(chunk: Any) -> str:
+    return chunk.choices[0].delta.get("content") or ""
+
+
+def consume_stream(stream: Iterator[Any]) -> tuple[str, bool]:
+    """
+    Reads a streamed chat completion until its docstring is complete, then closes the stream.
+
+    Args:
+        stream (Iterator[Any]): The chunks of the completion, as returned with stream=True.
+
+    Returns:
+        tuple[str, bool]: The text up to the end of the docstring, and whether the stream was
+        stopped before its end.
+    """
+    scanner = DocstringScanner()
+    stopped_early = False
+    try:
+        for chunk in stream:
+            if scanner.feed(_chunk_content(chunk)):
+                stopped_early = True
+                break
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return scanner.result(), stopped_early
+
+
+async def aconsume_stream(stream: AsyncIterator[Any]) -> tuple[str, bool]:
+    """
+    Reads a streamed chat completion until its docstring is complete, then closes the stream,
+    without blocking the event loop.
+
+    Args:
+        stream (AsyncIterator[Any]): The chunks of the completion, as returned by acreate with
+        stream=True.
+
+    Returns:
+        tuple[str, bool]: The text up to the end of the docstring, and whether the stream was
+        stopped before its end.
+    """
+    scanner = DocstringScanner()
+    stopped_early = False
+    try:
+        async for chunk in stream:
+            if scanner.feed(_chunk_content(chunk)):
+                stopped_early = True
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    return scanner.result(), stopped_early
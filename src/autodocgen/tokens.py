@@ -0,0 +1,19 @@
+import math
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens of a text without a tokenizer.
+
+    OpenAI models average about four characters per token on English text and Python code,
+    which is accurate enough for budgeting and rate limiting.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
@@ -0,0 +1,271 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional, Sequence, TYPE_CHECKING
+
+from .discovery import discover_python_files
+
+if TYPE_CHECKING:
+    import threading
+    from .node_index import NodeIndex
+
+# The modification time and size of a file, compared between polls.
+FileStat = tuple[int, int]
+# Selects the unique names of the nodes of a file to document, given its index.
+NodeSelector = Callable[["NodeIndex"], set[str]]
+
+
+def _stat(file_path: Path) -> Optional[FileStat]:
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Watcher:
+    """
+    Watcher class for regenerating the docstrings of the classes and functions whose body
+    changed while a tree is being edited.
+
+    The watched path is polled for new and modified Python files. Changes arriving within the
+    debounce delay of each other are handled together, once the files have settled. Every
+    changed file is documented by the document callback, which gets a selector of the nodes
+    whose body fingerprint (see DocNode.source_hash) differs from the previous version of the
+    file, so edits to docstrings and comments do not trigger a request, nor do the docstrings
+    written by the callback itself. The fingerprints of a file are only replaced once it has
+    been documented, so a file edited while it was being documented is documented again.
+
+    Attributes:
+    -----------
+    path : Path
+        The watched Python file or directory.
+    document : Callable[[Path, NodeSelector], bool]
+        Documents the selected nodes of a file, returning False if the file must be
+        documented again, e.g. because it changed in the meantime.
+    poll_interval : float
+        The pause between two polls, in seconds.
+    debounce : float
+        The time without further changes to wait for before documenting changed files.
+    include : Optional[Sequence[str]]
+        Globs a file of a watched directory must match.
+    exclude : Optional[Sequence[str]]
+        Globs of files and directories of a watched directory to ignore.
+    use_gitignore : bool
+        Whether to ignore paths ignored by .gitignore files.
+    stem_suffix : Optional[str]
+        The suffix of the output files, which are ignored, if any.
+    stats : dict[Path, FileStat]
+        The modification time and size of every watched file when it was last handled.
+    hashes : dict[Path, dict[str, str]]
+        The body fingerprints of the nodes of every watched file, keyed by unique name.
+    runs : int
+        The number of times changed files were documented.
+
+    Methods:
+    --------
+    scan(self) -> dict[Path, FileStat]
+        Lists the watched files with their modification time and size.
+    baseline(self)
+        Records the current state of the watched files, without documenting them.
+    poll(self) -> dict[Path, FileStat]
+        Lists the files that are new or modified since they were last handled.
+    select_changed(self, file_path: Path) -> NodeSelector
+        Creates the selector of the changed nodes of a file.
+    handle(self, files: Sequence[Path])
+        Documents changed files.
+    run(self, stop: Optional[threading.Event]=None)
+        Watches the path until interrupted.
+    """
+
+    def __init__(
+            self,
+            path: Path,
+            document: Callable[[Path, NodeSelector], bool],
+            poll_interval: float = 0.5,
+            debounce: float = 0.3,
+            include: Optional[Sequence[str]] = None,
+            exclude: Optional[Sequence[str]] = None,
+            use_gitignore: bool = True,
+            stem_suffix: Optional[str] = None,
+    ):
+        """
+        Initializes an instance of the class.
+
+        Args:
+            path (Path): The watched Python file or directory.
+            document (Callable[[Path, NodeSelector], bool]): Documents the selected nodes of
+            a file.
+            poll_interval (float, optional): The pause between two polls. Defaults to 0.5.
+            debounce (float, optional): The time without further changes to wait for.
+            Defaults to 0.3.
+            include (Optional[Sequence[str]], optional): Globs a file must match.
+            Defaults to "*.py".
+            exclude (Optional[Sequence[str]], optional): Globs of paths to ignore.
+            Defaults to None.
+            use_gitignore (bool, optional): Whether to ignore paths ignored by .gitignore
+            files. Defaults to True.
+            stem_suffix (Optional[str], optional): The suffix of the output files to ignore.
+            Defaults to None.
+
+        Returns:
+            None
+        """
+        self.path = Path(path)
+        self.document = document
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.include = include
+        self.exclude = exclude
+        self.use_gitignore = use_gitignore
+        self.stem_suffix = stem_suffix
+        self.stats: dict[Path, FileStat] = {}
+        self.hashes: dict[Path, dict[str, str]] = {}
+        self._pending_hashes: dict[Path, dict[str, str]] = {}
+        self.runs = 0
+
+    def scan(self) -> dict[Path, FileStat]:
+        """
+        Lists the watched files with their modification time and size.
+
+        Returns:
+            dict[Path, FileStat]: The stats of the files, keyed by path.
+        """
+        if self.path.is_file():
+            files = [self.path]
+        else:
+            files = discover_python_files(
+                self.path,
+                include=self.include,
+                exclude=self.exclude,
+                use_gitignore=self.use_gitignore,
+                stem_suffix=self.stem_suffix,
+            )
+        stats = {}
+        for file_path in files:
+            stat = _stat(file_path)
+            if stat is not None:
+                stats[file_path] = stat
+        return stats
+
+    def baseline(self):
+        """
+        Records the current state of the watched files, without documenting them, so only
+        later changes are documented. Files that cannot be parsed get their fingerprints once
+        they can.
+
+        Returns:
+            None
+        """
+        import ast  # pylint: disable=import-outside-toplevel
+        from .node_index import NodeIndex  # pylint: disable=import-outside-toplevel
+
+        self.stats = self.scan()
+        for file_path in self.stats:
+            try:
+                tree = ast.parse(file_path.read_text(encoding="utf-8"))
+            except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as error:
+                logging.debug("Cannot fingerprint %s: %s", file_path, error)
+                continue
+            self.hashes[file_path] = {
+                entry.unique_name: entry.source_hash for entry in NodeIndex(tree)
+            }
+
+    def poll(self) -> dict[Path, FileStat]:
+        """
+        Lists the files that are new or modified since they were last handled, and forgets
+        the deleted files.
+
+        Returns:
+            dict[Path, FileStat]: The stats of the changed files, keyed by path.
+        """
+        stats = self.scan()
+        for file_path in set(self.stats) - set(stats):
+            del self.stats[file_path]
+            self.hashes.pop(file_path, None)
+        return {
+            file_path: stat for file_path, stat in stats.items()
+            if self.stats.get(file_path) != stat
+        }
+
+    def select_changed(self, file_path: Path) -> NodeSelector:
+        """
+        Creates the selector of the nodes of a file whose body fingerprint differs from the
+        previous version of the file, or that are new. The new fingerprints are kept aside
+        until the file has been documented.
+
+        Args:
+            file_path (Path): The path of the file.
+
+        Returns:
+            NodeSelector: The selector.
+        """
+
+        def select(index: "NodeIndex") -> set[str]:
+            previous = self.hashes.get(file_path, {})
+            current = {entry.unique_name: entry.source_hash for entry in index}
+            self._pending_hashes[file_path] = current
+            return {name for name, digest in current.items() if previous.get(name) != digest}
+
+        return select
+
+    def handle(self, files: Sequence[Path]):
+        """
+        Documents changed files. A file the callback reports as changed in the meantime is
+        left to the next poll, whereas a file that cannot be parsed or documented is only
+        handled again once it changes.
+
+        Args:
+            files (Sequence[Path]): The changed files.
+
+        Returns:
+            None
+        """
+        self.runs += 1
+        for file_path in files:
+            stat = _stat(file_path)
+            try:
+                documented = self.document(file_path, self.select_changed(file_path))
+            except SyntaxError as error:
+                logging.warning("Cannot parse %s, waiting for a change: %s", file_path, error)
+                documented = None
+            except Exception:  # pylint: disable=broad-except
+                logging.exception("Failed to document %s, waiting for a change", file_path)
+                documented = None
+            pending = self._pending_hashes.pop(file_path, None)
+            if documented is False:
+                continue
+            if documented:
+                if pending is not None:
+                    self.hashes[file_path] = pending
+                # The docstrings written in place are not a change to handle.
+                stat = _stat(file_path)
+            if stat is not None:
+                self.stats[file_path] = stat
+
+    def run(self, stop: Optional["threading.Event"] = None):
+        """
+        Watches the path until interrupted, or until stop is set: polls it and, once the
+        changed files have not changed again for the debounce delay, documents them together.
+
+        Args:
+            stop (Optional[threading.Event], optional): An event ending the watch.
+            Defaults to None.
+
+        Returns:
+            None
+        """
+        self.baseline()
+        while stop is None or not stop.is_set():
+            changed = self.poll()
+            while changed:
+                time.sleep(self.debounce)
+                settled, changed = changed, self.poll()
+                if changed == settled:
+                    self.handle(sorted(changed))
+                    break
+            if stop is None:
+                time.sleep(self.poll_interval)
+            else:
+                stop.wait(self.poll_interval)
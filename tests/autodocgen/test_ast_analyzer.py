@@ -1,11 +1,18 @@
 import base64
 import secrets
+import threading
+import time
 from _ast import AST
 from pathlib import Path
 
 import pytest
 
 from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.metrics import MetricsCollector
+from src.autodocgen.rate_limiter import RateLimiter
+from src.autodocgen.retry import RetryExecutor
+from src.autodocgen.scheduler import RunBudget
 
 
 def generate_random_b64_string(length: int):
@@ -46,3 +53,54 @@ def test_write_ast_to_file(ast_analyzer, load_from_file):
 
     # Assert that the contents match the expected value
     assert file_contents == expected_code
+
+
+def test_messages_are_not_shared_between_instances(ast_analyzer):
+    other_analyzer = ASTAnalyzer()
+    ast_analyzer.add_new_prompt_to_messages("def f(): pass")
+    assert len(ast_analyzer.model_kwargs["messages"]) == 2
+    assert other_analyzer.model_kwargs["messages"] == ASTAnalyzer.default_messages
+    assert ASTAnalyzer.default_model_kwargs["messages"] == ASTAnalyzer.default_messages
+
+
+class SlowFirstStubBackend(StubBackend):
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def create(self, **kwargs):
+        if self.requests == 0:
+            self.requests += 1
+            self.released.wait(5)
+            return super().create(**kwargs)
+        self.released.set()
+        return super().create(**kwargs)
+
+
+def test_hedged_requests_reserve_capacity_and_are_charged():
+    executor = RetryExecutor(hedge=True, hedge_min_secs=0.05)
+    executor._latencies.extend([0.0] * 20)
+    rate_limiter = RateLimiter(rpm=1000, tpm=1_000_000)
+    acquired = []
+    acquire = rate_limiter.acquire
+    rate_limiter.acquire = lambda tokens: acquired.append(tokens) or acquire(tokens)
+    budget = RunBudget()
+    metrics = MetricsCollector()
+    analyzer = ASTAnalyzer(
+        backend=SlowFirstStubBackend(),
+        rate_limiter=rate_limiter,
+        budget=budget,
+        retry_executor=executor,
+    )
+    with metrics.track_node("module.py", "f", "Function", "gpt-3.5-turbo") as metric:
+        assert "f" in analyzer.obtain_pydoc("def f():\n    pass")
+        # The first attempt lost the race and completes in the background.
+        for _ in range(100):
+            if metric["requests"] == 2:
+                break
+            time.sleep(0.01)
+    executor.close()
+    assert executor.hedges == 1
+    assert len(acquired) == 2 and acquired[0] == acquired[1]
+    assert metric["requests"] == budget.used_requests == 2
+    assert analyzer.total_token_usage == budget.used_tokens > 0
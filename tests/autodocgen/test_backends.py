@@ -0,0 +1,106 @@
+import asyncio
+import pickle
+import sys
+
+import openai
+import pytest
+
+from src.autodocgen import cli
+from src.autodocgen.backends import (
+    OpenAIBackend,
+    OpenAICompatibleBackend,
+    StubBackend,
+    create_backend,
+)
+
+MESSAGES = [{"role": "user", "content": "def f(): pass"}]
+
+
+def test_openai_backend_passes_credentials_per_request(monkeypatch):
+    requests = []
+    monkeypatch.setattr(
+        openai.ChatCompletion,
+        "create",
+        lambda **kwargs: requests.append((kwargs, openai.requestssession)),
+    )
+    backend = OpenAICompatibleBackend("http://localhost:8000/v1", api_key="key", model="local")
+    backend.create(model="gpt-3.5-turbo", messages=MESSAGES)
+    backend.create(model="gpt-3.5-turbo", messages=MESSAGES)
+    backend.close()
+
+    (first_kwargs, first_session), (_, second_session) = requests
+    assert first_kwargs["api_key"] == "key"
+    assert first_kwargs["api_base"] == "http://localhost:8000/v1"
+    assert first_kwargs["model"] == "local"
+    assert first_session is second_session
+
+
+def test_openai_backend_reuses_aiohttp_session(monkeypatch):
+    sessions = []
+
+    async def fake_acreate(**kwargs):
+        sessions.append(openai.aiosession.get())
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", fake_acreate)
+    backend = OpenAIBackend(api_key="key")
+
+    async def send_requests():
+        await asyncio.gather(*(backend.acreate(messages=MESSAGES) for _ in range(3)))
+
+    backend.run(send_requests())
+    backend.run(send_requests())
+    assert len(sessions) == 6 and len(set(map(id, sessions))) == 1
+    assert openai.aiosession.get() is None
+    backend.close()
+    assert sessions[0].closed
+
+
+def test_backends_pass_the_timeout_to_the_http_layer(monkeypatch):
+    requests = []
+
+    async def fake_acreate(**kwargs):
+        requests.append((kwargs, openai.aiosession.get()))
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", lambda **kwargs: requests.append(kwargs))
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", fake_acreate)
+    backend = create_backend("openai-compatible", "http://localhost:8000/v1", timeout_secs=5)
+    backend.create(messages=MESSAGES)
+    backend.run(backend.acreate(messages=MESSAGES))
+    backend.close()
+
+    sync_kwargs, (async_kwargs, session) = requests
+    assert sync_kwargs["request_timeout"] == async_kwargs["request_timeout"] == 5
+    assert session.timeout.total == 5
+
+
+def test_backends_pickle_without_runtime_state():
+    backend = OpenAIBackend(api_key="key")
+    backend.run(asyncio.sleep(0))
+    copy = pickle.loads(pickle.dumps(backend))
+    assert copy.api_key == "key" and copy._loop is None
+    backend.close()
+
+    stub = StubBackend()
+    stub.create(messages=MESSAGES)
+    assert pickle.loads(pickle.dumps(stub)).requests == 1
+
+
+def test_create_backend_requires_base_url_for_compatible_backend():
+    with pytest.raises(ValueError):
+        create_backend("openai-compatible")
+    assert isinstance(create_backend("stub"), StubBackend)
+
+
+def test_main_with_stub_backend_does_not_need_openai_key(monkeypatch, tmp_path):
+    monkeypatch.delenv("OPENAI_KEY", raising=False)
+    for name in ("first", "second"):
+        (tmp_path / f"{name}.py").write_text(f"def {name}():\n    return 1\n")
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["autodocgen", str(tmp_path), "-i", "--no-cache", "--disable_tqdm", "--backend", "stub",
+         "--concurrency", "2", "--journal", str(tmp_path / "journal.jsonl")],
+    )
+    cli.main()
+    assert '"""Docs for first."""' in (tmp_path / "first.py").read_text()
+    assert '"""Docs for second."""' in (tmp_path / "second.py").read_text()
@@ -0,0 +1,27 @@
+from src.autodocgen.batching import build_batch_prompt, pack_batches, parse_batch_response
+
+
+def test_pack_batches_respects_budget_and_isolates_large_prompts():
+    assert pack_batches([10, 10, 10, 10], token_budget=100) == [[0, 1, 2, 3]]
+    assert pack_batches([25, 25, 25, 25, 25], token_budget=100) == [[0, 1, 2, 3], [4]]
+    assert pack_batches([10, 90, 10], token_budget=100) == [[1], [0, 2]]
+    assert pack_batches([1] * 5, token_budget=100, max_batch_size=2) == [[0, 1], [2, 3], [4]]
+
+
+def test_build_batch_prompt_names_every_node():
+    prompt = build_batch_prompt([("Shape.area", "def area(self):\n    return 0\n"), ("first", "def first(): ...")])
+    assert "### Shape.area\n```python\ndef area(self):\n    return 0\n```" in prompt
+    assert "### first\n```python\ndef first(): ...\n```" in prompt
+    assert "JSON" in prompt
+
+
+def test_parse_batch_response():
+    names = ["Shape.area", "first"]
+    assert parse_batch_response('{"Shape.area": "Area.", "first": "First."}', names) == {
+        "Shape.area": "Area.",
+        "first": "First.",
+    }
+    fenced = 'Here you go:\n```json\n{"first": "First.", "Shape.area": 3}\n```\nDone.'
+    assert parse_batch_response(fenced, names) == {"first": "First."}
+    assert parse_batch_response("Sorry, I cannot do that.", names) == {}
+    assert parse_batch_response('["first"]', names) == {}
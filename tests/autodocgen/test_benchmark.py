@@ -0,0 +1,59 @@
+import pytest
+
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.benchmark import (
+    compare_to_baseline,
+    generate_corpus,
+    run_benchmark,
+)
+
+
+@pytest.mark.parametrize("shape", ["small-functions", "huge-classes", "deep-packages"])
+def test_generate_corpus_counts_nodes(tmp_path, shape):
+    nodes = generate_corpus(tmp_path, shape, files=6, nodes_per_file=8)
+    source_files = list(tmp_path.rglob("*.py"))
+    assert len(source_files) == 6
+    assert nodes == sum(
+        source_file.read_text().count("def ") + source_file.read_text().count("class ")
+        for source_file in source_files
+    )
+
+
+def test_run_benchmark_sends_one_request_per_node():
+    result = run_benchmark("small-functions", files=2, nodes_per_file=3)
+    assert result["nodes"] == 6
+    assert result["requests"] == 6
+    assert result["prompt_tokens"] > 0
+
+
+def test_run_benchmark_retries_injected_errors():
+    stub = StubBackend(error_rate=0.2, rate_limit_rate=0.2, seed=1)
+    result = run_benchmark("deep-packages", files=3, nodes_per_file=4, stub=stub, concurrency=2)
+    assert result["errors"] + result["rate_limited"] > 0
+    assert result["requests"] == result["nodes"] + result["errors"] + result["rate_limited"]
+
+
+def test_stub_backend_answers_asynchronous_requests():
+    stub = StubBackend()
+    response = stub.run(
+        stub.acreate(messages=[{"role": "user", "content": "def f(): pass"}])
+    )
+    stub.close()
+    assert stub.requests == 1
+    assert response.choices[0].message.content == '"""Docs for f."""'
+
+
+def test_compare_to_baseline_flags_regressions():
+    baseline = {
+        "small-functions": {
+            "shape": "small-functions",
+            "nodes_per_sec": 100.0,
+            "requests": 10,
+            "prompt_tokens": 1000,
+            "completion_tokens": 100,
+        }
+    }
+    result = {**baseline["small-functions"], "nodes_per_sec": 70.0, "prompt_tokens": 1100}
+    regressions = compare_to_baseline([result], baseline, tolerance=0.2)
+    assert len(regressions) == 1
+    assert "nodes/s" in regressions[0]
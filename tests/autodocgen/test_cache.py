@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.backends import OpenAIBackend, StubBackend, backend_identity
+from src.autodocgen.cache import DocstringCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    docstring_cache = DocstringCache(tmp_path)
+    yield docstring_cache
+    docstring_cache.connection.close()
+
+
+def test_put_and_get_counts_hits_and_misses(cache):
+    key = cache.make_key("def f():\n    pass\n", ASTAnalyzer.default_model_kwargs, "prompt")
+    assert cache.get(key) is None
+    cache.put(key, '"""Does nothing."""')
+    assert cache.get(key) == '"""Does nothing."""'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_key_depends_on_source_kwargs_and_prompt():
+    model_kwargs = dict(ASTAnalyzer.default_model_kwargs)
+    key = DocstringCache.make_key("def f():\n    pass\n", model_kwargs, "prompt")
+    assert key == DocstringCache.make_key("def f():   \n    pass\n\n", model_kwargs, "prompt")
+    assert key != DocstringCache.make_key("def g():\n    pass\n", model_kwargs, "prompt")
+    assert key != DocstringCache.make_key("def f():\n    pass\n", model_kwargs, "other prompt")
+    assert key != DocstringCache.make_key(
+        "def f():\n    pass\n", {**model_kwargs, "temperature": 1}, "prompt"
+    )
+
+
+def test_key_depends_on_the_backend_and_the_requested_model():
+    model_kwargs = dict(ASTAnalyzer.default_model_kwargs)
+    default_model = model_kwargs["model"]
+    identities = [
+        backend_identity(StubBackend(), default_model),
+        backend_identity(OpenAIBackend(api_key="key"), default_model),
+        backend_identity(OpenAIBackend(api_key="key", model="gpt-4"), default_model),
+        backend_identity(OpenAIBackend(api_key="key", api_base="http://host/v1"), default_model),
+    ]
+    assert identities[2].model == "gpt-4"
+    keys = {
+        DocstringCache.make_key("def f():\n    pass\n", model_kwargs, "prompt", identity)
+        for identity in identities
+    }
+    assert len(keys) == len(identities)
+
+
+def test_key_ignores_conversation_history():
+    model_kwargs = dict(ASTAnalyzer.default_model_kwargs)
+    key = DocstringCache.make_key("def f():\n    pass\n", model_kwargs, "prompt")
+    model_kwargs["messages"] = model_kwargs["messages"] + [{"role": "user", "content": "earlier"}]
+    assert key == DocstringCache.make_key("def f():\n    pass\n", model_kwargs, "prompt")
+
+
+def test_evict_by_size_and_age(tmp_path):
+    cache = DocstringCache(tmp_path, max_entries=2, max_age_secs=60)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    cache.connection.execute("UPDATE docstrings SET accessed_at = ? WHERE key = 'a'", (time.time() - 120,))
+    assert cache.evict() == 1
+    assert cache.get("a") is None
+    assert cache.get("b") == "b" and cache.get("c") == "c"
+    cache.put("d", "d")
+    assert cache.evict() == 1
+    cache.close()
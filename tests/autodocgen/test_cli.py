@@ -29,3 +29,19 @@ def test_main_requires_path_argument(monkeypatch):
     with pytest.raises(SystemExit) as exc_info:
         cli.main()
     assert exc_info.value.code == 2
+
+
+def test_process_directory_processes_each_file_once(monkeypatch, tmp_path):
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    for relative_path in ("a.py", "pkg/b.py", "pkg/sub/c.py", "pkg/sub/c_doc.py"):
+        (tmp_path / relative_path).write_text("x = 1\n")
+    processed = []
+    monkeypatch.setattr(
+        cli, "process_python_file", lambda file_path, *args, **kwargs: processed.append(file_path)
+    )
+    cli.process_directory(tmp_path, overwrite_file=False, stem_suffix="_doc", disable_tqdm=True)
+    assert sorted(path.relative_to(tmp_path).as_posix() for path in processed) == [
+        "a.py",
+        "pkg/b.py",
+        "pkg/sub/c.py",
+    ]
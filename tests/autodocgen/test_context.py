@@ -0,0 +1,46 @@
+import pytest
+
+from src.autodocgen.context import ContextPolicy
+
+
+def conversation(exchanges: int, content: str = "x" * 40) -> list[dict]:
+    messages = [{"role": "user", "content": "instruction"}]
+    for index in range(exchanges):
+        messages.append({"role": "user", "content": f"prompt {index} {content}"})
+        messages.append({"role": "assistant", "content": f"response {index} {content}"})
+    messages.append({"role": "user", "content": "current"})
+    return messages
+
+
+def test_stateless_keeps_instruction_and_current_prompt():
+    messages = ContextPolicy("stateless").apply(conversation(3))
+    assert [message["content"] for message in messages] == ["instruction", "current"]
+
+
+def test_window_keeps_last_exchanges():
+    messages = ContextPolicy("window", window=1).apply(conversation(3))
+    assert len(messages) == 4
+    assert messages[1]["content"].startswith("prompt 2")
+    assert messages[2]["content"].startswith("response 2")
+    assert ContextPolicy("window", window=0).apply(conversation(3)) == conversation(0)
+
+
+def test_budget_keeps_exchanges_that_fit():
+    messages = conversation(5)
+    assert ContextPolicy("budget", token_budget=10_000).apply(messages) == messages
+    bounded = ContextPolicy("budget", token_budget=60).apply(messages)
+    assert len(bounded) == 6
+    assert bounded[1]["content"].startswith("prompt 3")
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        ContextPolicy("everything")
+
+
+def test_kept_exchanges_matches_apply():
+    policy = ContextPolicy("budget", token_budget=60)
+    messages = conversation(5)
+    kept = policy.kept_exchanges([26] * 5, 5)
+    assert kept == 2
+    assert len(policy.apply(messages)) == 2 + 2 * kept
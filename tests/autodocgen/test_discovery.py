@@ -0,0 +1,59 @@
+from pathlib import Path
+
+from src.autodocgen.discovery import GitIgnore, discover_python_files
+
+
+def make_tree(root: Path, paths: list[str]):
+    for relative_path in paths:
+        file_path = root / relative_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text("x = 1\n")
+
+
+def relative(root: Path, files) -> list[str]:
+    return [file_path.relative_to(root).as_posix() for file_path in files]
+
+
+def test_every_file_is_yielded_once(tmp_path):
+    make_tree(tmp_path, ["a.py", "pkg/__init__.py", "pkg/b.py", "pkg/sub/c.py", "pkg/sub/deep/d.py", "notes.txt"])
+    assert relative(tmp_path, discover_python_files(tmp_path)) == [
+        "a.py",
+        "pkg/b.py",
+        "pkg/sub/c.py",
+        "pkg/sub/deep/d.py",
+    ]
+
+
+def test_generated_outputs_are_skipped(tmp_path):
+    make_tree(tmp_path, ["a.py", "a_doc.py", "b_annotated.py"])
+    assert relative(tmp_path, discover_python_files(tmp_path)) == ["a.py", "b_annotated.py"]
+    assert relative(tmp_path, discover_python_files(tmp_path, stem_suffix="_annotated")) == ["a.py", "a_doc.py"]
+
+
+def test_include_and_exclude_globs(tmp_path):
+    make_tree(tmp_path, ["src/a.py", "src/test_a.py", "tests/test_b.py", "build/c.py"])
+    files = discover_python_files(tmp_path, include=["src/*"], exclude=["test_*.py"])
+    assert relative(tmp_path, files) == ["src/a.py"]
+    assert relative(tmp_path, discover_python_files(tmp_path, exclude=["build", "tests"])) == [
+        "src/a.py",
+        "src/test_a.py",
+    ]
+
+
+def test_gitignore_is_honoured(tmp_path):
+    (tmp_path / ".git").mkdir()
+    make_tree(tmp_path, ["a.py", "venv/lib.py", "pkg/gen.py", "pkg/keep_gen.py", "pkg/b.py"])
+    (tmp_path / ".gitignore").write_text("venv/\n*gen.py\n")
+    (tmp_path / "pkg" / ".gitignore").write_text("!keep_gen.py\n")
+    assert relative(tmp_path, discover_python_files(tmp_path)) == ["a.py", "pkg/b.py", "pkg/keep_gen.py"]
+    assert len(list(discover_python_files(tmp_path, use_gitignore=False))) == 5
+
+
+def test_gitignore_patterns(tmp_path):
+    gitignore = GitIgnore(tmp_path, ["/build", "docs/**/*.py", "# comment", "cache/"])
+    assert gitignore.match(tmp_path / "build", True)
+    assert gitignore.match(tmp_path / "src" / "build", True) is None
+    assert gitignore.match(tmp_path / "docs" / "a" / "b" / "c.py", False)
+    assert gitignore.match(tmp_path / "docs" / "c.py", False)
+    assert gitignore.match(tmp_path / "cache", False) is None
+    assert gitignore.match(tmp_path / "x" / "cache", True)
@@ -0,0 +1,133 @@
+import ast
+import asyncio
+import re
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.file_visitor import FileVisitor
+
+SOURCE = '''
+class Shape:
+    def area(self):
+        return 0
+
+
+def first():
+    return 1
+
+
+def second():
+    return 2
+'''
+
+
+def make_response(content: str):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content))],
+        usage={"total_tokens": 10},
+    )
+
+
+@pytest.fixture
+def ast_analyzer(monkeypatch):
+    monkeypatch.setenv("OPENAI_KEY", "test-key")
+    analyzer = ASTAnalyzer()
+    analyzer.tree = ast.parse(SOURCE)
+    return analyzer
+
+
+def test_collect_defs_matches_visit_order(ast_analyzer):
+    collected = FileVisitor(ast_analyzer).collect_defs(ast_analyzer.tree)
+    assert [(node.name, str_type) for node, str_type in collected] == [
+        ("Shape", "Class"),
+        ("area", "Function"),
+        ("first", "Function"),
+        ("second", "Function"),
+    ]
+
+
+def test_agenerate_documentation_limits_concurrency(monkeypatch, ast_analyzer):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_acreate(**kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        name = re.search(r"(?:class|def) (\w+)", kwargs["messages"][-1]["content"]).group(1)
+        return make_response(f'"""Docs for {name}."""')
+
+    monkeypatch.setattr(openai.ChatCompletion, "acreate", fake_acreate)
+    file_visitor = FileVisitor(ast_analyzer)
+    asyncio.run(ast_analyzer.agenerate_documentation(file_visitor, concurrency=2))
+
+    assert max_in_flight == 2
+    assert ast_analyzer.total_token_usage == 40
+    docstrings = {
+        node.name: ast.get_docstring(node)
+        for node in ast.walk(ast_analyzer.tree)
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef))
+    }
+    assert docstrings == {
+        "Shape": "Docs for Shape.",
+        "area": "Docs for area.",
+        "first": "Docs for first.",
+        "second": "Docs for second.",
+    }
+    assert ast_analyzer.model_kwargs["messages"] == ASTAnalyzer.default_messages
+
+
+def test_visit_batched_falls_back_to_single_requests(monkeypatch, ast_analyzer):
+    batch_prompts = []
+
+    def fake_batch(batch_prompt, node_count):
+        batch_prompts.append(batch_prompt)
+        return '{"Shape": "Docs for Shape.", "Shape.area": "Docs for area.", "first": 1}'
+
+    monkeypatch.setattr(ast_analyzer, "obtain_pydoc_batch", fake_batch)
+    monkeypatch.setattr(
+        ast_analyzer,
+        "obtain_pydoc",
+        lambda source_code: '"""Single docs for %s."""' % re.search(r"def (\w+)", source_code).group(1),
+    )
+    FileVisitor(ast_analyzer, batch_token_budget=10_000).visit(ast_analyzer.tree)
+
+    assert len(batch_prompts) == 1
+    docstrings = {
+        node.name: ast.get_docstring(node)
+        for node in ast.walk(ast_analyzer.tree)
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef))
+    }
+    assert docstrings == {
+        "Shape": "Docs for Shape.",
+        "area": "Docs for area.",
+        "first": "Single docs for first.",
+        "second": "Single docs for second.",
+    }
+
+
+def test_visit_records_node_metrics(monkeypatch, ast_analyzer):
+    def fake_create(**kwargs):
+        name = re.search(r"(?:class|def) (\w+)", kwargs["messages"][-1]["content"]).group(1)
+        response = make_response(f'"""Docs for {name}."""')
+        response.usage = {"prompt_tokens": 8, "completion_tokens": 2, "total_tokens": 10}
+        return response
+
+    monkeypatch.setattr(openai.ChatCompletion, "create", fake_create)
+    file_visitor = FileVisitor(ast_analyzer)
+    ast_analyzer.generate_documentation(file_visitor)
+
+    nodes = file_visitor.metrics.nodes
+    assert [(node["name"], node["kind"]) for node in nodes] == [
+        ("Shape", "Class"),
+        ("area", "Function"),
+        ("first", "Function"),
+        ("second", "Function"),
+    ]
+    assert all(node["requests"] == 1 and node["prompt_tokens"] == 8 for node in nodes)
+    assert all(node["model"] == ast_analyzer.model_kwargs["model"] for node in nodes)
@@ -0,0 +1,122 @@
+import ast
+
+import pytest
+
+from src.autodocgen import ASTAnalyzer, FileVisitor
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.fingerprint import (
+    FingerprintIndex,
+    structural_fingerprint,
+    substitute_identifiers,
+)
+from src.autodocgen.metrics import MetricsCollector
+
+SOURCE = '''def handle_user(request):
+    return service.get_user(request.id, "user", 1)
+
+
+def handle_order(request):
+    return service.get_order(request.id, "order", 2)
+
+
+def count_items(items):
+    return len(items)
+
+
+def total_items(items):
+    return sum(items)
+'''
+
+
+def fingerprints(source: str) -> dict:
+    return {node.name: structural_fingerprint(node) for node in ast.parse(source).body}
+
+
+def test_fingerprint_ignores_identifiers_literals_and_docstrings():
+    found = fingerprints(SOURCE + '\n\ndef handle_item(request):\n    """Docs."""\n'
+                                  '    return service.get_item(request.id, "item", 3)\n')
+    assert found["handle_user"].digest == found["handle_order"].digest
+    assert found["handle_user"].digest == found["handle_item"].digest
+    assert found["handle_user"].identifiers == ("handle_user", "request", "service", "get_user")
+    assert found["count_items"].digest != found["total_items"].digest
+
+
+def test_fingerprint_keeps_the_methods_called():
+    found = fingerprints(
+        "def add_item(self, x):\n    self.items.append(x)\n\n\n"
+        "def remove_item(self, x):\n    self.items.remove(x)\n\n\n"
+        "def add_entry(self, x):\n    self.entries.append(x)\n"
+    )
+    assert found["add_item"].digest != found["remove_item"].digest
+    assert found["add_item"].digest == found["add_entry"].digest
+    index = FingerprintIndex()
+    index.add(found["add_item"], "Adds an item.")
+    assert index.lookup(found["remove_item"]) is None
+
+
+def test_substitute_identifiers_replaces_identifiers_and_their_words():
+    docstring = "Handles a User request with get_user.\n\nReturns: the USER."
+    assert substitute_identifiers(
+        docstring, ("handle_user", "request", "get_user"), ("handle_order", "request", "get_order")
+    ) == "Handles a Order request with get_order.\n\nReturns: the ORDER."
+    assert substitute_identifiers("Same.", ("a",), ("a",)) == "Same."
+
+
+def test_index_reuses_the_most_similar_docstring_above_the_threshold():
+    found = fingerprints(SOURCE)
+    index = FingerprintIndex()
+    index.add(found["handle_user"], "Gets the user.")
+    assert index.lookup(found["handle_order"]) == "Gets the order."
+    assert index.lookup(found["count_items"]) is None
+    assert (index.lookups, index.reused, len(index)) == (2, 1, 1)
+    assert FingerprintIndex(threshold=0.99).lookup(found["handle_order"]) is None
+
+
+@pytest.mark.parametrize("concurrency, batch_tokens", [(1, 0), (4, 0), (4, 400), (1, 400)])
+def test_visitor_reuses_docstrings_of_duplicates(concurrency, batch_tokens):
+    stub = StubBackend()
+    ast_analyzer = ASTAnalyzer(backend=stub)
+    ast_analyzer.source_code = SOURCE
+    ast_analyzer.tree = ast.parse(SOURCE)
+    metrics = MetricsCollector()
+    file_visitor = FileVisitor(
+        ast_analyzer,
+        batch_token_budget=batch_tokens,
+        metrics=metrics,
+        fingerprints=FingerprintIndex(),
+    )
+    if concurrency > 1:
+        stub.run(ast_analyzer.agenerate_documentation(file_visitor, concurrency=concurrency))
+    else:
+        ast_analyzer.generate_documentation(file_visitor)
+    docstrings = {node.name: ast.get_docstring(node) for node in ast_analyzer.tree.body}
+    assert docstrings["handle_order"] == "Docs for handle_order."
+    assert docstrings["total_items"] == "Docs for total_items."
+    assert metrics.report()["run"]["reused"] == 1
+    assert stub.requests == (3 if batch_tokens == 0 else 1)
+
+
+def test_visitor_reuses_docstrings_of_nodes_left_untouched():
+    source = SOURCE.replace("(request):\n", '(request):\n    """Gets the user."""\n', 1)
+    ast_analyzer = ASTAnalyzer(backend=StubBackend())
+    ast_analyzer.source_code = source
+    ast_analyzer.tree = ast.parse(source)
+    file_visitor = FileVisitor(
+        ast_analyzer,
+        node_filter=lambda node: ast.get_docstring(node) is None,
+        fingerprints=FingerprintIndex(),
+    )
+    ast_analyzer.generate_documentation(file_visitor)
+    assert ast.get_docstring(ast_analyzer.tree.body[1]) == "Gets the order."
+
+
+def test_reuse_rate_counts_reused_nodes():
+    metrics = MetricsCollector()
+    with metrics.track_node("module.py", "first", "Function", "gpt-3.5-turbo"):
+        pass
+    with metrics.track_node("module.py", "second", "Function", "gpt-3.5-turbo") as metric:
+        metric["reused"] = True
+    with metrics.track_node("module.py", "third,fourth", "Batch", "gpt-3.5-turbo", 2):
+        pass
+    run = metrics.report()["run"]
+    assert (run["nodes"], run["reused"], run["reuse_rate"]) == (4, 1, 1 / 4)
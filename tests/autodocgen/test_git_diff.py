@@ -0,0 +1,143 @@
+import ast
+import json
+import subprocess
+import sys
+
+import pytest
+
+from src.autodocgen import cli
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.git_diff import DiffScope, GitDiffError, parse_unified_diff
+from src.autodocgen.node_index import NodeIndex
+
+SOURCE = '''import math
+
+
+class Shape:
+    sides = 0
+
+    def area(self):
+        return 0
+
+    @property
+    def name(self):
+        return "shape"
+
+
+def scale(value, factor):
+    return value * factor
+'''
+
+DIFF = '''diff --git a/pkg/shapes.py b/pkg/shapes.py
+index 1111111..2222222 100644
+--- a/pkg/shapes.py
++++ b/pkg/shapes.py
+@@ -8 +8,2 @@ class Shape:
+-        return 0
++        radius = 1
++        return math.pi * radius
+@@ -20,2 +21,0 @@ def scale(value, factor):
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-x = 1
+diff --git a/new.py b/new.py
+new file mode 100644
+--- /dev/null
++++ b/new.py
+@@ -0,0 +1,3 @@
++def f():
++    pass
++
+'''
+
+
+def git(cwd, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def docstrings(file_path):
+    tree = ast.parse(file_path.read_text())
+    return {entry.unique_name: entry.docstring for entry in NodeIndex(tree)}
+
+
+def test_parse_unified_diff_keeps_the_new_lines_of_added_and_modified_files():
+    assert parse_unified_diff(DIFF) == {
+        "pkg/shapes.py": [(8, 9), (21, 21)],
+        "new.py": [(1, 3)],
+    }
+
+
+@pytest.mark.parametrize(
+    "changed, selected",
+    [
+        ([(8, 8)], {"Shape.area"}),
+        ([(5, 5)], {"Shape"}),
+        ([(10, 10)], {"Shape.name"}),
+        ([(1, 2)], set()),
+        ([(6, 7)], {"Shape", "Shape.area"}),
+        ([(12, 16)], {"Shape.name", "scale"}),
+    ],
+)
+def test_changed_lines_select_the_innermost_enclosing_node(tmp_path, changed, selected):
+    file_path = tmp_path / "shapes.py"
+    scope = DiffScope(tmp_path, {file_path: changed})
+    index = NodeIndex(ast.parse(SOURCE))
+    assert scope.selector(file_path)(index) == selected
+    assert scope.select_nodes(tmp_path / "other.py", index) == set()
+
+
+def test_since_documents_only_the_changed_nodes_of_changed_files(tmp_path):
+    git(tmp_path, "init", "-q")
+    (tmp_path / "shapes.py").write_text(SOURCE)
+    (tmp_path / "other.py").write_text("def other():\n    return 1\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    git(tmp_path, "branch", "base")
+    (tmp_path / "shapes.py").write_text(SOURCE.replace("return 0", "return 1"))
+    git(tmp_path, "commit", "-q", "-am", "change")
+    (tmp_path / "shapes.py").write_text(
+        (tmp_path / "shapes.py").read_text().replace("value * factor", "factor * value")
+    )
+    (tmp_path / "new.py").write_text("def fresh():\n    return 2\n")
+    scope = DiffScope.from_git(tmp_path, since="base")
+    assert sorted(path.name for path in scope.changes) == ["new.py", "shapes.py"]
+    backend = StubBackend()
+    cli.process_directory(tmp_path, True, None, disable_tqdm=True, backend=backend, scope=scope)
+    assert docstrings(tmp_path / "shapes.py") == {
+        "Shape": None,
+        "Shape.area": "Docs for area.",
+        "Shape.name": None,
+        "scale": "Docs for scale.",
+    }
+    assert docstrings(tmp_path / "new.py") == {"fresh": "Docs for fresh."}
+    assert docstrings(tmp_path / "other.py") == {"other": None}
+    with pytest.raises(GitDiffError):
+        DiffScope.from_git(tmp_path, diff="missing..HEAD")
+
+
+def test_plan_since_only_counts_the_changed_nodes(monkeypatch, tmp_path, capsys):
+    monkeypatch.delenv("OPENAI_KEY", raising=False)
+    git(tmp_path, "init", "-q")
+    (tmp_path / "shapes.py").write_text(SOURCE)
+    (tmp_path / "other.py").write_text("def other():\n    return 1\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "base")
+    (tmp_path / "shapes.py").write_text(SOURCE.replace("return 0", "return 1"))
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["autodocgen", str(tmp_path), "--plan", "--plan-format", "json", "--no-cache",
+         "--since", "HEAD"],
+    )
+    cli.main()
+    plan = json.loads(capsys.readouterr().out)
+    assert [file_plan["file"] for file_plan in plan["files"]] == [str(tmp_path / "shapes.py")]
+    assert plan["run"]["nodes"] == 1
@@ -0,0 +1,54 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+HEAVY_MODULES = ("openai", "black", "astor", "tqdm", "dotenv", "asyncio")
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def run_python(code: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def import_secs(module: str) -> float:
+    return min(
+        run_python(
+            "import json, time\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(json.dumps(time.perf_counter() - start))"
+        )
+        for _ in range(3)
+    )
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [["autodocgen", "--help"], ["autodocgen", "does_not_exist.py"]],
+)
+def test_cli_startup_does_not_import_heavy_modules(argv):
+    loaded = run_python(
+        "import json, sys\n"
+        "from src.autodocgen.cli import main\n"
+        f"sys.argv = {argv!r}\n"
+        "try:\n"
+        "    main()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    assert loaded == []
+
+
+def test_cli_import_is_faster_than_importing_openai():
+    assert import_secs("src.autodocgen.cli") < import_secs("openai")
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+from src.autodocgen import cli
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.journal import CheckpointJournal
+
+SOURCE = '''class Shape:
+    def area(self):
+        return 0
+
+
+def first():
+    return 1
+
+
+def second():
+    return 2
+'''
+
+
+class FailingStubBackend(StubBackend):
+    def __init__(self, fail_after: int):
+        super().__init__()
+        self.fail_after = fail_after
+
+    def create(self, **kwargs):
+        if self.requests >= self.fail_after:
+            raise KeyboardInterrupt
+        return super().create(**kwargs)
+
+
+def test_journal_replays_entries_and_ignores_torn_lines(tmp_path):
+    journal = CheckpointJournal(tmp_path / "journal.jsonl")
+    journal.record("hash", "Shape.area", "Docs.")
+    journal.close()
+    with open(tmp_path / "journal.jsonl", "a", encoding="utf-8") as journal_file:
+        journal_file.write('{"file": "hash", "node": "fir')
+
+    replayed = CheckpointJournal(tmp_path / "journal.jsonl")
+    assert replayed.get("hash", "Shape.area") == "Docs."
+    assert replayed.get("hash", "first") is None
+    replayed.close()
+    assert CheckpointJournal(tmp_path / "journal.jsonl", replay=False).entries == {}
+
+
+def test_resume_only_requests_missing_nodes(monkeypatch, tmp_path):
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    os.chmod(source_file, 0o640)
+    journal_path = tmp_path / "journal.jsonl"
+    cli_options = ["--no-cache", "--journal", str(journal_path)]
+
+    monkeypatch.setattr(cli, "create_backend", lambda *args: FailingStubBackend(fail_after=2))
+    monkeypatch.setattr(sys, "argv", ["autodocgen", str(source_file), "-i", *cli_options])
+    with pytest.raises(KeyboardInterrupt):
+        cli.main()
+    assert source_file.read_text() == SOURCE
+    assert len(journal_path.read_text().splitlines()) == 2
+
+    stub = StubBackend()
+    monkeypatch.setattr(cli, "create_backend", lambda *args: stub)
+    monkeypatch.setattr(
+        sys, "argv", ["autodocgen", str(source_file), "-i", "--resume", *cli_options]
+    )
+    cli.main()
+    assert stub.requests == 2
+    assert not journal_path.exists()
+    output = source_file.read_text()
+    assert all(f'"""Docs for {name}."""' in output for name in ("Shape", "area", "first", "second"))
+    assert os.stat(source_file).st_mode & 0o777 == 0o640
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["module.py"]
@@ -0,0 +1,91 @@
+import ast
+
+from src.autodocgen.manifest import RunManifest, node_fingerprint
+from src.autodocgen.node_index import NodeIndex
+
+SOURCE = '''
+class Greeter:
+    """Greets people."""
+
+    def greet(self, name):
+        return "Hello " + name
+
+
+def undocumented():
+    return 1
+'''
+
+
+def nodes_by_name(index):
+    return {entry.unique_name: entry.node for entry in index}
+
+
+def test_fingerprint_ignores_docstrings():
+    tree = ast.parse(SOURCE)
+    greeter = nodes_by_name(NodeIndex(tree))["Greeter"]
+    fingerprint = node_fingerprint(greeter)
+    greeter.body[0] = ast.Expr(value=ast.Constant(value="Something else."))
+    greeter.body[1].body.insert(0, ast.Expr(value=ast.Constant(value="Greets.")))
+    assert node_fingerprint(greeter) == fingerprint
+
+
+def test_unchanged_file_is_skipped_until_modified(tmp_path):
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    manifest = RunManifest(tmp_path / "manifest.json")
+    assert not manifest.is_unchanged(source_file)
+    manifest.record(source_file, NodeIndex(ast.parse(SOURCE)))
+    manifest.save()
+
+    reloaded = RunManifest(tmp_path / "manifest.json")
+    assert reloaded.is_unchanged(source_file)
+    source_file.write_text(SOURCE + "\nx = 1\n")
+    assert not reloaded.is_unchanged(source_file)
+
+
+def test_node_filter_policies(tmp_path):
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    manifest = RunManifest(tmp_path / "manifest.json")
+    manifest.record(source_file, NodeIndex(ast.parse(SOURCE)))
+
+    changed_tree = ast.parse(SOURCE.replace("return 1", "return 2").replace('"Hello "', '"Hi "'))
+    changed_index = NodeIndex(changed_tree)
+    nodes = nodes_by_name(changed_index)
+    assert manifest.node_filter(source_file, changed_index, "all") is None
+
+    only_missing = manifest.node_filter(source_file, changed_index, "only-missing")
+    assert sorted(name for name, node in nodes.items() if only_missing(node)) == ["Greeter.greet", "undocumented"]
+
+    nodes["Greeter"].body[0] = ast.Expr(value=ast.Constant(value="Greets people."))
+    refresh_stale = manifest.node_filter(source_file, changed_index, "refresh-stale")
+    assert sorted(name for name, node in nodes.items() if refresh_stale(node)) == [
+        "Greeter",
+        "Greeter.greet",
+        "undocumented",
+    ]
+
+
+def test_refresh_stale_tells_nodes_with_the_same_qualname_apart(tmp_path):
+    source = (
+        "class Point:\n"
+        "    @property\n"
+        "    def x(self):\n"
+        '        """Gets x."""\n'
+        "        return self._x\n\n"
+        "    @x.setter\n"
+        "    def x(self, value):\n"
+        '        """Sets x."""\n'
+        "        self._x = value\n"
+    )
+    source_file = tmp_path / "point.py"
+    source_file.write_text(source)
+    manifest = RunManifest(tmp_path / "manifest.json")
+    manifest.record(source_file, NodeIndex(ast.parse(source)))
+    assert set(manifest.get_record(source_file)["nodes"]) == {"Point.x", "Point.x#2"}
+    index = NodeIndex(ast.parse(source.replace("self._x = value", "self._x = int(value)")))
+    refresh_stale = manifest.node_filter(source_file, index, "refresh-stale")
+    assert [entry.unique_name for entry in index if refresh_stale(entry.node)] == [
+        "Point",
+        "Point.x#2",
+    ]
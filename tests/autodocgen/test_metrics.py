@@ -0,0 +1,116 @@
+import ast
+import asyncio
+import json
+
+import pytest
+
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.cache import DocstringCache
+from src.autodocgen.file_visitor import FileVisitor
+from src.autodocgen.metrics import (
+    MetricsCollector,
+    estimate_cost,
+    percentile,
+    record_rate_limit_wait,
+    record_request_usage,
+    record_retry,
+)
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
+
+
+def test_estimate_cost_of_known_and_unknown_models():
+    assert estimate_cost("gpt-4", 1000, 1000) == pytest.approx(0.09)
+    assert estimate_cost("unknown-model", 1000, 1000) == 0.0
+
+
+def test_track_node_collects_usage_of_concurrent_nodes():
+    metrics = MetricsCollector()
+
+    async def document(name: str, retries: int):
+        with metrics.track_node("module.py", name, "Function", "gpt-4"):
+            for _ in range(retries):
+                record_retry()
+                await asyncio.sleep(0)
+            record_rate_limit_wait(0.5)
+            record_request_usage({"prompt_tokens": 100, "completion_tokens": 20})
+
+    async def run():
+        await asyncio.gather(document("first", 2), document("second", 0))
+
+    asyncio.run(run())
+    record_request_usage({"prompt_tokens": 1000})
+
+    nodes = {node["name"]: node for node in metrics.nodes}
+    assert nodes["first"]["retries"] == 2
+    assert nodes["second"]["retries"] == 0
+    assert all(node["requests"] == 1 for node in nodes.values())
+    assert all(node["prompt_tokens"] == 100 for node in nodes.values())
+    assert all(node["rate_limit_wait_secs"] == 0.5 for node in nodes.values())
+
+
+def test_report_aggregates_files_and_run(tmp_path):
+    metrics = MetricsCollector()
+    with metrics.track_node("a.py", "first", "Function", "gpt-4"):
+        record_request_usage({"prompt_tokens": 1000, "completion_tokens": 1000})
+    with metrics.track_node("a.py", "second", "Function", "gpt-4") as metric:
+        metric["cache_hit"] = True
+    metrics.record_file("a.py", 1.5)
+    worker_metrics = MetricsCollector()
+    with worker_metrics.track_node("b.py", "third", "Class", "gpt-4"):
+        record_request_usage({"prompt_tokens": 1000, "completion_tokens": 0})
+    worker_metrics.record_file("b.py", 0.5)
+    metrics.merge(worker_metrics.export())
+
+    metrics.write_json(tmp_path / "metrics.json")
+    metrics.write_prometheus(tmp_path / "metrics.prom")
+
+    report = json.loads((tmp_path / "metrics.json").read_text())
+    assert report["run"]["nodes"] == 3
+    assert report["run"]["cache_hits"] == 1
+    assert report["run"]["requests"] == 2
+    assert report["run"]["estimated_cost_usd"] == pytest.approx(0.12)
+    assert report["files"]["a.py"]["wall_secs"] == 1.5
+    assert report["files"]["b.py"]["prompt_tokens"] == 1000
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert 'autodocgen_cache_lookups{result="hit"} 1' in prometheus
+    assert 'autodocgen_tokens{type="prompt"} 2000' in prometheus
+
+
+class MalformedBatchStubBackend(StubBackend):
+    def respond(self, **kwargs):
+        response = super().respond(**kwargs)
+        if response.choices[0].message.content.startswith("{"):
+            response.choices[0].message.content = "Not JSON."
+        return response
+
+
+@pytest.mark.parametrize("use_cache, concurrency", [(True, 1), (True, 4), (False, 1)])
+def test_cache_misses_count_lookups_once(tmp_path, use_cache, concurrency):
+    source = "def first():\n    return 1\n\n\ndef second():\n    return 2\n"
+    stub = MalformedBatchStubBackend()
+    ast_analyzer = ASTAnalyzer(backend=stub)
+    ast_analyzer.source_code = source
+    ast_analyzer.tree = ast.parse(source)
+    metrics = MetricsCollector()
+    file_visitor = FileVisitor(
+        ast_analyzer,
+        cache=DocstringCache(tmp_path) if use_cache else None,
+        batch_token_budget=10_000,
+        metrics=metrics,
+    )
+    if concurrency > 1:
+        stub.run(ast_analyzer.agenerate_documentation(file_visitor, concurrency=concurrency))
+    else:
+        ast_analyzer.generate_documentation(file_visitor)
+    run = metrics.report()["run"]
+    # The malformed batch falls back to a request per node, without another lookup.
+    assert run["requests"] == 3
+    assert (run["nodes"], run["cache_misses"]) == (2, 2 if use_cache else 0)
@@ -0,0 +1,100 @@
+import ast
+
+from src.autodocgen import ASTAnalyzer, FileVisitor
+from src.autodocgen import file_visitor as file_visitor_module
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.fingerprint import FingerprintIndex
+from src.autodocgen.manifest import node_fingerprint
+from src.autodocgen.node_index import NodeIndex, module_name
+
+SOURCE = '''class Service:
+    """Serves."""
+
+    class Config:
+        def load(self):
+            return {}
+
+    async def fetch(self, key):
+        def normalize(value):
+            return value.strip()
+
+        return normalize(key)
+
+
+async def handler(request):
+    return request
+
+
+def factory():
+    class Product:
+        def build(self):
+            return 1
+
+    return Product
+
+
+if True:
+    def handler(request):
+        return None
+'''
+
+
+def test_index_collects_classes_then_functions_with_qualnames():
+    index = NodeIndex(ast.parse(SOURCE), "pkg.api", SOURCE)
+    assert [(entry.kind, entry.unique_name, entry.parent) for entry in index] == [
+        ("Class", "Service", None),
+        ("Class", "Service.Config", "Service"),
+        ("Class", "factory.Product", "factory"),
+        ("Function", "Service.Config.load", "Service.Config"),
+        ("Function", "Service.fetch", "Service"),
+        ("Function", "handler", None),
+        ("Function", "factory", None),
+        ("Function", "factory.Product.build", "factory.Product"),
+        ("Function", "handler#2", None),
+    ]
+    service, fetch = index.entries[0], index.entries[4]
+    assert (service.qualified_name, service.docstring) == ("pkg.api.Service", "Serves.")
+    assert (fetch.lineno, fetch.end_lineno) == (8, 12)
+    assert index.source_segment(fetch).startswith("    async def fetch(self, key):")
+    assert fetch.source_hash == node_fingerprint(fetch.node)
+    assert index.get(fetch.node) is fetch
+
+
+def test_module_name_includes_packages(tmp_path):
+    package = tmp_path / "pkg" / "sub"
+    package.mkdir(parents=True)
+    (tmp_path / "pkg" / "__init__.py").write_text("")
+    (package / "__init__.py").write_text("")
+    assert module_name(package / "mod.py") == "pkg.sub.mod"
+    assert module_name(package / "__init__.py") == "pkg.sub"
+    assert module_name(tmp_path / "script.py") == "script"
+
+
+def test_visit_documents_async_functions_from_a_single_index(monkeypatch):
+    built = []
+    original = file_visitor_module.NodeIndex
+
+    def counting_index(*args, **kwargs):
+        built.append(None)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(file_visitor_module, "NodeIndex", counting_index)
+    stub = StubBackend()
+    ast_analyzer = ASTAnalyzer(backend=stub)
+    ast_analyzer.source_code = SOURCE
+    ast_analyzer.tree = ast.parse(SOURCE)
+    file_visitor = FileVisitor(ast_analyzer, fingerprints=FingerprintIndex())
+    file_visitor.prepare_prompts(ast_analyzer.tree)
+    ast_analyzer.generate_documentation(file_visitor)
+    assert len(built) == 1
+    docstrings = {
+        entry.unique_name: ast.get_docstring(entry.node) for entry in file_visitor.node_index
+    }
+    assert docstrings["Service.fetch"] == "Docs for fetch."
+    assert docstrings["handler"] == "Docs for handler."
+    assert docstrings["Service.Config"] == "Docs for Config."
+    inner = [
+        node for node in ast.walk(ast_analyzer.tree)
+        if isinstance(node, ast.FunctionDef) and node.name == "normalize"
+    ]
+    assert ast.get_docstring(inner[0]) is None
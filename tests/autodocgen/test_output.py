@@ -0,0 +1,118 @@
+import json
+import subprocess
+
+import pytest
+
+from src.autodocgen import cli
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.manifest import RunManifest
+from src.autodocgen.output import OutputWriter, apply_sidecar
+
+SOURCES = {
+    "pkg/shapes.py": '''class Shape:
+    # The number of sides.
+    sides = 0
+
+    def area(self):
+        """Old docstring."""
+        return 0
+''',
+    "pkg/ops.py": "def add(a, b):\n    return a + b",
+    "pkg/empty.py": "X = 1\n",
+}
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for relative_path, source in SOURCES.items():
+        (tmp_path / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / relative_path).write_text(source)
+    return tmp_path
+
+
+def documented_in_place(tmp_path):
+    expected = tmp_path / "expected"
+    for relative_path, source in SOURCES.items():
+        (expected / relative_path).parent.mkdir(parents=True, exist_ok=True)
+        (expected / relative_path).write_text(source)
+    cli.process_directory(expected / "pkg", True, None, disable_tqdm=True, backend=StubBackend())
+    return {path: (expected / path).read_text() for path in SOURCES}
+
+
+def current(tmp_path):
+    return {path: (tmp_path / path).read_text() for path in SOURCES}
+
+
+def test_patch_out_writes_a_single_patch_and_leaves_the_files_untouched(tree):
+    output = OutputWriter.open("patch", tree / "docs.patch")
+    cli.process_directory(
+        tree / "pkg", True, None, disable_tqdm=True, backend=StubBackend(), output=output
+    )
+    output.close()
+    assert current(tree) == SOURCES
+    assert (output.files, output.docstrings) == (2, 3)
+    patch = (tree / "docs.patch").read_text()
+    assert patch.count("+++ b/pkg/") == 2
+    assert "\\ No newline at end of file" in patch
+    subprocess.run(["git", "apply", "docs.patch"], cwd=tree, check=True)
+    assert current(tree) == documented_in_place(tree)
+
+
+def test_patch_out_does_not_record_the_untouched_files_in_the_manifest(tree):
+    manifest = RunManifest(tree / "manifest.json")
+    patches = []
+    for _ in range(2):
+        output = OutputWriter.open("patch", tree / "docs.patch")
+        cli.process_directory(
+            tree / "pkg",
+            True,
+            None,
+            disable_tqdm=True,
+            backend=StubBackend(),
+            manifest=manifest,
+            output=output,
+        )
+        output.close()
+        patches.append((tree / "docs.patch").read_text())
+    assert manifest.files == {}
+    assert patches[1] == patches[0] and patches[0].count("+++ b/pkg/") == 2
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_jsonl_out_records_every_docstring_for_apply(tree, jobs):
+    output = OutputWriter.open("jsonl", tree / "docs.jsonl")
+    cli.process_directory(
+        tree / "pkg",
+        True,
+        None,
+        disable_tqdm=True,
+        backend=StubBackend(),
+        jobs=jobs,
+        output=output,
+    )
+    output.close()
+    assert current(tree) == SOURCES
+    records = [json.loads(line) for line in (tree / "docs.jsonl").read_text().splitlines()]
+    assert sorted((record["file"], record["qualname"], record["line"]) for record in records) == [
+        ("pkg/ops.py", "add", 1),
+        ("pkg/shapes.py", "Shape", 1),
+        ("pkg/shapes.py", "Shape.area", 5),
+    ]
+    assert apply_sidecar(tree / "docs.jsonl") == (3, 0)
+    assert current(tree) == documented_in_place(tree)
+
+
+def test_apply_skips_records_of_missing_nodes(tree, capsys):
+    sidecar = tree / "docs.jsonl"
+    sidecar.write_text(
+        json.dumps({"file": "pkg/ops.py", "qualname": "add", "line": 1, "docstring": "Adds."})
+        + "\n"
+        + json.dumps({"file": "pkg/ops.py", "qualname": "sub", "line": 4, "docstring": "Subs."})
+        + "\n"
+    )
+    with pytest.raises(SystemExit) as exc_info:
+        cli.apply_main([str(sidecar)])
+    assert exc_info.value.code == 1
+    assert "Applied 1 docstrings, skipped 1" in capsys.readouterr().out
+    assert (tree / "pkg/ops.py").read_text() == 'def add(a, b):\n    """Adds."""\n    return a + b'
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.cli import process_directory
+from src.autodocgen.pipeline import run_pipeline
+
+
+def test_run_pipeline_keeps_order_and_bounds_queued_items():
+    prepared, finished = [], []
+    threads = set()
+
+    def prepare(item):
+        prepared.append(item)
+        threads.add(("prepare", threading.current_thread().name))
+        return None if item == 3 else item * 10
+
+    def generate(item):
+        threads.add(("generate", threading.current_thread().name))
+        # One item per stage and depth items per queue, plus the skipped item.
+        assert len(prepared) - len(finished) <= 2 * 2 + 3 + 1
+
+    def finish(item):
+        finished.append(item)
+
+    run_pipeline(range(20), prepare, generate, finish, depth=2)
+    assert finished == [item * 10 for item in range(20) if item != 3]
+    assert ("generate", threading.current_thread().name) in threads
+    assert ("prepare", threading.current_thread().name) not in threads
+
+
+def test_run_pipeline_finishes_generated_items_before_raising():
+    finished = []
+
+    def generate(item):
+        if item == 3:
+            raise RuntimeError("generation failed")
+
+    with pytest.raises(RuntimeError):
+        run_pipeline(range(10), lambda item: item, generate, finished.append, depth=2)
+    assert finished == [0, 1, 2]
+
+
+def test_run_pipeline_raises_errors_of_other_stages():
+    def prepare(item):
+        if item == 2:
+            raise ValueError("parse error")
+        return item
+
+    def finish(item):
+        if item == 5:
+            raise OSError("disk full")
+
+    with pytest.raises(ValueError):
+        run_pipeline(range(10), prepare, lambda item: None, lambda item: None)
+    with pytest.raises(OSError):
+        run_pipeline(range(10), lambda item: item, lambda item: None, finish)
+
+
+def test_pipelined_directory_matches_sequential_processing(tmp_path):
+    outputs = {}
+    for depth in (0, 2):
+        directory = tmp_path / str(depth)
+        directory.mkdir()
+        for index in range(5):
+            (directory / f"module{index}.py").write_text(
+                f"class Shape{index}:\n    def area(self):\n        return {index}\n"
+            )
+        stub = StubBackend()
+        process_directory(
+            directory,
+            overwrite_file=True,
+            stem_suffix="_doc",
+            disable_tqdm=True,
+            backend=stub,
+            pipeline_depth=depth,
+        )
+        stub.close()
+        assert stub.requests == 10
+        outputs[depth] = {path.name: path.read_text() for path in directory.iterdir()}
+    assert outputs[0] == outputs[2]
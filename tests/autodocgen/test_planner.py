@@ -0,0 +1,147 @@
+import ast
+import json
+import sys
+
+from src.autodocgen import cli
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.backends import resolve_backend_identity
+from src.autodocgen.cache import DocstringCache
+from src.autodocgen.context import ContextPolicy
+from src.autodocgen.manifest import RunManifest
+from src.autodocgen.node_index import NodeIndex
+from src.autodocgen.planner import plan_file, plan_run, project_wall_secs
+from src.autodocgen.prompt_builder import PromptBuilder
+from src.autodocgen.rate_limiter import RateLimiter
+
+SOURCE = '''
+class Shape:
+    def area(self):
+        return 0
+
+
+def first():
+    return 1
+
+
+def second():
+    """Already documented."""
+    return 2
+'''
+
+
+def test_plan_file_counts_history_of_serial_requests(tmp_path):
+    tree = ast.parse(SOURCE)
+    stateless = plan_file(tmp_path, tree, PromptBuilder(), ContextPolicy("stateless"))
+    window = plan_file(tmp_path, tree, PromptBuilder(), ContextPolicy("window", window=2))
+    concurrent = plan_file(
+        tmp_path, tree, PromptBuilder(), ContextPolicy("window", window=2), concurrency=4
+    )
+    assert stateless["nodes"] == stateless["requests"] == 4
+    assert window["prompt_tokens"] > stateless["prompt_tokens"]
+    assert concurrent["prompt_tokens"] == stateless["prompt_tokens"]
+    assert window["completion_tokens"] == stateless["completion_tokens"]
+
+
+def test_plan_file_skips_cached_nodes_and_packs_batches(tmp_path):
+    tree = ast.parse(SOURCE)
+    prompt_builder = PromptBuilder()
+    cache = DocstringCache(tmp_path)
+    shape = tree.body[0]
+    backend = resolve_backend_identity(
+        "openai", None, None, ASTAnalyzer.default_model_kwargs["model"]
+    )
+    cache.put(
+        DocstringCache.make_key(
+            prompt_builder.build(shape).source,
+            ASTAnalyzer.default_model_kwargs,
+            ASTAnalyzer.default_prepend_prompt,
+            backend,
+        ),
+        '"""Cached."""',
+    )
+    plan = plan_file(
+        tmp_path, tree, prompt_builder, ContextPolicy(), cache=cache, batch_token_budget=10_000
+    )
+    stub_plan = plan_file(
+        tmp_path,
+        tree,
+        prompt_builder,
+        ContextPolicy(),
+        cache=cache,
+        backend=resolve_backend_identity("stub", None, None, backend.model),
+    )
+    assert (plan["cached"], stub_plan["cached"]) == (1, 0)
+    assert plan["requests"] == 1
+    assert cache.hits == cache.misses == 0
+
+
+def test_project_wall_secs_uses_rate_limits_beyond_the_first_minute():
+    rate_limiter = RateLimiter(rpm=60, tpm=1_000_000)
+    assert project_wall_secs(30, 100, rate_limiter, latency_secs=0) == 0
+    assert project_wall_secs(180, 100, rate_limiter, latency_secs=0) == 120
+    assert project_wall_secs(10, 100, rate_limiter, parallel_requests=5, latency_secs=2) == 4
+
+
+def test_plan_run_groups_directories_with_only_missing(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "a.py").write_text(SOURCE)
+    (tmp_path / "pkg" / "b.py").write_text(SOURCE)
+    plan = plan_run(
+        tmp_path,
+        PromptBuilder(),
+        ContextPolicy(),
+        RateLimiter(rpm=60, tpm=40_000),
+        policy="only-missing",
+    )
+    assert sorted(plan["directories"]) == [".", "pkg"]
+    assert plan["run"]["files"] == 2
+    assert plan["run"]["nodes"] == 6
+
+
+def test_plan_run_refreshes_stale_nodes_of_the_manifest(tmp_path):
+    source_file = tmp_path / "a.py"
+    source_file.write_text(SOURCE)
+    manifest = RunManifest(tmp_path / "manifest.json")
+    manifest.record(source_file, NodeIndex(ast.parse(SOURCE)))
+    source_file.write_text(SOURCE.replace("return 2", "return 3"))
+    plan = plan_run(
+        source_file,
+        PromptBuilder(),
+        ContextPolicy(),
+        RateLimiter(rpm=60, tpm=40_000),
+        manifest=manifest,
+        policy="refresh-stale",
+    )
+    # The three undocumented nodes and the documented one whose body changed.
+    assert plan["run"]["nodes"] == 4
+
+
+def test_main_plan_does_not_need_openai_key(monkeypatch, tmp_path, capsys):
+    monkeypatch.delenv("OPENAI_KEY", raising=False)
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["autodocgen", str(source_file), "--plan", "--plan-format", "json", "--no-cache"],
+    )
+    cli.main()
+    plan = json.loads(capsys.readouterr().out)
+    assert plan["run"]["requests"] == 4
+    assert source_file.read_text() == SOURCE
+
+
+def test_main_plan_uses_the_backend_model(monkeypatch, tmp_path, capsys):
+    monkeypatch.delenv("OPENAI_KEY", raising=False)
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    argv = ["autodocgen", str(source_file), "--plan", "--plan-format", "json", "--no-cache"]
+    monkeypatch.setattr(sys, "argv", argv + ["--backend-model", "gpt-4"])
+    cli.main()
+    plan = json.loads(capsys.readouterr().out)["run"]
+    monkeypatch.setattr(sys, "argv", argv)
+    cli.main()
+    default_plan = json.loads(capsys.readouterr().out)["run"]
+    assert (plan["model"], default_plan["model"]) == ("gpt-4", "gpt-3.5-turbo")
+    assert plan["estimated_cost_usd"] > default_plan["estimated_cost_usd"]
+    assert plan["projected_wall_secs"] >= default_plan["projected_wall_secs"]
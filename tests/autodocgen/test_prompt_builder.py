@@ -0,0 +1,55 @@
+import ast
+
+from src.autodocgen.prompt_builder import PromptBuilder, skeletonize_class, trim_source
+
+SOURCE = '''
+@dataclass
+class Account(Base):
+    """A bank account."""
+
+    currency: str = "EUR"
+    registry = {}
+
+    def deposit(self, amount):
+        """Adds money."""
+        self.balance += amount
+        return self.balance
+
+    async def sync(self):
+        await self.client.push(self)
+
+    class Meta:
+        table = "accounts"
+
+        def describe(self):
+            return self.table
+'''
+
+
+def test_skeleton_keeps_signatures_docstrings_and_attributes():
+    class_node = ast.parse(SOURCE).body[0]
+    skeleton = ast.unparse(skeletonize_class(class_node))
+    assert "class Account(Base):" in skeleton and "@dataclass" in skeleton
+    assert "currency: str = 'EUR'" in skeleton and "registry = {}" in skeleton
+    assert "def deposit(self, amount):\n        \"\"\"Adds money.\"\"\"\n        ..." in skeleton
+    assert "async def sync(self):\n        ..." in skeleton
+    assert "table = 'accounts'" in skeleton and "def describe(self):\n            ..." in skeleton
+    assert "self.balance" not in skeleton and "push" not in skeleton
+    assert "self.balance += amount" in ast.unparse(class_node)
+
+
+def test_trim_source_respects_budget():
+    source = "def f():\n" + "".join(f"    x{index} = {index}\n" for index in range(100))
+    trimmed = trim_source(source, max_tokens=20)
+    assert trimmed.startswith("def f():\n    x0 = 0\n")
+    assert trimmed.rstrip().endswith("more lines omitted")
+    assert len(trimmed) < len(source)
+    assert trim_source("def f():\n    pass\n", max_tokens=20) == "def f():\n    pass\n"
+
+
+def test_build_reports_saved_tokens():
+    class_node = ast.parse(SOURCE).body[0]
+    prompt = PromptBuilder().build(class_node)
+    assert prompt.saved_tokens == prompt.original_tokens - prompt.prompt_tokens > 0
+    full_prompt = PromptBuilder(skeletonize_classes=False).build(class_node)
+    assert full_prompt.saved_tokens == 0
@@ -0,0 +1,42 @@
+import asyncio
+
+from src.autodocgen.rate_limiter import DEFAULT_MODEL_LIMITS, RateLimiter
+
+
+def test_for_model_uses_known_limits_and_overrides():
+    limiter = RateLimiter.for_model("gpt-4")
+    assert (limiter.rpm, limiter.tpm) == (DEFAULT_MODEL_LIMITS["gpt-4"]["rpm"], DEFAULT_MODEL_LIMITS["gpt-4"]["tpm"])
+    limiter = RateLimiter.for_model("gpt-4", rpm=10, tpm=1000)
+    assert (limiter.rpm, limiter.tpm) == (10, 1000)
+
+
+def test_acquire_does_not_wait_under_quota():
+    limiter = RateLimiter(rpm=600, tpm=100_000)
+    assert limiter.acquire(1000) == 0
+    assert limiter.acquire(1000) == 0
+    assert limiter.total_wait_secs == 0
+
+
+def test_acquire_waits_when_requests_run_out():
+    limiter = RateLimiter(rpm=6000, tpm=1_000_000)
+    limiter.request_level = 0
+    waited = limiter.acquire(10)
+    assert 0 < waited < 0.1
+
+
+def test_token_reservation_is_reconciled():
+    limiter = RateLimiter(rpm=600, tpm=10_000)
+    limiter.acquire(2000)
+    level_after_reservation = limiter.token_level
+    limiter.record_usage(used_tokens=500, reserved_tokens=2000)
+    assert limiter.token_level >= level_after_reservation + 1500
+
+
+def test_rate_limit_lowers_and_recovers_the_rate():
+    limiter = RateLimiter(rpm=6000, tpm=1_000_000)
+    limiter.on_rate_limit(retry_after=0.01)
+    assert limiter.rate_factor == 0.5
+    assert asyncio.run(limiter.aacquire(10)) > 0
+    for _ in range(20):
+        limiter.record_usage(used_tokens=10, reserved_tokens=10)
+    assert limiter.rate_factor == 1.0
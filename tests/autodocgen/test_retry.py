@@ -0,0 +1,184 @@
+import asyncio
+import pickle
+import threading
+import time
+
+import pytest
+from openai.error import APIConnectionError, InvalidRequestError, RateLimitError
+
+from src.autodocgen.rate_limiter import RateLimiter
+from src.autodocgen.retry import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryExecutor,
+    retry_after_secs,
+)
+
+
+def failing(errors: list, response: str = "ok"):
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if errors:
+            raise errors.pop(0)
+        return response
+
+    return request, calls
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr("src.autodocgen.retry.time.sleep", delays.append)
+    return delays
+
+
+def test_backoff_grows_exponentially_up_to_the_maximum():
+    executor = RetryExecutor(base_delay_secs=1, max_delay_secs=5)
+    assert all(0 <= executor.backoff_secs(1) <= 1 for _ in range(50))
+    assert max(executor.backoff_secs(3) for _ in range(200)) > 2
+    assert all(executor.backoff_secs(10) <= 5 for _ in range(50))
+
+
+def test_call_retries_retryable_errors_until_the_maximum(sleeps):
+    executor = RetryExecutor(max_attempts=3, base_delay_secs=0)
+    request, calls = failing([APIConnectionError("down"), APIConnectionError("down")])
+    assert executor.call(request) == "ok"
+    assert (len(calls), len(sleeps)) == (3, 2)
+    request, calls = failing([APIConnectionError(str(index)) for index in range(3)])
+    with pytest.raises(APIConnectionError, match="2"):
+        executor.call(request)
+    assert len(calls) == 3
+
+
+def test_call_raises_errors_that_cannot_succeed_on_a_retry(sleeps):
+    request, calls = failing([InvalidRequestError("bad request", param=None)])
+    with pytest.raises(InvalidRequestError):
+        RetryExecutor().call(request)
+    assert (len(calls), sleeps) == (1, [])
+
+
+def test_call_waits_for_retry_after_and_lowers_the_rate_limiter(sleeps):
+    request, _ = failing([APIConnectionError("down", headers={"Retry-After": "7"})])
+    RetryExecutor().call(request)
+    assert sleeps == [7.0]
+    rate_limiter = RateLimiter(rpm=60, tpm=100_000)
+    request, _ = failing([RateLimitError("slow down", headers={"retry-after": "3"})])
+    RetryExecutor().call(request, rate_limiter)
+    assert rate_limiter.rate_factor < 1
+    assert rate_limiter.blocked_until > time.monotonic() + 2
+    assert sleeps == [7.0, 0.0]
+    assert retry_after_secs(RateLimitError("slow down")) is None
+
+
+def test_circuit_breaker_opens_after_consecutive_failures_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_secs=60)
+    breaker.record_failure()
+    breaker.before_request()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_request()
+    assert error.value.retry_after > 59
+    breaker.opened_until = 0
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    breaker.before_request()
+
+
+def test_open_circuit_fails_requests_without_sending_them(sleeps):
+    executor = RetryExecutor(max_attempts=3, breaker=CircuitBreaker(1, reset_secs=60))
+    request, calls = failing([APIConnectionError("down")] * 3)
+    with pytest.raises(CircuitOpenError):
+        executor.call(request)
+    assert len(calls) == 1
+    assert sleeps[-1] > 59
+
+
+def test_attempt_leaves_the_timeout_to_the_backend():
+    executor = RetryExecutor(timeout_secs=0.05)
+    caller = threading.current_thread()
+
+    def send():
+        time.sleep(0.1)
+        return threading.current_thread()
+
+    # Without hedging, no thread is started, so no request is abandoned still in flight.
+    assert executor.attempt(send) is caller
+    assert executor._pool is None
+
+
+def test_attempt_hedges_slow_requests():
+    executor = RetryExecutor(hedge=True, hedge_min_secs=0.05)
+    for _ in range(20):
+        assert executor.attempt(lambda: "fast") == "fast"
+    release = threading.Event()
+    calls = []
+
+    def send():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "hedged"
+
+    assert executor.attempt(send) == "hedged"
+    assert executor.hedges == 1
+    release.set()
+    executor.close()
+
+
+def test_aattempt_hedges_slow_requests_and_cancels_the_loser():
+    executor = RetryExecutor(hedge=True, hedge_min_secs=0.05)
+    cancelled = []
+
+    async def fast():
+        return "fast"
+
+    async def run():
+        for _ in range(20):
+            await executor.aattempt(fast)
+        calls = []
+
+        async def send():
+            calls.append(None)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.append(None)
+                    raise
+                return "slow"
+            return "hedged"
+
+        result = await executor.aattempt(send)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == "hedged"
+    assert (executor.hedges, cancelled) == (1, [None])
+
+
+def test_acall_retries_timeouts():
+    executor = RetryExecutor(timeout_secs=0.05, base_delay_secs=0)
+    calls = []
+
+    async def send():
+        calls.append(None)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+        return "ok"
+
+    assert asyncio.run(executor.acall(lambda: executor.aattempt(send))) == "ok"
+    assert len(calls) == 2
+
+
+def test_executor_pickles():
+    executor = RetryExecutor(hedge=True)
+    executor.attempt(lambda: "ok")
+    copy = pickle.loads(pickle.dumps(executor))
+    assert copy.hedge and copy.attempt(lambda: "ok") == "ok"
+    executor.close()
+    copy.close()
@@ -0,0 +1,158 @@
+import ast
+import pickle
+import sys
+
+import pytest
+
+from src.autodocgen import ASTAnalyzer, FileVisitor, cli
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.file_visitor import collect_defs
+from src.autodocgen.manifest import RunManifest
+from src.autodocgen.node_index import NodeIndex
+from src.autodocgen.scheduler import RunBudget, parse_duration, rank_defs, rank_files
+
+SOURCE = '''def _helper():
+    return 1
+
+
+def documented():
+    """Already documented."""
+    return helper_user()
+
+
+def small():
+    return 2
+
+
+def large():
+    first = 1
+    second = 2
+    return first + second
+
+
+class Shape:
+    def _private(self):
+        return 0
+'''
+
+
+def test_parse_duration_accepts_units():
+    assert parse_duration("90") == 90
+    assert parse_duration("15m") == 900
+    assert parse_duration("1.5h") == 5400
+    with pytest.raises(ValueError):
+        parse_duration("-1s")
+    with pytest.raises(ValueError):
+        parse_duration("soon")
+
+
+def test_budget_is_exhausted_by_tokens_requests_or_deadline():
+    budget = RunBudget(max_tokens=100, max_requests=3)
+    budget.charge(60)
+    assert not budget.exhausted()
+    budget.charge(60)
+    assert budget.exhausted_reason() == "max tokens"
+    budget = RunBudget(max_requests=1)
+    budget.charge(1)
+    assert budget.exhausted_reason() == "max requests"
+    assert RunBudget(deadline_secs=0).exhausted_reason() == "deadline"
+    assert not RunBudget().exhausted()
+
+
+def test_budget_split_keeps_deadline_and_pickles():
+    budget = RunBudget(max_tokens=1000, max_requests=5, deadline_secs=60)
+    share = pickle.loads(pickle.dumps(budget.split(2)))
+    assert (share.max_tokens, share.max_requests) == (500, 2)
+    assert share.deadline == budget.deadline
+    share.charge(10)
+    assert share.used_tokens == 10
+
+
+def test_rank_defs_orders_public_undocumented_referenced_and_large_first():
+    tree = ast.parse(SOURCE)
+    index = NodeIndex(tree)
+    ranked = [node.name for node, _ in rank_defs(index, index.defs())]
+    assert ranked == ["large", "Shape", "small", "documented", "_helper", "_private"]
+
+
+def test_rank_files_orders_files_by_public_undocumented_nodes(tmp_path):
+    private = tmp_path / "private.py"
+    private.write_text("def _helper():\n    return 1\n")
+    public = tmp_path / "public.py"
+    public.write_text(SOURCE)
+    broken = tmp_path / "broken.py"
+    broken.write_text("def broken(:\n")
+    assert rank_files([broken, private, public]) == [public, private, broken]
+
+
+def test_visitor_stops_at_the_request_budget():
+    stub = StubBackend()
+    ast_analyzer = ASTAnalyzer(backend=stub, budget=RunBudget(max_requests=2))
+    ast_analyzer.source_code = SOURCE
+    ast_analyzer.tree = ast.parse(SOURCE)
+    file_visitor = FileVisitor(ast_analyzer)
+    ast_analyzer.generate_documentation(file_visitor)
+    assert stub.requests == 2
+    assert file_visitor.skipped_nodes == ["small", "documented", "_helper", "_private"]
+    docstrings = {
+        node.name: ast.get_docstring(node)
+        for node, _ in collect_defs(ast_analyzer.tree)
+    }
+    assert docstrings["Shape"] == "Docs for Shape."
+    assert docstrings["large"] == "Docs for large."
+    assert docstrings["documented"] == "Already documented."
+    assert docstrings["small"] is None
+
+
+@pytest.mark.parametrize("batch_tokens", [0, 20])
+def test_async_visitor_stops_at_the_request_budget(batch_tokens):
+    stub = StubBackend()
+    ast_analyzer = ASTAnalyzer(backend=stub, budget=RunBudget(max_requests=1))
+    ast_analyzer.source_code = SOURCE
+    ast_analyzer.tree = ast.parse(SOURCE)
+    file_visitor = FileVisitor(ast_analyzer, batch_token_budget=batch_tokens)
+    stub.run(ast_analyzer.agenerate_documentation(file_visitor, concurrency=1))
+    assert stub.requests == 1
+    assert file_visitor.skipped_nodes
+    assert ast.get_docstring(ast_analyzer.tree.body[0]) is None
+
+
+def test_exhausted_budget_writes_partial_files_and_stops(monkeypatch, tmp_path):
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE)
+    manifest_path = tmp_path / "manifest.json"
+    stub = StubBackend()
+    monkeypatch.setattr(cli, "create_backend", lambda *args: stub)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "autodocgen", str(source_file), "-i", "--no-cache", "--max-requests", "1",
+            "--manifest", str(manifest_path), "--journal", str(tmp_path / "journal.jsonl"),
+        ],
+    )
+    cli.main()
+    assert stub.requests == 1
+    assert '"""Docs for large."""' in source_file.read_text()
+    assert "Docs for Shape" not in source_file.read_text()
+    assert not RunManifest(manifest_path).is_unchanged(source_file)
+
+
+@pytest.mark.parametrize("pipeline_depth", [0, 2])
+def test_exhausted_budget_leaves_files_without_docstrings_unwritten(tmp_path, pipeline_depth):
+    for name in "abcd":
+        (tmp_path / f"{name}.py").write_text(
+            f"def {name}_first():\n    return 1\n\n\ndef {name}_second():\n    return 2\n"
+        )
+    cli.process_directory(
+        tmp_path,
+        False,
+        "_doc",
+        disable_tqdm=True,
+        backend=StubBackend(),
+        budget=RunBudget(max_requests=5),
+        pipeline_depth=pipeline_depth,
+    )
+    written = sorted(tmp_path.glob("*_doc.py"))
+    assert len(written) == 3
+    assert all('"""Docs for' in file_path.read_text() for file_path in written)
@@ -0,0 +1,143 @@
+import ast
+
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.node_index import NodeIndex
+from src.autodocgen.splice import render_docstring, splice_docstrings
+
+SOURCE = '''# A comment that ast.unparse would drop
+import os
+
+
+class Shape:  # trailing comment
+    """Old docstring."""
+
+    def area(self):
+        # compute the area
+        return   0
+
+
+def short(): return "é"
+'''
+
+
+def add_docstrings(source: str, docstrings: dict) -> ast.AST:
+    tree = ast.parse(source)
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef)) and node.name in docstrings:
+            ASTAnalyzer.add_docstring_to_ast(node, docstrings[node.name])
+    return tree
+
+
+def test_splice_without_new_docstrings_returns_source():
+    assert splice_docstrings(SOURCE, ast.parse(SOURCE)) is SOURCE
+
+
+def test_splice_inserts_and_replaces_docstrings_only():
+    tree = add_docstrings(
+        SOURCE,
+        {
+            "Shape": '"""New class docstring."""',
+            "area": '"""\n    Computes the area.\n\n    Returns:\n        int: The area.\n    """',
+            "short": "Short docstring.",
+        },
+    )
+    assert splice_docstrings(SOURCE, tree) == '''# A comment that ast.unparse would drop
+import os
+
+
+class Shape:  # trailing comment
+    """New class docstring."""
+
+    def area(self):
+        """
+        Computes the area.
+
+        Returns:
+            int: The area.
+        """
+        # compute the area
+        return   0
+
+
+def short():
+    """Short docstring."""
+    return "é"
+'''
+
+
+def test_splice_reads_the_original_statements_from_the_index():
+    docstrings = {"Shape": "Class.", "area": "Area.", "short": "Short."}
+    tree = ast.parse(SOURCE)
+    index = NodeIndex(tree)
+    for entry in index:
+        ASTAnalyzer.add_docstring_to_ast(entry.node, docstrings[entry.node.name])
+    assert splice_docstrings(SOURCE, tree, index) == splice_docstrings(
+        SOURCE, add_docstrings(SOURCE, docstrings)
+    )
+
+
+def test_spliced_docstrings_match_the_tree():
+    tree = add_docstrings(SOURCE, {"Shape": "Class.", "area": "Area.", "short": 'Ends "quoted"'})
+    spliced_tree = ast.parse(splice_docstrings(SOURCE, tree))
+    docstrings = {
+        node.name: ast.get_docstring(node)
+        for node in ast.walk(spliced_tree)
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef))
+    }
+    assert docstrings == {"Shape": "Class.", "area": "Area.", "short": 'Ends "quoted"'}
+
+
+def test_splice_inserts_docstrings_above_decorated_first_statements():
+    source = """class Point:
+    @property
+    def x(self): return 1
+
+
+def outer():
+    # The inner function.
+    @functools.wraps(
+        outer
+    )
+    @staticmethod
+    def inner():
+        pass
+    return inner
+"""
+    tree = add_docstrings(source, {"Point": "A point.", "outer": "Outer.", "inner": "Inner."})
+    new_code = splice_docstrings(source, tree)
+    assert new_code == """class Point:
+    \"\"\"A point.\"\"\"
+    @property
+    def x(self): return 1
+
+
+def outer():
+    \"\"\"Outer.\"\"\"
+    # The inner function.
+    @functools.wraps(
+        outer
+    )
+    @staticmethod
+    def inner():
+        \"\"\"Inner.\"\"\"
+        pass
+    return inner
+"""
+
+
+def test_render_docstring_escapes_quotes_and_backslashes():
+    literal = render_docstring('Uses """quotes""" and \\n', "    ")
+    assert ast.literal_eval(literal) == 'Uses """quotes""" and \\n'
+
+
+def test_write_file_from_ast_reformat_regenerates_file(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_KEY", "test-key")
+    source_file = tmp_path / "module.py"
+    source_file.write_text(SOURCE, encoding="utf-8")
+    ast_analyzer = ASTAnalyzer(file_path=source_file)
+    spliced = ast_analyzer.write_file_from_ast(tmp_path / "spliced.py", str_return=True)
+    reformatted = ast_analyzer.write_file_from_ast(
+        tmp_path / "reformatted.py", str_return=True, reformat=True
+    )
+    assert spliced == SOURCE
+    assert "# A comment" not in reformatted
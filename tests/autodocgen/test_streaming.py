@@ -0,0 +1,68 @@
+import pytest
+
+from src.autodocgen.ast_analyzer import ASTAnalyzer
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.file_visitor import FileVisitor
+from src.autodocgen.streaming import DocstringScanner, consume_stream, extract_docstring
+
+RESPONSES = [
+    '"""Docs for f."""\n\nThis docstring explains f.',
+    'Here you go:\n```python\ndef f():\n    """Docs for f."""\n```\nMore text',
+    "```\nDocs for f.\n```\nThen '''other''' text",
+    "'''Docs for f.''' and then \"\"\"late docs\"\"\"",
+    '""""""Empty docstring.',
+    'Example:\n```\nf()\n```\n"""Docs for f."""',
+    '"""Docs with "" quotes."""',
+    "No docstring at all",
+]
+
+
+@pytest.mark.parametrize("response", RESPONSES)
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 1000])
+def test_scanner_extracts_the_docstring_of_the_full_response(response, chunk_size):
+    scanner = DocstringScanner()
+    for start in range(0, len(response), chunk_size):
+        if scanner.feed(response[start:start + chunk_size]):
+            break
+    text = scanner.result()
+    assert response.startswith(text)
+    assert extract_docstring(text) == extract_docstring(response)
+
+
+def test_scanner_only_stops_early_after_double_quotes():
+    scanner = DocstringScanner()
+    assert not scanner.feed("```\nExample.\n```\n")
+    assert scanner.feed('"""Docs for f."""\ntrailing')
+    assert extract_docstring(scanner.result()) == ("Docs for f.", "three double quotes")
+
+
+def test_scanner_waits_for_open_double_quotes():
+    scanner = DocstringScanner()
+    assert not scanner.feed('"""Docs with ```code``` inside')
+    assert scanner.feed(' end."""\ntrailing')
+    assert extract_docstring(scanner.result())[0] == "Docs with ```code``` inside end."
+
+
+def test_consume_stream_closes_the_stream_early():
+    stub = StubBackend(commentary_tokens=50)
+    chunks = stub.create(messages=[{"role": "user", "content": "def f(): pass"}], stream=True)
+    text, stopped_early = consume_stream(chunks)
+    assert text == '"""Docs for f."""'
+    assert stopped_early
+    assert chunks.gi_frame is None
+
+
+def test_streamed_visit_records_early_stops(monkeypatch, tmp_path):
+    source_file = tmp_path / "module.py"
+    source_file.write_text("def first():\n    return 1\n\n\ndef second():\n    return 2\n")
+    stub = StubBackend(commentary_tokens=50)
+    ast_analyzer = ASTAnalyzer(file_path=source_file, backend=stub, stream=True)
+    file_visitor = FileVisitor(ast_analyzer)
+    stub.run(ast_analyzer.agenerate_documentation(file_visitor, concurrency=2))
+    stub.close()
+
+    nodes = file_visitor.metrics.nodes
+    assert [node["early_stops"] for node in nodes] == [1, 1]
+    assert all(0 < node["saved_completion_tokens"] <= 1024 for node in nodes)
+    output = ast_analyzer.write_file_from_ast(tmp_path / "out.py", str_return=True)
+    assert '"""Docs for first."""' in output and "explains" not in output
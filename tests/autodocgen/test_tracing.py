@@ -0,0 +1,114 @@
+import asyncio
+import json
+import sys
+
+import pytest
+
+from src.autodocgen import cli, tracing
+from src.autodocgen.tracing import Tracer, span
+
+SOURCE = '''class Greeter:
+    def greet(self, name):
+        return "Hello " + name
+
+
+def farewell(name):
+    return "Bye " + name
+'''
+
+
+@pytest.fixture(autouse=True)
+def no_tracer():
+    tracing.disable_tracing()
+    yield
+    tracing.disable_tracing()
+
+
+def test_span_does_nothing_while_tracing_is_disabled():
+    with span("idle"):
+        pass
+    assert tracing.current_tracer() is None
+    tracer = tracing.enable_tracing()
+    with pytest.raises(ValueError):
+        with span("failing", "io", attempt=1):
+            raise ValueError("boom")
+    (event,) = tracer.drain()
+    assert (event["name"], event["cat"], event["ph"], event["args"]) == (
+        "failing",
+        "io",
+        "X",
+        {"attempt": 1},
+    )
+    assert event["dur"] >= 0 and tracer.events == []
+
+
+def test_concurrent_tasks_get_their_own_tracks():
+    tracer = Tracer()
+
+    async def request(index):
+        with tracer.span("request", "network", {"index": index}):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(request(0), request(1))
+
+    asyncio.run(run())
+    assert len({event["tid"] for event in tracer.events}) == 2
+
+
+def test_trace_out_exports_the_spans_of_a_run(monkeypatch, tmp_path):
+    file_path = tmp_path / "greeter.py"
+    file_path.write_text(SOURCE)
+    trace_path = tmp_path / "trace.json"
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "autodocgen",
+            str(file_path),
+            "-i",
+            "--backend",
+            "stub",
+            "--no-cache",
+            "--reformat",
+            "--trace-out",
+            str(trace_path),
+        ],
+    )
+    cli.main()
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    names = {event["name"] for event in events}
+    assert {
+        "run",
+        "read_file",
+        "ast.parse",
+        "node_index",
+        "astor.to_source",
+        "build_prompt",
+        "prepare_prompts",
+        "generate_documentation",
+        "visit_def",
+        "rate_limiter.acquire",
+        "request",
+        "extract_docstring",
+        "ast.unparse",
+        "black.format_str",
+        "write_file",
+    } <= names
+    run = next(event for event in events if event["name"] == "run")
+    assert all(run["ts"] <= event["ts"] and event["ph"] == "X" for event in events)
+    assert sum(event["name"] == "request" for event in events) == 3
+
+
+def test_profile_prints_the_slowest_functions(monkeypatch, tmp_path, capsys):
+    file_path = tmp_path / "greeter.py"
+    file_path.write_text(SOURCE)
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["autodocgen", str(file_path), "-i", "--backend", "stub", "--no-cache", "--profile"],
+    )
+    cli.main()
+    err = capsys.readouterr().err
+    assert "Ordered by: cumulative time" in err
+    assert "run_from_args" in err
@@ -0,0 +1,147 @@
+import ast
+import threading
+import time
+
+import pytest
+
+from src.autodocgen import cli
+from src.autodocgen.backends import StubBackend
+from src.autodocgen.node_index import NodeIndex
+from src.autodocgen.watch import Watcher
+
+SOURCE = '''def add(a, b):
+    return a + b
+
+
+def sub(a, b):
+    return a - b
+'''
+
+
+def docstrings(file_path):
+    tree = ast.parse(file_path.read_text())
+    return {entry.unique_name: entry.docstring for entry in NodeIndex(tree)}
+
+
+def stub_document(backend, documented):
+    def document(file_path, select_nodes):
+        def select(index):
+            names = select_nodes(index)
+            documented.append(sorted(names))
+            return names
+
+        prepared = cli.prepare_python_file(file_path, backend=backend, select_nodes=select)
+        if prepared is not None:
+            cli.generate_python_file(prepared)
+            cli.write_python_file(prepared, True, None)
+        return True
+
+    return document
+
+
+def test_watcher_documents_only_the_nodes_whose_body_changed(tmp_path):
+    file_path = tmp_path / "ops.py"
+    file_path.write_text(SOURCE)
+    documented = []
+    watcher = Watcher(tmp_path, stub_document(StubBackend(), documented))
+    watcher.baseline()
+    assert watcher.poll() == {}
+    file_path.write_text(SOURCE.replace("a - b", "b - a"))
+    watcher.handle(sorted(watcher.poll()))
+    assert documented == [["sub"]]
+    assert docstrings(file_path) == {"add": None, "sub": "Docs for sub."}
+    # The docstring written in place is not a change, nor is editing a docstring.
+    assert watcher.poll() == {}
+    file_path.write_text(file_path.read_text().replace("Docs for sub.", "Subtracts."))
+    watcher.handle(sorted(watcher.poll()))
+    assert documented == [["sub"], []]
+    assert docstrings(file_path)["sub"] == "Subtracts."
+
+
+def test_watcher_retries_files_changed_while_documented(tmp_path):
+    file_path = tmp_path / "ops.py"
+    file_path.write_text(SOURCE)
+    results = [False, True]
+    selected = []
+
+    def document(path, select_nodes):
+        selected.append(select_nodes(NodeIndex(ast.parse(path.read_text()))))
+        return results.pop(0)
+
+    watcher = Watcher(file_path, document)
+    watcher.baseline()
+    file_path.write_text(SOURCE.replace("a + b", "b + a"))
+    watcher.handle(sorted(watcher.poll()))
+    assert list(watcher.poll()) == [file_path]
+    watcher.handle(sorted(watcher.poll()))
+    assert selected == [{"add"}, {"add"}]
+    assert watcher.poll() == {}
+
+
+def test_watcher_debounces_bursts_of_changes(tmp_path):
+    file_path = tmp_path / "ops.py"
+    file_path.write_text(SOURCE)
+    handled = []
+    watcher = Watcher(
+        tmp_path,
+        lambda path, select_nodes: handled.append(path) or True,
+        poll_interval=0.01,
+        debounce=0.3,
+    )
+    stop = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stop,))
+    thread.start()
+    try:
+        while not watcher.stats:
+            time.sleep(0.01)
+        for index in range(5):
+            file_path.write_text(SOURCE + "\n" * (index + 1))
+            time.sleep(0.05)
+        deadline = time.monotonic() + 5
+        while not handled and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+    finally:
+        stop.set()
+        thread.join()
+    assert (handled, watcher.runs) == ([file_path], 1)
+
+
+def test_watch_main_documents_changes_with_a_warm_backend(tmp_path, capsys):
+    file_path = tmp_path / "ops.py"
+    file_path.write_text(SOURCE)
+    stop = threading.Event()
+    argv = [
+        str(tmp_path),
+        "-i",
+        "--backend",
+        "stub",
+        "--no-cache",
+        "--poll-interval",
+        "0.01",
+        "--debounce",
+        "0.05",
+    ]
+    thread = threading.Thread(target=cli.watch_main, args=(argv, stop))
+    thread.start()
+    try:
+        while "Watching" not in capsys.readouterr().out:
+            time.sleep(0.01)
+        time.sleep(0.3)
+        file_path.write_text(SOURCE + "\n\ndef neg(a):\n    return -a\n")
+        deadline = time.monotonic() + 10
+        while docstrings(file_path).get("neg") is None and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        stop.set()
+        thread.join()
+    assert docstrings(file_path) == {"add": None, "sub": None, "neg": "Docs for neg."}
+
+
+def test_watch_main_requires_documenting_in_place(tmp_path, capsys):
+    (tmp_path / "ops.py").write_text(SOURCE)
+    with pytest.raises(SystemExit) as exc_info:
+        cli.watch_main([str(tmp_path), "--backend", "stub", "--no-cache"], threading.Event())
+    assert exc_info.value.code == 2
+    assert "requires -i/--overwrite" in capsys.readouterr().err
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ops.py"]